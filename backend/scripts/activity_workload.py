@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Relatório de carga de trabalho das atividades (activity_workload_reports)
+
+Para cada empresa, lê as atividades por cursor no servidor, em lotes colunares, e
+agrega com NumPy (np.unique + np.bincount, sem laço por linha) por responsável,
+grupo de trabalho, departamento, sprint, projeto e empresa inteira:
+
+  carga          itens abertos (OPEN_STATUSES), horas estimadas em aberto, urgentes em aberto
+  atraso         abertos vencidos, horas vencidas e faixas de atraso (dias)
+  erro           atividades concluídas com estimated_hours e actual_hours: soma
+                 real / soma estimada (viés), percentis de real/estimado e do erro
+                 percentual absoluto, e histograma de real/estimado
+
+Atualização incremental: activity_workload_state guarda, por empresa, o maior
+updated_at incluído no relatório; refresh recalcula só empresas com atividades
+alteradas depois disso, nunca calculadas ou com relatório mais velho que
+--max-age-hours (o atraso muda com o relógio e exclusões físicas não alteram
+updated_at). Colunas ausentes no schema (ex.: sprint_id) viram chave vazia.
+
+Estruturas: supabase/migrations/20251004000000_activity_workload.sql
+
+Uso:
+    python activity_workload.py refresh
+    python activity_workload.py refresh --company 00000000-0000-0000-0000-000000000000 --force
+    python activity_workload.py show --company 00000000-0000-0000-0000-000000000000 --dimension sprint
+"""
+
+import argparse
+import sys
+import time
+
+from dataset_io import to_json
+from pg_utils import (
+    LoadThrottle,
+    ProgressReporter,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    list_distinct_owners,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Dimensão: colunas candidatas de activities (a primeira que existir)
+DIMENSIONS = {
+    'employee': ('responsible_id', 'assigned_to', 'created_by'),
+    'work_group': ('work_group',),
+    'department': ('department',),
+    'sprint': ('sprint_id',),
+    'project': ('project_id',),
+}
+DONE_STATUS = 'completed'
+SKIPPED_STATUS = 'cancelled'
+# Só estes contam como carga aberta; archived e status desconhecidos ficam fora
+# (os schemas de activities usam in_progress e in-progress)
+OPEN_STATUSES = ('pending', 'in_progress', 'in-progress', 'overdue')
+AGING_DAYS = (1, 3, 7, 30)          # faixas de atraso: <1, 1-3, 3-7, 7-30, >=30 dias
+RATIO_EDGES = (0.5, 0.8, 1.25, 2.0)  # real/estimado: <0.5, 0.5-0.8, 0.8-1.25, 1.25-2, >=2
+PERCENTILES = (50, 75, 90)
+
+
+def activity_query(columns):
+    """SELECT das atividades de uma empresa, adaptado às colunas que existem"""
+    def pick(candidates, cast, fallback):
+        for column in candidates:
+            if column in columns:
+                return cast.format(column)
+        return fallback
+
+    keys = [f"COALESCE({pick(c, '{}::text', 'NULL')}, '')" for c in DIMENSIONS.values()]
+    urgent = ' OR '.join(filter(None, [
+        "is_urgent" if 'is_urgent' in columns else None,
+        "priority = 'urgent'" if 'priority' in columns else None,
+    ])) or 'false'
+    return f"""
+        SELECT {', '.join(keys)},
+               COALESCE(status, ''), COALESCE({urgent}, false),
+               {pick(('estimated_hours',), '{}::float8', 'NULL::float8')},
+               {pick(('actual_hours',), '{}::float8', 'NULL::float8')},
+               {pick(('due_date',), 'EXTRACT(EPOCH FROM {})::float8', 'NULL::float8')},
+               updated_at
+        FROM public.activities
+        WHERE company_id = %(company)s AND status IS DISTINCT FROM '{SKIPPED_STATUS}'
+    """
+
+
+def load_activities(conn, query, company_id, batch_size=20000):
+    """Atividades da empresa em arrays NumPy, convertidos lote a lote"""
+    names = list(DIMENSIONS) + ['status', 'urgent', 'estimated', 'actual', 'due']
+    dtypes = [object] * len(DIMENSIONS) + [object, bool, np.float64, np.float64, np.float64]
+    chunks = {name: [] for name in names}
+    last_updated = None
+    with conn.cursor(name='activity_workload') as cur:
+        cur.itersize = batch_size
+        cur.execute(query, {'company': company_id})
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            for name, dtype, values in zip(names, dtypes, columns):
+                chunks[name].append(np.array(values, dtype=dtype))
+            batch_max = max((ts for ts in columns[-1] if ts is not None), default=None)
+            if batch_max is not None and (last_updated is None or batch_max > last_updated):
+                last_updated = batch_max
+    conn.commit()
+    data = {name: np.concatenate(chunks[name]) if chunks[name] else np.zeros(0, dtype=dtype)
+            for name, dtype in zip(names, dtypes)}
+    return data, last_updated
+
+
+def segment_percentiles(values, groups, group_count, percentiles):
+    """Percentis (interpolação linear, como np.percentile) de `values` por grupo, vetorizado"""
+    result = np.full((group_count, len(percentiles)), np.nan)
+    if len(values) == 0:
+        return result
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    present = counts > 0
+    for j, p in enumerate(percentiles):
+        pos = starts[present] + (counts[present] - 1) * (p / 100.0)
+        low = np.floor(pos).astype(np.int64)
+        high = np.ceil(pos).astype(np.int64)
+        result[present, j] = ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+    return result
+
+
+def _round(value, digits=2):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def dimension_report(keys, data, now):
+    """[(chave, itens, abertos, vencidos, horas abertas, métricas)] de uma dimensão"""
+    if len(keys) == 0:
+        return []
+    labels, group = np.unique(keys.astype(str), return_inverse=True)
+    g = len(labels)
+
+    def total(mask, weights=None):
+        w = mask if weights is None else np.where(mask, weights, 0.0)
+        return np.bincount(group, weights=w, minlength=g)
+
+    estimated = data['estimated']
+    actual = data['actual']
+    done = data['status'] == DONE_STATUS
+    open_ = np.isin(data['status'], OPEN_STATUSES)
+    overdue = open_ & (data['due'] < now)
+    est_hours = np.nan_to_num(estimated)
+
+    items = np.bincount(group, minlength=g)
+    open_items = total(open_)
+    open_hours = total(open_, est_hours)
+    unestimated = total(open_ & ~(estimated > 0))
+    urgent_open = total(open_ & data['urgent'])
+    overdue_items = total(overdue)
+    overdue_hours = total(overdue, est_hours)
+
+    bucket = np.digitize((now - data['due']) / 86400.0, AGING_DAYS)
+    aging = np.bincount(group[overdue] * (len(AGING_DAYS) + 1) + bucket[overdue],
+                        minlength=g * (len(AGING_DAYS) + 1)).reshape(g, -1)
+
+    # Erro estimado × real: só concluídas com as duas horas preenchidas
+    sample = done & (estimated > 0) & (actual >= 0)
+    ratio = actual[sample] / estimated[sample]
+    sample_group = group[sample]
+    samples = np.bincount(sample_group, minlength=g)
+    bias = np.bincount(sample_group, weights=actual[sample], minlength=g) / np.maximum(
+        np.bincount(sample_group, weights=estimated[sample], minlength=g), 1e-9)
+    ratio_pct = segment_percentiles(ratio, sample_group, g, PERCENTILES)
+    ape_pct = segment_percentiles(np.abs(ratio - 1.0), sample_group, g, PERCENTILES)
+    histogram = np.bincount(sample_group * (len(RATIO_EDGES) + 1) + np.digitize(ratio, RATIO_EDGES),
+                            minlength=g * (len(RATIO_EDGES) + 1)).reshape(g, -1)
+    completed = total(done)
+    completed_est = total(done, est_hours)
+    completed_actual = total(done, np.nan_to_num(actual))
+
+    rows = []
+    for i, label in enumerate(labels):
+        metrics = {
+            'load': {
+                'open': int(open_items[i]),
+                'open_estimated_hours': _round(open_hours[i]),
+                'open_unestimated': int(unestimated[i]),
+                'urgent_open': int(urgent_open[i]),
+            },
+            'overdue': {
+                'items': int(overdue_items[i]),
+                'estimated_hours': _round(overdue_hours[i]),
+                'aging_days': list(AGING_DAYS),
+                'aging': aging[i].tolist(),
+            },
+            'completed': {
+                'items': int(completed[i]),
+                'estimated_hours': _round(completed_est[i]),
+                'actual_hours': _round(completed_actual[i]),
+            },
+            'estimate_error': {
+                'samples': int(samples[i]),
+                'bias': _round(bias[i], 4) if samples[i] else None,
+                'ratio': {f"p{p}": _round(v, 4) for p, v in zip(PERCENTILES, ratio_pct[i])},
+                'abs_pct_error': {f"p{p}": _round(v, 4) for p, v in zip(PERCENTILES, ape_pct[i])},
+                'ratio_edges': list(RATIO_EDGES),
+                'histogram': histogram[i].tolist(),
+            },
+        }
+        rows.append((str(label), int(items[i]), int(open_items[i]), int(overdue_items[i]),
+                     _round(open_hours[i]) or 0, metrics))
+    return rows
+
+
+def company_report(data, now):
+    """{dimensão: linhas}; 'company' é o total da empresa (chave '')"""
+    n = len(data['status'])
+    report = {'company': dimension_report(np.full(n, '', dtype=object), data, now)}
+    for dimension in DIMENSIONS:
+        report[dimension] = dimension_report(data[dimension], data, now)
+    return report
+
+
+def companies_to_refresh(conn, companies, max_age_hours, force):
+    """Empresas nunca calculadas, com atividades alteradas depois do relatório ou com relatório velho"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.company_id::text,
+                   (SELECT MAX(a.updated_at) FROM public.activities a WHERE a.company_id = c.company_id),
+                   s.source_updated_at,
+                   s.computed_at < now() - make_interval(hours => %s)
+            FROM unnest(%s::uuid[]) AS c(company_id)
+            LEFT JOIN public.activity_workload_state s ON s.company_id = c.company_id
+        """, (max_age_hours, [str(c) for c in companies]))
+        rows = cur.fetchall()
+    conn.commit()
+    todo = []
+    for company_id, latest, computed_through, stale in rows:
+        if force or computed_through is None or stale or (latest is not None and latest > computed_through):
+            todo.append(company_id)
+    return todo
+
+
+def store(conn, company_id, report, source_updated_at, activities):
+    """Substitui o relatório da empresa e avança o estado numa única transação"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM public.activity_workload_reports WHERE company_id = %s", (company_id,))
+        cur.executemany("""
+            INSERT INTO public.activity_workload_reports
+              (company_id, dimension, dimension_key, items, open_items, overdue_items, open_estimated_hours, metrics)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s::jsonb)
+        """, [(company_id, dimension, key, items, open_items, overdue, hours, to_json(metrics))
+              for dimension, rows in report.items()
+              for key, items, open_items, overdue, hours, metrics in rows])
+        cur.execute("""
+            INSERT INTO public.activity_workload_state (company_id, source_updated_at, activities, computed_at)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (company_id) DO UPDATE
+            SET source_updated_at = EXCLUDED.source_updated_at, activities = EXCLUDED.activities,
+                computed_at = now()
+        """, (company_id, source_updated_at, activities))
+    conn.commit()
+
+
+def run_refresh(conn, args):
+    catalog = fetch_table_columns(conn, ['public.activities'])
+    columns = {name for name, _, _ in catalog.get('public.activities', [])}
+    if 'company_id' not in columns:
+        print("❌ activities não tem company_id")
+        sys.exit(1)
+    query = activity_query(columns)
+    companies = args.company or list_distinct_owners(conn, table='activities', column='company_id')
+    todo = companies_to_refresh(conn, companies, args.max_age_hours, args.force)
+    print(f"🚀 Carga de trabalho: {len(todo)} de {len(companies)} empresas para recalcular...")
+
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    progress = ProgressReporter('empresas', len(todo))
+    activities = 0
+    for company_id in todo:
+        throttle.wait()
+        data, last_updated = load_activities(conn, query, company_id, args.batch_size)
+        report = company_report(data, time.time())
+        store(conn, company_id, report, last_updated, len(data['status']))
+        activities += len(data['status'])
+        progress.update(1, atividades=activities)
+    progress.finish()
+
+
+def run_show(conn, args):
+    if not args.company:
+        print("❌ show exige --company")
+        sys.exit(1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.get_activity_workload(%s, %s)", (args.company[0], args.dimension))
+        rows = cur.fetchall()
+    conn.commit()
+    if not rows:
+        print("ℹ️ Nada em cache para essa empresa; rode refresh")
+        return
+    print(f"📊 {args.dimension} (calculado em {rows[0][-1]:%Y-%m-%d %H:%M})")
+    for key, items, open_items, overdue, hours, metrics, _ in rows[:args.limit]:
+        error = metrics['estimate_error']
+        print(f"   {key or '(vazio)':<38} {items:>6} itens  abertos {open_items:>5} ({hours}h)  "
+              f"vencidos {overdue:>5} {metrics['overdue']['aging']}  "
+              f"real/estimado {error['bias'] or '-'} (n={error['samples']}, p90 erro {error['abs_pct_error']['p90']})")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Carga de trabalho, atraso e erro de estimativa das atividades")
+    parser.add_argument('command', choices=['refresh', 'show'])
+    parser.add_argument('--company', action='append', help="Limita a estas company_id")
+    parser.add_argument('--force', action='store_true', help="Recalcula mesmo sem alterações")
+    parser.add_argument('--max-age-hours', type=int, default=24, help="Recalcula relatórios mais velhos que isto")
+    parser.add_argument('--dimension', choices=['company'] + list(DIMENSIONS), default='employee')
+    parser.add_argument('--limit', type=int, default=30, help="show: linhas exibidas")
+    parser.add_argument('--batch-size', type=int, default=20000, help="Atividades por lote")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if np is None:
+        print("❌ numpy não instalado. Execute: pip install numpy")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='activity_workload')
+    started = time.monotonic()
+    try:
+        if args.command == 'refresh':
+            run_refresh(conn, args)
+            print(f"🎉 Relatório atualizado em {format_duration(time.monotonic() - started)}")
+        else:
+            run_show(conn, args)
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; empresas concluídas já foram confirmadas")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Runner de backfill online e com throttling
+
+Substitui os UPDATEs gigantes de unify_phone_columns.sql, add_company_id_to_all_tables.sql
+e migrate_existing_data_to_companies.sql por lotes curtos percorrendo faixas da chave
+primária. O tamanho do lote se adapta para mirar uma latência por lote e o job pausa
+quando o lag de replicação ou as esperas por lock passam dos limites.
+
+Uso:
+    python backfill_runner.py --list
+    python backfill_runner.py company_id:leads --target-ms 300
+    python backfill_runner.py --table contacts --set "phone = phone_number" \\
+        --where "phone IS NULL AND phone_number IS NOT NULL"
+"""
+
+import argparse
+import sys
+import time
+
+from pg_utils import (
+    AdaptiveChunker,
+    LoadThrottle,
+    ProgressReporter,
+    estimate_row_count,
+    get_pg_connection,
+    qualified_name,
+    quote_ident,
+)
+
+try:
+    from psycopg2 import errors as pg_errors
+except ImportError:
+    pg_errors = None
+
+
+def _company_from_owner(table):
+    """Backfill de company_id a partir do profile do owner (migrate_existing_data_to_companies.sql)"""
+    return {
+        'table': table,
+        'set': 'company_id = p.company_id',
+        'from': 'public.profiles p',
+        'where': 't.owner_id = p.id AND t.company_id IS NULL AND p.company_id IS NOT NULL',
+    }
+
+
+# Backfills conhecidos; a tabela alvo é sempre referenciada pelo alias "t"
+BACKFILLS = {
+    'contacts_phone': {
+        'table': 'contacts',
+        'set': 'phone = t.phone_number',
+        'where': 't.phone IS NULL AND t.phone_number IS NOT NULL',
+    },
+    'company_id:inventory': {
+        'table': 'inventory',
+        'set': 'company_id = pr.company_id',
+        'from': 'public.products pr',
+        'where': 't.product_id = pr.id AND t.company_id IS NULL AND pr.company_id IS NOT NULL',
+    },
+    # Reescrever raw dispara trg_whatsapp_mensagens_offload_raw, que move o payload
+    # para whatsapp_mensagens_raw (20250924000000_whatsapp_raw_payload_offload.sql)
+    'raw_offload': {
+        'table': 'whatsapp_mensagens',
+        'set': 'raw = t.raw',
+        'where': 't.raw IS NOT NULL',
+    },
+}
+for _table in ('employees', 'products', 'funnel_stages', 'leads', 'deals',
+               'activities', 'projects', 'suppliers', 'contacts'):
+    BACKFILLS[f'company_id:{_table}'] = _company_from_owner(_table)
+
+
+def build_update_sql(spec, key='id'):
+    """Monta o UPDATE restrito à faixa (lo, hi] da chave primária"""
+    key = quote_ident(key)
+    sql = f"UPDATE {qualified_name(spec['table'])} t SET {spec['set']}"
+    if spec.get('from'):
+        sql += f" FROM {spec['from']}"
+    where = [f"t.{key} > %(lo)s OR %(lo)s IS NULL", f"t.{key} <= %(hi)s"]
+    if spec.get('where'):
+        where.append(spec['where'])
+    sql += " WHERE " + " AND ".join(f"({w})" for w in where)
+    return sql
+
+
+def next_upper_bound(conn, table, lo, chunk_size, key='id'):
+    """Retorna (hi, linhas na faixa) do próximo lote, ou (None, 0) no fim da tabela"""
+    key = quote_ident(key)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {key}, COUNT(*) OVER ()
+            FROM (
+              SELECT {key} FROM {qualified_name(table)}
+              WHERE %(lo)s IS NULL OR {key} > %(lo)s
+              ORDER BY {key}
+              LIMIT %(limit)s
+            ) s
+            ORDER BY {key} DESC
+            LIMIT 1
+        """, {'lo': lo, 'limit': chunk_size})
+        row = cur.fetchone()
+    return (row[0], row[1]) if row else (None, 0)
+
+
+def run_backfill(conn, spec, key='id', start_after=None, target_seconds=0.5,
+                 initial_chunk=1000, min_chunk=100, max_chunk=50000,
+                 max_replication_lag=5.0, max_lock_waits=5, lock_timeout_ms=2000,
+                 dry_run=False, report_every=5.0):
+    """Executa o backfill em lotes adaptativos; retorna (linhas varridas, linhas alteradas, última chave)"""
+    table = spec['table']
+    update_sql = build_update_sql(spec, key)
+    chunker = AdaptiveChunker(initial_chunk, min_chunk, max_chunk, target_seconds)
+    throttle = LoadThrottle(conn, max_replication_lag, max_lock_waits)
+    progress = ProgressReporter(f"backfill {table}", estimate_row_count(conn, table), report_every)
+
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = %s", (f"{int(lock_timeout_ms)}ms",))
+    conn.commit()
+
+    lo = start_after
+    updated = 0
+    while True:
+        throttle.wait()
+        hi, scanned = next_upper_bound(conn, table, lo, chunker.size, key)
+        if hi is None:
+            break
+
+        started = time.monotonic()
+        try:
+            with conn.cursor() as cur:
+                if dry_run:
+                    changed = 0
+                else:
+                    cur.execute(update_sql, {'lo': lo, 'hi': hi})
+                    changed = cur.rowcount
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if pg_errors and isinstance(e, (pg_errors.LockNotAvailable, pg_errors.QueryCanceled)):
+                print(f"⚠️ Lote ({lo}, {hi}] bloqueado ({e.__class__.__name__}); reduzindo para {chunker.shrink()}")
+                continue
+            raise
+
+        chunker.record(time.monotonic() - started)
+        updated += changed
+        lo = hi
+        progress.update(scanned, alterados=updated, lote=chunker.size, ultima_chave=lo)
+
+    progress.finish(alterados=updated, pausado=f"{throttle.total_paused:.0f}s")
+    return progress.done, updated, lo
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Backfill online em lotes adaptativos por faixa de PK")
+    parser.add_argument('backfill', nargs='?', help="Nome de um backfill conhecido (veja --list)")
+    parser.add_argument('--list', action='store_true', help="Lista os backfills conhecidos")
+    parser.add_argument('--table', help="Tabela alvo para backfill customizado (alias t)")
+    parser.add_argument('--set', dest='set_clause', help="Cláusula SET do backfill customizado")
+    parser.add_argument('--from', dest='from_clause', help="Cláusula FROM opcional (joins)")
+    parser.add_argument('--where', help="Filtro adicional (use o alias t)")
+    parser.add_argument('--key', default='id', help="Coluna da chave primária (padrão: id)")
+    parser.add_argument('--start-after', help="Retoma a partir desta chave (exclusiva)")
+    parser.add_argument('--target-ms', type=float, default=500, help="Latência alvo por lote em ms")
+    parser.add_argument('--initial-chunk', type=int, default=1000)
+    parser.add_argument('--min-chunk', type=int, default=100)
+    parser.add_argument('--max-chunk', type=int, default=50000)
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--max-lock-waits', type=int, default=5, help="Sessões esperando lock antes de pausar")
+    parser.add_argument('--lock-timeout-ms', type=int, default=2000)
+    parser.add_argument('--dry-run', action='store_true', help="Só percorre as faixas, sem UPDATE")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, spec in BACKFILLS.items():
+            print(f"  {name:<24} {spec['table']}: SET {spec['set']}")
+        return
+
+    if args.backfill:
+        if args.backfill not in BACKFILLS:
+            print(f"❌ Backfill desconhecido: {args.backfill} (use --list)")
+            sys.exit(1)
+        spec = BACKFILLS[args.backfill]
+    elif args.table and args.set_clause:
+        spec = {'table': args.table, 'set': args.set_clause,
+                'from': args.from_clause, 'where': args.where}
+    else:
+        parser.error("informe um backfill conhecido ou --table e --set")
+
+    print(f"🚀 Iniciando backfill em {spec['table']}{' (dry-run)' if args.dry_run else ''}...")
+    conn = get_pg_connection(args.dsn, application_name='backfill_runner')
+    try:
+        _, _, last_key = run_backfill(
+            conn, spec,
+            key=args.key,
+            start_after=args.start_after,
+            target_seconds=args.target_ms / 1000.0,
+            initial_chunk=args.initial_chunk,
+            min_chunk=args.min_chunk,
+            max_chunk=args.max_chunk,
+            max_replication_lag=args.max_lag,
+            max_lock_waits=args.max_lock_waits,
+            lock_timeout_ms=args.lock_timeout_ms,
+            dry_run=args.dry_run,
+        )
+        print(f"🎉 Backfill concluído (última chave: {last_key})")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; retome com --start-after usando a última chave reportada")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
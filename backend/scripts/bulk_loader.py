@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Carga em massa via COPY ... FROM STDIN para Postgres local ou de staging
+
+Lê arquivos CSV (com cabeçalho), NDJSON ou COPY texto (opcionalmente .gz) e faz
+streaming direto para o COPY, sem passar pelo PostgREST. Antes da carga remove
+os índices não essenciais (não PK/UNIQUE/constraint) e os recria no final; tabelas
+independentes são carregadas em paralelo, em níveis do grafo de FKs. Ao final,
+valida o fechamento das FKs das tabelas carregadas.
+
+Uso:
+    python bulk_loader.py --dataset /tmp/crm_bench --jobs 4
+    python bulk_loader.py --file public.leads=leads.csv.gz --file public.contacts=contacts.ndjson
+    python bulk_loader.py --dataset /tmp/crm_bench --disable-triggers --truncate
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dataset_io import IteratorFile, copy_field, iter_ndjson, open_input, read_manifest, to_json
+from pg_utils import (
+    fetch_foreign_keys,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    qualified_name,
+    quote_ident,
+)
+
+INDEX_BACKUP_NAME = 'dropped_indexes.json'
+
+
+def detect_format(path):
+    """Detecta o formato pelo nome do arquivo"""
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith('.ndjson') or name.endswith('.jsonl'):
+        return 'ndjson'
+    if name.endswith('.copy') or name.endswith('.tsv'):
+        return 'copy'
+    raise ValueError(f"Formato não reconhecido: {path}")
+
+
+def build_load_plan(args):
+    """Monta a lista de cargas [{table, path, format, columns}] a partir do dataset ou de --file"""
+    plan = []
+    if args.dataset:
+        manifest = read_manifest(args.dataset)
+        for entry in manifest['tables']:
+            if entry['name'] in args.skip or (args.only and entry['name'] not in args.only):
+                continue
+            plan.append({
+                'table': entry['name'],
+                'path': os.path.join(args.dataset, entry['file']),
+                'format': entry.get('format') or detect_format(entry['file']),
+                'columns': entry.get('columns'),
+            })
+    for spec in args.file or []:
+        table, _, path = spec.partition('=')
+        if not path:
+            raise ValueError(f"Use --file tabela=arquivo (recebido: {spec})")
+        plan.append({
+            'table': table if '.' in table else f"public.{table}",
+            'path': path,
+            'format': detect_format(path),
+            'columns': None,
+        })
+    return plan
+
+
+def dependency_levels(tables, foreign_keys):
+    """Agrupa tabelas em níveis: cada nível só depende de níveis anteriores"""
+    pending = set(tables)
+    parents = {t: set() for t in tables}
+    for fk in foreign_keys:
+        if fk['child'] in pending and fk['parent'] in pending and fk['child'] != fk['parent']:
+            parents[fk['child']].add(fk['parent'])
+
+    levels = []
+    while pending:
+        ready = sorted(t for t in pending if not (parents[t] & pending))
+        if not ready:
+            # Ciclo de FKs: carrega o restante junto (use --disable-triggers)
+            ready = sorted(pending)
+        levels.append(ready)
+        pending -= set(ready)
+    return levels
+
+
+def _ndjson_copy_lines(path, columns, catalog_types):
+    """Converte NDJSON em linhas COPY texto respeitando json/jsonb e arrays do catálogo"""
+    kinds = []
+    for column in columns:
+        data_type = catalog_types.get(column, 'text')
+        if data_type in ('json', 'jsonb'):
+            kinds.append('json')
+        elif data_type.endswith('[]'):
+            kinds.append('array')
+        else:
+            kinds.append('scalar')
+
+    for record in iter_ndjson(path):
+        fields = []
+        for column, kind in zip(columns, kinds):
+            value = record.get(column)
+            if value is not None and kind == 'json':
+                fields.append(copy_field(to_json(value)))
+            elif isinstance(value, (list, dict)) and kind == 'scalar':
+                fields.append(copy_field(to_json(value)))
+            else:
+                fields.append(copy_field(value))
+        yield '\t'.join(fields) + '\n'
+
+
+def _peek_ndjson_columns(path):
+    for record in iter_ndjson(path):
+        return list(record.keys())
+    return []
+
+
+def copy_table(conn, load, catalog):
+    """Executa o COPY de um arquivo; retorna o número de linhas carregadas"""
+    table = load['table']
+    table_columns = catalog[table]
+    known = {name for name, _, _ in table_columns}
+    types = {name: data_type for name, data_type, _ in table_columns}
+    target = qualified_name(table)
+
+    with conn.cursor() as cur:
+        if load['format'] == 'csv':
+            with open_input(load['path']) as fh:
+                header = next(csv.reader([fh.readline()]))
+                _check_columns(table, header, known)
+                column_sql = ', '.join(quote_ident(c) for c in header)
+                cur.copy_expert(f"COPY {target} ({column_sql}) FROM STDIN WITH (FORMAT csv)", fh)
+        elif load['format'] == 'ndjson':
+            columns = [c for c in (load['columns'] or _peek_ndjson_columns(load['path'])) if c in known]
+            column_sql = ', '.join(quote_ident(c) for c in columns)
+            source = IteratorFile(_ndjson_copy_lines(load['path'], columns, types))
+            cur.copy_expert(f"COPY {target} ({column_sql}) FROM STDIN", source)
+        else:
+            columns = load['columns'] or [name for name, _, _ in table_columns]
+            _check_columns(table, columns, known)
+            column_sql = ', '.join(quote_ident(c) for c in columns)
+            with open_input(load['path']) as fh:
+                cur.copy_expert(f"COPY {target} ({column_sql}) FROM STDIN", fh)
+        rows = cur.rowcount
+    return rows
+
+
+def _check_columns(table, columns, known):
+    missing = [c for c in columns if c not in known]
+    if missing:
+        raise ValueError(f"{table}: colunas inexistentes no banco: {', '.join(missing)}")
+
+
+def truncate_tables(conn, tables):
+    """Esvazia todas as tabelas do plano num único TRUNCATE, antes de qualquer worker
+
+    Um TRUNCATE ... CASCADE por worker apagaria filhas já carregadas por outras
+    threads (ou travaria contra os locks delas) quando todas rodam no mesmo nível.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"TRUNCATE {', '.join(qualified_name(t) for t in tables)} CASCADE")
+    conn.commit()
+
+
+def load_one(dsn, load, catalog, disable_triggers):
+    """Carrega uma tabela em conexão própria (executado em thread)"""
+    conn = get_pg_connection(dsn, application_name='bulk_loader')
+    started = time.monotonic()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET synchronous_commit = off")
+            if disable_triggers:
+                # Ignora triggers e checagem de FK; o fechamento é validado depois
+                cur.execute("SET session_replication_role = replica")
+        rows = copy_table(conn, load, catalog)
+        conn.commit()
+        return load['table'], rows, time.monotonic() - started
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def fetch_droppable_indexes(conn, tables):
+    """Índices que podem ser removidos durante a carga (não PK, não UNIQUE, sem constraint)"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT n.nspname || '.' || t.relname, n.nspname, i.relname, pg_get_indexdef(ix.indexrelid)
+            FROM pg_index ix
+            JOIN pg_class i ON i.oid = ix.indexrelid
+            JOIN pg_class t ON t.oid = ix.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            WHERE NOT ix.indisprimary
+              AND NOT ix.indisunique
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = ix.indexrelid)
+              AND n.nspname || '.' || t.relname = ANY(%s)
+            ORDER BY 1, 3
+        """, (list(tables),))
+        return [{'table': r[0], 'schema': r[1], 'name': r[2], 'definition': r[3]} for r in cur.fetchall()]
+
+
+def drop_indexes(conn, indexes, backup_path):
+    """Salva as definições em disco e remove os índices"""
+    with open(backup_path, 'w', encoding='utf-8') as fh:
+        json.dump(indexes, fh, indent=2)
+    with conn.cursor() as cur:
+        for index in indexes:
+            cur.execute(f"DROP INDEX IF EXISTS {quote_ident(index['schema'])}.{quote_ident(index['name'])}")
+    conn.commit()
+    print(f"🗑️ {len(indexes)} índices não essenciais removidos (backup em {backup_path})")
+
+
+def recreate_indexes(dsn, indexes, jobs):
+    """Recria índices em paralelo (uma conexão por worker)"""
+    def build(index):
+        conn = get_pg_connection(dsn, autocommit=True, application_name='bulk_loader')
+        try:
+            started = time.monotonic()
+            with conn.cursor() as cur:
+                cur.execute("SET maintenance_work_mem = '512MB'")
+                cur.execute(index['definition'].replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+            return index['name'], time.monotonic() - started
+        finally:
+            conn.close()
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for future in as_completed([pool.submit(build, index) for index in indexes]):
+            name, elapsed = future.result()
+            print(f"   🔧 índice {name} recriado em {format_duration(elapsed)}")
+
+
+def validate_fk_closure(conn, tables, foreign_keys):
+    """Conta linhas órfãs em cada FK das tabelas carregadas; retorna {constraint: órfãs}"""
+    orphans = {}
+    loaded = set(tables)
+    with conn.cursor() as cur:
+        for fk in foreign_keys:
+            if fk['child'] not in loaded:
+                continue
+            join = ' AND '.join(f"p.{quote_ident(pc)} = c.{quote_ident(cc)}"
+                                for cc, pc in zip(fk['child_columns'], fk['parent_columns']))
+            not_null = ' AND '.join(f"c.{quote_ident(cc)} IS NOT NULL" for cc in fk['child_columns'])
+            cur.execute(f"""
+                SELECT COUNT(*) FROM {qualified_name(fk['child'])} c
+                WHERE {not_null}
+                  AND NOT EXISTS (SELECT 1 FROM {qualified_name(fk['parent'])} p WHERE {join})
+            """)
+            count = cur.fetchone()[0]
+            orphans[fk['name']] = count
+            status = "✅" if count == 0 else "❌"
+            print(f"   {status} {fk['child']}({', '.join(fk['child_columns'])}) -> {fk['parent']}: {count:,} órfãs")
+    conn.commit()
+    return orphans
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Carga em massa com COPY FROM STDIN")
+    parser.add_argument('--dataset', help="Diretório com manifest.json (ex.: saída do generate_crm_dataset.py)")
+    parser.add_argument('--file', action='append', help="tabela=arquivo (.csv, .ndjson, .copy, opcionalmente .gz)")
+    parser.add_argument('--only', action='append', default=[], help="Carrega só estas tabelas do dataset")
+    parser.add_argument('--skip', action='append', default=[], help="Ignora estas tabelas do dataset")
+    parser.add_argument('--jobs', type=int, default=4, help="Cargas/índices em paralelo")
+    parser.add_argument('--keep-indexes', action='store_true', help="Não remove índices durante a carga")
+    parser.add_argument('--restore-indexes', metavar='BACKUP',
+                        help="Só recria índices de um backup dropped_indexes.json (após falha)")
+    parser.add_argument('--disable-triggers', action='store_true',
+                        help="session_replication_role=replica (requer superuser; FKs validadas no final)")
+    parser.add_argument('--truncate', action='store_true', help="TRUNCATE ... CASCADE antes de carregar")
+    parser.add_argument('--no-validate', action='store_true', help="Pula a validação de FKs")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.restore_indexes:
+        with open(args.restore_indexes, encoding='utf-8') as fh:
+            recreate_indexes(args.dsn, json.load(fh), args.jobs)
+        return
+
+    plan = build_load_plan(args)
+    if not plan:
+        parser.error("nada para carregar: informe --dataset ou --file")
+
+    started = time.monotonic()
+    conn = get_pg_connection(args.dsn, application_name='bulk_loader')
+    tables = [load['table'] for load in plan]
+    catalog = fetch_table_columns(conn, tables)
+    missing = [t for t in tables if t not in catalog]
+    if missing:
+        print(f"❌ Tabelas não encontradas no banco: {', '.join(missing)}")
+        sys.exit(1)
+
+    foreign_keys = fetch_foreign_keys(conn, schemas=sorted({t.split('.')[0] for t in tables}))
+    by_table = {load['table']: load for load in plan}
+    levels = [tables] if args.disable_triggers else dependency_levels(tables, foreign_keys)
+
+    indexes = []
+    if not args.keep_indexes:
+        indexes = fetch_droppable_indexes(conn, tables)
+        backup_dir = args.dataset or '.'
+        drop_indexes(conn, indexes, os.path.join(backup_dir, INDEX_BACKUP_NAME))
+
+    if args.truncate:
+        print(f"🧹 TRUNCATE de {len(tables)} tabelas...")
+        truncate_tables(conn, tables)
+
+    print(f"🚀 Carregando {len(plan)} tabelas em {len(levels)} níveis com {args.jobs} workers...")
+    total_rows = 0
+    try:
+        for depth, level in enumerate(levels, 1):
+            with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+                futures = [pool.submit(load_one, args.dsn, by_table[t], catalog,
+                                       args.disable_triggers) for t in level]
+                for future in as_completed(futures):
+                    table, rows, elapsed = future.result()
+                    total_rows += max(rows, 0)
+                    rate = rows / elapsed if elapsed > 0 else 0
+                    print(f"   ✅ [nível {depth}] {table}: {rows:,} linhas em {format_duration(elapsed)} ({rate:,.0f}/s)")
+    finally:
+        if indexes:
+            print(f"🔧 Recriando {len(indexes)} índices...")
+            recreate_indexes(args.dsn, indexes, args.jobs)
+
+    with conn.cursor() as cur:
+        for table in tables:
+            cur.execute(f"ANALYZE {qualified_name(table)}")
+    conn.commit()
+
+    if not args.no_validate:
+        print("🔍 Validando fechamento das FKs...")
+        orphans = validate_fk_closure(conn, tables, foreign_keys)
+        if any(orphans.values()):
+            conn.close()
+            print("❌ Existem linhas órfãs; verifique os arquivos carregados")
+            sys.exit(2)
+    conn.close()
+    print(f"🎉 {total_rows:,} linhas carregadas em {format_duration(time.monotonic() - started)}")
+
+
+if __name__ == "__main__":
+    main()
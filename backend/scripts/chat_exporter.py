@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Exportação completa de conversas do WhatsApp (por chat ou por tenant)
+
+Lê whatsapp_mensagens em ordem cronológica com paginação keyset por
+(timestamp, id), sem OFFSET e sem carregar a conversa em memória (mensagens sem
+timestamp vêm no fim, numa passada própria por id), e grava para
+cada chat um NDJSON comprimido e/ou uma transcrição HTML. As mídias (media_url)
+vão para um manifest media.ndjson; com --fetch-media são baixadas em paralelo por
+um pool limitado (no máximo 2 downloads pendentes por worker), com SHA-256 e
+retomada: arquivos já baixados não são buscados de novo. Só URLs http(s) são baixadas
+(inclusive após redirecionamento); file://, ftp:// etc. entram no manifest como falha.
+
+Com --include-archive as mensagens antigas de whatsapp_mensagens_archive vêm antes
+das da tabela quente (arquivos Parquet: message_archiver.py fetch).
+
+Saída:
+    <out>/<owner_id>/<chat>/messages.ndjson.gz
+    <out>/<owner_id>/<chat>/transcript.html
+    <out>/<owner_id>/<chat>/media.ndjson
+    <out>/<owner_id>/<chat>/media/<id>.<ext>
+    <out>/manifest.json
+
+Uso:
+    python chat_exporter.py --owner <uuid> --chat 5511999999999@s.whatsapp.net --out /tmp/chats
+    python chat_exporter.py --owner <uuid> --all-chats --format both --fetch-media --media-workers 8 --out /tmp/chats
+"""
+
+import argparse
+import datetime
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from dataset_io import open_output, to_json
+from pg_utils import ProgressReporter, fetch_table_columns, format_duration, get_pg_connection
+from table_exporter import iter_keyset_pages
+
+MESSAGE_COLUMNS = ['id', 'message_id', 'chat_id', 'phone', 'wpp_name', 'connection_id', 'conteudo',
+                   'message_type', 'remetente', 'status', 'lida', 'timestamp', 'media_url', 'media_mime']
+CHAT_FILTER = "owner_id = %(owner)s AND chat_id = %(chat)s"
+# A comparação de linha (timestamp, id) > (...) nunca é verdadeira com timestamp NULL:
+# essas mensagens têm passada própria por id, depois das datadas (como ORDER BY ... NULLS LAST)
+MESSAGE_PASSES = [
+    (['timestamp', 'id'], CHAT_FILTER + ' AND "timestamp" IS NOT NULL'),
+    (['id'], CHAT_FILTER + ' AND "timestamp" IS NULL'),
+]
+MEDIA_SCHEMES = ('http', 'https')
+
+HTML_HEAD = """<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; background: #efeae2; max-width: 860px; margin: 0 auto; padding: 16px; }}
+.msg {{ border-radius: 8px; padding: 6px 10px; margin: 4px 0; max-width: 75%; white-space: pre-wrap; }}
+.CLIENTE {{ background: #fff; }}
+.ATENDENTE {{ background: #d9fdd3; margin-left: auto; }}
+.meta {{ color: #667781; font-size: 11px; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+"""
+
+
+def chat_slug(chat_id):
+    """Nome de diretório seguro para um chat_id (JID)"""
+    return re.sub(r'[^0-9A-Za-z._-]', '_', chat_id)[:120] or '_'
+
+
+def media_file_name(row_id, mime, url):
+    """Nome determinístico do arquivo de mídia (permite retomar downloads)"""
+    ext = mimetypes.guess_extension((mime or '').split(';')[0].strip()) if mime else None
+    if not ext:
+        ext = os.path.splitext(urllib.parse.urlparse(url).path)[1][:8] or '.bin'
+    return f"{row_id}{ext}"
+
+
+def list_chats(conn, owner_id):
+    """Chats do owner pelo resumo whatsapp_conversations (ou DISTINCT nas mensagens)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.whatsapp_conversations') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("""
+                SELECT chat_id FROM public.whatsapp_conversations
+                WHERE owner_id = %s ORDER BY last_message_at DESC NULLS LAST
+            """, (owner_id,))
+        else:
+            cur.execute("""
+                SELECT DISTINCT chat_id FROM public.whatsapp_mensagens
+                WHERE owner_id = %s AND chat_id IS NOT NULL
+            """, (owner_id,))
+        chats = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return chats
+
+
+class HtmlTranscriptWriter:
+    """Transcrição HTML escrita em streaming, mensagem a mensagem"""
+
+    def __init__(self, path, title):
+        self.path = path
+        self._fh = open(path, 'w', encoding='utf-8')
+        self._fh.write(HTML_HEAD.format(title=html.escape(title)))
+
+    def write(self, message, media_href=None):
+        sender = message.get('remetente') or 'CLIENTE'
+        when = message.get('timestamp')
+        when = when.strftime('%d/%m/%Y %H:%M') if isinstance(when, datetime.datetime) else str(when or '')
+        name = message.get('wpp_name') if sender == 'CLIENTE' else 'Atendente'
+        body = html.escape(message.get('conteudo') or '')
+        if media_href:
+            label = html.escape(message.get('message_type') or 'mídia')
+            body += f'{"<br>" if body else ""}<a href="{html.escape(media_href)}">[{label}]</a>'
+        self._fh.write(f'<div class="msg {html.escape(sender)}"><div class="meta">'
+                       f'{html.escape(name or "")} · {when}</div>{body}</div>\n')
+
+    def close(self):
+        self._fh.write('</body>\n</html>\n')
+        self._fh.close()
+
+
+class HttpOnlyRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Segue redirecionamentos apenas para http(s)"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if urllib.parse.urlparse(newurl).scheme.lower() not in MEDIA_SCHEMES:
+            raise ValueError(f"redirecionamento para esquema não permitido: {newurl[:100]}")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+class MediaFetcher:
+    """Pool limitado de downloads; o manifest é escrito conforme cada mídia termina"""
+
+    def __init__(self, workers, headers=None, max_bytes=None, timeout=60):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.capacity = workers * 2
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.headers = dict(headers or {})
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(HttpOnlyRedirectHandler)
+        self.lock = threading.Lock()
+        self.stats = {'fetched': 0, 'cached': 0, 'failed': 0, 'bytes': 0}
+
+    def submit(self, url, path, entry, manifest):
+        """Agenda o download; bloqueia enquanto o pool estiver cheio (memória constante)"""
+        self.slots.acquire()
+        future = self.pool.submit(self._fetch, url, path, entry)
+        future.add_done_callback(lambda f: self._done(f, manifest))
+
+    def _fetch(self, url, path, entry):
+        if urllib.parse.urlparse(url).scheme.lower() not in MEDIA_SCHEMES:
+            entry.update(status='failed', error="esquema de URL não permitido (só http/https)")
+            return entry
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            entry.update(status='cached', bytes=os.path.getsize(path))
+            return entry
+        tmp_path = path + '.part'
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            request = urllib.request.Request(url, headers=self.headers)
+            with self.opener.open(request, timeout=self.timeout) as response, open(tmp_path, 'wb') as fh:
+                for block in iter(lambda: response.read(1 << 16), b''):
+                    size += len(block)
+                    if self.max_bytes and size > self.max_bytes:
+                        raise ValueError(f"mídia maior que {self.max_bytes} bytes")
+                    digest.update(block)
+                    fh.write(block)
+            os.replace(tmp_path, path)
+            entry.update(status='fetched', bytes=size, sha256=digest.hexdigest())
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            entry.update(status='failed', error=str(e)[:200])
+        return entry
+
+    def _done(self, future, manifest):
+        try:
+            entry = future.result()
+            with self.lock:
+                manifest.write(to_json(entry) + '\n')
+                self.stats[entry['status']] += 1
+                if entry['status'] == 'fetched':
+                    self.stats['bytes'] += entry.get('bytes', 0)
+        finally:
+            self.slots.release()
+
+    def drain(self):
+        """Espera os downloads pendentes (chamado ao fim de cada chat)"""
+        for _ in range(self.capacity):
+            self.slots.acquire()
+        for _ in range(self.capacity):
+            self.slots.release()
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+
+def iter_chat_messages(conn, owner_id, chat_id, columns, page_size, include_archive):
+    """Mensagens do chat em ordem cronológica: arquivo frio primeiro, depois a tabela quente"""
+    params = {'owner': owner_id, 'chat': chat_id}
+    tables = ['public.whatsapp_mensagens']
+    if include_archive:
+        tables.insert(0, 'public.whatsapp_mensagens_archive')
+    for table in tables:
+        for key_columns, where in MESSAGE_PASSES:
+            for rows, _ in iter_keyset_pages(conn, table, columns, key_columns, page_size, where, params):
+                for row in rows:
+                    yield dict(zip(columns, row))
+
+
+def export_chat(conn, args, owner_id, chat_id, columns, fetcher, progress):
+    """Exporta um chat; retorna a entrada do manifest geral"""
+    chat_dir = os.path.join(args.out, str(owner_id), chat_slug(chat_id))
+    media_dir = os.path.join(chat_dir, 'media')
+    os.makedirs(chat_dir, exist_ok=True)
+    if fetcher:
+        os.makedirs(media_dir, exist_ok=True)
+
+    ndjson = open_output(os.path.join(chat_dir, 'messages.ndjson')) if args.format in ('ndjson', 'both') else None
+    transcript = None
+    if args.format in ('html', 'both'):
+        transcript = HtmlTranscriptWriter(os.path.join(chat_dir, 'transcript.html'), chat_id)
+    media_manifest = open(os.path.join(chat_dir, 'media.ndjson'), 'w', encoding='utf-8')
+
+    messages = 0
+    media = 0
+    first_at = last_at = None
+    try:
+        for message in iter_chat_messages(conn, owner_id, chat_id, columns, args.page_size, args.include_archive):
+            messages += 1
+            first_at = first_at or message.get('timestamp')
+            last_at = message.get('timestamp')
+            media_href = None
+            url = message.get('media_url')
+            if url:
+                media += 1
+                entry = {'id': str(message['id']), 'message_id': message.get('message_id'),
+                         'timestamp': message.get('timestamp'), 'media_url': url,
+                         'media_mime': message.get('media_mime')}
+                if fetcher:
+                    name = media_file_name(message['id'], message.get('media_mime'), url)
+                    entry['file'] = f"media/{name}"
+                    media_href = entry['file']
+                    fetcher.submit(url, os.path.join(media_dir, name), entry, media_manifest)
+                else:
+                    media_href = url
+                    media_manifest.write(to_json(entry) + '\n')
+            if ndjson:
+                ndjson.write(to_json(message) + '\n')
+            if transcript:
+                transcript.write(message, media_href)
+            if messages % 1000 == 0:
+                progress.update(1000)
+        progress.update(messages % 1000)
+    finally:
+        if fetcher:
+            fetcher.drain()
+        if ndjson:
+            ndjson.close()
+        if transcript:
+            transcript.close()
+        media_manifest.close()
+    conn.commit()
+
+    return {'owner_id': owner_id, 'chat_id': chat_id, 'directory': os.path.relpath(chat_dir, args.out),
+            'messages': messages, 'media': media, 'first_at': first_at, 'last_at': last_at}
+
+
+def parse_header(text):
+    name, _, value = text.partition(':')
+    if not value:
+        raise argparse.ArgumentTypeError("use 'Nome: valor'")
+    return name.strip(), value.strip()
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Exporta conversas completas do WhatsApp")
+    parser.add_argument('--owner', required=True, help="owner_id do tenant")
+    parser.add_argument('--chat', action='append', help="chat_id a exportar (repetível)")
+    parser.add_argument('--all-chats', action='store_true', help="Exporta todas as conversas do owner")
+    parser.add_argument('--out', required=True, help="Diretório de saída")
+    parser.add_argument('--format', choices=['ndjson', 'html', 'both'], default='ndjson')
+    parser.add_argument('--page-size', type=int, default=2000, help="Mensagens por página keyset")
+    parser.add_argument('--include-archive', action='store_true', help="Inclui whatsapp_mensagens_archive")
+    parser.add_argument('--fetch-media', action='store_true', help="Baixa as mídias listadas no manifest")
+    parser.add_argument('--media-workers', type=int, default=4, help="Downloads simultâneos")
+    parser.add_argument('--media-header', action='append', type=parse_header, default=[],
+                        help="Header HTTP para os downloads ('Authorization: Bearer ...')")
+    parser.add_argument('--max-media-mb', type=float, default=100, help="Tamanho máximo por mídia")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if not args.chat and not args.all_chats:
+        print("❌ Informe --chat ou --all-chats")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='chat_exporter')
+    # Snapshot consistente por conversa (uma transação por chat, sem segurar o xmin do tenant inteiro)
+    conn.set_session(readonly=True, isolation_level='REPEATABLE READ')
+    available = {name for name, _, _ in fetch_table_columns(conn, ['public.whatsapp_mensagens'])
+                 ['public.whatsapp_mensagens']}
+    columns = [c for c in MESSAGE_COLUMNS if c in available]
+    if args.include_archive:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.whatsapp_mensagens_archive') IS NOT NULL")
+            if not cur.fetchone()[0]:
+                print("⚠️ whatsapp_mensagens_archive não existe; exportando só a tabela quente")
+                args.include_archive = False
+
+    chats = args.chat or list_chats(conn, args.owner)
+    os.makedirs(args.out, exist_ok=True)
+    fetcher = None
+    if args.fetch_media:
+        fetcher = MediaFetcher(args.media_workers, headers=dict(args.media_header),
+                               max_bytes=int(args.max_media_mb * 1024 * 1024))
+
+    print(f"🚀 Exportando {len(chats)} conversas de {args.owner} para {args.out} ({args.format})...")
+    started = time.monotonic()
+    progress = ProgressReporter('mensagens')
+    entries = []
+    try:
+        for chat_id in chats:
+            entry = export_chat(conn, args, args.owner, chat_id, columns, fetcher, progress)
+            entries.append(entry)
+            print(f"   ✅ {chat_id}: {entry['messages']:,} mensagens, {entry['media']:,} mídias")
+    finally:
+        if fetcher:
+            fetcher.close()
+        conn.close()
+    progress.finish()
+
+    manifest = {
+        'generator': 'chat_exporter',
+        'exported_at': datetime.datetime.now(datetime.timezone.utc),
+        'owner_id': args.owner,
+        'format': args.format,
+        'include_archive': args.include_archive,
+        'columns': columns,
+        'media': fetcher.stats if fetcher else None,
+        'chats': entries,
+    }
+    with open(os.path.join(args.out, 'manifest.json'), 'w', encoding='utf-8') as fh:
+        json.dump(json.loads(to_json(manifest)), fh, ensure_ascii=False, indent=2)
+
+    total = sum(e['messages'] for e in entries)
+    print(f"🎉 {total:,} mensagens de {len(entries)} conversas em {format_duration(time.monotonic() - started)}")
+    if fetcher:
+        stats = fetcher.stats
+        print(f"   📎 mídias: {stats['fetched']:,} baixadas ({stats['bytes'] / 1e6:,.1f} MB), "
+              f"{stats['cached']:,} já existentes, {stats['failed']:,} falhas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Reconciliador incremental de perfis do WhatsApp com contacts
+
+Substitui as varreduras completas de update_contacts_with_whatsapp_data.js e
+force_extract_all_contacts.js: lê só as mensagens alteradas desde o último
+watermark (updated_at, id), guarda em memória o perfil mais recente de cada
+(owner_id, telefone) num LRU limitado e grava em lote, via tabela temporária, apenas
+os contatos que mudaram (criando os que faltam). O relatório
+contacts_extraction_report.json é mantido por deltas a partir de uma contagem
+completa inicial (--full-report refaz a contagem): a cada execução soma as mensagens
+criadas desde a última marca e desconta as removidas (ledger
+whatsapp_message_deletions). Alterações mais recentes que --safety-lag segundos
+ficam para a próxima execução, como em incremental_exporter.py.
+
+Índices: supabase/migrations/20250925000000_contact_enrichment_indexes.sql
+
+Uso:
+    python contact_enrichment.py --state /data/contact_enrichment.json
+    python contact_enrichment.py --state /data/contact_enrichment.json --full-report --no-create
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import sys
+import time
+
+from dataset_io import IteratorFile, copy_field
+from incremental_exporter import load_state, save_state
+from pg_utils import LoadThrottle, ProgressReporter, fetch_table_columns, format_duration, get_pg_connection, quote_ident
+from table_exporter import iter_keyset_pages
+
+# Coluna da mensagem -> coluna do contato (mesmo mapeamento de update_contacts_with_whatsapp_data.js)
+PROFILE_FIELDS = [
+    ('wpp_name', 'name_wpp'),
+    ('wpp_name', 'whatsapp_name'),
+    ('chat_id', 'whatsapp_jid'),
+    ('whatsapp_business_name', 'whatsapp_business_name'),
+    ('whatsapp_business_description', 'whatsapp_business_description'),
+    ('whatsapp_business_category', 'whatsapp_business_category'),
+    ('whatsapp_business_email', 'whatsapp_business_email'),
+    ('whatsapp_business_website', 'whatsapp_business_website'),
+    ('whatsapp_business_address', 'whatsapp_business_address'),
+    ('whatsapp_verified', 'whatsapp_verified'),
+    ('whatsapp_status', 'whatsapp_status'),
+    ('whatsapp_last_seen', 'whatsapp_last_seen'),
+]
+
+BASE_COLUMNS = ['id', 'owner_id', 'chat_id', 'remetente', 'wpp_name', 'created_at', 'updated_at']
+
+REPORT_TABLES = ['whatsapp_atendimentos', 'whatsapp_mensagens', 'contacts']
+
+DELETIONS_TABLE = 'public.whatsapp_message_deletions'
+
+# Numa só instrução (mesmo snapshot): consome o ledger de remoções e conta as mensagens
+# novas. Só descontam os minutos já contados antes (< from); remoções de mensagens
+# ainda não contadas apenas saem do ledger.
+MESSAGE_COUNTS_SQL = """
+    WITH consumed AS (
+      DELETE FROM public.whatsapp_message_deletions
+      RETURNING created_minute, messages, without_wpp_name, without_raw
+    ), removed AS (
+      SELECT COALESCE(SUM(messages), 0) AS messages, COALESCE(SUM(without_wpp_name), 0) AS without_wpp_name,
+             COALESCE(SUM(without_raw), 0) AS without_raw
+      FROM consumed
+      WHERE {counted}
+    ), added AS (
+      SELECT COUNT(*) AS messages, COUNT(*) FILTER (WHERE m.wpp_name IS NULL) AS without_wpp_name,
+             COUNT(*) FILTER (WHERE m.raw IS NULL{side}) AS without_raw
+      FROM public.whatsapp_mensagens m
+      WHERE {window}
+    )
+    SELECT a.messages - r.messages, a.without_wpp_name - r.without_wpp_name, a.without_raw - r.without_raw
+    FROM added a, removed r
+"""
+
+
+class ProfileCache:
+    """LRU de perfis por (owner_id, telefone); entradas despejadas vão para o lote de escrita"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def observe(self, key, values):
+        """Mescla valores não nulos mais recentes; retorna as entradas despejadas"""
+        entry = self._entries.pop(key, None) or {}
+        entry.update({k: v for k, v in values.items() if v is not None})
+        self._entries[key] = entry
+        evicted = []
+        while len(self._entries) > self.capacity:
+            evicted.append(self._entries.popitem(last=False))
+        return evicted
+
+    def drain(self):
+        entries = list(self._entries.items())
+        self._entries.clear()
+        return entries
+
+
+def phone_from_chat(chat_id):
+    """Telefone E.164 (só dígitos) do JID de um contato; None para grupos e JIDs estranhos"""
+    if not chat_id or not chat_id.endswith('@s.whatsapp.net'):
+        return None
+    phone = chat_id.split('@', 1)[0].split(':', 1)[0]
+    return phone if phone.isdigit() else None
+
+
+class ContactWriter:
+    """Grava lotes de perfis em contacts via COPY + UPDATE/INSERT; acumula os deltas do relatório"""
+
+    def __init__(self, conn, fields, contact_types, create_missing):
+        self.conn = conn
+        self.fields = fields
+        self.targets = [target for _, target in fields]
+        self.contact_types = contact_types
+        self.create_missing = create_missing
+        self.updated = 0
+        self.created = 0
+        self.name_filled = 0
+        self.created_without_name = 0
+        self._created_table = False
+
+    def _ensure_temp_table(self):
+        if self._created_table:
+            return
+        columns = ', '.join(f"{quote_ident(t)} {self.contact_types[t]}" for t in self.targets)
+        with self.conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE tmp_contact_enrichment (owner_id UUID, phone TEXT, {columns})")
+        self._created_table = True
+
+    def _sql(self):
+        set_sql = ', '.join(f"{quote_ident(t)} = COALESCE(t.{quote_ident(t)}, c.{quote_ident(t)})"
+                            for t in self.targets)
+        differs = ' OR '.join(f"c.{quote_ident(t)} IS DISTINCT FROM COALESCE(t.{quote_ident(t)}, c.{quote_ident(t)})"
+                              for t in self.targets)
+        extra = ''
+        if 'name' in self.contact_types and 'name_wpp' in self.targets:
+            # Push Name substitui nomes vazios ou genéricos ("Contato ...")
+            extra += (", name = CASE WHEN t.name_wpp IS NOT NULL AND (c.name IS NULL OR c.name LIKE 'Contato%')"
+                      " THEN t.name_wpp ELSE c.name END")
+        if 'updated_at' in self.contact_types:
+            extra += ", updated_at = now()"
+        missing = "c.name_wpp IS NULL" if 'name_wpp' in self.targets else "FALSE"
+        update_sql = f"""
+            WITH changed AS (
+              SELECT c.id, ({missing}) AS was_missing
+              FROM public.contacts c
+              JOIN tmp_contact_enrichment t ON t.owner_id = c.owner_id AND t.phone = c.phone
+              WHERE {differs}
+              FOR UPDATE OF c
+            ), updated AS (
+              UPDATE public.contacts c SET {set_sql}{extra}
+              FROM tmp_contact_enrichment t, changed ch
+              WHERE c.id = ch.id AND t.owner_id = c.owner_id AND t.phone = c.phone
+              RETURNING ch.was_missing AND NOT ({missing}) AS filled
+            )
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE filled) FROM updated
+        """
+        target_sql = ', '.join(quote_ident(t) for t in self.targets)
+        name_sql = ", name" if 'name' in self.contact_types else ""
+        name_value = (", COALESCE(t.name_wpp, t.phone)" if 'name_wpp' in self.targets else ", t.phone") if name_sql else ""
+        insert_sql = f"""
+            WITH inserted AS (
+              INSERT INTO public.contacts (owner_id, phone{name_sql}, {target_sql})
+              SELECT t.owner_id, t.phone{name_value}, {', '.join(f't.{quote_ident(c)}' for c in self.targets)}
+              FROM tmp_contact_enrichment t
+              WHERE NOT EXISTS (SELECT 1 FROM public.contacts c WHERE c.owner_id = t.owner_id AND c.phone = t.phone)
+              RETURNING {missing.replace('c.', '')} AS missing
+            )
+            SELECT COUNT(*), COUNT(*) FILTER (WHERE missing) FROM inserted
+        """
+        return update_sql, insert_sql
+
+    def write(self, entries):
+        """Aplica um lote de ((owner_id, phone), perfil)"""
+        if not entries:
+            return
+        self._ensure_temp_table()
+        update_sql, insert_sql = self._sql()
+        lines = ('\t'.join(copy_field(v) for v in (owner, phone, *(profile.get(t) for t in self.targets))) + '\n'
+                 for (owner, phone), profile in entries)
+        with self.conn.cursor() as cur:
+            cur.execute("TRUNCATE tmp_contact_enrichment")
+            cur.copy_expert("COPY tmp_contact_enrichment FROM STDIN", IteratorFile(lines))
+            cur.execute(update_sql)
+            updated, filled = cur.fetchone()
+            self.updated += updated
+            self.name_filled += filled
+            if self.create_missing:
+                cur.execute(insert_sql)
+                created, without_name = cur.fetchone()
+                self.created += created
+                self.created_without_name += without_name
+        self.conn.commit()
+
+
+def full_counts(conn):
+    """Contagem completa dos contatos (mesmos critérios de extract_all_contacts_info.js)
+
+    As mensagens são contadas por sync_message_counts sem marca anterior.
+    """
+    catalog = fetch_table_columns(conn, ['public.contacts'])
+    columns = {table: {name for name, _, _ in cols} for table, cols in catalog.items()}
+    counts = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM public.contacts")
+        counts['contacts_found'] = cur.fetchone()[0]
+        if 'name_wpp' in columns.get('public.contacts', ()):
+            cur.execute("SELECT COUNT(*) FROM public.contacts WHERE name_wpp IS NULL")
+            counts['contacts_without_name_wpp'] = cur.fetchone()[0]
+        else:
+            counts['contacts_without_name_wpp'] = counts['contacts_found']
+    conn.commit()
+    return counts
+
+
+def conversation_counts(conn):
+    """whatsapp_atendimentos é pequena (uma linha por conversa); contada a cada execução"""
+    catalog = fetch_table_columns(conn, ['public.whatsapp_atendimentos'])
+    columns = {name for name, _, _ in catalog.get('public.whatsapp_atendimentos', [])}
+    with conn.cursor() as cur:
+        if 'display_name' in columns:
+            cur.execute("SELECT COUNT(*), COUNT(*) FILTER (WHERE display_name IS NULL) FROM public.whatsapp_atendimentos")
+        else:
+            cur.execute("SELECT COUNT(*), COUNT(*) FROM public.whatsapp_atendimentos")
+        found, without_name = cur.fetchone()
+    conn.commit()
+    return found, without_name
+
+
+def sync_message_counts(conn, counts, counted_until, mark, has_raw_table):
+    """Aplica aos contadores de mensagens as criadas em [counted_until, mark) menos as removidas
+
+    counted_until None é a contagem completa: tudo antes de mark (e sem created_at) entra,
+    e o ledger acumulado é descartado.
+    """
+    side = (" AND NOT EXISTS (SELECT 1 FROM public.whatsapp_mensagens_raw r WHERE r.message_id = m.id)"
+            if has_raw_table else "")
+    if counted_until is None:
+        counted, window = "FALSE", "m.created_at IS NULL OR m.created_at < %(mark)s"
+    else:
+        counted = "created_minute IS NULL OR created_minute < %(from)s"
+        window = "m.created_at >= %(from)s AND m.created_at < %(mark)s"
+    with conn.cursor() as cur:
+        cur.execute(MESSAGE_COUNTS_SQL.format(counted=counted, window=window, side=side),
+                    {'from': counted_until, 'mark': mark})
+        messages, without_wpp_name, without_raw = cur.fetchone()
+    conn.commit()
+    for key, delta in (('messages_found', messages), ('messages_without_wpp_name', without_wpp_name),
+                       ('messages_without_raw', without_raw)):
+        counts[key] = counts.get(key, 0) + int(delta)
+
+
+def write_report(path, counts, samples):
+    """Grava o relatório no formato de contacts_extraction_report.json"""
+    report = {
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'tables_checked': REPORT_TABLES,
+        'conversations_found': counts['conversations_found'],
+        'messages_found': counts['messages_found'],
+        'contacts_found': counts['contacts_found'],
+        'missing_fields': {
+            'conversations_without_display_name': counts['conversations_without_display_name'],
+            'messages_without_wpp_name': counts['messages_without_wpp_name'],
+            'messages_without_raw': counts['messages_without_raw'],
+            'contacts_without_name_wpp': counts['contacts_without_name_wpp'],
+        },
+        'sample_data': samples,
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        json.dump(report, fh, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Reconciliador incremental de perfis do WhatsApp com contacts")
+    parser.add_argument('--state', required=True, help="Arquivo JSON com watermark e contadores do relatório")
+    parser.add_argument('--report', default='contacts_extraction_report.json', help="Relatório a regenerar")
+    parser.add_argument('--full-report', action='store_true', help="Refaz as contagens completas do relatório")
+    parser.add_argument('--no-create', action='store_true', help="Não cria contatos para telefones sem cadastro")
+    parser.add_argument('--cache-size', type=int, default=100000, help="Perfis mantidos no LRU")
+    parser.add_argument('--write-batch', type=int, default=5000, help="Perfis por escrita em lote")
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--checkpoint-pages', type=int, default=50, help="Páginas entre checkpoints do watermark")
+    parser.add_argument('--safety-lag', type=int, default=60,
+                        help="Ignora alterações mais recentes que N segundos (transações ainda abertas)")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    state = load_state(args.state)
+    conn = get_pg_connection(args.dsn, application_name='contact_enrichment')
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+
+    catalog = fetch_table_columns(conn, ['public.whatsapp_mensagens', 'public.contacts', 'public.whatsapp_mensagens_raw',
+                                         DELETIONS_TABLE])
+    conn.commit()
+    if DELETIONS_TABLE not in catalog:
+        print("❌ whatsapp_message_deletions não existe; aplique a migration 20250925000000_contact_enrichment_indexes.sql")
+        sys.exit(1)
+    message_columns = {name for name, _, _ in catalog['public.whatsapp_mensagens']}
+    contact_types = {name: pg_type for name, pg_type, _ in catalog['public.contacts']}
+    fields = [(src, dst) for src, dst in PROFILE_FIELDS if src in message_columns and dst in contact_types]
+    columns = BASE_COLUMNS + sorted({src for src, _ in fields} - set(BASE_COLUMNS))
+    has_raw_table = 'public.whatsapp_mensagens_raw' in catalog
+
+    with conn.cursor() as cur:
+        # Marca alinhada ao minuto: o ledger de remoções agrupa por minuto de created_at
+        cur.execute("SELECT now() - make_interval(secs => %s), "
+                    "date_trunc('minute', now() - make_interval(secs => %s))", (args.safety_lag, args.safety_lag))
+        cutoff, created_mark = cur.fetchone()
+    conn.commit()
+
+    if args.full_report or state.get('counts') is None:
+        print("🔎 Contagem completa do relatório...")
+        counts = full_counts(conn)
+        counted_until = None
+    else:
+        counts = state['counts']
+        counted_until = datetime.datetime.fromisoformat(state['created_at'])
+    sync_message_counts(conn, counts, counted_until, created_mark, has_raw_table)
+    state.update({'counts': counts, 'created_at': created_mark.isoformat()})
+    save_state(args.state, state)
+    watermark = None
+    if state.get('updated_at'):
+        watermark = (datetime.datetime.fromisoformat(state['updated_at']), state['id'])
+
+    cache = ProfileCache(args.cache_size)
+    writer = ContactWriter(conn, fields, contact_types, not args.no_create)
+    pending = []
+    samples = []
+    progress = ProgressReporter('mensagens')
+    started = time.monotonic()
+
+    def flush(entries):
+        # Um telefone despejado e visto de novo aparece duas vezes; o perfil mais novo vem depois
+        merged = {}
+        for key, profile in entries:
+            merged.setdefault(key, {}).update(profile)
+        entries = list(merged.items())
+        for i in range(0, len(entries), args.write_batch):
+            throttle.wait()
+            writer.write(entries[i:i + args.write_batch])
+
+    applied = {'created': 0, 'created_without_name': 0, 'name_filled': 0}
+
+    def checkpoint(last_key):
+        flush(pending + cache.drain())
+        pending.clear()
+        counts['contacts_found'] += writer.created - applied['created']
+        counts['contacts_without_name_wpp'] += ((writer.created_without_name - applied['created_without_name'])
+                                                - (writer.name_filled - applied['name_filled']))
+        applied.update(created=writer.created, created_without_name=writer.created_without_name,
+                       name_filled=writer.name_filled)
+        state['counts'] = counts
+        if last_key:
+            state['updated_at'], state['id'] = last_key[0].isoformat(), str(last_key[1])
+        save_state(args.state, state)
+
+    last_key = watermark
+    pages = iter_keyset_pages(conn, 'public.whatsapp_mensagens', columns, ['updated_at', 'id'], args.page_size,
+                              where="updated_at IS NOT NULL AND updated_at < %(cutoff)s",
+                              params={'cutoff': cutoff}, start_after=watermark)
+    for page_number, (rows, last_key) in enumerate(pages, 1):
+        for row in rows:
+            message = dict(zip(columns, row))
+            phone = phone_from_chat(message['chat_id'])
+            if message['remetente'] != 'CLIENTE' or not phone:
+                continue
+            profile = {dst: message[src] for src, dst in fields}
+            pending.extend(cache.observe((str(message['owner_id']), phone), profile))
+            if len(samples) < 5 and message['wpp_name']:
+                samples.append({'phone': phone, 'wpp_name': message['wpp_name'], 'updated_at': message['updated_at']})
+        conn.commit()
+
+        if len(pending) >= args.write_batch:
+            flush(pending)
+            pending.clear()
+        if page_number % args.checkpoint_pages == 0:
+            checkpoint(last_key)
+        progress.update(len(rows), cache=len(cache), contatos=writer.updated + writer.created)
+
+    checkpoint(last_key)
+    progress.finish()
+
+    counts['conversations_found'], counts['conversations_without_display_name'] = conversation_counts(conn)
+    conn.close()
+    write_report(args.report, counts, {'profiles': samples})
+    print(f"🎉 {writer.updated:,} contatos atualizados, {writer.created:,} criados em "
+          f"{format_duration(time.monotonic() - started)}; relatório em {args.report}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; o watermark do último checkpoint foi salvo")
+        sys.exit(1)
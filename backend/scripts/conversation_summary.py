@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Reconstrução e verificação em massa da tabela de resumo whatsapp_conversations
+
+O resumo é mantido pelos triggers da migration
+20250921000000_whatsapp_conversations_summary.sql; este script serve para a carga
+inicial, para reconstruir após cargas com triggers desabilitados (bulk_loader.py
+--disable-triggers) e para detectar/corrigir divergências owner a owner. O comando
+unread confere só os contadores de não lidas, em lotes de owners e sem reconstruir
+o resumo (repair_whatsapp_unread_counts, migration 20250926000000).
+
+Uso:
+    python conversation_summary.py rebuild
+    python conversation_summary.py verify --repair
+    python conversation_summary.py verify --owner 00000000-0000-0000-0000-000000000000
+    python conversation_summary.py unread --repair --batch-size 200
+"""
+
+import argparse
+import sys
+import time
+
+from pg_utils import LoadThrottle, ProgressReporter, format_duration, get_pg_connection, list_distinct_owners
+
+DRIFT_SQL = """
+    WITH expected AS (
+      SELECT chat_id,
+             COUNT(*) AS total,
+             COUNT(*) FILTER (WHERE remetente = 'CLIENTE' AND lida = false) AS unread,
+             MAX(timestamp) AS last_at
+      FROM public.whatsapp_mensagens
+      WHERE owner_id = %(owner)s AND chat_id IS NOT NULL
+      GROUP BY chat_id
+    ),
+    actual AS (
+      SELECT chat_id, total_messages, unread_count, last_message_at
+      FROM public.whatsapp_conversations
+      WHERE owner_id = %(owner)s
+    )
+    SELECT COALESCE(e.chat_id, a.chat_id),
+           e.total, a.total_messages,
+           e.unread, a.unread_count,
+           e.last_at, a.last_message_at
+    FROM expected e
+    FULL JOIN actual a ON a.chat_id = e.chat_id
+    WHERE e.total IS DISTINCT FROM a.total_messages
+       OR e.unread IS DISTINCT FROM a.unread_count
+       OR e.last_at IS DISTINCT FROM a.last_message_at
+"""
+
+
+def rebuild_owner(conn, owner_id):
+    """Reconstrói o resumo de um owner; retorna o número de conversas"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT public.rebuild_whatsapp_conversations(%s)", (owner_id,))
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def find_drift(conn, owner_id):
+    """Retorna as conversas do owner cujo resumo diverge das mensagens"""
+    with conn.cursor() as cur:
+        cur.execute(DRIFT_SQL, {'owner': owner_id})
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def unread_drift(conn, owner_ids, repair=False):
+    """Confere (e opcionalmente corrige) as não lidas de um lote de owners"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.repair_whatsapp_unread_counts(%s::uuid[], %s)",
+                    (list(owner_ids), repair))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def run_unread(conn, throttle, owners, args):
+    """Comando unread: verifica os contadores em lotes de owners"""
+    progress = ProgressReporter('owners', len(owners))
+    drifted = 0
+    for start in range(0, len(owners), args.batch_size):
+        batch = owners[start:start + args.batch_size]
+        throttle.wait()
+        drift = unread_drift(conn, batch, repair=args.repair)
+        drifted += len(drift)
+        for owner_id, chat_id, expected, actual in drift[:args.show]:
+            print(f"   ❌ {owner_id} {chat_id}: não lidas {actual} (esperado {expected})")
+        progress.update(len(batch))
+    progress.finish()
+    return drifted
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Reconstrói/verifica whatsapp_conversations")
+    parser.add_argument('command', choices=['rebuild', 'verify', 'unread'])
+    parser.add_argument('--owner', action='append', help="Limita a estes owner_id (padrão: todos)")
+    parser.add_argument('--repair', action='store_true', help="verify: reconstrói owners com divergência; unread: corrige os contadores")
+    parser.add_argument('--show', type=int, default=5, help="Exemplos de divergência por owner (unread: por lote)")
+    parser.add_argument('--batch-size', type=int, default=100, help="unread: owners por lote")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='conversation_summary')
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    owners = args.owner or list_distinct_owners(conn)
+    print(f"🚀 {args.command} de whatsapp_conversations para {len(owners)} owners...")
+
+    started = time.monotonic()
+    if args.command == 'unread':
+        drifted = run_unread(conn, throttle, owners, args)
+        conn.close()
+        if drifted and not args.repair:
+            print(f"⚠️ {drifted} conversas com contador divergente; rode novamente com --repair")
+            sys.exit(2)
+        print(f"✅ Contadores verificados em {format_duration(time.monotonic() - started)} "
+              f"({drifted} conversas corrigidas)")
+        return
+
+    progress = ProgressReporter('owners', len(owners))
+    drifted = 0
+    conversations = 0
+    for owner_id in owners:
+        throttle.wait()
+        if args.command == 'rebuild':
+            conversations += rebuild_owner(conn, owner_id)
+        else:
+            drift = find_drift(conn, owner_id)
+            if drift:
+                drifted += 1
+                print(f"   ❌ owner {owner_id}: {len(drift)} conversas divergentes")
+                for chat_id, exp_total, total, exp_unread, unread, exp_last, last in drift[:args.show]:
+                    print(f"      {chat_id}: total {total} (esperado {exp_total}), "
+                          f"não lidas {unread} (esperado {exp_unread}), última {last} (esperado {exp_last})")
+                if args.repair:
+                    conversations += rebuild_owner(conn, owner_id)
+                    print(f"   🔧 owner {owner_id} reconstruído")
+        progress.update(1)
+
+    progress.finish()
+    conn.close()
+    if args.command == 'rebuild':
+        print(f"🎉 {conversations:,} conversas reconstruídas em {format_duration(time.monotonic() - started)}")
+    elif drifted and not args.repair:
+        print(f"⚠️ {drifted} owners com divergência; rode novamente com --repair")
+        sys.exit(2)
+    else:
+        print(f"✅ Verificação concluída ({drifted} owners corrigidos)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Rollups diários do Dashboard e dos Relatórios (dashboard_daily_rollups)
+
+Mantém, por empresa e por dia de criação, a contagem e o valor de leads, deals,
+activities, projects e products por status e prioridade, e as atividades abertas
+por dia de vencimento (entity = 'activities_due'). Cada entidade tem um watermark
+(updated_at, id) em dashboard_rollup_watermarks: refresh lê só as linhas alteradas
+desde a última execução, junta os pares (empresa, dia) tocados e recalcula esses
+buckets a partir da tabela base na mesma transação que avança o watermark.
+
+Exclusões físicas e mudanças de empresa/created_at não aparecem em updated_at;
+refresh --full recalcula tudo (ex.: uma vez por semana). companies fica de fora
+(o tenant dela é owner_id, não company_id).
+
+Estruturas: supabase/migrations/20251003000000_dashboard_rollups.sql
+
+Uso:
+    python dashboard_rollups.py refresh --full
+    python dashboard_rollups.py refresh --entities leads activities --safety-lag 120
+    python dashboard_rollups.py status
+"""
+
+import argparse
+import sys
+import time
+
+from activity_workload import OPEN_STATUSES
+from pg_utils import LoadThrottle, ProgressReporter, fetch_table_columns, format_duration, get_pg_connection
+
+TIMEZONE = 'America/Sao_Paulo'
+LOCK_KEY = 'dashboard_rollups'
+# Mesmos status abertos de activity_workload (archived não é carga); o predicado de
+# idx_activities_open_due repete esta lista
+OPEN_ACTIVITY_FILTER = f"due_date IS NOT NULL AND status IN ({', '.join(repr(s) for s in OPEN_STATUSES)})"
+
+# Entidade: (tabela, candidatos de status, de prioridade, de valor, filtro de linhas vivas).
+# O primeiro candidato que existir na tabela é usado; sem nenhum, o bucket fica '' / 0.
+ENTITIES = {
+    'leads': ('leads', ('status',), ('priority',), ('value', 'budget'), 'deleted_at IS NULL'),
+    'deals': ('deals', ('status',), (), ('value',), None),
+    'activities': ('activities', ('status',), ('priority',), (), None),
+    'projects': ('projects', ('status',), ('priority',), ('budget',), None),
+    'products': ('products', ('status',), (), ('base_price', 'price'), None),
+}
+
+DAY_SQL = f"(t.created_at AT TIME ZONE '{TIMEZONE}')::date"
+
+
+class EntitySpec:
+    """Expressões SQL de uma entidade, resolvidas contra as colunas reais da tabela"""
+
+    def __init__(self, name, columns):
+        table, status, priority, amount, live = ENTITIES[name]
+        self.name = name
+        self.table = table
+        self.status = self._pick(columns, status, "''", "t.{}::text")
+        self.priority = self._pick(columns, priority, "''", "t.{}::text")
+        self.amount = self._pick(columns, amount, "0", "t.{}")
+        if live and live.split()[0] not in columns:
+            live = None
+        self.live = f"t.{live}" if live else "true"
+
+    @staticmethod
+    def _pick(columns, candidates, default, template):
+        for column in candidates:
+            if column in columns:
+                return template.format(column)
+        return default
+
+    def aggregate_sql(self, bucket_join):
+        """INSERT dos buckets; `bucket_join` restringe a tabela base (vazio = tudo)"""
+        return f"""
+            INSERT INTO public.dashboard_daily_rollups (company_id, entity, day, status, priority, items, amount)
+            SELECT t.company_id, %(entity)s, {DAY_SQL}, COALESCE({self.status}, ''), COALESCE({self.priority}, ''),
+                   COUNT(*), COALESCE(SUM({self.amount}), 0)
+            FROM public.{self.table} t
+            {bucket_join}
+            WHERE t.company_id IS NOT NULL AND t.created_at IS NOT NULL AND {self.live}
+            GROUP BY 1, 3, 4, 5
+        """
+
+
+def resolve_entities(conn, names):
+    catalog = fetch_table_columns(conn, [f"public.{ENTITIES[n][0]}" for n in names])
+    specs = []
+    for name in names:
+        columns = [c for c, _, _ in catalog.get(f"public.{ENTITIES[name][0]}", [])]
+        if not {'id', 'company_id', 'created_at', 'updated_at'} <= set(columns):
+            print(f"   ⚠️ {name}: tabela sem id/company_id/created_at/updated_at; ignorando")
+            continue
+        specs.append(EntitySpec(name, columns))
+    return specs
+
+
+def load_watermark(conn, entity):
+    with conn.cursor() as cur:
+        cur.execute("SELECT updated_at, last_id FROM public.dashboard_rollup_watermarks WHERE entity = %s",
+                    (entity,))
+        row = cur.fetchone()
+    return tuple(row) if row and row[0] is not None else None
+
+
+def save_watermark(cur, entity, watermark):
+    cur.execute("""
+        INSERT INTO public.dashboard_rollup_watermarks (entity, updated_at, last_id, refreshed_at)
+        VALUES (%s, %s, %s, now())
+        ON CONFLICT (entity) DO UPDATE
+        SET updated_at = EXCLUDED.updated_at, last_id = EXCLUDED.last_id, refreshed_at = now()
+    """, (entity, watermark[0] if watermark else None, watermark[1] if watermark else None))
+
+
+def refresh_buckets(cur, spec, buckets):
+    """Recalcula os buckets (empresa, dia) de uma entidade a partir da tabela base"""
+    companies = [str(company) for company, _ in buckets]
+    days = [day for _, day in buckets]
+    cur.execute("""
+        DELETE FROM public.dashboard_daily_rollups r
+        USING unnest(%(companies)s::uuid[], %(days)s::date[]) AS b(company_id, day)
+        WHERE r.entity = %(entity)s AND r.company_id = b.company_id AND r.day = b.day
+    """, {'entity': spec.name, 'companies': companies, 'days': days})
+    # Intervalo de created_at do dia local: usa o índice (company_id, created_at)
+    cur.execute(spec.aggregate_sql(f"""
+            JOIN unnest(%(companies)s::uuid[], %(days)s::date[]) AS b(company_id, day)
+              ON t.company_id = b.company_id
+             AND t.created_at >= (b.day::timestamp AT TIME ZONE '{TIMEZONE}')
+             AND t.created_at < ((b.day + 1)::timestamp AT TIME ZONE '{TIMEZONE}')
+    """), {'entity': spec.name, 'companies': companies, 'days': days})
+
+
+def refresh_due(cur, companies=None):
+    """Recalcula 'activities_due' (atividades abertas por vencimento) das empresas, ou de todas"""
+    if companies is None:
+        cur.execute("DELETE FROM public.dashboard_daily_rollups WHERE entity = 'activities_due'")
+        scope, params = "", {}
+    else:
+        params = {'companies': [str(c) for c in companies]}
+        cur.execute("""
+            DELETE FROM public.dashboard_daily_rollups
+            WHERE entity = 'activities_due' AND company_id = ANY(%(companies)s::uuid[])
+        """, params)
+        scope = "AND company_id = ANY(%(companies)s::uuid[])"
+    cur.execute(f"""
+        INSERT INTO public.dashboard_daily_rollups (company_id, entity, day, status, priority, items)
+        SELECT company_id, 'activities_due', (due_date AT TIME ZONE '{TIMEZONE}')::date, COALESCE(status, ''), COALESCE(priority, ''), COUNT(*)
+        FROM public.activities
+        WHERE company_id IS NOT NULL AND {OPEN_ACTIVITY_FILTER} {scope}
+        GROUP BY 1, 3, 4, 5
+    """, params)
+
+
+def refresh_full(conn, spec, cutoff):
+    """Recalcula a entidade inteira e posiciona o watermark no fim (até o cutoff)"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM public.dashboard_daily_rollups WHERE entity = %s", (spec.name,))
+        cur.execute(spec.aggregate_sql(""), {'entity': spec.name})
+        inserted = cur.rowcount
+        if spec.name == 'activities':
+            refresh_due(cur)
+        cur.execute(f"""
+            SELECT updated_at, id FROM public.{spec.table}
+            WHERE updated_at < %s
+            ORDER BY updated_at DESC, id DESC
+            LIMIT 1
+        """, (cutoff,))
+        save_watermark(cur, spec.name, cur.fetchone())
+    conn.commit()
+    print(f"   ✅ {spec.name}: {inserted:,} buckets recalculados")
+
+
+def refresh_incremental(conn, spec, cutoff, page_size, throttle):
+    """Recalcula só os buckets tocados desde o watermark, uma página de alterações por transação"""
+    watermark = load_watermark(conn, spec.name)
+    if watermark is None:
+        print(f"   ⚠️ {spec.name}: sem watermark; fazendo carga completa")
+        refresh_full(conn, spec, cutoff)
+        return 0, 0
+    progress = ProgressReporter(f"alterações {spec.name}")
+    changed = touched = 0
+    while True:
+        throttle.wait()
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT t.updated_at, t.id, t.company_id, {DAY_SQL}
+                FROM public.{spec.table} t
+                WHERE t.updated_at < %(cutoff)s AND (t.updated_at, t.id) > (%(ts)s, %(id)s)
+                ORDER BY t.updated_at, t.id
+                LIMIT %(limit)s
+            """, {'cutoff': cutoff, 'ts': watermark[0], 'id': watermark[1], 'limit': page_size})
+            rows = cur.fetchall()
+            if not rows:
+                conn.commit()
+                break
+            buckets = sorted({(company, day) for _, _, company, day in rows if company and day})
+            if buckets:
+                refresh_buckets(cur, spec, buckets)
+                if spec.name == 'activities':
+                    refresh_due(cur, sorted({company for company, _ in buckets}))
+            watermark = (rows[-1][0], rows[-1][1])
+            save_watermark(cur, spec.name, watermark)
+        conn.commit()
+        changed += len(rows)
+        touched += len(buckets)
+        progress.update(len(rows), buckets=touched)
+        if len(rows) < page_size:
+            break
+    progress.finish()
+    return changed, touched
+
+
+def acquire_lock(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_KEY,))
+        locked = cur.fetchone()[0]
+    conn.commit()
+    return locked
+
+
+def run_refresh(conn, args):
+    if not acquire_lock(conn):
+        print("⚠️ Outro refresh está em andamento; saindo")
+        return
+    with conn.cursor() as cur:
+        cur.execute("SELECT now() - make_interval(secs => %s)", (args.safety_lag,))
+        cutoff = cur.fetchone()[0]
+    conn.commit()
+    specs = resolve_entities(conn, args.entities)
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    mode = 'completo' if args.full else 'incremental'
+    print(f"🚀 Refresh {mode} dos rollups até {cutoff.isoformat()} ({', '.join(s.name for s in specs)})...")
+    for spec in specs:
+        started = time.monotonic()
+        if args.full:
+            refresh_full(conn, spec, cutoff)
+            continue
+        changed, touched = refresh_incremental(conn, spec, cutoff, args.page_size, throttle)
+        if changed:
+            print(f"   ✅ {spec.name}: {changed:,} linhas alteradas, {touched:,} buckets recalculados "
+                  f"em {format_duration(time.monotonic() - started)}")
+
+
+def run_status(conn, args):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT r.entity, COUNT(*), COUNT(DISTINCT r.company_id), MIN(r.day), MAX(r.day), SUM(r.items),
+                   w.updated_at, w.refreshed_at
+            FROM public.dashboard_daily_rollups r
+            LEFT JOIN public.dashboard_rollup_watermarks w
+              ON w.entity = CASE WHEN r.entity = 'activities_due' THEN 'activities' ELSE r.entity END
+            GROUP BY r.entity, w.updated_at, w.refreshed_at
+            ORDER BY r.entity
+        """)
+        rows = cur.fetchall()
+    conn.commit()
+    if not rows:
+        print("⚠️ Nenhum rollup; rode refresh --full")
+        return
+    for entity, buckets, companies, first, last, items, watermark, refreshed in rows:
+        print(f"📊 {entity}: {buckets:,} buckets, {companies:,} empresas, {first} a {last}, "
+              f"{items:,} itens; watermark {watermark}, refresh em {refreshed}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Rollups diários do Dashboard e dos Relatórios")
+    parser.add_argument('command', choices=['refresh', 'status'])
+    parser.add_argument('--entities', nargs='+', choices=list(ENTITIES), default=list(ENTITIES))
+    parser.add_argument('--full', action='store_true', help="Recalcula tudo e reposiciona os watermarks")
+    parser.add_argument('--safety-lag', type=int, default=60,
+                        help="Ignora alterações mais recentes que N segundos (transações ainda abertas)")
+    parser.add_argument('--page-size', type=int, default=2000, help="Linhas alteradas por transação")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='dashboard_rollups')
+    started = time.monotonic()
+    try:
+        if args.command == 'status':
+            run_status(conn, args)
+        else:
+            run_refresh(conn, args)
+            print(f"🎉 Concluído em {format_duration(time.monotonic() - started)}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; páginas concluídas já foram confirmadas")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Leitura e escrita de datasets em arquivos (formato COPY texto, CSV ou NDJSON)
+com manifest.json descrevendo tabelas, colunas e contagem de linhas
+"""
+
+import datetime
+import decimal
+import gzip
+import hashlib
+import io
+import json
+import os
+import uuid
+
+MANIFEST_NAME = 'manifest.json'
+
+FORMAT_EXTENSIONS = {
+    'copy': '.copy',
+    'csv': '.csv',
+    'ndjson': '.ndjson',
+}
+
+_COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\',
+    '\t': '\\t',
+    '\n': '\\n',
+    '\r': '\\r',
+})
+
+
+def _json_default(value):
+    """Serializa tipos que o json padrão não conhece"""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, (uuid.UUID, decimal.Decimal)):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+
+def to_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def _array_literal(values):
+    """Converte lista Python em literal de array do Postgres ({a,"b c"})"""
+    items = []
+    for item in values:
+        if item is None:
+            items.append('NULL')
+            continue
+        text = str(item).replace('\\', '\\\\').replace('"', '\\"')
+        items.append(f'"{text}"')
+    return '{' + ','.join(items) + '}'
+
+
+def copy_field(value):
+    """Formata um valor Python como campo do COPY em formato texto"""
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (list, tuple)):
+        text = _array_literal(value)
+    elif isinstance(value, dict):
+        text = to_json(value)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        text = value.isoformat()
+    else:
+        text = str(value)
+    return text.translate(_COPY_ESCAPES)
+
+
+def csv_field(value):
+    """Formata um valor como campo CSV do COPY: NULL sem aspas, texto sempre entre aspas"""
+    if value is None:
+        return ''
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    if isinstance(value, (list, tuple)):
+        text = _array_literal(value)
+    elif isinstance(value, dict):
+        text = to_json(value)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        text = value.isoformat()
+    else:
+        text = str(value)
+    return '"' + text.replace('"', '""') + '"'
+
+
+def open_output(path, compress=True):
+    """Abre arquivo de saída em texto, com gzip opcional"""
+    if compress:
+        # mtime=0 mantém o arquivo idêntico entre execuções com a mesma seed
+        raw = gzip.GzipFile(path + '.gz', 'wb', compresslevel=3, mtime=0)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='')
+
+
+def open_input(path):
+    """Abre arquivo de entrada em texto, detectando gzip pela extensão"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+class TableWriter:
+    """Escreve linhas de uma tabela em streaming (uma linha por chamada)"""
+
+    def __init__(self, directory, table, columns, fmt='copy', compress=True):
+        if fmt not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Formato não suportado: {fmt}")
+        self.table = table
+        self.columns = list(columns)
+        self.fmt = fmt
+        self.rows = 0
+        base = table.split('.')[-1] if table.startswith('public.') else table
+        self.file_name = base + FORMAT_EXTENSIONS[fmt] + ('.gz' if compress else '')
+        self.path = os.path.join(directory, self.file_name)
+        self._fh = open_output(os.path.join(directory, base + FORMAT_EXTENSIONS[fmt]), compress)
+        if fmt == 'csv':
+            self._fh.write(','.join(self.columns) + '\n')
+
+    def write(self, row):
+        """Escreve uma linha (tupla na ordem de self.columns)"""
+        if self.fmt == 'copy':
+            self._fh.write('\t'.join(copy_field(v) for v in row))
+            self._fh.write('\n')
+        elif self.fmt == 'csv':
+            self._fh.write(','.join(csv_field(v) for v in row))
+            self._fh.write('\n')
+        else:
+            self._fh.write(to_json(dict(zip(self.columns, row))))
+            self._fh.write('\n')
+        self.rows += 1
+
+    def close(self):
+        self._fh.close()
+
+    def describe(self):
+        return {
+            'name': self.table,
+            'file': self.file_name,
+            'format': self.fmt,
+            'columns': self.columns,
+            'rows': self.rows,
+        }
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Checksum SHA-256 de um arquivo, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_manifest(directory, tables, **extra):
+    """Grava manifest.json com a descrição das tabelas na ordem de carga"""
+    manifest = dict(extra)
+    manifest['tables'] = tables
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, ensure_ascii=False, indent=2, default=_json_default)
+    return manifest
+
+
+def read_manifest(directory):
+    """Lê manifest.json de um diretório de dataset"""
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def iter_ndjson(path):
+    """Itera objetos de um arquivo NDJSON (gzip opcional) sem carregá-lo inteiro"""
+    with open_input(path) as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class IteratorFile(io.TextIOBase):
+    """Adapta um iterador de linhas de texto em arquivo legível (para COPY FROM STDIN)"""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._lines)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self._buffer = self._buffer, ''
+        else:
+            chunk, self._buffer = self._buffer[:size], self._buffer[size:]
+        return chunk
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Planos de exclusão em cascata gerados a partir do grafo de FKs (pg_constraint)
+
+force_delete_lead fixava quatro tabelas filhas e test_cascade_delete.py apagava
+atendimentos na mão antes do lead; toda tabela nova que referencia leads quebrava
+a exclusão com erro de FK. Este script lê as FKs do catálogo, descobre todas as
+tabelas que dependem (direta ou indiretamente) de uma raiz e as ordena
+topologicamente. A partir disso gera uma função set-based por raiz:
+
+    cascade_delete_<raiz>(p_ids <tipo da PK>[]) RETURNS TABLE (table_name, deleted)
+
+que apaga os descendentes das folhas para a raiz com um DELETE por tabela
+(subconsultas encadeadas até "id = ANY(p_ids)", sem laço por linha), zera as
+colunas de FKs ON DELETE SET NULL num UPDATE e fecha auto-referências
+(parent_id) com CTE recursiva. FKs compostas, SET DEFAULT e arestas que fecham
+ciclos entre tabelas diferentes ficam de fora e são listadas no plano.
+
+Também aponta colunas de FK sem índice: cada DELETE no pai (cascata do banco ou
+desta função) vira uma varredura sequencial na filha.
+
+Uso:
+    python fk_cascade.py plan leads companies projects
+    python fk_cascade.py sql leads --out supabase/migrations/20250928000000_cascade_delete_leads.sql
+    python fk_cascade.py install leads
+    python fk_cascade.py indexes --sql
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import sys
+
+from pg_utils import estimate_row_count, fetch_foreign_keys, fetch_table_columns, get_pg_connection, quote_ident
+from table_exporter import fetch_primary_key
+
+DELETE_ACTIONS = {'a': 'NO ACTION', 'r': 'RESTRICT', 'c': 'CASCADE', 'n': 'SET NULL', 'd': 'SET DEFAULT'}
+
+
+def qualify(table):
+    """'public.leads' -> public.leads com identificadores citados"""
+    schema, _, name = table.partition('.')
+    return f"{quote_ident(schema)}.{quote_ident(name)}"
+
+
+def short_name(table):
+    """Nome usado nos resultados: sem schema quando for public (como purge_leads)"""
+    return table.split('.', 1)[1] if table.startswith('public.') else table
+
+
+def fetch_indexed_prefixes(conn, schemas=('public',)):
+    """{tabela: [colunas de cada índice válido e não parcial, na ordem]}"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT n.nspname || '.' || c.relname,
+                   ARRAY(SELECT a.attname::text
+                         FROM unnest(ix.indkey) WITH ORDINALITY k(attnum, ord)
+                         JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+                         ORDER BY k.ord)
+            FROM pg_index ix
+            JOIN pg_class c ON c.oid = ix.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = ANY(%s)
+              AND ix.indisvalid
+              AND ix.indpred IS NULL
+              AND ix.indexprs IS NULL
+        """, (list(schemas),))
+        rows = cur.fetchall()
+    conn.commit()
+    indexes = collections.defaultdict(list)
+    for table, columns in rows:
+        indexes[table].append(list(columns))
+    return indexes
+
+
+def fk_is_indexed(fk, indexes):
+    """A FK está coberta se algum índice começa pelas suas colunas (em qualquer ordem)"""
+    wanted = set(fk['child_columns'])
+    return any(set(columns[:len(wanted)]) == wanted for columns in indexes.get(fk['child'], []))
+
+
+def index_ddl(fk):
+    """CREATE INDEX sugerido para uma FK sem índice"""
+    table = fk['child'].split('.', 1)[1]
+    name = f"idx_{table}_{'_'.join(fk['child_columns'])}"[:63]
+    columns = ', '.join(quote_ident(c) for c in fk['child_columns'])
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote_ident(name)} ON {qualify(fk['child'])} ({columns});"
+
+
+class CascadePlan:
+    """Subgrafo de exclusão de uma raiz: tabelas, arestas, ordem e exceções"""
+
+    def __init__(self, root, foreign_keys, max_depth=8):
+        self.root = root
+        self.delete_edges = []
+        self.null_edges = []
+        self.self_edges = collections.defaultdict(list)
+        self.skipped = []
+        self.nodes = {root: 0}
+
+        children = collections.defaultdict(list)
+        for fk in foreign_keys:
+            children[fk['parent']].append(fk)
+
+        queue = collections.deque([root])
+        while queue:
+            parent = queue.popleft()
+            for fk in children[parent]:
+                action = fk['on_delete']
+                if len(fk['child_columns']) != 1:
+                    self.skipped.append((fk, 'FK composta'))
+                elif action == 'd':
+                    self.skipped.append((fk, 'ON DELETE SET DEFAULT (fica com o banco)'))
+                elif action == 'n':
+                    self.null_edges.append(fk)
+                elif fk['child'] == parent:
+                    self.self_edges[parent].append(fk)
+                elif fk['child'] not in self.nodes and self.nodes[parent] + 1 > max_depth:
+                    self.skipped.append((fk, f"além de --max-depth {max_depth}"))
+                else:
+                    self.delete_edges.append(fk)
+                    if fk['child'] not in self.nodes:
+                        self.nodes[fk['child']] = self.nodes[parent] + 1
+                        queue.append(fk['child'])
+
+        self._break_cycles()
+        self.order = self._topological_order()
+
+    def _break_cycles(self):
+        """Remove arestas de retorno (ciclos entre tabelas distintas) encontradas por DFS a partir da raiz"""
+        outgoing = collections.defaultdict(list)
+        for fk in self.delete_edges:
+            outgoing[fk['parent']].append(fk)
+        state = {}
+        back_edges = []
+
+        def visit(node):
+            state[node] = 'open'
+            for fk in outgoing[node]:
+                child = fk['child']
+                if state.get(child) == 'open':
+                    back_edges.append(fk)
+                elif child not in state:
+                    visit(child)
+            state[node] = 'done'
+
+        visit(self.root)
+        for fk in back_edges:
+            self.delete_edges.remove(fk)
+            self.skipped.append((fk, 'fecha ciclo entre tabelas (resolva manualmente)'))
+
+    def _topological_order(self):
+        """Pais antes dos filhos (Kahn); a exclusão percorre a lista ao contrário"""
+        incoming = {node: set() for node in self.nodes}
+        for fk in self.delete_edges:
+            incoming[fk['child']].add(fk['parent'])
+        order = []
+        pending = set(self.nodes)
+        while pending:
+            ready = sorted(n for n in pending if not (incoming[n] & pending))
+            if not ready:
+                raise RuntimeError(f"ciclo não resolvido entre {sorted(pending)}")
+            order.extend(ready)
+            pending -= set(ready)
+        return order
+
+    def incoming(self, node):
+        return [fk for fk in self.delete_edges if fk['child'] == node]
+
+    def all_edges(self):
+        edges = list(self.delete_edges) + list(self.null_edges)
+        for fks in self.self_edges.values():
+            edges.extend(fks)
+        return edges
+
+
+class CascadeSqlBuilder:
+    """Gera a função plpgsql set-based de uma CascadePlan"""
+
+    def __init__(self, plan, root_key, root_type, schema='public'):
+        self.plan = plan
+        self.root_key = root_key
+        self.root_type = root_type
+        self.schema = schema
+
+    @property
+    def function_name(self):
+        return f"cascade_delete_{self.plan.root.split('.', 1)[1]}"[:63]
+
+    def _base_predicate(self, node, alias, depth):
+        if node == self.plan.root:
+            return f"{alias}.{quote_ident(self.root_key)} = ANY(p_ids)"
+        inner = f"t{depth + 1}"
+        conditions = []
+        for fk in self.plan.incoming(node):
+            parent_predicate = self.predicate(fk['parent'], inner, depth + 1)
+            conditions.append(
+                f"{alias}.{quote_ident(fk['child_columns'][0])} IN ("
+                f"SELECT {inner}.{quote_ident(fk['parent_columns'][0])} FROM {qualify(fk['parent'])} {inner} "
+                f"WHERE {parent_predicate})")
+        return ' OR '.join(f"({c})" for c in conditions) if len(conditions) > 1 else conditions[0]
+
+    def predicate(self, node, alias, depth=0):
+        """Condição SQL que seleciona as linhas de `node` atingidas pela exclusão das raízes"""
+        self_fks = self.plan.self_edges.get(node)
+        if not self_fks:
+            return self._base_predicate(node, alias, depth)
+        # Auto-referência (ex.: parent_id): fecha o conjunto com CTE recursiva
+        key = quote_ident(self_fks[0]['parent_columns'][0])
+        seed = f"s{depth}"
+        walk = f"w{depth}"
+        joins = ' OR '.join(f"{walk}.{quote_ident(fk['child_columns'][0])} = r{depth}.k" for fk in self_fks)
+        return (f"{alias}.{key} IN (WITH RECURSIVE r{depth}(k) AS ("
+                f"SELECT {seed}.{key} FROM {qualify(node)} {seed} WHERE {self._base_predicate(node, seed, depth)} "
+                f"UNION SELECT {walk}.{key} FROM {qualify(node)} {walk} JOIN r{depth} ON {joins}"
+                f") SELECT k FROM r{depth})")
+
+    def statements(self):
+        """[(rótulo, comentário, SQL)] na ordem de execução: folhas primeiro"""
+        result = []
+        nulls_by_parent = collections.defaultdict(list)
+        for fk in self.plan.null_edges:
+            if fk['parent'] in self.plan.nodes:
+                nulls_by_parent[fk['parent']].append(fk)
+
+        for node in reversed(self.plan.order):
+            for fk in nulls_by_parent[node]:
+                column = quote_ident(fk['child_columns'][0])
+                sql = (f"UPDATE {qualify(fk['child'])} c SET {column} = NULL "
+                       f"WHERE c.{column} IN (SELECT t0.{quote_ident(fk['parent_columns'][0])} "
+                       f"FROM {qualify(node)} t0 WHERE {self.predicate(node, 't0')})")
+                result.append((f"{short_name(fk['child'])}.{fk['child_columns'][0]} -> NULL",
+                               f"{fk['name']}: ON DELETE SET NULL", sql))
+            edges = self.plan.incoming(node)
+            comment = ', '.join(f"{fk['name']} ({DELETE_ACTIONS[fk['on_delete']]})" for fk in edges) or 'raiz'
+            sql = f"DELETE FROM {qualify(node)} t0 WHERE {self.predicate(node, 't0')}"
+            result.append((short_name(node), comment, sql))
+        return result
+
+    def function_sql(self):
+        name = f"{quote_ident(self.schema)}.{quote_ident(self.function_name)}"
+        signature = f"{name}({self.root_type}[])"
+        body = []
+        for label, comment, sql in self.statements():
+            body.append(f"  -- {comment}")
+            body.append(f"  {sql};")
+            body.append("  GET DIAGNOSTICS v_count = ROW_COUNT;")
+            body.append(f"  table_name := '{label}'; deleted := v_count; RETURN NEXT;")
+            body.append("")
+        skipped = [f"--   {fk['name']} ({fk['child']} -> {fk['parent']}): {reason}" for fk, reason in self.plan.skipped]
+        header = [
+            f"-- {self.function_name}: gerado por backend/scripts/fk_cascade.py em "
+            f"{datetime.datetime.now(datetime.timezone.utc):%Y-%m-%d %H:%M} UTC; regenere em vez de editar",
+            f"-- Ordem de exclusão: {', '.join(short_name(t) for t in reversed(self.plan.order))}",
+        ]
+        if skipped:
+            header.append("-- Fora do plano (o DELETE pode falhar se houver linhas nelas):")
+            header.extend(skipped)
+        return '\n'.join(header + [
+            f"CREATE OR REPLACE FUNCTION {name}(p_ids {self.root_type}[])",
+            "RETURNS TABLE (table_name TEXT, deleted BIGINT)",
+            "LANGUAGE plpgsql",
+            "SECURITY DEFINER",
+            "SET search_path = public",
+            "AS $fn$",
+            "#variable_conflict use_column",
+            "DECLARE",
+            "  v_count BIGINT;",
+            "BEGIN",
+        ] + body[:-1] + [
+            "END;",
+            "$fn$;",
+            "",
+            f"REVOKE ALL ON FUNCTION {signature} FROM PUBLIC;",
+            f"GRANT EXECUTE ON FUNCTION {signature} TO service_role;",
+            "",
+        ])
+
+
+def build_plans(conn, roots, schemas, max_depth):
+    """[(CascadePlan, CascadeSqlBuilder)] para cada raiz"""
+    foreign_keys = fetch_foreign_keys(conn, schemas)
+    tables = [r if '.' in r else f"public.{r}" for r in roots]
+    catalog = fetch_table_columns(conn, tables)
+    plans = []
+    for root in tables:
+        if root not in catalog:
+            print(f"❌ Tabela não encontrada: {root}")
+            sys.exit(1)
+        key = fetch_primary_key(conn, root)
+        if len(key) != 1:
+            print(f"❌ {root} precisa de chave primária de uma coluna (tem {key or 'nenhuma'})")
+            sys.exit(1)
+        root_type = dict((name, pg_type) for name, pg_type, _ in catalog[root])[key[0]]
+        plan = CascadePlan(root, foreign_keys, max_depth)
+        plans.append((plan, CascadeSqlBuilder(plan, key[0], root_type)))
+    conn.commit()
+    return plans
+
+
+def print_plan(conn, plan, indexes):
+    print(f"\n🌳 {plan.root}: {len(plan.nodes) - 1} tabelas dependentes")
+    for table in reversed(plan.order):
+        depth = plan.nodes[table]
+        edges = ', '.join(f"{fk['parent'].split('.', 1)[1]}.{fk['parent_columns'][0]} "
+                          f"<- {fk['child_columns'][0]} {DELETE_ACTIONS[fk['on_delete']]}"
+                          for fk in plan.incoming(table))
+        print(f"   {'  ' * depth}🗑️ {table}{f'  ({edges})' if edges else ''}")
+    for fk in plan.null_edges:
+        print(f"   ∅ {fk['child']}.{fk['child_columns'][0]} -> NULL ({fk['name']})")
+    for fk, reason in plan.skipped:
+        print(f"   ⚠️ {fk['name']} ({fk['child']} -> {fk['parent']}): {reason}")
+    missing = [fk for fk in plan.all_edges() if not fk_is_indexed(fk, indexes)]
+    for fk in missing:
+        rows = estimate_row_count(conn, fk['child'].split('.', 1)[1], fk['child'].split('.', 1)[0])
+        print(f"   🐢 sem índice: {fk['child']}({', '.join(fk['child_columns'])}) ~{rows:,} linhas")
+    conn.commit()
+    return missing
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Gera planos de exclusão em cascata a partir das FKs")
+    parser.add_argument('command', choices=['plan', 'sql', 'install', 'indexes'])
+    parser.add_argument('roots', nargs='*', help="Tabelas raiz (ex.: leads companies projects)")
+    parser.add_argument('--schema', action='append', help="Schemas das tabelas filhas (padrão: public)")
+    parser.add_argument('--max-depth', type=int, default=8, help="Profundidade máxima a partir da raiz")
+    parser.add_argument('--out', help="sql: grava o SQL neste arquivo (padrão: stdout)")
+    parser.add_argument('--sql', action='store_true', help="indexes: imprime os CREATE INDEX sugeridos")
+    parser.add_argument('--json', action='store_true', help="plan: saída em JSON")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    schemas = tuple(args.schema or ['public'])
+    if args.command != 'indexes' and not args.roots:
+        parser.error(f"{args.command} exige ao menos uma tabela raiz")
+
+    conn = get_pg_connection(args.dsn, application_name='fk_cascade')
+    indexes = fetch_indexed_prefixes(conn, schemas)
+
+    if args.command == 'indexes':
+        missing = [fk for fk in fetch_foreign_keys(conn, schemas) if not fk_is_indexed(fk, indexes)]
+        conn.commit()
+        for fk in missing:
+            print(index_ddl(fk) if args.sql else
+                  f"🐢 {fk['child']}({', '.join(fk['child_columns'])}) -> {fk['parent']} [{fk['name']}]")
+        if not args.sql:
+            print(f"{'⚠️' if missing else '✅'} {len(missing)} FKs sem índice")
+        conn.close()
+        return
+
+    plans = build_plans(conn, args.roots, schemas, args.max_depth)
+
+    if args.command == 'plan':
+        if args.json:
+            print(json.dumps([{
+                'root': plan.root,
+                'delete_order': list(reversed(plan.order)),
+                'set_null': [fk['name'] for fk in plan.null_edges],
+                'skipped': [{'fk': fk['name'], 'reason': reason} for fk, reason in plan.skipped],
+                'unindexed': [index_ddl(fk) for fk in plan.all_edges() if not fk_is_indexed(fk, indexes)],
+            } for plan, _ in plans], indent=2, ensure_ascii=False))
+        else:
+            for plan, builder in plans:
+                missing = print_plan(conn, plan, indexes)
+                print(f"   ➡️ função: {builder.function_name}; {len(missing)} FKs sem índice")
+    elif args.command == 'sql':
+        sql = '\n'.join(builder.function_sql() for _, builder in plans)
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as fh:
+                fh.write(sql)
+            print(f"📁 SQL gravado em {args.out}")
+        else:
+            sys.stdout.write(sql)
+    else:
+        with conn.cursor() as cur:
+            for _, builder in plans:
+                cur.execute(builder.function_sql())
+                print(f"✅ {builder.function_name} instalada")
+        conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Análise de conversão do funil (leads × funnel_stages × pipelines) com cache diário
+
+Para cada empresa, lê por cursor no servidor o histórico de etapas
+(lead_stage_history) da coorte de leads criados na janela, em lotes colunares, e
+calcula com NumPy, por pipeline e por responsável:
+
+  reach          leads que chegaram a cada etapa (pela maior etapa alcançada)
+  conversion     taxa etapa -> etapa seguinte (reach[k+1] / reach[k])
+  matrix         transições observadas origem -> destino (inclui voltas e saltos)
+  time_in_stage  p50/p75/p90 em horas das passagens encerradas por etapa, e a
+                 idade mediana dos leads que ainda estão nela
+  velocity       ganhos, perdidos, taxa de ganho, ticket médio, ciclo médio (dias)
+                 e velocidade do pipeline (oportunidades × ticket × taxa / ciclo)
+
+O catálogo de etapas é o de cada empresa (funnel_stages.company_id, mais as etapas
+compartilhadas que o histórico dela usa): as etapas sem pipeline de empresas
+diferentes não se misturam num mesmo funil. O resultado vai para
+funnel_analytics_daily (uma linha por empresa, pipeline, responsável e dia);
+empresas já calculadas no dia são puladas sem --force.
+Entradas retroativas (backfilled) contam para o alcance, não para o tempo em etapa.
+
+Estruturas: supabase/migrations/20251001000000_funnel_analytics.sql
+
+Uso:
+    python funnel_analytics.py compute --window-days 90
+    python funnel_analytics.py compute --day 2025-09-30 --company 00000000-0000-0000-0000-000000000000 --force
+    python funnel_analytics.py show --company 00000000-0000-0000-0000-000000000000
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from dataset_io import to_json
+from pg_utils import (
+    LoadThrottle,
+    ProgressReporter,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    list_distinct_owners,
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Etapas da empresa e as (padrão/compartilhadas) que aparecem no histórico dela
+STAGES_SQL = """
+    SELECT id::text, name, order_position, pipeline_id::text
+    FROM public.funnel_stages
+    WHERE {scope}
+    ORDER BY pipeline_id NULLS LAST, order_position, name
+"""
+
+# Coorte: leads vivos da empresa criados na janela, com todo o histórico até o fim dela
+HISTORY_SQL = """
+    SELECT h.lead_id::text, h.to_stage_id::text,
+           EXTRACT(EPOCH FROM h.entered_at)::float8, h.backfilled,
+           l.owner_id::text, l.status, COALESCE(l.value, 0)::float8
+    FROM public.leads l
+    JOIN public.lead_stage_history h ON h.lead_id = l.id
+    WHERE l.company_id = %(company)s
+      AND l.deleted_at IS NULL
+      AND l.created_at >= %(start)s AND l.created_at < %(end)s
+      AND h.entered_at < %(end)s
+    ORDER BY h.lead_id, h.entered_at, h.id
+"""
+
+HISTORY_COLUMNS = ['lead', 'stage', 'ts', 'backfilled', 'owner', 'status', 'value']
+PERCENTILES = (50, 75, 90)
+
+
+class StageCatalog:
+    """Etapas de uma empresa por pipeline, na ordem do Kanban"""
+
+    def __init__(self, rows):
+        self.pipeline_of = {}
+        self.name_of = {}
+        self.by_pipeline = {}
+        for stage_id, name, _, pipeline_id in rows:
+            self.pipeline_of[stage_id] = pipeline_id
+            self.name_of[stage_id] = name
+            self.by_pipeline.setdefault(pipeline_id, []).append(stage_id)
+
+    def ranks(self, stage_ids, pipeline_id):
+        """Posição de cada etapa no pipeline (-1 se for de outro pipeline)"""
+        position = {stage_id: i for i, stage_id in enumerate(self.by_pipeline.get(pipeline_id, []))}
+        return np.fromiter((position.get(s, -1) for s in stage_ids), dtype=np.int32, count=len(stage_ids))
+
+
+def stages_have_company(conn):
+    """funnel_stages.company_id só existe com apply_company_isolation_complete.sql"""
+    catalog = fetch_table_columns(conn, ['public.funnel_stages'])
+    conn.commit()
+    return 'company_id' in {name for name, _, _ in catalog.get('public.funnel_stages', [])}
+
+
+def fetch_stages(conn, company_id, stage_ids, by_company=True):
+    """Catálogo da empresa: etapas com o company_id dela e os pipelines das etapas citadas em stage_ids"""
+    # Pipelines citados entram inteiros (etapas ainda não alcançadas têm alcance 0)
+    scope = ("id = ANY(%(stages)s::uuid[]) OR pipeline_id IN "
+             "(SELECT pipeline_id FROM public.funnel_stages WHERE id = ANY(%(stages)s::uuid[]))")
+    if by_company:
+        scope = f"company_id = %(company)s OR {scope}"
+    with conn.cursor() as cur:
+        cur.execute(STAGES_SQL.format(scope=scope),
+                    {'company': company_id, 'stages': sorted({s for s in stage_ids if s})})
+        rows = cur.fetchall()
+    conn.commit()
+    return StageCatalog(rows)
+
+
+def load_history(conn, company_id, start, end, batch_size=20000):
+    """Histórico da coorte em arrays NumPy (contíguo por lead), lido em lotes"""
+    chunks = {name: [] for name in HISTORY_COLUMNS}
+    with conn.cursor(name='funnel_history') as cur:
+        cur.itersize = batch_size
+        cur.execute(HISTORY_SQL, {'company': company_id, 'start': start, 'end': end})
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            columns = list(zip(*rows))
+            for name, values in zip(HISTORY_COLUMNS, columns):
+                chunks[name].append(values)
+    conn.commit()
+
+    def column(name, dtype):
+        values = [v for chunk in chunks[name] for v in chunk]
+        return np.array(values, dtype=dtype)
+
+    return {
+        'lead': column('lead', object),
+        'stage': column('stage', object),
+        'ts': column('ts', np.float64),
+        'backfilled': column('backfilled', bool),
+        'owner': column('owner', object),
+        'status': column('status', object),
+        'value': column('value', np.float64),
+    }
+
+
+def segment_starts(leads):
+    """Índices onde começa cada lead (linhas contíguas por lead)"""
+    if len(leads) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, leads[1:] != leads[:-1]])
+
+
+def take_leads(history, starts, lead_mask):
+    """Subconjunto do histórico com as linhas dos leads selecionados"""
+    lengths = np.diff(np.r_[starts, len(history['lead'])])
+    rows = np.repeat(lead_mask, lengths)
+    return {name: values[rows] for name, values in history.items()}
+
+
+def _hours(values):
+    if len(values) == 0:
+        return None
+    return {f"p{p}": round(float(v) / 3600.0, 2) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def funnel_metrics(history, stage_ids, ranks, now):
+    """Métricas de um grupo de leads de um pipeline; ranks = posição da etapa de cada linha"""
+    leads = history['lead']
+    n = len(leads)
+    starts = segment_starts(leads)
+    k = len(stage_ids)
+    same_next = np.zeros(n, dtype=bool)
+    if n > 1:
+        same_next[:-1] = leads[1:] == leads[:-1]
+    next_ts = np.where(same_next, np.r_[history['ts'][1:], now], now) if n else np.zeros(0)
+
+    # Alcance: maior etapa do pipeline atingida por lead
+    max_rank = np.maximum.reduceat(ranks, starts) if n else np.zeros(0, dtype=np.int32)
+    reach = np.array([(max_rank >= i).sum() for i in range(k)], dtype=np.int64)
+    conversion = [round(float(reach[i + 1] / reach[i]), 4) if reach[i] else None for i in range(k - 1)]
+
+    # Transições origem -> destino dentro do pipeline
+    matrix = np.zeros((k, k), dtype=np.int64)
+    moves = same_next & (ranks >= 0)
+    moves[:-1] &= ranks[1:] >= 0
+    origin = np.flatnonzero(moves)
+    np.add.at(matrix, (ranks[origin], ranks[origin + 1]), 1)
+
+    # Tempo em etapa: passagens encerradas (sem backfill) e idade de quem ainda está na etapa
+    stay = next_ts - history['ts']
+    closed = same_next & ~history['backfilled'] & (ranks >= 0)
+    current = ~same_next & (ranks >= 0)
+    time_in_stage = {}
+    for i, stage_id in enumerate(stage_ids):
+        durations = stay[closed & (ranks == i)]
+        ages = stay[current & (ranks == i)]
+        time_in_stage[stage_id] = {
+            'closed': int(len(durations)),
+            'hours': _hours(durations),
+            'open': int(len(ages)),
+            'open_median_hours': round(float(np.median(ages)) / 3600.0, 2) if len(ages) else None,
+        }
+
+    # Velocidade do pipeline (por lead: status e valor atuais, ciclo = primeira a última entrada)
+    status = history['status'][starts]
+    value = history['value'][starts]
+    ends = np.r_[starts[1:], n] - 1
+    cycle_days = (history['ts'][ends] - history['ts'][starts]) / 86400.0
+    won = status == 'won'
+    lost = status == 'lost'
+    decided = int(won.sum() + lost.sum())
+    win_rate = float(won.sum()) / decided if decided else None
+    avg_won = float(value[won].mean()) if won.any() else None
+    avg_cycle = float(cycle_days[won].mean()) if won.any() else None
+    velocity = None
+    if win_rate and avg_won is not None and avg_cycle:
+        velocity = round(len(starts) * avg_won * win_rate / avg_cycle, 2)
+
+    return {
+        'stages': stage_ids,
+        'reach': reach.tolist(),
+        'conversion': conversion,
+        'matrix': matrix.tolist(),
+        'time_in_stage': time_in_stage,
+        'velocity': {
+            'leads': int(len(starts)),
+            'won': int(won.sum()),
+            'lost': int(lost.sum()),
+            'win_rate': round(win_rate, 4) if win_rate is not None else None,
+            'avg_won_value': round(avg_won, 2) if avg_won is not None else None,
+            'avg_cycle_days': round(avg_cycle, 2) if avg_cycle is not None else None,
+            'per_day': velocity,
+        },
+    }
+
+
+def company_metrics(history, catalog, now, min_owner_leads=5):
+    """[(pipeline_id, owner_id, leads, métricas)] da empresa; owner_id None = todos"""
+    starts = segment_starts(history['lead'])
+    if len(starts) == 0:
+        return []
+    ends = np.r_[starts[1:], len(history['lead'])] - 1
+    # Pipeline do lead = pipeline da etapa atual (última entrada)
+    lead_pipeline = np.array([catalog.pipeline_of.get(s) for s in history['stage'][ends]], dtype=object)
+    lead_owner = history['owner'][starts]
+
+    results = []
+    for pipeline_id in catalog.by_pipeline:
+        in_pipeline = lead_pipeline == pipeline_id
+        if not in_pipeline.any():
+            continue
+        stage_ids = catalog.by_pipeline[pipeline_id]
+        groups = [(None, in_pipeline)]
+        owners, counts = np.unique(lead_owner[in_pipeline].astype(str), return_counts=True)
+        for owner, count in zip(owners, counts):
+            if owner != 'None' and count >= min_owner_leads:
+                groups.append((owner, in_pipeline & (lead_owner.astype(str) == owner)))
+        for owner_id, mask in groups:
+            subset = take_leads(history, starts, mask)
+            ranks = catalog.ranks(subset['stage'], pipeline_id)
+            results.append((pipeline_id, owner_id, int(mask.sum()), funnel_metrics(subset, stage_ids, ranks, now)))
+    return results
+
+
+def cached_companies(conn, day, window_days):
+    with conn.cursor() as cur:
+        cur.execute("SELECT DISTINCT company_id FROM public.funnel_analytics_daily "
+                    "WHERE day = %s AND window_days = %s", (day, window_days))
+        rows = {str(row[0]) for row in cur.fetchall()}
+    conn.commit()
+    return rows
+
+
+def store(conn, company_id, day, window_days, results):
+    """Substitui o cache da empresa no dia numa única transação"""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM public.funnel_analytics_daily "
+                    "WHERE company_id = %s AND day = %s AND window_days = %s", (company_id, day, window_days))
+        cur.executemany("""
+            INSERT INTO public.funnel_analytics_daily (company_id, pipeline_id, owner_id, day, window_days, leads, metrics)
+            VALUES (%s, %s, %s, %s, %s, %s, %s::jsonb)
+        """, [(company_id, pipeline_id, owner_id, day, window_days, leads, to_json(metrics))
+              for pipeline_id, owner_id, leads, metrics in results])
+    conn.commit()
+
+
+def run_compute(conn, args):
+    day = args.day or datetime.date.today()
+    end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min, datetime.timezone.utc)
+    start = end - datetime.timedelta(days=args.window_days)
+    by_company = stages_have_company(conn)
+    companies = args.company or [str(c) for c in list_distinct_owners(conn, table='leads', column='company_id')]
+    if not args.force:
+        done = cached_companies(conn, day, args.window_days)
+        companies = [c for c in companies if c not in done]
+    print(f"🚀 Funil de {day} (janela de {args.window_days} dias) para {len(companies)} empresas...")
+
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    progress = ProgressReporter('empresas', len(companies))
+    rows = 0
+    for company_id in companies:
+        throttle.wait()
+        history = load_history(conn, company_id, start, end, args.batch_size)
+        catalog = fetch_stages(conn, company_id, history['stage'].tolist(), by_company)
+        results = company_metrics(history, catalog, end.timestamp(), args.min_owner_leads)
+        if results:
+            store(conn, company_id, day, args.window_days, results)
+            rows += len(results)
+        progress.update(1, linhas=rows)
+    progress.finish()
+
+
+def run_show(conn, args):
+    if not args.company:
+        print("❌ show exige --company")
+        sys.exit(1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.get_funnel_analytics(%s, %s, %s)",
+                    (args.company[0], args.day, args.window_days))
+        rows = cur.fetchall()
+    conn.commit()
+    if not rows:
+        print("ℹ️ Nada em cache para essa empresa; rode compute")
+        return
+    catalog = fetch_stages(conn, args.company[0], [s for row in rows for s in row[4]['stages']],
+                           stages_have_company(conn))
+    for pipeline_id, owner_id, day, leads, metrics, computed_at in rows:
+        if owner_id is not None and not args.owners:
+            continue
+        velocity = metrics['velocity']
+        print(f"\n📊 {day} pipeline {pipeline_id or '(sem pipeline)'} "
+              f"{'responsável ' + str(owner_id) if owner_id else 'todos'} — {leads} leads")
+        for i, stage_id in enumerate(metrics['stages']):
+            stats = metrics['time_in_stage'][stage_id]
+            rate = metrics['conversion'][i] if i < len(metrics['conversion']) else None
+            hours = stats['hours'] or {}
+            print(f"   {catalog.name_of.get(stage_id, stage_id):<22} alcance {metrics['reach'][i]:>6} "
+                  f"→ {'' if rate is None else f'{rate:.0%}':>5}  p50 {hours.get('p50', '-')}h "
+                  f"p90 {hours.get('p90', '-')}h  parados {stats['open']}")
+        print(f"   ganhos {velocity['won']} perdidos {velocity['lost']} taxa {velocity['win_rate']} "
+              f"ciclo {velocity['avg_cycle_days']}d velocidade {velocity['per_day']}/dia")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Conversão, tempo em etapa e velocidade do funil")
+    parser.add_argument('command', choices=['compute', 'show'])
+    parser.add_argument('--day', type=datetime.date.fromisoformat, help="Dia de referência (padrão: hoje)")
+    parser.add_argument('--window-days', type=int, default=90, help="Coorte: leads criados nestes dias")
+    parser.add_argument('--company', action='append', help="Limita a estas company_id")
+    parser.add_argument('--force', action='store_true', help="Recalcula empresas já em cache no dia")
+    parser.add_argument('--min-owner-leads', type=int, default=5, help="Mínimo de leads para métricas por responsável")
+    parser.add_argument('--owners', action='store_true', help="show: inclui as linhas por responsável")
+    parser.add_argument('--batch-size', type=int, default=20000, help="Linhas de histórico por lote")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if np is None:
+        print("❌ numpy não instalado. Execute: pip install numpy")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='funnel_analytics')
+    started = time.monotonic()
+    try:
+        if args.command == 'compute':
+            run_compute(conn, args)
+            print(f"🎉 Funil calculado em {format_duration(time.monotonic() - started)}")
+        else:
+            run_show(conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Gerador de dataset sintético do CRM para benchmarks
+
+Gera, de forma reprodutível (--seed), volumes realistas de empresas, pipelines,
+etapas do funil, leads com tags, negócios, projetos, atividades, produtos,
+movimentações de estoque, contatos, atendimentos e mensagens do WhatsApp.
+As FKs são preservadas dentro de cada tenant (owner_id/company_id) e a saída é
+escrita em streaming como arquivos COPY (texto) ou NDJSON, com um manifest.json
+na ordem de carga (veja bulk_loader.py).
+
+Uso:
+    python generate_crm_dataset.py --out /tmp/crm_bench --tenants 50 --messages 5000000
+    python generate_crm_dataset.py --out /tmp/crm_small --scale small --format ndjson
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+import unicodedata
+import uuid
+
+from dataset_io import TableWriter, write_manifest
+from pg_utils import ProgressReporter
+
+SCALES = {
+    'small': dict(tenants=5, leads=5000, deals=1000, projects=200, activities=10000,
+                  products=500, movements=20000, messages=200000),
+    'medium': dict(tenants=50, leads=200000, deals=40000, projects=5000, activities=300000,
+                   products=10000, movements=500000, messages=5000000),
+    'large': dict(tenants=500, leads=2000000, deals=400000, projects=50000, activities=3000000,
+                  products=100000, movements=5000000, messages=30000000),
+}
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Henrique',
+               'Isabela', 'João', 'Larissa', 'Marcos', 'Natália', 'Otávio', 'Paula', 'Rafael',
+               'Sofia', 'Thiago', 'Vanessa', 'Wagner']
+LAST_NAMES = ['Silva', 'Santos', 'Oliveira', 'Souza', 'Lima', 'Pereira', 'Costa', 'Rodrigues',
+              'Almeida', 'Nascimento', 'Carvalho', 'Gomes', 'Ribeiro', 'Martins', 'Rocha']
+CITIES = [('São Paulo', 'SP', '11'), ('Rio de Janeiro', 'RJ', '21'), ('Belo Horizonte', 'MG', '31'),
+          ('Curitiba', 'PR', '41'), ('Porto Alegre', 'RS', '51'), ('Salvador', 'BA', '71'),
+          ('Recife', 'PE', '81'), ('Fortaleza', 'CE', '85'), ('Brasília', 'DF', '61'),
+          ('Goiânia', 'GO', '62')]
+SECTORS = ['Tecnologia', 'Varejo', 'Saúde', 'Educação', 'Indústria', 'Serviços', 'Agronegócio']
+
+# Vocabulário de tags com pesos no formato Zipf; variantes "sujas" simulam digitação livre
+TAGS = ['urgente', 'vip', 'follow-up', 'orçamento', 'indicação', 'retorno', 'evento',
+        'whatsapp', 'instagram', 'site', 'parceiro', 'recompra', 'inativo', 'b2b', 'b2c']
+TAG_WEIGHTS = [1.0 / (i + 1) for i in range(len(TAGS))]
+
+LEAD_SOURCES = ['website', 'whatsapp', 'referral', 'social_media', 'event', 'cold_call']
+PRIORITIES = ['low', 'medium', 'high', 'urgent']
+PRIORITY_WEIGHTS = [0.25, 0.45, 0.22, 0.08]
+STAGE_NAMES = ['Novo Lead', 'Contato Inicial', 'Proposta', 'Reunião', 'Fechamento']
+STAGE_COLORS = ['#3b82f6', '#8b5cf6', '#f59e0b', '#ef4444', '#10b981']
+ACTIVITY_TYPES = ['task', 'call', 'meeting', 'email', 'visit']
+ACTIVITY_STATUS = ['pending', 'in_progress', 'completed', 'cancelled']
+ACTIVITY_STATUS_WEIGHTS = [0.35, 0.2, 0.4, 0.05]
+DEPARTMENTS = ['Comercial', 'Marketing', 'Suporte', 'Financeiro', 'Operações', 'TI']
+WORK_GROUPS = ['Equipe A', 'Equipe B', 'Equipe C', 'Squad Growth', 'Squad Core']
+PROJECT_STATUS = ['planning', 'active', 'completed', 'cancelled']
+
+MESSAGE_TYPES = ['TEXTO', 'IMAGEM', 'AUDIO', 'VIDEO', 'DOCUMENTO', 'STICKER']
+MESSAGE_TYPE_WEIGHTS = [0.80, 0.08, 0.07, 0.02, 0.02, 0.01]
+MEDIA_MIMES = {
+    'IMAGEM': 'image/jpeg',
+    'AUDIO': 'audio/ogg; codecs=opus',
+    'VIDEO': 'video/mp4',
+    'DOCUMENTO': 'application/pdf',
+    'STICKER': 'image/webp',
+}
+CHAT_PHRASES = ['Olá, tudo bem?', 'Gostaria de um orçamento', 'Qual o prazo de entrega?',
+                'Pode me enviar o catálogo?', 'Obrigado!', 'Vou verificar e retorno',
+                'Segue a proposta em anexo', 'Qual o valor à vista?', 'Bom dia!',
+                'Perfeito, pode fechar', 'Ainda tem em estoque?', 'Aguardo retorno']
+
+# Colunas geradas por tabela, na ordem de carga (pais antes dos filhos)
+TABLES = [
+    ('auth.users', ['id', 'email', 'created_at']),
+    ('public.companies', ['id', 'owner_id', 'fantasy_name', 'company_name', 'cnpj', 'city',
+                          'state', 'email', 'phone', 'sector', 'status', 'created_at', 'updated_at']),
+    ('public.pipelines', ['id', 'owner_id', 'company_id', 'name', 'is_default', 'created_at', 'updated_at']),
+    ('public.funnel_stages', ['id', 'owner_id', 'company_id', 'pipeline_id', 'name', 'order_position',
+                              'color', 'probability', 'created_at']),
+    ('public.products', ['id', 'owner_id', 'company_id', 'name', 'type', 'sku', 'base_price',
+                         'unit', 'status', 'created_at', 'updated_at']),
+    ('public.projects', ['id', 'owner_id', 'company_id', 'name', 'status', 'priority', 'start_date',
+                         'end_date', 'budget', 'created_at', 'updated_at']),
+    ('public.contacts', ['id', 'owner_id', 'company_id', 'name', 'name_wpp', 'phone', 'email',
+                         'status', 'created_at', 'updated_at']),
+    ('public.leads', ['id', 'owner_id', 'company_id', 'name', 'email', 'phone', 'source', 'priority',
+                      'stage_id', 'status', 'value', 'tags', 'created_at', 'updated_at', 'deleted_at']),
+    ('public.deals', ['id', 'owner_id', 'company_id', 'product_id', 'stage_id', 'title', 'value',
+                      'probability', 'expected_close_date', 'status', 'created_at', 'updated_at']),
+    ('public.activities', ['id', 'owner_id', 'company_id', 'title', 'type', 'priority', 'status',
+                           'due_date', 'project_id', 'work_group', 'department', 'estimated_hours',
+                           'actual_hours', 'is_urgent', 'progress', 'created_at', 'updated_at']),
+    ('public.inventory_movements', ['id', 'owner_id', 'product_id', 'movement_type', 'quantity',
+                                    'reason', 'reference_type', 'created_at']),
+    ('public.whatsapp_atendimentos', ['id', 'owner_id', 'company_id', 'connection_id', 'numero_cliente',
+                                      'nome_cliente', 'status', 'ultima_mensagem_preview',
+                                      'ultima_mensagem_em', 'nao_lidas', 'created_at', 'updated_at']),
+    ('public.whatsapp_mensagens', ['id', 'owner_id', 'atendimento_id', 'chat_id', 'message_id', 'phone',
+                                   'wpp_name', 'connection_id', 'conteudo', 'tipo', 'message_type',
+                                   'status', 'remetente', 'timestamp', 'lida', 'media_url', 'media_mime',
+                                   'raw', 'created_at', 'updated_at']),
+]
+
+
+def ascii_slug(text):
+    """Remove acentos e deixa em minúsculas (para e-mails)"""
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode().lower()
+
+
+class DatasetGenerator:
+    """Gera o dataset tenant a tenant, mantendo em memória só as chaves de FK do tenant atual"""
+
+    def __init__(self, out_dir, counts, seed=42, fmt='copy', compress=True,
+                 start=None, days=365, with_raw=True, dirty_tag_rate=0.05):
+        self.out_dir = out_dir
+        self.counts = counts
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.fmt = fmt
+        self.compress = compress
+        self.end = start or datetime.datetime(2025, 9, 1, tzinfo=datetime.timezone.utc)
+        self.start = self.end - datetime.timedelta(days=days)
+        self.span_seconds = days * 86400
+        self.with_raw = with_raw
+        self.dirty_tag_rate = dirty_tag_rate
+        self.writers = {}
+
+    # ------------------------------------------------------------------ helpers
+
+    def uuid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def moment(self, after=None):
+        """Instante aleatório na janela (opcionalmente depois de `after`)"""
+        low = self.start if after is None else max(after, self.start)
+        span = max((self.end - low).total_seconds(), 1)
+        return low + datetime.timedelta(seconds=self.rng.random() * span)
+
+    def person(self):
+        return f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}"
+
+    def mobile(self, ddd):
+        return f"55{ddd}9{self.rng.randint(10000000, 99999999)}"
+
+    def messy_phone(self, e164_digits):
+        """Formata o número como usuários digitam (para testar normalização)"""
+        ddd, number = e164_digits[2:4], e164_digits[4:]
+        style = self.rng.random()
+        if style < 0.4:
+            return e164_digits
+        if style < 0.6:
+            return f"({ddd}) {number[:5]}-{number[5:]}"
+        if style < 0.8:
+            return f"+55 {ddd} {number[:5]} {number[5:]}"
+        if style < 0.9:
+            return f"{ddd}{number}"
+        return f"0{ddd}{number}"
+
+    def tags(self):
+        count = self.rng.choices([0, 1, 2, 3, 4], [0.35, 0.3, 0.2, 0.1, 0.05])[0]
+        chosen = []
+        for tag in self.rng.choices(TAGS, TAG_WEIGHTS, k=count):
+            if self.rng.random() < self.dirty_tag_rate:
+                tag = self.rng.choice([tag.capitalize(), tag.upper(), tag + ' ', ' ' + tag])
+            if tag not in chosen:
+                chosen.append(tag)
+        return chosen
+
+    def split(self, total, weights):
+        """Distribui `total` proporcionalmente aos pesos (soma exata)"""
+        weight_sum = sum(weights)
+        shares = [int(total * w / weight_sum) for w in weights]
+        for i in range(total - sum(shares)):
+            shares[i % len(shares)] += 1
+        return shares
+
+    def write(self, table, row):
+        self.writers[table].write(row)
+
+    # ------------------------------------------------------------------ geração
+
+    def run(self):
+        os.makedirs(self.out_dir, exist_ok=True)
+        for table, columns in TABLES:
+            self.writers[table] = TableWriter(self.out_dir, table, columns, self.fmt, self.compress)
+
+        tenants = self.counts['tenants']
+        # Poucos tenants grandes e muitos pequenos (Pareto)
+        weights = [self.rng.paretovariate(1.2) for _ in range(tenants)]
+        per_tenant = {key: self.split(self.counts[key], weights)
+                      for key in ('leads', 'deals', 'projects', 'activities', 'products',
+                                  'movements', 'messages')}
+
+        progress = ProgressReporter('mensagens', self.counts['messages'])
+        for index in range(tenants):
+            shares = {key: values[index] for key, values in per_tenant.items()}
+            self.generate_tenant(index, shares, progress)
+
+        for writer in self.writers.values():
+            writer.close()
+        progress.finish()
+        return write_manifest(
+            self.out_dir,
+            [self.writers[table].describe() for table, _ in TABLES],
+            generator='generate_crm_dataset',
+            seed=self.seed,
+            format=self.fmt,
+            counts=self.counts,
+            window={'start': self.start, 'end': self.end},
+        )
+
+    def generate_tenant(self, index, shares, progress):
+        rng = self.rng
+        owner_id = self.uuid()
+        company_id = self.uuid()
+        created = self.moment()
+        city, state, ddd = rng.choice(CITIES)
+        company_name = f"{rng.choice(LAST_NAMES)} {rng.choice(SECTORS)} {index + 1}"
+
+        self.write('auth.users', (owner_id, f"owner{index + 1}@bench.vbsolution.local", created))
+        self.write('public.companies', (
+            company_id, owner_id, company_name, f"{company_name} LTDA",
+            f"{rng.randint(10, 99)}.{rng.randint(100, 999)}.{rng.randint(100, 999)}/0001-{rng.randint(10, 99)}",
+            city, state, f"contato@empresa{index + 1}.com.br", self.mobile(ddd),
+            rng.choice(SECTORS), 'active', created, created,
+        ))
+
+        # Pipelines e etapas
+        stages = []
+        for p in range(rng.choice([1, 1, 2, 3])):
+            pipeline_id = self.uuid()
+            self.write('public.pipelines', (pipeline_id, owner_id, company_id,
+                                            'Pipeline Padrão' if p == 0 else f"Pipeline {p + 1}",
+                                            p == 0, created, created))
+            for position, name in enumerate(STAGE_NAMES):
+                stage_id = self.uuid()
+                probability = min(100, 10 + position * 25)
+                self.write('public.funnel_stages', (stage_id, owner_id, company_id, pipeline_id, name,
+                                                    position + 1, STAGE_COLORS[position], probability, created))
+                stages.append((stage_id, probability))
+        # Leads afunilam: etapas iniciais concentram mais registros
+        stage_weights = [0.5 ** (i % len(STAGE_NAMES)) for i in range(len(stages))]
+
+        products = []
+        for _ in range(max(1, shares['products'])):
+            product_id = self.uuid()
+            price = round(rng.lognormvariate(5, 1), 2)
+            when = self.moment(created)
+            self.write('public.products', (product_id, owner_id, company_id,
+                                           f"Produto {rng.randint(1, 99999)}", rng.choice(['product', 'service']),
+                                           f"SKU-{rng.randint(100000, 999999)}", price, 'unidade', 'active',
+                                           when, when))
+            products.append(product_id)
+
+        projects = []
+        for _ in range(shares['projects']):
+            project_id = self.uuid()
+            when = self.moment(created)
+            start_date = when.date()
+            end_date = start_date + datetime.timedelta(days=rng.randint(14, 180))
+            self.write('public.projects', (project_id, owner_id, company_id, f"Projeto {rng.randint(1, 9999)}",
+                                           rng.choice(PROJECT_STATUS), rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0],
+                                           start_date, end_date, round(rng.uniform(5000, 500000), 2),
+                                           when, self.moment(when)))
+            projects.append(project_id)
+
+        for _ in range(shares['leads']):
+            stage_id, probability = rng.choices(stages, stage_weights)[0]
+            when = self.moment(created)
+            updated = self.moment(when)
+            name = self.person()
+            if probability >= 100:
+                status = rng.choice(['won', 'won', 'lost'])
+            else:
+                status = rng.choice(['hot', 'cold', 'cold'])
+            deleted_at = self.moment(updated) if rng.random() < 0.03 else None
+            self.write('public.leads', (self.uuid(), owner_id, company_id, name,
+                                        f"{ascii_slug(name.split()[0])}{rng.randint(1, 99999)}@mail.com",
+                                        self.messy_phone(self.mobile(rng.choice(CITIES)[2])),
+                                        rng.choice(LEAD_SOURCES), rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0],
+                                        stage_id, status, round(rng.lognormvariate(8, 1.2), 2), self.tags(),
+                                        when, updated, deleted_at))
+
+        for _ in range(shares['deals']):
+            stage_id, probability = rng.choices(stages, stage_weights)[0]
+            when = self.moment(created)
+            self.write('public.deals', (self.uuid(), owner_id, company_id, rng.choice(products), stage_id,
+                                        f"Negócio {rng.randint(1, 99999)}", round(rng.lognormvariate(9, 1.3), 2),
+                                        probability, (when + datetime.timedelta(days=rng.randint(7, 120))).date(),
+                                        'won' if probability >= 100 else rng.choice(['active', 'active', 'lost']),
+                                        when, self.moment(when)))
+
+        for _ in range(shares['activities']):
+            when = self.moment(created)
+            status = rng.choices(ACTIVITY_STATUS, ACTIVITY_STATUS_WEIGHTS)[0]
+            estimated = round(rng.choice([0.5, 1, 2, 4, 8, 16]) * rng.uniform(0.8, 1.2), 2)
+            actual = round(estimated * rng.lognormvariate(0.1, 0.4), 2) if status == 'completed' else None
+            priority = rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0]
+            self.write('public.activities', (
+                self.uuid(), owner_id, company_id, f"Atividade {rng.randint(1, 999999)}",
+                rng.choice(ACTIVITY_TYPES), priority, status,
+                when + datetime.timedelta(days=rng.randint(-5, 30)),
+                rng.choice(projects) if projects and rng.random() < 0.7 else None,
+                rng.choice(WORK_GROUPS), rng.choice(DEPARTMENTS), estimated, actual,
+                priority == 'urgent', 100 if status == 'completed' else rng.choice([0, 25, 50, 75]),
+                when, self.moment(when),
+            ))
+
+        for _ in range(shares['movements']):
+            movement_type = rng.choices(['in', 'out', 'adjustment'], [0.4, 0.55, 0.05])[0]
+            self.write('public.inventory_movements', (
+                self.uuid(), owner_id, rng.choice(products), movement_type,
+                rng.randint(1, 200) if movement_type != 'adjustment' else rng.randint(-20, 20),
+                None, {'in': 'purchase_order', 'out': 'sales_order'}.get(movement_type, 'adjustment'),
+                self.moment(created),
+            ))
+
+        self.generate_chats(owner_id, company_id, shares['messages'], progress)
+
+    def chat_length(self, remaining):
+        """Tamanho de conversa com cauda pesada (poucas conversas gigantes)"""
+        if self.rng.random() < 0.0005:
+            length = self.rng.randint(20000, 150000)
+        else:
+            length = max(1, int(self.rng.lognormvariate(3.0, 1.4)))
+        return min(length, remaining)
+
+    def generate_chats(self, owner_id, company_id, budget, progress):
+        rng = self.rng
+        connection_id = f"conn_{owner_id[:8]}"
+        remaining = budget
+        while remaining > 0:
+            length = self.chat_length(remaining)
+            remaining -= length
+
+            city_ddd = rng.choice(CITIES)[2]
+            phone = self.mobile(city_ddd)
+            chat_id = f"{phone}@s.whatsapp.net"
+            contact_name = self.person()
+            wpp_name = contact_name if rng.random() < 0.85 else None
+            atendimento_id = self.uuid()
+            first_at = self.moment()
+
+            self.write('public.contacts', (self.uuid(), owner_id, company_id, contact_name, wpp_name,
+                                           self.messy_phone(phone), None, 'active', first_at, first_at))
+
+            last_at, last_preview, unread = self.generate_messages(
+                owner_id, atendimento_id, chat_id, phone, wpp_name, connection_id, first_at, length)
+
+            self.write('public.whatsapp_atendimentos', (atendimento_id, owner_id, company_id, connection_id,
+                                                        phone, contact_name, 'active', last_preview, last_at,
+                                                        unread, first_at, last_at))
+            progress.update(length)
+
+    def generate_messages(self, owner_id, atendimento_id, chat_id, phone, wpp_name,
+                          connection_id, first_at, length):
+        rng = self.rng
+        # Rajadas de mensagens próximas separadas por pausas longas que cabem na janela
+        span = max((self.end - first_at).total_seconds(), 60)
+        burst_gap = 45.0
+        long_gap = max(burst_gap, (span - 0.8 * length * burst_gap) / max(0.2 * length, 1))
+        unread_tail = rng.choice([0, 0, 0, 1, 2, 3, 5])
+
+        at = first_at
+        sender = 'CLIENTE'
+        unread = 0
+        preview = ''
+        for i in range(length):
+            if i:
+                gap = rng.expovariate(1 / burst_gap) if rng.random() < 0.8 else rng.expovariate(1 / long_gap)
+                at = at + datetime.timedelta(seconds=gap)
+                if rng.random() < 0.45:
+                    sender = 'ATENDENTE' if sender == 'CLIENTE' else 'CLIENTE'
+            msg_type = rng.choices(MESSAGE_TYPES, MESSAGE_TYPE_WEIGHTS)[0]
+            text = rng.choice(CHAT_PHRASES) if msg_type == 'TEXTO' else ''
+            message_id = f"3EB0{rng.getrandbits(64):016X}"
+            media_url = None
+            if msg_type != 'TEXTO':
+                media_url = f"https://media.bench.local/{owner_id}/{message_id}"
+            lida = not (sender == 'CLIENTE' and i >= length - unread_tail)
+            unread += not lida
+            raw = None
+            if self.with_raw:
+                raw = {
+                    'key': {'remoteJid': chat_id, 'fromMe': sender == 'ATENDENTE', 'id': message_id},
+                    'pushName': wpp_name,
+                    'messageTimestamp': int(at.timestamp()),
+                    'message': {'conversation': text} if msg_type == 'TEXTO'
+                    else {'mediaMessage': {'mimetype': MEDIA_MIMES[msg_type], 'url': media_url}},
+                }
+            preview = text or f"[{msg_type}]"
+            self.write('public.whatsapp_mensagens', (
+                self.uuid(), owner_id, atendimento_id, chat_id, message_id, phone,
+                wpp_name if sender == 'CLIENTE' else None, connection_id, text, msg_type, msg_type.lower(),
+                'ATIVO', sender, at, lida, media_url, MEDIA_MIMES.get(msg_type), raw, at, at,
+            ))
+        return at, preview[:160], unread
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Gera dataset sintético do CRM para benchmarks")
+    parser.add_argument('--out', required=True, help="Diretório de saída")
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small', help="Volumes pré-definidos")
+    for key in SCALES['small']:
+        parser.add_argument(f"--{key}", type=int, help=f"Sobrescreve a quantidade de {key}")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['copy', 'ndjson'], default='copy')
+    parser.add_argument('--no-compress', action='store_true', help="Não comprimir com gzip")
+    parser.add_argument('--days', type=int, default=365, help="Janela de histórico em dias")
+    parser.add_argument('--no-raw', action='store_true', help="Não gerar payload raw das mensagens")
+    parser.add_argument('--dirty-tag-rate', type=float, default=0.05,
+                        help="Fração de tags com caixa/espaços inconsistentes")
+    args = parser.parse_args()
+
+    counts = dict(SCALES[args.scale])
+    for key in counts:
+        if getattr(args, key) is not None:
+            counts[key] = getattr(args, key)
+    if counts['tenants'] < 1:
+        print("❌ --tenants deve ser >= 1")
+        sys.exit(1)
+
+    print(f"🚀 Gerando dataset ({args.format}, seed={args.seed}) em {args.out}...")
+    for key, value in counts.items():
+        print(f"   {key}: {value:,}")
+
+    started = time.monotonic()
+    manifest = DatasetGenerator(
+        args.out, counts, seed=args.seed, fmt=args.format, compress=not args.no_compress,
+        days=args.days, with_raw=not args.no_raw, dirty_tag_rate=args.dirty_tag_rate,
+    ).run()
+
+    for table in manifest['tables']:
+        print(f"   ✅ {table['name']:<32} {table['rows']:>12,} linhas -> {table['file']}")
+    print(f"🎉 Dataset gerado em {time.monotonic() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
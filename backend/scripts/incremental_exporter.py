@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Exportação incremental guiada por watermarks de updated_at
+
+Guarda por tabela o último (updated_at, id) exportado e, a cada execução, exporta
+só as linhas alteradas desde então (os triggers update_updated_at_column mantêm a
+coluna). Tabelas com deleted_at (ex.: leads) também geram um arquivo de tombstones
+com os ids excluídos logicamente. Cada execução grava um diretório próprio com
+manifest.json; o estado só avança depois que o arquivo da tabela foi gravado.
+
+Índices necessários: supabase/migrations/20250920000000_incremental_sync_indexes.sql
+
+Uso:
+    python incremental_exporter.py --out /data/warehouse_sync
+    python incremental_exporter.py --out /data/warehouse_sync --tables leads activities --reset leads
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from dataset_io import TableWriter, file_sha256, write_manifest
+from pg_utils import ProgressReporter, fetch_table_columns, format_duration, get_pg_connection
+from table_exporter import iter_keyset_pages
+
+# Tabelas com trigger update_updated_at_column (fix_data_isolation.py)
+DEFAULT_TABLES = ['user_profiles', 'companies', 'projects', 'activities', 'products',
+                  'employees', 'leads', 'work_groups', 'calendar_events']
+STATE_NAME = 'sync_state.json'
+
+
+def load_state(path):
+    """Carrega os watermarks salvos ({tabela: {updated_at, id, deleted_at, deleted_id}})"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def save_state(path, state):
+    """Grava o estado de forma atômica (arquivo temporário + rename)"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as fh:
+        json.dump(state, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def _watermark(state, ts_key, id_key):
+    if state.get(ts_key) is None:
+        return None
+    return (datetime.datetime.fromisoformat(state[ts_key]), state[id_key])
+
+
+def export_changes(conn, table, columns, run_dir, cutoff, watermark, page_size):
+    """Exporta linhas com (updated_at, id) > watermark e updated_at < cutoff"""
+    writer = TableWriter(run_dir, table, columns, 'ndjson', compress=True)
+    progress = ProgressReporter(f"alterações {table}")
+    last_key = watermark
+    try:
+        pages = iter_keyset_pages(conn, table, columns, ['updated_at', 'id'], page_size,
+                                  where="updated_at IS NOT NULL AND updated_at < %(cutoff)s",
+                                  params={'cutoff': cutoff}, start_after=watermark)
+        for rows, last_key in pages:
+            for row in rows:
+                writer.write(row)
+            progress.update(len(rows))
+    finally:
+        writer.close()
+    return writer, last_key
+
+
+def export_deletes(conn, table, run_dir, cutoff, watermark, page_size):
+    """Exporta tombstones (id, deleted_at) de linhas excluídas logicamente desde o watermark"""
+    base = table.split('.')[-1]
+    writer = TableWriter(run_dir, f"{base}.deletes", ['id', 'deleted_at'], 'ndjson', compress=True)
+    last_key = watermark
+    try:
+        pages = iter_keyset_pages(conn, table, ['deleted_at', 'id'], ['deleted_at', 'id'], page_size,
+                                  where="deleted_at IS NOT NULL AND deleted_at < %(cutoff)s",
+                                  params={'cutoff': cutoff}, start_after=watermark)
+        for rows, last_key in pages:
+            for deleted_at, row_id in rows:
+                writer.write((row_id, deleted_at))
+    finally:
+        writer.close()
+    return writer, last_key
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Exportação incremental por watermark de updated_at")
+    parser.add_argument('--out', required=True, help="Diretório base (estado + uma pasta por execução)")
+    parser.add_argument('--tables', nargs='+', default=DEFAULT_TABLES)
+    parser.add_argument('--reset', nargs='*', default=[], help="Zera o watermark destas tabelas (export completo)")
+    parser.add_argument('--safety-lag', type=int, default=60,
+                        help="Ignora alterações mais recentes que N segundos (transações ainda abertas)")
+    parser.add_argument('--page-size', type=int, default=5000)
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    state_path = os.path.join(args.out, STATE_NAME)
+    state = load_state(state_path)
+    tables = [t if '.' in t else f"public.{t}" for t in args.tables]
+    for table in args.reset:
+        state.pop(table if '.' in table else f"public.{table}", None)
+
+    conn = get_pg_connection(args.dsn, application_name='incremental_exporter')
+    with conn.cursor() as cur:
+        cur.execute("SELECT now() - make_interval(secs => %s)", (args.safety_lag,))
+        cutoff = cur.fetchone()[0]
+    catalog = fetch_table_columns(conn, tables)
+
+    run_dir = os.path.join(args.out, cutoff.strftime('%Y%m%dT%H%M%SZ'))
+    os.makedirs(run_dir, exist_ok=True)
+    print(f"🚀 Exportação incremental até {cutoff.isoformat()} em {run_dir}...")
+
+    started = time.monotonic()
+    entries = []
+    for table in tables:
+        if table not in catalog:
+            print(f"   ⚠️ {table} não existe; ignorando")
+            continue
+        columns = [name for name, _, _ in catalog[table]]
+        if 'updated_at' not in columns or 'id' not in columns:
+            print(f"   ⚠️ {table} não tem updated_at/id; ignorando")
+            continue
+
+        table_state = dict(state.get(table, {}))
+        watermark = _watermark(table_state, 'updated_at', 'id')
+        writer, last_key = export_changes(conn, table, columns, run_dir, cutoff, watermark, args.page_size)
+        entry = writer.describe()
+        entry.update({
+            'sha256': file_sha256(writer.path),
+            'from_watermark': list(watermark) if watermark else None,
+            'to_watermark': list(last_key) if last_key else None,
+        })
+        entries.append(entry)
+        if last_key:
+            table_state['updated_at'], table_state['id'] = last_key[0].isoformat(), str(last_key[1])
+
+        deleted = 0
+        if 'deleted_at' in columns:
+            del_watermark = _watermark(table_state, 'deleted_at', 'deleted_id')
+            del_writer, del_key = export_deletes(conn, table, run_dir, cutoff, del_watermark, args.page_size)
+            deleted = del_writer.rows
+            del_entry = del_writer.describe()
+            del_entry.update({'sha256': file_sha256(del_writer.path), 'tombstones_for': table})
+            entries.append(del_entry)
+            if del_key:
+                table_state['deleted_at'], table_state['deleted_id'] = del_key[0].isoformat(), str(del_key[1])
+
+        conn.rollback()
+        state[table] = table_state
+        save_state(state_path, state)
+        print(f"   ✅ {table}: {entry['rows']:,} alteradas, {deleted:,} excluídas")
+
+    conn.close()
+    write_manifest(run_dir, entries, generator='incremental_exporter', format='ndjson', cutoff=cutoff)
+    print(f"🎉 Delta exportado em {format_duration(time.monotonic() - started)}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; tabelas concluídas já tiveram o watermark salvo")
+        sys.exit(1)
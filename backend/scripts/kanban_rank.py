@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Chaves fracionárias do Kanban (kanban_rank): rebalanceamento e benchmark
+
+Mover um card grava só a linha dele (move_lead/move_activity calculam uma chave
+entre as dos vizinhos). Com o tempo as chaves de uma coluna crescem; rebalance
+encontra as colunas com chave longa, sem chave ou empatada e reescreve a coluna
+inteira com chaves curtas e igualmente espaçadas, na ordem atual, numa única
+transação por coluna (UPDATE ... FROM unnest). Na primeira execução (--all) as
+chaves nascem da ordem por created_at.
+
+benchmark simula movimentos de cards (aleatórios, para o topo ou troca com o
+vizinho na mesma coluna) e compara as linhas gravadas com posição inteira (desloca
+todos os cards entre origem e destino) e com kanban_rank (1 linha por movimento +
+rebalanceamentos). Com os padrões, random e top gravam ~75x e ~90x menos linhas;
+em adjacent a posição inteira também só grava os dois cards e o ganho é ~2x.
+
+Estruturas: supabase/migrations/20251002000000_kanban_rank.sql
+
+Uso:
+    python kanban_rank.py status --table leads
+    python kanban_rank.py rebalance --table leads --all
+    python kanban_rank.py rebalance --table activities --max-length 12
+    python kanban_rank.py benchmark --cards 500 --columns 6 --moves 20000 --workload top
+"""
+
+import argparse
+import collections
+import math
+import random
+import sys
+import time
+
+from pg_utils import LoadThrottle, ProgressReporter, format_duration, get_pg_connection
+
+try:
+    from psycopg2 import errors as pg_errors
+except ImportError:
+    pg_errors = None
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+INDEX = {d: i for i, d in enumerate(DIGITS)}
+
+# Coluna do Kanban por tabela: (colunas que identificam a coluna, filtro de linhas vivas)
+BOARDS = {
+    'leads': (('company_id', 'stage_id'), 'deleted_at IS NULL'),
+    'activities': (('company_id', 'status'), 'true'),
+}
+
+
+def rank_between(before, after):
+    """Chave entre `before` e `after` (None = ponta); espelha public.rank_between"""
+    at_start, at_end = before is None, after is None
+    a, b = before or '', after
+    if b is not None and a >= b:
+        raise ValueError(f"rank_between: {a!r} deve ser menor que {b!r}")
+    prefix = ''
+    while True:
+        if b is not None:
+            n = 0
+            while n < len(b) and (a[n] if n < len(a) else '0') == b[n]:
+                n += 1
+            prefix += b[:n]
+            a, b = a[n:], b[n:]
+        da = INDEX[a[0]] if a else 0
+        db = INDEX[b[0]] if b else BASE
+        if db - da > 1:
+            if at_end and not at_start and a:
+                digit = da + 1
+            elif at_start and not at_end and b is not None:
+                digit = db - 1
+            else:
+                digit = (da + db) // 2
+            return prefix + DIGITS[digit]
+        if b is not None and len(b) > 1:
+            return prefix + b[0]
+        prefix += DIGITS[da]
+        a, b = a[1:], None
+
+
+def spaced_keys(count):
+    """`count` chaves crescentes, curtas e igualmente espaçadas (sem '0' no final)"""
+    if count <= 0:
+        return []
+    width = max(1, math.ceil(math.log(count + 1, BASE))) + 1
+    space = BASE ** width
+    keys = []
+    for i in range(1, count + 1):
+        value = i * space // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, BASE)
+            digits.append(DIGITS[digit])
+        keys.append(''.join(reversed(digits)).rstrip('0'))
+    return keys
+
+
+def column_stats(conn, table, max_length, include_all=False):
+    """[(chave da coluna, cards, maior chave, sem chave, empatadas)] que precisam de rebalanceamento"""
+    keys, live = BOARDS[table]
+    key_sql = ', '.join(keys)
+    having = "" if include_all else (
+        f"HAVING MAX(length(kanban_rank)) > {int(max_length)} "
+        "OR COUNT(*) FILTER (WHERE kanban_rank IS NULL) > 0 "
+        "OR COUNT(kanban_rank) > COUNT(DISTINCT kanban_rank)"
+    )
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {key_sql}, COUNT(*), COALESCE(MAX(length(kanban_rank)), 0),
+                   COUNT(*) FILTER (WHERE kanban_rank IS NULL),
+                   COUNT(kanban_rank) - COUNT(DISTINCT kanban_rank)
+            FROM public.{table}
+            WHERE {live}
+            GROUP BY {key_sql}
+            {having}
+            ORDER BY COUNT(*) DESC
+        """)
+        rows = cur.fetchall()
+    conn.commit()
+    return [(tuple(row[:len(keys)]),) + tuple(row[len(keys):]) for row in rows]
+
+
+def rebalance_column(conn, table, column_key):
+    """Reescreve as chaves de uma coluna na ordem atual; retorna linhas alteradas"""
+    keys, live = BOARDS[table]
+    match = ' AND '.join(f"{k} IS NOT DISTINCT FROM %s" for k in keys)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT id FROM public.{table}
+            WHERE {match} AND {live}
+            ORDER BY kanban_rank NULLS LAST, created_at, id
+            FOR UPDATE
+        """, column_key)
+        ids = [str(row[0]) for row in cur.fetchall()]
+        cur.execute(f"""
+            UPDATE public.{table} t
+            SET kanban_rank = r.rank
+            FROM unnest(%s::uuid[], %s::text[]) AS r(id, rank)
+            WHERE t.id = r.id AND t.kanban_rank IS DISTINCT FROM r.rank
+        """, (ids, spaced_keys(len(ids))))
+        changed = cur.rowcount
+    conn.commit()
+    return changed
+
+
+def run_rebalance(conn, args):
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = %s", (f"{int(args.lock_timeout_ms)}ms",))
+    conn.commit()
+    columns = column_stats(conn, args.table, args.max_length, args.all)
+    cards = sum(row[1] for row in columns)
+    print(f"🚀 Rebalanceando {len(columns)} colunas de {args.table} ({cards:,} cards)...")
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    progress = ProgressReporter('cards', cards)
+    changed = 0
+    for column_key, count, *_ in columns:
+        throttle.wait()
+        try:
+            changed += rebalance_column(conn, args.table, column_key)
+        except Exception as e:
+            conn.rollback()
+            if pg_errors and isinstance(e, (pg_errors.LockNotAvailable, pg_errors.QueryCanceled)):
+                print(f"⚠️ Coluna {column_key} ocupada; fica para a próxima execução")
+                continue
+            raise
+        progress.update(count)
+    progress.finish()
+    return changed
+
+
+def run_status(conn, args):
+    columns = column_stats(conn, args.table, args.max_length, include_all=True)
+    lengths = collections.Counter()
+    for column_key, count, longest, missing, tied in columns:
+        lengths[longest] += 1
+        flag = '⚠️' if longest > args.max_length or missing or tied else '✅'
+        if flag == '⚠️' or args.verbose:
+            print(f"   {flag} {column_key}: {count} cards, maior chave {longest}, "
+                  f"sem chave {missing}, empatadas {tied}")
+    print(f"📊 {len(columns)} colunas; maior chave por coluna: "
+          + ', '.join(f"{length}:{n}" for length, n in sorted(lengths.items())))
+
+
+def simulate(cards, columns, moves, workload, max_length, seed):
+    """Linhas gravadas com posição inteira e com kanban_rank para a mesma sequência de movimentos"""
+    rng = random.Random(seed)
+    board = [[] for _ in range(columns)]
+    for card in range(cards):
+        board[card % columns].append(card)
+    ranks = [dict(zip(col, spaced_keys(len(col)))) for col in board]
+    integer_writes = rank_writes = rebalances = longest = 0
+
+    for _ in range(moves):
+        source = rng.choice([c for c in range(columns) if board[c]])
+        old = rng.randrange(len(board[source]))
+        card = board[source].pop(old)
+        del ranks[source][card]
+        # adjacent: troca com o vizinho na mesma coluna (reordenação fina)
+        target = source if workload == 'adjacent' else rng.randrange(columns)
+        column = board[target]
+        if workload == 'top':
+            new = 0
+        elif workload == 'adjacent':
+            new = max(0, min(len(column), old + rng.choice((-1, 1))))
+        else:
+            new = rng.randint(0, len(column))
+
+        # Posição inteira: o card e todos os deslocados nas duas colunas
+        if target == source:
+            integer_writes += abs(new - old) + 1
+        else:
+            integer_writes += (len(board[source]) - old) + (len(column) - new) + 1
+
+        before = ranks[target][column[new - 1]] if new > 0 else None
+        after = ranks[target][column[new]] if new < len(column) else None
+        key = rank_between(before, after)
+        column.insert(new, card)
+        ranks[target][card] = key
+        rank_writes += 1
+        longest = max(longest, len(key))
+        if len(key) > max_length:
+            ranks[target] = dict(zip(column, spaced_keys(len(column))))
+            rank_writes += len(column)
+            rebalances += 1
+
+    return {'integer': integer_writes, 'rank': rank_writes, 'rebalances': rebalances, 'longest_key': longest}
+
+
+def run_benchmark(args):
+    print(f"🧪 {args.moves:,} movimentos '{args.workload}' em {args.columns} colunas com {args.cards} cards "
+          f"(rebalanceia acima de {args.max_length} caracteres)")
+    started = time.monotonic()
+    result = simulate(args.cards, args.columns, args.moves, args.workload, args.max_length, args.seed)
+    per_move_int = result['integer'] / args.moves
+    per_move_rank = result['rank'] / args.moves
+    print(f"   posição inteira: {result['integer']:>12,} linhas ({per_move_int:.1f}/movimento)")
+    print(f"   kanban_rank:     {result['rank']:>12,} linhas ({per_move_rank:.2f}/movimento, "
+          f"{result['rebalances']} rebalanceamentos, maior chave {result['longest_key']})")
+    print(f"✅ {per_move_int / per_move_rank:.1f}x menos gravações em {format_duration(time.monotonic() - started)}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Rebalanceamento e benchmark das chaves do Kanban")
+    parser.add_argument('command', choices=['status', 'rebalance', 'benchmark'])
+    parser.add_argument('--table', choices=sorted(BOARDS), default='leads')
+    parser.add_argument('--max-length', type=int, default=12, help="Rebalanceia colunas com chave maior que isto")
+    parser.add_argument('--all', action='store_true', help="rebalance: todas as colunas (carga inicial)")
+    parser.add_argument('--verbose', action='store_true', help="status: lista todas as colunas")
+    parser.add_argument('--lock-timeout-ms', type=int, default=2000)
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--cards', type=int, default=500, help="benchmark: cards no quadro")
+    parser.add_argument('--columns', type=int, default=6, help="benchmark: colunas")
+    parser.add_argument('--moves', type=int, default=20000, help="benchmark: movimentos")
+    parser.add_argument('--workload', choices=['random', 'top', 'adjacent'], default='random')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.command == 'benchmark':
+        run_benchmark(args)
+        return
+
+    conn = get_pg_connection(args.dsn, application_name='kanban_rank')
+    started = time.monotonic()
+    try:
+        if args.command == 'status':
+            run_status(conn, args)
+        else:
+            changed = run_rebalance(conn, args)
+            print(f"🎉 {changed:,} cards com chave nova em {format_duration(time.monotonic() - started)}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; colunas concluídas já foram confirmadas")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
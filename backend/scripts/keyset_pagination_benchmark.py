@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark de paginação OFFSET x keyset para conversas e mensagens do WhatsApp
+
+Percorre a conversa (ou a caixa de entrada) página a página com o cursor das
+funções *_keyset e, em profundidades amostradas, mede a mesma página via
+OFFSET na mesma ordenação (get_conversations_optimized para conversas; para
+mensagens, a consulta de get_conversation_messages_optimized em ordem DESC, já
+que a função ordena ASC). Com keyset a latência deve ficar estável
+independente da profundidade; com OFFSET ela cresce linearmente.
+
+Uso:
+    python keyset_pagination_benchmark.py messages --owner <uuid>            # maior conversa do owner
+    python keyset_pagination_benchmark.py messages --owner <uuid> --chat 5511...@s.whatsapp.net
+    python keyset_pagination_benchmark.py conversations --owner <uuid> --page-size 20
+"""
+
+import argparse
+import json
+import sys
+
+from pg_utils import get_pg_connection, latency_summary, time_query
+
+QUERIES = {
+    'messages': {
+        'keyset': "SELECT * FROM public.get_conversation_messages_keyset(%(owner)s, %(chat)s, %(limit)s, %(cursor)s)",
+        # get_conversation_messages_optimized ordena ASC; o OFFSET é medido na mesma
+        # ordem do keyset (mais recentes primeiro) para comparar a mesma página
+        'offset': """
+            SELECT m.id::TEXT, m.message_id, m.chat_id, m.phone, m.conteudo, m.message_type, m.media_url,
+                   m.media_mime, m.remetente, m.status, m.lida, m.timestamp, m.owner_id, m.connection_id
+            FROM public.whatsapp_mensagens m
+            WHERE m.owner_id = %(owner)s AND m.chat_id = %(chat)s
+            ORDER BY m.timestamp DESC NULLS FIRST, m.id::TEXT DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        """,
+    },
+    'conversations': {
+        'keyset': "SELECT * FROM public.get_conversations_keyset(%(owner)s, %(limit)s, %(cursor)s)",
+        'offset': "SELECT * FROM public.get_conversations_optimized(%(owner)s, %(limit)s, %(offset)s)",
+    },
+}
+
+
+def largest_chat(conn, owner_id):
+    """Conversa com mais mensagens do owner (via resumo whatsapp_conversations)"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT chat_id, total_messages FROM public.whatsapp_conversations
+            WHERE owner_id = %s ORDER BY total_messages DESC LIMIT 1
+        """, (owner_id,))
+        row = cur.fetchone()
+    conn.commit()
+    return row
+
+
+def sample_depths(max_pages):
+    """Profundidades 1, 2, 5, 10, 20, 50, ... até max_pages"""
+    depths = []
+    base = 1
+    while base <= max_pages:
+        for step in (1, 2, 5):
+            if base * step <= max_pages:
+                depths.append(base * step)
+        base *= 10
+    if max_pages not in depths:
+        depths.append(max_pages)
+    return depths
+
+
+def run_benchmark(conn, kind, owner_id, chat_id, page_size, max_pages, repeat):
+    """Retorna [{page, keyset: resumo, offset: resumo}] nas profundidades amostradas"""
+    queries = QUERIES[kind]
+    depths = set(sample_depths(max_pages))
+    results = []
+    cursor = None
+    for page in range(1, max_pages + 1):
+        params = {'owner': owner_id, 'chat': chat_id, 'limit': page_size, 'cursor': cursor}
+        keyset_ms, rows = time_query(conn, queries['keyset'], params, repeat if page in depths else 1)
+        if page in depths:
+            offset_params = dict(params, offset=(page - 1) * page_size)
+            offset_ms, _ = time_query(conn, queries['offset'], offset_params, repeat)
+            results.append({
+                'page': page,
+                'rows_skipped': (page - 1) * page_size,
+                'keyset': latency_summary(keyset_ms),
+                'offset': latency_summary(offset_ms),
+            })
+            print(f"   página {page:>6}: keyset p50 {results[-1]['keyset']['p50']:>8.2f} ms | "
+                  f"offset p50 {results[-1]['offset']['p50']:>8.2f} ms")
+        if len(rows) < page_size:
+            break
+        cursor = rows[-1][-1]  # next_cursor é a última coluna
+    return results
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Compara paginação OFFSET x keyset")
+    parser.add_argument('kind', choices=sorted(QUERIES))
+    parser.add_argument('--owner', required=True, help="owner_id a consultar")
+    parser.add_argument('--chat', help="chat_id (messages; padrão: maior conversa do owner)")
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--max-pages', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5, help="Repetições por profundidade amostrada")
+    parser.add_argument('--json', help="Grava os resultados neste arquivo")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='keyset_pagination_benchmark')
+    chat_id = args.chat
+    if args.kind == 'messages' and not chat_id:
+        row = largest_chat(conn, args.owner)
+        if not row:
+            print("❌ Owner sem conversas em whatsapp_conversations")
+            sys.exit(1)
+        chat_id = row[0]
+        print(f"💬 Usando a maior conversa: {chat_id} ({row[1]:,} mensagens)")
+
+    print(f"🚀 Benchmark {args.kind}: páginas de {args.page_size}, até {args.max_pages} páginas...")
+    results = run_benchmark(conn, args.kind, args.owner, chat_id, args.page_size, args.max_pages, args.repeat)
+    conn.close()
+
+    if results:
+        first, last = results[0], results[-1]
+        print(f"📊 keyset: {first['keyset']['p50']:.2f} ms -> {last['keyset']['p50']:.2f} ms | "
+              f"offset: {first['offset']['p50']:.2f} ms -> {last['offset']['p50']:.2f} ms "
+              f"(página {last['page']})")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump({'kind': args.kind, 'owner': args.owner, 'chat': chat_id,
+                       'page_size': args.page_size, 'results': results}, fh, indent=2)
+        print(f"💾 Resultados gravados em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
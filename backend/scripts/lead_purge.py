@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Purga em lote de leads excluídos (soft delete) há mais que o período de retenção
+
+Substitui a limpeza que chamava force_delete_lead uma vez por lead: cada lote de
+leads com deleted_at anterior ao corte é travado com FOR UPDATE SKIP LOCKED e
+apagado por purge_leads (dependentes e leads com "lead_id = ANY($1)") numa única
+transação. O lote se adapta para mirar uma latência alvo, limitado por --max-batch,
+e o job pausa sob lag de replicação ou esperas por lock. Interromper é seguro:
+lotes concluídos ficam confirmados e o restante é purgado na próxima execução.
+
+Estruturas: supabase/migrations/20250927000000_lead_purge.sql
+Com --function cascade_delete_leads usa a função gerada por fk_cascade.py, que
+cobre todas as tabelas que referenciam leads segundo o catálogo.
+
+Uso:
+    python lead_purge.py --retention-days 30 --dry-run
+    python lead_purge.py --retention-days 30 --batch 200 --max-batch 2000
+    python lead_purge.py --retention-days 90 --company 00000000-0000-0000-0000-000000000000
+    python lead_purge.py --retention-days 30 --function cascade_delete_leads
+"""
+
+import argparse
+import collections
+import re
+import sys
+import time
+
+from pg_utils import AdaptiveChunker, LoadThrottle, ProgressReporter, format_duration, get_pg_connection
+
+try:
+    from psycopg2 import errors as pg_errors
+except ImportError:
+    pg_errors = None
+
+SELECT_BATCH_SQL = """
+    SELECT id FROM public.leads
+    WHERE deleted_at < %(cutoff)s
+      AND (%(company)s::uuid IS NULL OR company_id = %(company)s::uuid)
+    ORDER BY deleted_at, id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+
+def purge_cutoff(conn, retention_days):
+    """Instante de corte calculado no servidor (evita divergência de relógio)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT now() - make_interval(days => %s)", (retention_days,))
+        cutoff = cur.fetchone()[0]
+    conn.commit()
+    return cutoff
+
+
+def count_purgeable(conn, cutoff, company_id=None):
+    """{tabela: linhas a apagar} para o dry-run"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.count_purgeable_leads(%s, %s)", (cutoff, company_id))
+        counts = dict(cur.fetchall())
+    conn.commit()
+    return counts
+
+
+def purge(conn, cutoff, chunker, throttle, company_id=None, limit=None, lock_timeout_ms=2000,
+          function='purge_leads'):
+    """Apaga lotes até não restar candidato (ou até --limit); retorna {tabela: linhas apagadas}"""
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = %s", (f"{int(lock_timeout_ms)}ms",))
+    conn.commit()
+
+    pending = count_purgeable(conn, cutoff, company_id).get('leads', 0)
+    if limit:
+        pending = min(pending, limit)
+    progress = ProgressReporter('leads purgados', pending)
+    totals = collections.Counter()
+
+    while not limit or totals['leads'] < limit:
+        throttle.wait()
+        size = chunker.size if not limit else min(chunker.size, limit - totals['leads'])
+        started = time.monotonic()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(SELECT_BATCH_SQL, {'cutoff': cutoff, 'company': company_id, 'limit': size})
+                ids = [str(row[0]) for row in cur.fetchall()]
+                if not ids:
+                    conn.commit()
+                    break
+                cur.execute(f"SELECT * FROM public.{function}(%s::uuid[])", (ids,))
+                deleted = dict(cur.fetchall())
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if pg_errors and isinstance(e, (pg_errors.LockNotAvailable, pg_errors.QueryCanceled)):
+                print(f"⚠️ Lote bloqueado ({e.__class__.__name__}); reduzindo para {chunker.shrink()}")
+                continue
+            if pg_errors and isinstance(e, pg_errors.ForeignKeyViolation):
+                print(f"❌ Outra tabela ainda referencia os leads do lote: {str(e).strip()}")
+                print("   Gere o plano completo com: python fk_cascade.py install leads (e use --function cascade_delete_leads)")
+                sys.exit(1)
+            raise
+
+        chunker.record(time.monotonic() - started)
+        totals.update(deleted)
+        progress.update(deleted.get('leads', 0), lote=chunker.size)
+
+    progress.finish()
+    return totals
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Purga em lote de leads com soft delete")
+    parser.add_argument('--retention-days', type=int, default=30,
+                        help="Purga leads excluídos há mais que estes dias")
+    parser.add_argument('--company', help="Limita a uma company_id")
+    parser.add_argument('--batch', type=int, default=200, help="Tamanho inicial do lote de leads")
+    parser.add_argument('--min-batch', type=int, default=10)
+    parser.add_argument('--max-batch', type=int, default=2000, help="Teto do lote de leads")
+    parser.add_argument('--target-ms', type=int, default=500, help="Duração alvo por lote")
+    parser.add_argument('--limit', type=int, help="Máximo de leads nesta execução")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--lock-timeout-ms', type=int, default=2000)
+    parser.add_argument('--function', default='purge_leads',
+                        help="Função de purga por lote (ex.: cascade_delete_leads de fk_cascade.py)")
+    parser.add_argument('--dry-run', action='store_true', help="Só conta o que seria apagado")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if not re.fullmatch(r'[a-z_][a-z0-9_]*', args.function):
+        print(f"❌ Nome de função inválido: {args.function}")
+        sys.exit(1)
+    if args.retention_days < 0:
+        print("❌ --retention-days deve ser >= 0")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='lead_purge')
+    cutoff = purge_cutoff(conn, args.retention_days)
+    scope = f" da empresa {args.company}" if args.company else ""
+    print(f"🚀 Purga de leads{scope} excluídos antes de {cutoff:%Y-%m-%d %H:%M}"
+          f"{' (dry-run)' if args.dry_run else ''}...")
+
+    if args.dry_run:
+        for table, rows in count_purgeable(conn, cutoff, args.company).items():
+            print(f"   📋 {table:<20} {rows:>12,} linhas")
+        conn.close()
+        return
+
+    started = time.monotonic()
+    chunker = AdaptiveChunker(initial=min(args.batch, args.max_batch), minimum=args.min_batch,
+                              maximum=args.max_batch, target_seconds=args.target_ms / 1000.0)
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    try:
+        totals = purge(conn, cutoff, chunker, throttle, args.company, args.limit, args.lock_timeout_ms,
+                       args.function)
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; lotes concluídos já foram confirmados")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+    for table, rows in sorted(totals.items()):
+        print(f"   🗑️ {table:<20} {rows:>12,} linhas")
+    print(f"🎉 {totals['leads']:,} leads purgados em {format_duration(time.monotonic() - started)} "
+          f"(pausas por carga: {format_duration(throttle.total_paused)})")
+
+
+if __name__ == "__main__":
+    main()
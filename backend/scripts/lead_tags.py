@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Tags de leads: busca, contagem por empresa e renomeação/remoção em massa
+
+Renomear ou remover uma tag reescreve os arrays no servidor em lotes: cada lote
+seleciona pelo índice GIN (tags && origens) os leads que ainda têm alguma das
+tags de origem e troca todas de uma vez com um único UPDATE (mantendo a ordem
+das demais tags e sem duplicar o destino). Nenhum lead é lido para o Python;
+tag_normalizer.py usa o mesmo UPDATE com um mapa de várias origens.
+lead_tag_counts acompanha pelos triggers; verify compara com o recálculo e
+--repair reconstrói as empresas divergentes.
+
+Estruturas: supabase/migrations/20250929000000_lead_tags.sql
+
+Uso:
+    python lead_tags.py counts --company 00000000-0000-0000-0000-000000000000
+    python lead_tags.py search --company 00000000-0000-0000-0000-000000000000 --tag urgente --tag vip --any
+    python lead_tags.py rename --from Urgente --from URGENTE --to urgente
+    python lead_tags.py remove --tag teste --company 00000000-0000-0000-0000-000000000000
+    python lead_tags.py verify --repair
+"""
+
+import argparse
+import collections
+import sys
+import time
+
+from pg_utils import AdaptiveChunker, LoadThrottle, ProgressReporter, format_duration, get_pg_connection
+
+try:
+    from psycopg2 import errors as pg_errors
+except ImportError:
+    pg_errors = None
+
+# Aplica o mapa origem -> destino (destino NULL remove) num lote de leads
+REWRITE_BATCH_SQL = """
+    UPDATE public.leads l
+    SET tags = ARRAY(
+          SELECT r.tag
+          FROM (
+            SELECT COALESCE(m.target, CASE WHEN m.source IS NULL THEN u.tag END) AS tag, u.ord
+            FROM unnest(l.tags) WITH ORDINALITY AS u(tag, ord)
+            LEFT JOIN unnest(%(sources)s::text[], %(targets)s::text[]) AS m(source, target)
+              ON m.source = u.tag
+          ) r
+          WHERE r.tag IS NOT NULL
+          GROUP BY r.tag
+          ORDER BY MIN(r.ord)
+        ),
+        updated_at = now()
+    WHERE l.id IN (
+      SELECT id FROM public.leads
+      WHERE tags && %(sources)s::text[]
+        AND (%(company)s::uuid IS NULL OR company_id = %(company)s::uuid)
+        AND (%(after)s::uuid IS NULL OR id > %(after)s::uuid)
+      ORDER BY id
+      LIMIT %(limit)s
+      FOR UPDATE
+    )
+    RETURNING l.id
+"""
+
+DRIFT_SQL = """
+    WITH expected AS (
+      SELECT * FROM public.lead_tag_counts_expected(%(company)s)
+    ),
+    actual AS (
+      SELECT company_id, tag, lead_count FROM public.lead_tag_counts
+      WHERE %(company)s::uuid IS NULL OR company_id = %(company)s::uuid
+    )
+    SELECT COALESCE(e.company_id, a.company_id), COALESCE(e.tag, a.tag), e.lead_count, a.lead_count
+    FROM expected e
+    FULL JOIN actual a ON a.company_id = e.company_id AND a.tag = e.tag
+    WHERE e.lead_count IS DISTINCT FROM a.lead_count
+    ORDER BY 1, 2
+"""
+
+
+def tag_counts(conn, company_id, limit=100):
+    """[(tag, leads)] mais usadas da empresa, lidas do rollup"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.get_lead_tag_counts(%s, %s)", (company_id, limit))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def search(conn, company_id, tags, match='all', limit=50):
+    """Leads vivos da empresa com todas (all) ou alguma (any) das tags"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT id, name, tags, created_at
+            FROM public.search_leads_by_tags(%s, %s::text[], %s, %s)
+        """, (company_id, list(tags), match, limit))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def count_tagged(conn, sources, company_id=None):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COUNT(*) FROM public.leads
+            WHERE tags && %s::text[] AND (%s::uuid IS NULL OR company_id = %s::uuid)
+        """, (list(sources), company_id, company_id))
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def rewrite_tags(conn, mapping, chunker, throttle, company_id=None, lock_timeout_ms=2000,
+                 label='leads retagueados'):
+    """Aplica {tag origem: destino ou None} aos leads que têm alguma origem; retorna leads alterados
+
+    Cada lote pega pelo índice GIN os leads com alguma tag de origem e reescreve os
+    arrays num único UPDATE. O avanço é por id (keyset): se o trigger de
+    normalização devolver uma origem ao array, o lead não é revisitado.
+    """
+    mapping = {source: target for source, target in mapping.items() if source != target}
+    if not mapping:
+        return 0
+    sources = sorted(mapping)
+    params = {'sources': sources, 'targets': [mapping[s] for s in sources], 'company': company_id}
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = %s", (f"{int(lock_timeout_ms)}ms",))
+    conn.commit()
+
+    progress = ProgressReporter(label, count_tagged(conn, sources, company_id))
+    changed = 0
+    after = None
+    while True:
+        throttle.wait()
+        started = time.monotonic()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(REWRITE_BATCH_SQL, dict(params, limit=chunker.size, after=after))
+                ids = [row[0] for row in cur.fetchall()]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if pg_errors and isinstance(e, (pg_errors.LockNotAvailable, pg_errors.QueryCanceled)):
+                print(f"⚠️ Lote bloqueado ({e.__class__.__name__}); reduzindo para {chunker.shrink()}")
+                continue
+            raise
+        if not ids:
+            break
+        chunker.record(time.monotonic() - started)
+        after = max(ids, key=str)
+        changed += len(ids)
+        progress.update(len(ids), lote=chunker.size)
+    progress.finish()
+    return changed
+
+
+def retag(conn, sources, target, chunker, throttle, company_id=None, lock_timeout_ms=2000):
+    """Troca as tags `sources` por `target` (None remove) em lotes; retorna leads alterados"""
+    mapping = {source: target for source in set(sources)}
+    return rewrite_tags(conn, mapping, chunker, throttle, company_id, lock_timeout_ms)
+
+
+def find_drift(conn, company_id=None):
+    """[(company_id, tag, esperado, atual)] onde o rollup diverge dos leads"""
+    with conn.cursor() as cur:
+        cur.execute(DRIFT_SQL, {'company': company_id})
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def rebuild(conn, company_id=None):
+    with conn.cursor() as cur:
+        cur.execute("SELECT public.rebuild_lead_tag_counts(%s)", (company_id,))
+        rebuilt = cur.fetchone()[0]
+    conn.commit()
+    return rebuilt
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Busca, contagem e renomeação em massa de tags de leads")
+    parser.add_argument('command', choices=['counts', 'search', 'rename', 'remove', 'verify'])
+    parser.add_argument('--company', help="company_id (obrigatório em counts/search)")
+    parser.add_argument('--tag', action='append', default=[], help="search/remove: tag (repetível)")
+    parser.add_argument('--any', action='store_true', help="search: basta uma das tags")
+    parser.add_argument('--from', dest='sources', action='append', default=[],
+                        help="rename: tag de origem (repetível, várias viram uma)")
+    parser.add_argument('--to', dest='target', help="rename: tag de destino")
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--batch', type=int, default=500, help="Leads por lote inicial")
+    parser.add_argument('--max-batch', type=int, default=5000)
+    parser.add_argument('--target-ms', type=int, default=500, help="Duração alvo por lote")
+    parser.add_argument('--lock-timeout-ms', type=int, default=2000)
+    parser.add_argument('--repair', action='store_true', help="verify: reconstrói as empresas divergentes")
+    parser.add_argument('--show', type=int, default=10, help="verify: divergências exibidas")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.command in ('counts', 'search') and not args.company:
+        print(f"❌ {args.command} exige --company")
+        sys.exit(1)
+    if args.command in ('search', 'remove') and not args.tag:
+        print(f"❌ {args.command} exige ao menos uma --tag")
+        sys.exit(1)
+    if args.command == 'rename' and (not args.sources or not args.target):
+        print("❌ rename exige --from e --to")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='lead_tags')
+    started = time.monotonic()
+    try:
+        if args.command == 'counts':
+            rows = tag_counts(conn, args.company, args.limit)
+            print(f"🏷️ {len(rows)} tags da empresa {args.company}")
+            for tag, leads in rows:
+                print(f"   {tag:<30} {leads:>10,}")
+
+        elif args.command == 'search':
+            match = 'any' if args.any else 'all'
+            rows = search(conn, args.company, args.tag, match, args.limit)
+            print(f"🔎 {len(rows)} leads com {'alguma' if args.any else 'todas'} de: {', '.join(args.tag)}")
+            for lead_id, name, tags, created_at in rows:
+                print(f"   {lead_id}  {created_at:%Y-%m-%d}  {name or '-'}  [{', '.join(tags or [])}]")
+
+        elif args.command in ('rename', 'remove'):
+            sources = args.sources if args.command == 'rename' else args.tag
+            target = args.target if args.command == 'rename' else None
+            chunker = AdaptiveChunker(initial=min(args.batch, args.max_batch), minimum=10,
+                                      maximum=args.max_batch, target_seconds=args.target_ms / 1000.0)
+            throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+            action = f"→ '{target}'" if target else "(remoção)"
+            print(f"🚀 {', '.join(sources)} {action}{f' na empresa {args.company}' if args.company else ''}...")
+            changed = retag(conn, sources, target, chunker, throttle, args.company, args.lock_timeout_ms)
+            print(f"🎉 {changed:,} leads alterados em {format_duration(time.monotonic() - started)}")
+
+        else:
+            drift = find_drift(conn, args.company)
+            companies = collections.Counter(company_id for company_id, _, _, _ in drift)
+            for company_id, tag, expected, actual in drift[:args.show]:
+                print(f"   ❌ {company_id} '{tag}': {actual} (esperado {expected})")
+            if not drift:
+                print("✅ lead_tag_counts confere com os leads")
+            elif args.repair:
+                for company_id in companies:
+                    rebuild(conn, company_id)
+                print(f"🔧 {len(companies)} empresas reconstruídas ({len(drift)} tags divergentes)")
+            else:
+                print(f"⚠️ {len(drift)} tags divergentes em {len(companies)} empresas; rode com --repair")
+                sys.exit(2)
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; lotes concluídos já foram confirmados")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
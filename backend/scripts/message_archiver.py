@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Arquivamento frio de whatsapp_mensagens por janela de retenção
+
+Para cada owner com linha em whatsapp_retention_policies, move as mensagens mais
+antigas que retention_days para whatsapp_mensagens_archive (partições mensais) ou
+para arquivos Parquet catalogados em whatsapp_archive_files. Cada lote é uma
+transação (DELETE ... RETURNING + INSERT, ou arquivo + catálogo + DELETE), então o
+job pode ser interrompido e retomado a qualquer momento sem estado externo. Entre
+lotes respeita lag de replicação e esperas de lock. No destino tabela o lote é um único
+comando: DELETE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING alimenta
+o INSERT, sem trazer as linhas ao cliente.
+
+Estruturas: supabase/migrations/20250923000000_whatsapp_message_archive.sql
+
+Uso:
+    python message_archiver.py run --dry-run
+    python message_archiver.py run --parquet-dir /data/wa_archive --max-lag 2
+    python message_archiver.py run --owner <uuid> --default-retention-days 365
+    python message_archiver.py fetch --owner <uuid> --chat 5511...@s.whatsapp.net --limit 100
+    python message_archiver.py status
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from dataset_io import file_sha256, to_json
+from pg_utils import (
+    AdaptiveChunker,
+    LoadThrottle,
+    ProgressReporter,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    quote_ident,
+)
+from table_exporter import ParquetTableWriter, pq
+
+HOT_TABLE = 'public.whatsapp_mensagens'
+ARCHIVE_TABLE = 'public.whatsapp_mensagens_archive'
+RAW_TABLE = 'public.whatsapp_mensagens_raw'
+
+# Payloads já desviados para a tabela lateral (20250924000000_whatsapp_raw_payload_offload.sql)
+RAW_EXPR = "COALESCE(m.raw, (SELECT r.raw FROM public.whatsapp_mensagens_raw r WHERE r.message_id = m.id)) AS raw"
+
+# Destino Parquet: as linhas precisam ir ao cliente para o arquivo
+SELECT_BATCH_SQL = """
+    SELECT {select} FROM public.whatsapp_mensagens m
+    WHERE owner_id = %(owner)s AND timestamp < %(cutoff)s
+    ORDER BY timestamp, id
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+"""
+
+# Destino tabela: trava, remove e copia o lote num único comando
+MOVE_SQL = """
+    WITH moved AS (
+      DELETE FROM public.whatsapp_mensagens m
+      WHERE m.id IN (
+        SELECT id FROM public.whatsapp_mensagens
+        WHERE owner_id = %(owner)s AND timestamp < %(cutoff)s
+        ORDER BY timestamp, id
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+      )
+      RETURNING {select}
+    )
+    INSERT INTO public.whatsapp_mensagens_archive ({columns})
+    SELECT {columns} FROM moved
+"""
+
+
+def load_policies(conn, owners=None, default_days=None):
+    """[(owner_id, retention_days, target)] das políticas (ou de --default-retention-days)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT owner_id::TEXT, retention_days, target FROM public.whatsapp_retention_policies")
+        policies = {owner: (days, target) for owner, days, target in cur.fetchall()}
+    conn.commit()
+    if default_days:
+        for owner in owners or []:
+            policies.setdefault(owner, (default_days, 'table'))
+    if owners:
+        policies = {owner: policy for owner, policy in policies.items() if owner in owners}
+    return [(owner, days, target) for owner, (days, target) in sorted(policies.items())]
+
+
+def archive_columns(conn):
+    """Colunas comuns às tabelas quente e de arquivo, na ordem da tabela quente, e se há tabela de raw"""
+    catalog = fetch_table_columns(conn, [HOT_TABLE, ARCHIVE_TABLE, RAW_TABLE])
+    conn.commit()
+    if ARCHIVE_TABLE not in catalog:
+        print("❌ whatsapp_mensagens_archive não existe; aplique a migration 20250923000000_whatsapp_message_archive.sql")
+        sys.exit(1)
+    archived = {name for name, _, _ in catalog[ARCHIVE_TABLE]}
+    columns = [(name, pg_type) for name, pg_type, _ in catalog[HOT_TABLE] if name in archived]
+    return columns, RAW_TABLE in catalog
+
+
+def count_pending(conn, owner_id, cutoff):
+    """Mensagens do owner que seriam arquivadas"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM public.whatsapp_mensagens WHERE owner_id = %s AND timestamp < %s",
+                    (owner_id, cutoff))
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+class OwnerArchiver:
+    """Move as mensagens antigas de um owner em lotes adaptativos"""
+
+    def __init__(self, conn, columns, throttle, chunker, parquet_dir=None, raw_side_table=False):
+        self.conn = conn
+        self.columns = [name for name, _ in columns]
+        self.pg_types = dict(columns)
+        self.column_sql = ', '.join(quote_ident(c) for c in self.columns)
+        self.select_sql = ', '.join(RAW_EXPR if c == 'raw' and raw_side_table else f"m.{quote_ident(c)}"
+                                    for c in self.columns)
+        self.throttle = throttle
+        self.chunker = chunker
+        self.parquet_dir = parquet_dir
+        self._partitions = set()
+        self._id_index = self.columns.index('id')
+        self._ts_index = self.columns.index('timestamp')
+        self._chat_index = self.columns.index('chat_id')
+
+    def _lock_batch(self, owner_id, cutoff):
+        with self.conn.cursor() as cur:
+            cur.execute(SELECT_BATCH_SQL.format(select=self.select_sql),
+                        {'owner': owner_id, 'cutoff': cutoff, 'limit': self.chunker.size})
+            return cur.fetchall()
+
+    def _ensure_partitions(self, owner_id, cutoff):
+        # Partições são por mês UTC (ensure_whatsapp_archive_partition): cria de uma vez
+        # os meses entre a mensagem mais antiga do owner e o cutoff
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT min(timestamp) FROM public.whatsapp_mensagens WHERE owner_id = %s AND timestamp < %s",
+                        (owner_id, cutoff))
+            oldest = cur.fetchone()[0]
+            if oldest is None:
+                return
+            month = oldest.astimezone(datetime.timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            last = cutoff.astimezone(datetime.timezone.utc)
+            while month <= last:
+                key = month.strftime('%Y-%m')
+                if key not in self._partitions:
+                    cur.execute("SELECT public.ensure_whatsapp_archive_partition(%s::timestamptz)", (month,))
+                    self._partitions.add(key)
+                month = (month + datetime.timedelta(days=32)).replace(day=1)
+        self.conn.commit()
+
+    def _move_to_table(self, owner_id, cutoff):
+        with self.conn.cursor() as cur:
+            cur.execute(MOVE_SQL.format(columns=self.column_sql, select=self.select_sql),
+                        {'owner': owner_id, 'cutoff': cutoff, 'limit': self.chunker.size})
+            return cur.rowcount
+
+    def _move_to_parquet(self, owner_id, rows):
+        first = rows[0]
+        # Nome determinístico pela primeira chave do lote: uma retomada regrava o mesmo arquivo
+        directory = os.path.join(self.parquet_dir, owner_id, first[self._ts_index].strftime('%Y%m'))
+        os.makedirs(directory, exist_ok=True)
+        name = f"{first[self._ts_index].strftime('%Y%m%dT%H%M%S')}-{first[self._id_index]}"
+        writer = ParquetTableWriter(directory, name, self.columns, self.pg_types)
+        writer.write_page(rows)
+        writer.close()
+        path = writer.path
+
+        timestamps = [row[self._ts_index] for row in rows if row[self._ts_index]]
+        chat_ids = sorted({row[self._chat_index] for row in rows if row[self._chat_index]})
+        ids = [str(row[self._id_index]) for row in rows]
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO public.whatsapp_archive_files
+                  (owner_id, path, chat_ids, min_timestamp, max_timestamp, row_count, sha256)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (path) DO UPDATE SET
+                  chat_ids = EXCLUDED.chat_ids, min_timestamp = EXCLUDED.min_timestamp,
+                  max_timestamp = EXCLUDED.max_timestamp, row_count = EXCLUDED.row_count,
+                  sha256 = EXCLUDED.sha256, created_at = now()
+            """, (owner_id, path, chat_ids, min(timestamps, default=None), max(timestamps, default=None),
+                  len(rows), file_sha256(path)))
+            cur.execute("DELETE FROM public.whatsapp_mensagens WHERE id = ANY(%s::uuid[])", (ids,))
+            return cur.rowcount
+
+    def run(self, owner_id, cutoff, target, progress):
+        """Arquiva até não restar mensagem antes do cutoff; retorna o total movido"""
+        moved = 0
+        if target != 'parquet':
+            self._ensure_partitions(owner_id, cutoff)
+        while True:
+            self.throttle.wait()
+            started = time.monotonic()
+            if target == 'parquet':
+                rows = self._lock_batch(owner_id, cutoff)
+                count = self._move_to_parquet(owner_id, rows) if rows else 0
+            else:
+                count = self._move_to_table(owner_id, cutoff)
+            self.conn.commit()
+            if not count:
+                return moved
+            self.chunker.record(time.monotonic() - started)
+            moved += count
+            progress.update(count, batch=self.chunker.size)
+
+
+def command_run(conn, args):
+    """Arquiva os owners com política de retenção"""
+    owners = args.owner
+    policies = load_policies(conn, owners, args.default_retention_days)
+    if not policies:
+        print("ℹ️ Nenhuma política de retenção (whatsapp_retention_policies vazia)")
+        return
+    columns, raw_side_table = archive_columns(conn)
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    chunker = AdaptiveChunker(initial=args.batch, maximum=args.max_batch, target_seconds=args.target_ms / 1000.0)
+    archiver = OwnerArchiver(conn, columns, throttle, chunker, args.parquet_dir, raw_side_table)
+
+    started = time.monotonic()
+    total = 0
+    for owner_id, days, target in policies:
+        target = args.target or target
+        if target == 'parquet' and not args.parquet_dir:
+            print(f"   ⚠️ owner {owner_id}: destino parquet exige --parquet-dir; ignorando")
+            continue
+        with conn.cursor() as cur:
+            cur.execute("SELECT now() - make_interval(days => %s)", (days,))
+            cutoff = cur.fetchone()[0]
+        conn.commit()
+
+        pending = count_pending(conn, owner_id, cutoff)
+        if args.dry_run or not pending:
+            print(f"   📋 owner {owner_id}: {pending:,} mensagens antes de {cutoff:%Y-%m-%d} ({target})")
+            continue
+        progress = ProgressReporter(f"owner {owner_id} -> {target}", pending)
+        moved = archiver.run(owner_id, cutoff, target, progress)
+        progress.finish()
+        total += moved
+
+    print(f"🎉 {total:,} mensagens arquivadas em {format_duration(time.monotonic() - started)} "
+          f"(pausas por carga: {format_duration(throttle.total_paused)})")
+
+
+def command_fetch(conn, args):
+    """Imprime em NDJSON as mensagens arquivadas de uma conversa (tabela + Parquet), mais recentes primeiro"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.get_archived_conversation_messages(%s, %s, %s)",
+                    (args.owner, args.chat, args.limit))
+        names = [d[0] for d in cur.description if d[0] != 'next_cursor']
+        messages = [dict(zip(names, row)) for row in cur.fetchall()]
+        cur.execute("SELECT path FROM public.get_archived_conversation_files(%s, %s)", (args.owner, args.chat))
+        paths = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    if paths and pq is None:
+        print("❌ pyarrow não instalado. Execute: pip install pyarrow", file=sys.stderr)
+        sys.exit(1)
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"⚠️ Arquivo catalogado ausente: {path}", file=sys.stderr)
+            continue
+        table = pq.read_table(path, filters=[('chat_id', '=', args.chat)])
+        for record in table.to_pylist():
+            messages.append({name: record.get(name) for name in names})
+        # Arquivos vêm do mais recente para o mais antigo; para quando já há o suficiente
+        if len(messages) >= args.limit * 2:
+            break
+
+    messages.sort(key=lambda m: (m['timestamp'] is not None, m['timestamp'], str(m['id'])), reverse=True)
+    for message in messages[:args.limit]:
+        sys.stdout.write(to_json(message) + '\n')
+
+
+def command_status(conn, _args):
+    """Tamanho e linhas estimadas por partição do arquivo, mais o catálogo Parquet"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, c.reltuples::BIGINT, pg_total_relation_size(c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname
+        """, (ARCHIVE_TABLE,))
+        partitions = cur.fetchall()
+        cur.execute("SELECT COUNT(*), COALESCE(SUM(row_count), 0) FROM public.whatsapp_archive_files")
+        files, file_rows = cur.fetchone()
+    conn.commit()
+    for name, rows, size in partitions:
+        print(f"   {name:<45} ~{max(rows, 0):>12,} linhas  {size / 1024 / 1024:>10.1f} MB")
+    print(json.dumps({'partitions': len(partitions), 'parquet_files': files, 'parquet_rows': int(file_rows)}))
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Arquivamento frio de whatsapp_mensagens")
+    parser.add_argument('command', choices=['run', 'fetch', 'status'])
+    parser.add_argument('--owner', action='append', help="run: limita a estes owner_id; fetch: owner da conversa")
+    parser.add_argument('--chat', help="fetch: chat_id")
+    parser.add_argument('--limit', type=int, default=100, help="fetch: mensagens a retornar")
+    parser.add_argument('--default-retention-days', type=int,
+                        help="run: retenção para owners de --owner sem política cadastrada")
+    parser.add_argument('--target', choices=['table', 'parquet'], help="run: sobrescreve o destino das políticas")
+    parser.add_argument('--parquet-dir', help="run: diretório base dos arquivos Parquet")
+    parser.add_argument('--batch', type=int, default=2000, help="Tamanho inicial do lote")
+    parser.add_argument('--max-batch', type=int, default=20000)
+    parser.add_argument('--target-ms', type=int, default=500, help="Duração alvo por lote")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dry-run', action='store_true', help="run: só conta o que seria arquivado")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='message_archiver')
+    if args.command == 'run':
+        command_run(conn, args)
+    elif args.command == 'fetch':
+        if not args.owner or len(args.owner) != 1 or not args.chat:
+            parser.error("fetch exige --owner (um) e --chat")
+        args.owner = args.owner[0]
+        command_fetch(conn, args)
+    else:
+        command_status(conn, args)
+    conn.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; lotes concluídos já foram confirmados e o job pode ser retomado")
+        sys.exit(1)
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos índices de whatsapp_mensagens por configuração
+
+performance-indexes.sql e as migrations de 20250907 criam vários índices em
+whatsapp_mensagens sem evidência de quais consultas os usam. Este script, para
+cada configuração de índices, remove/cria os índices candidatos, roda ANALYZE e
+repete as formas reais de consulta (wa-list-messages por atendimento_id/created_at,
+RPCs de conversa, filtros de não lidas e de tipo) com parâmetros amostrados da
+própria tabela. Registra p50/p95/p99, o plano (EXPLAIN) de cada consulta, os
+índices que o planner escolheu, o tamanho dos índices e o custo de inserção.
+
+Além dos candidatos abaixo, todo índice que já existir na tabela (pg_indexes) entra
+no jogo: 'none' remove tudo menos a PK e os índices de constraints, 'all' junta
+candidatos e existentes, e no final cada índice volta com a definição original.
+
+Pensado para um Postgres local carregado com o dataset sintético:
+    python generate_crm_dataset.py --out /tmp/crm_bench --scale large
+    python message_index_benchmark.py --dataset /tmp/crm_bench --report bench.json
+
+Uso:
+    python message_index_benchmark.py --report bench.json
+    python message_index_benchmark.py --configs none perf all --leave-one-out --samples 200
+    python message_index_benchmark.py --config minimal=idx_msgs_owner_chat_ts,idx_wa_msg_owner_time
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from pg_utils import format_duration, get_pg_connection, latency_summary, quote_ident, time_query
+
+TABLE = 'public.whatsapp_mensagens'
+
+# Índices candidatos (nome -> definição); a PK e os índices de constraints nunca são tocados
+CANDIDATE_INDEXES = {
+    # performance-indexes.sql
+    'idx_msgs_owner_chat_ts': "(owner_id, chat_id, timestamp DESC)",
+    'idx_msgs_owner_chat_id': "(owner_id, chat_id, id)",
+    'idx_msgs_unread': "(owner_id, chat_id, lida, timestamp DESC)",
+    'idx_msgs_type': "(owner_id, chat_id, message_type, timestamp DESC)",
+    # supabase/migrations/20250907_*
+    'idx_wa_msg_atendimento': "(atendimento_id)",
+    'idx_wa_msg_owner': "(owner_id)",
+    'idx_wa_msg_created': "(created_at DESC)",
+    'idx_wa_msg_owner_time': "(owner_id, atendimento_id, created_at)",
+}
+
+PRESET_CONFIGS = {
+    'none': [],
+    'perf': ['idx_msgs_owner_chat_ts', 'idx_msgs_owner_chat_id', 'idx_msgs_unread', 'idx_msgs_type'],
+    'migrations': ['idx_wa_msg_atendimento', 'idx_wa_msg_owner', 'idx_wa_msg_created', 'idx_wa_msg_owner_time'],
+}
+
+# Formas de consulta reais; 'explain' é a consulta interna quando 'sql' chama uma RPC plpgsql
+WORKLOADS = {
+    'wa_list_first_page': {
+        'sql': """SELECT * FROM public.whatsapp_mensagens WHERE atendimento_id = %(atendimento)s
+                  ORDER BY created_at DESC LIMIT 30""",
+    },
+    'wa_list_before': {
+        'sql': """SELECT * FROM public.whatsapp_mensagens WHERE atendimento_id = %(atendimento)s
+                  AND created_at < %(before)s ORDER BY created_at DESC LIMIT 30""",
+    },
+    'rpc_messages_offset': {
+        'sql': "SELECT * FROM public.get_conversation_messages_optimized(%(owner)s, %(chat)s, 50, 0)",
+        # Mesma consulta da função (supabase/functions/get_conversations_optimized.sql): ASC
+        'explain': """SELECT * FROM public.whatsapp_mensagens m WHERE m.owner_id = %(owner)s
+                      AND m.chat_id = %(chat)s ORDER BY m.timestamp ASC LIMIT 50 OFFSET 0""",
+    },
+    'rpc_messages_keyset': {
+        'sql': """SELECT * FROM public.get_conversation_messages_keyset(%(owner)s, %(chat)s, 50,
+                  public.encode_page_cursor(%(before_ts)s, %(id)s))""",
+        'explain': """SELECT * FROM public.whatsapp_mensagens m WHERE m.owner_id = %(owner)s
+                      AND m.chat_id = %(chat)s AND m.timestamp <= %(before_ts)s
+                      AND (m.timestamp < %(before_ts)s OR m.id::TEXT < %(id)s)
+                      ORDER BY m.timestamp DESC NULLS FIRST, m.id::TEXT DESC LIMIT 50""",
+    },
+    'chat_unread': {
+        'sql': """SELECT id, timestamp FROM public.whatsapp_mensagens WHERE owner_id = %(owner)s
+                  AND chat_id = %(chat)s AND lida = false ORDER BY timestamp DESC LIMIT 50""",
+    },
+    'owner_unread_counts': {
+        'sql': """SELECT chat_id, COUNT(*) FROM public.whatsapp_mensagens WHERE owner_id = %(owner)s
+                  AND remetente = 'CLIENTE' AND lida = false GROUP BY chat_id""",
+    },
+    'chat_type_filter': {
+        'sql': """SELECT id, timestamp FROM public.whatsapp_mensagens WHERE owner_id = %(owner)s
+                  AND chat_id = %(chat)s AND message_type = %(message_type)s
+                  ORDER BY timestamp DESC LIMIT 50""",
+    },
+}
+
+SAMPLE_SQL = """
+    SELECT owner_id, chat_id, atendimento_id, created_at, timestamp, id::TEXT, message_type
+    FROM public.whatsapp_mensagens TABLESAMPLE SYSTEM (%(percent)s) REPEATABLE (%(seed)s)
+    WHERE chat_id IS NOT NULL AND atendimento_id IS NOT NULL
+    LIMIT %(limit)s
+"""
+
+INSERT_PROBE_SQL = """
+    INSERT INTO public.whatsapp_mensagens (owner_id, atendimento_id, chat_id, message_id, phone,
+           connection_id, conteudo, tipo, message_type, status, remetente, timestamp, lida, created_at)
+    SELECT owner_id, atendimento_id, chat_id, message_id || '-bench', phone,
+           connection_id, conteudo, tipo, message_type, status, remetente, timestamp, lida, created_at
+    FROM public.whatsapp_mensagens TABLESAMPLE SYSTEM (1) REPEATABLE (7)
+    LIMIT %(rows)s
+"""
+
+
+def existing_indexes(conn):
+    """Índices atuais de whatsapp_mensagens fora a PK e os de constraints ({nome: indexdef})"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT i.indexname, i.indexdef FROM pg_indexes i
+            WHERE i.schemaname = 'public' AND i.tablename = 'whatsapp_mensagens'
+              AND NOT EXISTS (
+                SELECT 1 FROM pg_constraint c
+                WHERE c.conindid = format('%I.%I', i.schemaname, i.indexname)::regclass
+              )
+        """)
+        return dict(cur.fetchall())
+
+
+def index_catalog(original):
+    """DDL de cada índice conhecido: candidatos + existentes (a definição real prevalece)"""
+    catalog = {name: f"CREATE INDEX {quote_ident(name)} ON {TABLE} {columns}"
+               for name, columns in CANDIDATE_INDEXES.items()}
+    catalog.update(original)
+    return catalog
+
+
+def apply_config(conn, wanted, catalog):
+    """Remove os índices fora da configuração, cria os que faltam e roda ANALYZE"""
+    present = set(existing_indexes(conn))
+    with conn.cursor() as cur:
+        for name in sorted(present - set(wanted)):
+            cur.execute(f"DROP INDEX IF EXISTS public.{quote_ident(name)}")
+        for name in wanted:
+            if name not in present:
+                started = time.monotonic()
+                cur.execute(catalog[name])
+                print(f"   🔨 {name} criado em {format_duration(time.monotonic() - started)}")
+        cur.execute(f"ANALYZE {TABLE}")
+
+
+def restore_indexes(conn, definitions):
+    """Volta os índices da tabela ao estado original"""
+    with conn.cursor() as cur:
+        for name in sorted(set(existing_indexes(conn)) - set(definitions)):
+            cur.execute(f"DROP INDEX IF EXISTS public.{quote_ident(name)}")
+        present = existing_indexes(conn)
+        for name, definition in definitions.items():
+            if name not in present:
+                cur.execute(definition)
+        cur.execute(f"ANALYZE {TABLE}")
+
+
+def index_sizes(conn, names):
+    """Tamanho em bytes de cada índice"""
+    if not names:
+        return {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT relname, pg_relation_size(oid) FROM pg_class WHERE relname = ANY(%s)", (list(names),))
+        return dict(cur.fetchall())
+
+
+def sample_params(conn, count, seed):
+    """Amostra parâmetros reais (owner, chat, atendimento, cursores) da tabela"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", (TABLE,))
+        reltuples = max(cur.fetchone()[0], 1)
+        # ~10x a amostra pedida para ter variedade entre páginas do heap
+        percent = min(100.0, max(0.01, count * 10 * 100.0 / reltuples))
+        cur.execute(SAMPLE_SQL, {'percent': percent, 'seed': seed, 'limit': count * 10})
+        rows = cur.fetchall()
+    random.Random(seed).shuffle(rows)
+    return [
+        {'owner': owner, 'chat': chat, 'atendimento': atendimento, 'before': created_at,
+         'before_ts': ts, 'id': row_id, 'message_type': message_type or 'text'}
+        for owner, chat, atendimento, created_at, ts, row_id, message_type in rows[:count]
+    ]
+
+
+def _plan_indexes(node, found):
+    if 'Index Name' in node:
+        found.add(node['Index Name'])
+    for child in node.get('Plans', []):
+        _plan_indexes(child, found)
+    return found
+
+
+def explain(conn, sql, params):
+    """Plano em JSON com EXPLAIN (ANALYZE, BUFFERS); retorna (plano, índices usados)"""
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0], sorted(_plan_indexes(plan[0]['Plan'], set()))
+
+
+def insert_cost(conn, rows):
+    """ms por linha para inserir `rows` mensagens (transação desfeita no final)"""
+    with conn.cursor() as cur:
+        started = time.perf_counter()
+        cur.execute(INSERT_PROBE_SQL, {'rows': rows})
+        inserted = cur.rowcount
+        elapsed = (time.perf_counter() - started) * 1000.0
+    conn.rollback()
+    return round(elapsed / max(inserted, 1), 4)
+
+
+def run_config(conn, name, wanted, catalog, samples, warmup, insert_rows):
+    """Aplica a configuração e mede todas as formas de consulta"""
+    print(f"⚙️ Configuração {name}: {', '.join(wanted) or '(só PK)'}")
+    conn.autocommit = True
+    apply_config(conn, wanted, catalog)
+    conn.autocommit = False
+
+    result = {'indexes': wanted, 'index_bytes': index_sizes(conn, wanted), 'workloads': {}}
+    for workload, spec in WORKLOADS.items():
+        for params in samples[:warmup]:
+            time_query(conn, spec['sql'], params)
+        latencies = []
+        for params in samples:
+            elapsed, _ = time_query(conn, spec['sql'], params)
+            latencies.extend(elapsed)
+        plan, used = explain(conn, spec.get('explain', spec['sql']), samples[0])
+        conn.rollback()
+        summary = latency_summary(latencies)
+        result['workloads'][workload] = dict(summary, indexes_used=used, plan=plan)
+        print(f"   {workload:<22} p50 {summary['p50']:>8.2f} | p95 {summary['p95']:>8.2f} | "
+              f"p99 {summary['p99']:>8.2f} ms  {', '.join(used) or 'seq scan'}")
+
+    if insert_rows:
+        result['insert_ms_per_row'] = insert_cost(conn, insert_rows)
+        print(f"   {'insert':<22} {result['insert_ms_per_row']:.4f} ms/linha")
+    return result
+
+
+def unused_indexes(report):
+    """Candidatos que nenhuma consulta usou em nenhuma configuração em que existiam"""
+    unused = {}
+    for config in report['configs'].values():
+        used = set()
+        for workload in config['workloads'].values():
+            used.update(workload['indexes_used'])
+        for name in config['indexes']:
+            unused.setdefault(name, True)
+            if name in used:
+                unused[name] = False
+    return sorted(name for name, flag in unused.items() if flag)
+
+
+def parse_configs(args, catalog):
+    """Monta {nome: [índices]} a partir de --configs, --config e --leave-one-out"""
+    configs = {}
+    for name in args.configs:
+        if name == 'current':
+            continue
+        configs[name] = sorted(catalog) if name == 'all' else PRESET_CONFIGS[name]
+    for spec in args.config:
+        name, _, names = spec.partition('=')
+        wanted = [n for n in names.split(',') if n]
+        unknown = [n for n in wanted if n not in catalog]
+        if unknown:
+            raise SystemExit(f"❌ Índices desconhecidos em {name}: {', '.join(unknown)}")
+        configs[name] = wanted
+    if args.leave_one_out:
+        for name in sorted(catalog):
+            configs[f"all-{name}"] = [n for n in sorted(catalog) if n != name]
+    return configs
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Benchmark dos índices de whatsapp_mensagens")
+    parser.add_argument('--dataset', help="Carrega antes este dataset com bulk_loader.py --truncate")
+    parser.add_argument('--configs', nargs='+', default=['current', 'none', 'perf', 'migrations', 'all'],
+                        help=f"Configurações pré-definidas ({', '.join(['current', 'all'] + sorted(PRESET_CONFIGS))})")
+    parser.add_argument('--config', action='append', default=[], help="nome=idx1,idx2 (configuração extra)")
+    parser.add_argument('--leave-one-out', action='store_true', help="Adiciona 'all' menos cada índice")
+    parser.add_argument('--samples', type=int, default=100, help="Parâmetros amostrados por consulta")
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--insert-rows', type=int, default=5000, help="Linhas da sonda de inserção (0 desliga)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report', help="Grava o relatório JSON (com planos) neste arquivo")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.dataset:
+        loader = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bulk_loader.py')
+        command = [sys.executable, loader, '--dataset', args.dataset, '--truncate']
+        if args.dsn:
+            command += ['--dsn', args.dsn]
+        print(f"📦 Carregando {args.dataset}...")
+        subprocess.run(command, check=True)
+
+    conn = get_pg_connection(args.dsn, application_name='message_index_benchmark')
+    original = existing_indexes(conn)
+    catalog = index_catalog(original)
+    configs = {'current': sorted(original)} if 'current' in args.configs else {}
+    configs.update(parse_configs(args, catalog))
+
+    samples = sample_params(conn, args.samples, args.seed)
+    conn.rollback()
+    if not samples:
+        print("❌ whatsapp_mensagens vazia; carregue um dataset antes (--dataset)")
+        sys.exit(1)
+    print(f"🚀 {len(configs)} configurações x {len(WORKLOADS)} consultas x {len(samples)} amostras")
+
+    started = time.monotonic()
+    report = {'table': TABLE, 'samples': len(samples), 'seed': args.seed, 'configs': {}}
+    try:
+        for name, wanted in configs.items():
+            report['configs'][name] = run_config(conn, name, wanted, catalog, samples,
+                                              args.warmup, args.insert_rows)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        restore_indexes(conn, original)
+        conn.close()
+        print("↩️ Índices originais restaurados")
+
+    report['unused_indexes'] = unused_indexes(report)
+    if report['unused_indexes']:
+        print(f"🗑️ Nunca usados pelo planner: {', '.join(report['unused_indexes'])}")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fh:
+            json.dump(report, fh, indent=2, default=str)
+        print(f"💾 Relatório gravado em {args.report}")
+    print(f"🎉 Benchmark concluído em {format_duration(time.monotonic() - started)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Utilitários compartilhados para scripts que falam direto com o Postgres do Supabase
+(conexão, throttling por carga de produção e relatório de progresso)
+"""
+
+import os
+import sys
+import time
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:
+    psycopg2 = None
+
+
+def get_pg_connection(dsn=None, autocommit=False, application_name='vb-scripts'):
+    """Cria conexão direta com o Postgres usando SUPABASE_DB_URL ou DATABASE_URL"""
+    if psycopg2 is None:
+        print("❌ psycopg2 não instalado. Execute: pip install psycopg2-binary")
+        sys.exit(1)
+
+    dsn = dsn or os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
+    if not dsn:
+        print("❌ Defina SUPABASE_DB_URL (ou DATABASE_URL) com a connection string do Postgres")
+        sys.exit(1)
+
+    conn = psycopg2.connect(dsn, application_name=application_name)
+    conn.autocommit = autocommit
+    return conn
+
+
+def quote_ident(name):
+    """Escapa um identificador (tabela/coluna) para uso em SQL dinâmico"""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def qualified_name(table, schema='public'):
+    """Retorna schema.tabela escapado"""
+    if '.' in table:
+        schema, table = table.split('.', 1)
+    return f"{quote_ident(schema)}.{quote_ident(table)}"
+
+
+def estimate_row_count(conn, table, schema='public'):
+    """Estimativa barata de linhas via pg_class.reltuples (sem COUNT(*))"""
+    if '.' in table:
+        schema, table = table.split('.', 1)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT GREATEST(c.reltuples, 0)::bigint
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s
+        """, (schema, table))
+        row = cur.fetchone()
+    return row[0] if row else 0
+
+
+class LoadThrottle:
+    """Pausa o job enquanto o banco estiver sob carga (lag de replicação ou esperas por lock)"""
+
+    def __init__(self, conn, max_replication_lag=5.0, max_lock_waits=5,
+                 pause_seconds=2.0, max_pause_seconds=300.0):
+        self.conn = conn
+        self.max_replication_lag = max_replication_lag
+        self.max_lock_waits = max_lock_waits
+        self.pause_seconds = pause_seconds
+        self.max_pause_seconds = max_pause_seconds
+        self.total_paused = 0.0
+
+    def current_load(self):
+        """Retorna (lag de replicação em segundos, sessões esperando lock)"""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT
+                  COALESCE((SELECT MAX(EXTRACT(EPOCH FROM replay_lag)) FROM pg_stat_replication), 0),
+                  (SELECT COUNT(*) FROM pg_stat_activity
+                    WHERE wait_event_type = 'Lock' AND pid <> pg_backend_pid())
+            """)
+            lag, lock_waits = cur.fetchone()
+        if not self.conn.autocommit:
+            self.conn.commit()
+        return float(lag or 0), int(lock_waits or 0)
+
+    def wait(self):
+        """Bloqueia até a carga voltar aos limites configurados"""
+        waited = 0.0
+        while True:
+            lag, lock_waits = self.current_load()
+            if lag <= self.max_replication_lag and lock_waits <= self.max_lock_waits:
+                return waited
+            if waited >= self.max_pause_seconds:
+                print(f"⚠️ Carga ainda alta após {waited:.0f}s (lag={lag:.1f}s, locks={lock_waits}); seguindo mesmo assim")
+                return waited
+            print(f"⏸️ Pausando: lag={lag:.1f}s, esperas por lock={lock_waits}")
+            time.sleep(self.pause_seconds)
+            waited += self.pause_seconds
+            self.total_paused += self.pause_seconds
+
+
+class AdaptiveChunker:
+    """Ajusta o tamanho do lote para mirar uma latência alvo por lote"""
+
+    def __init__(self, initial=1000, minimum=100, maximum=50000, target_seconds=0.5):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+
+    def record(self, elapsed):
+        """Atualiza o tamanho do próximo lote a partir da latência observada"""
+        if elapsed <= 0:
+            factor = 2.0
+        else:
+            # Limitar a variação para não oscilar entre lotes
+            factor = min(2.0, max(0.5, self.target_seconds / elapsed))
+        self.size = int(min(self.maximum, max(self.minimum, self.size * factor)))
+        return self.size
+
+    def shrink(self):
+        """Reduz o lote pela metade (ex.: após lock_timeout)"""
+        self.size = max(self.minimum, self.size // 2)
+        return self.size
+
+
+class ProgressReporter:
+    """Imprime progresso, taxa e ETA em intervalos regulares"""
+
+    def __init__(self, label, total=None, every_seconds=5.0):
+        self.label = label
+        self.total = total
+        self.every_seconds = every_seconds
+        self.done = 0
+        self.started = time.monotonic()
+        self.last_report = self.started
+
+    def update(self, count, force=False, **extra):
+        self.done += count
+        now = time.monotonic()
+        if force or now - self.last_report >= self.every_seconds:
+            self.last_report = now
+            print(self.line(now, **extra))
+
+    def line(self, now=None, **extra):
+        now = now or time.monotonic()
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.done / elapsed
+        parts = [f"📊 {self.label}: {self.done:,}"]
+        if self.total:
+            pct = min(100.0, 100.0 * self.done / self.total)
+            parts[0] += f"/{self.total:,} ({pct:.1f}%)"
+            remaining = max(self.total - self.done, 0)
+            if rate > 0:
+                parts.append(f"ETA {format_duration(remaining / rate)}")
+        parts.append(f"{rate:,.0f}/s")
+        parts.extend(f"{k}={v}" for k, v in extra.items())
+        return " | ".join(parts)
+
+    def finish(self, **extra):
+        print(self.line(**extra).replace("📊", "✅", 1) + f" | total {format_duration(time.monotonic() - self.started)}")
+
+
+def format_duration(seconds):
+    """Formata segundos como 1h02m03s"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{secs:02d}s"
+    if minutes:
+        return f"{minutes}m{secs:02d}s"
+    return f"{secs}s"
+
+
+def fetch_table_columns(conn, tables):
+    """Ordem, tipo e NOT NULL das colunas de várias tabelas em uma única consulta ao catálogo
+
+    Retorna {'schema.tabela': [(coluna, tipo, not_null), ...]} na ordem física das colunas.
+    """
+    names = [t if '.' in t else f"public.{t}" for t in tables]
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT n.nspname || '.' || c.relname, a.attname,
+                   format_type(a.atttypid, a.atttypmod), a.attnotnull
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+            WHERE n.nspname || '.' || c.relname = ANY(%s)
+            ORDER BY 1, a.attnum
+        """, (names,))
+        rows = cur.fetchall()
+    columns = {}
+    for table, column, data_type, not_null in rows:
+        columns.setdefault(table, []).append((column, data_type, not_null))
+    return columns
+
+
+def fetch_foreign_keys(conn, schemas=('public',)):
+    """Lista as FKs do catálogo (pg_constraint) com colunas na ordem da constraint"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT con.conname,
+                   cn.nspname || '.' || cc.relname AS child,
+                   ARRAY(SELECT a.attname::text
+                         FROM unnest(con.conkey) WITH ORDINALITY k(attnum, ord)
+                         JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+                         ORDER BY k.ord) AS child_columns,
+                   pn.nspname || '.' || pc.relname AS parent,
+                   ARRAY(SELECT a.attname::text
+                         FROM unnest(con.confkey) WITH ORDINALITY k(attnum, ord)
+                         JOIN pg_attribute a ON a.attrelid = con.confrelid AND a.attnum = k.attnum
+                         ORDER BY k.ord) AS parent_columns,
+                   con.confdeltype
+            FROM pg_constraint con
+            JOIN pg_class cc ON cc.oid = con.conrelid
+            JOIN pg_namespace cn ON cn.oid = cc.relnamespace
+            JOIN pg_class pc ON pc.oid = con.confrelid
+            JOIN pg_namespace pn ON pn.oid = pc.relnamespace
+            WHERE con.contype = 'f' AND cn.nspname = ANY(%s)
+            ORDER BY child, con.conname
+        """, (list(schemas),))
+        rows = cur.fetchall()
+    return [
+        {'name': name, 'child': child, 'child_columns': list(child_cols),
+         'parent': parent, 'parent_columns': list(parent_cols), 'on_delete': on_delete}
+        for name, child, child_cols, parent, parent_cols, on_delete in rows
+    ]
+
+
+def list_distinct_owners(conn, table='whatsapp_mensagens', column='owner_id'):
+    """Lista valores distintos de owner_id com skip scan (CTE recursiva sobre o índice)
+
+    Evita o SELECT DISTINCT que varreria a tabela inteira; cada passo é um
+    lookup no índice que começa por owner_id.
+    """
+    target = qualified_name(table)
+    col = quote_ident(column)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH RECURSIVE owners AS (
+              (SELECT {col} AS owner_id FROM {target} WHERE {col} IS NOT NULL ORDER BY {col} LIMIT 1)
+              UNION ALL
+              SELECT (SELECT {col} FROM {target} WHERE {col} > o.owner_id ORDER BY {col} LIMIT 1)
+              FROM owners o
+              WHERE o.owner_id IS NOT NULL
+            )
+            SELECT owner_id FROM owners WHERE owner_id IS NOT NULL
+        """)
+        owners = [row[0] for row in cur.fetchall()]
+    if not conn.autocommit:
+        conn.commit()
+    return owners
+
+
+def time_query(conn, sql, params=None, repeat=1):
+    """Executa a consulta `repeat` vezes; retorna (latências em ms, linhas da última execução)"""
+    samples = []
+    rows = []
+    with conn.cursor() as cur:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+            samples.append((time.perf_counter() - started) * 1000.0)
+    if not conn.autocommit:
+        conn.commit()
+    return samples, rows
+
+
+def latency_summary(samples):
+    """Resumo p50/p95/p99/máximo (ms) de uma lista de latências"""
+    if not samples:
+        return {'n': 0, 'p50': None, 'p95': None, 'p99': None, 'max': None}
+    ordered = sorted(samples)
+
+    def pct(p):
+        index = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+        return round(ordered[index], 3)
+
+    return {'n': len(ordered), 'p50': pct(50), 'p95': pct(95), 'p99': pct(99), 'max': round(ordered[-1], 3)}
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Normalização de telefones (E.164, regras brasileiras) e deduplicação de contatos
+
+Substitui os patches pontuais (unify_phone_columns.sql, final_contacts_phone_fix.sql,
+fix-phone*.js) por um motor em duas etapas:
+
+  plan   lê contacts.phone, leads.phone e os telefones distintos de
+         whatsapp_mensagens em lotes colunares, normaliza tudo de forma vetorizada
+         (pandas/NumPy), agrupa contatos duplicados por (owner_id, telefone) num
+         índice de hash e grava o plano (COPY + manifest.json) para revisão
+  apply  carrega o plano em tabelas temporárias via COPY e aplica em lotes:
+         funde os contatos duplicados (religa FKs para o sobrevivente e apaga os
+         demais) e depois atualiza os telefones com UPDATE ... FROM
+
+Formato canônico: dígitos E.164 sem o "+" (ex.: 5511987654321), o mesmo dos chat_id
+do WhatsApp (5511987654321@s.whatsapp.net) e da busca de useContactSync.ts.
+
+Uso:
+    python phone_dedup.py plan --out /tmp/phone_plan
+    python phone_dedup.py apply /tmp/phone_plan --max-lag 2
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from dataset_io import TableWriter, open_input, read_manifest, write_manifest
+from pg_utils import (
+    AdaptiveChunker,
+    LoadThrottle,
+    ProgressReporter,
+    fetch_foreign_keys,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    quote_ident,
+)
+
+try:
+    import numpy as np
+    import pandas as pd
+except ImportError:
+    np = None
+    pd = None
+
+# DDDs válidos (Anatel)
+VALID_DDDS = frozenset(
+    [11, 12, 13, 14, 15, 16, 17, 18, 19, 21, 22, 24, 27, 28, 31, 32, 33, 34, 35, 37, 38]
+    + list(range(41, 50)) + [51, 53, 54, 55] + list(range(61, 70))
+    + [71, 73, 74, 75, 77, 79] + list(range(81, 90)) + list(range(91, 100))
+)
+
+# Campos de contacts usados para escolher o sobrevivente e completar seus dados
+CONTACT_INFO_COLUMNS = ['name', 'name_wpp', 'email', 'company_id']
+
+SOURCES = {
+    'contacts': "SELECT id::TEXT, owner_id::TEXT, {phone} AS phone, created_at, {filled} AS filled "
+                "FROM public.contacts WHERE {phone} IS NOT NULL",
+    'leads': "SELECT id::TEXT, owner_id::TEXT, phone FROM public.leads WHERE phone IS NOT NULL",
+    'whatsapp_mensagens': "SELECT owner_id::TEXT, phone, COUNT(*) AS messages FROM public.whatsapp_mensagens "
+                          "WHERE phone IS NOT NULL GROUP BY owner_id, phone",
+}
+
+
+def normalize_phones(values):
+    """Normaliza uma Series de telefones para dígitos E.164; inválidos viram NA"""
+    raw = pd.Series(values, dtype='object').fillna('').astype(str).str.strip()
+    # JIDs do WhatsApp: 5511...@s.whatsapp.net, 5511...:12@s.whatsapp.net
+    raw = raw.str.replace(r'[@:].*$', '', regex=True)
+    international = raw.str.startswith('+') | raw.str.startswith('00')
+    digits = raw.str.replace(r'\D', '', regex=True)
+    digits = digits.mask(digits.str.startswith('00'), digits.str.slice(2))
+
+    # Prefixo de tronco (0) e código de operadora (0 + 2 dígitos) em números nacionais
+    trunk = ~international & digits.str.startswith('0')
+    digits = digits.mask(trunk, digits.str.slice(1))
+    carrier = trunk & digits.str.len().isin([12, 13])
+    digits = digits.mask(carrier, digits.str.slice(2))
+
+    # DDD + número sem país
+    national = ~international & digits.str.len().isin([10, 11])
+    digits = digits.mask(national, '55' + digits)
+
+    length = digits.str.len()
+    brazil = digits.str.startswith('55') & length.isin([12, 13])
+    # Celulares antigos (8 dígitos começando com 6-9) recebem o nono dígito
+    legacy_mobile = brazil & (length == 12) & digits.str.slice(4, 5).isin(['6', '7', '8', '9'])
+    digits = digits.mask(legacy_mobile, digits.str.slice(0, 4) + '9' + digits.str.slice(4))
+
+    length = digits.str.len()
+    first = digits.str.slice(4, 5)
+    ddd = pd.to_numeric(digits.str.slice(2, 4), errors='coerce')
+    valid_brazil = brazil & ddd.isin(VALID_DDDS) & (
+        ((length == 13) & (first == '9')) | ((length == 12) & first.isin(['2', '3', '4', '5']))
+    )
+    valid_foreign = international & ~digits.str.startswith('55') & length.between(8, 15)
+    return digits.where(valid_brazil | valid_foreign)
+
+
+def iter_frames(conn, sql, columns, batch_size):
+    """Lê o resultado em DataFrames de até batch_size linhas (cursor no servidor)"""
+    with conn.cursor(name='phone_dedup_scan') as cur:
+        cur.itersize = batch_size
+        cur.execute(sql)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    conn.commit()
+
+
+def load_normalized(conn, source, sql, columns, batch_size):
+    """Carrega uma fonte inteira normalizando lote a lote; retorna um DataFrame compacto"""
+    progress = ProgressReporter(f"leitura {source}")
+    frames = []
+    for frame in iter_frames(conn, sql, columns, batch_size):
+        frame['e164'] = normalize_phones(frame['phone'])
+        frame['owner_id'] = frame['owner_id'].astype('category')
+        frames.append(frame)
+        progress.update(len(frame))
+    progress.finish()
+    if not frames:
+        return pd.DataFrame(columns=columns + ['e164'])
+    result = pd.concat(frames, ignore_index=True)
+    result['owner_id'] = result['owner_id'].astype(str)
+    return result
+
+
+def plan_contact_merges(contacts):
+    """Agrupa contatos por hash de (owner_id, e164); retorna DataFrame drop_id -> keep_id"""
+    valid = contacts[contacts['e164'].notna()].copy()
+    if valid.empty:
+        return pd.DataFrame(columns=['owner_id', 'e164', 'keep_id', 'drop_id'])
+    valid['key'] = pd.util.hash_pandas_object(valid[['owner_id', 'e164']], index=False).to_numpy()
+    # Sobrevivente: mais campos preenchidos e, no empate, o mais antigo
+    valid = valid.sort_values(['key', 'filled', 'created_at', 'id'], ascending=[True, False, True, True],
+                              na_position='last', kind='mergesort')
+
+    key = valid['key'].to_numpy()
+    owner = valid['owner_id'].to_numpy()
+    e164 = valid['e164'].to_numpy()
+    same = np.zeros(len(valid), dtype=bool)
+    # Compara com a linha anterior: mesma chave de hash e mesmos valores (descarta colisões)
+    same[1:] = (key[1:] == key[:-1]) & (owner[1:] == owner[:-1]) & (e164[1:] == e164[:-1])
+
+    ids = valid['id'].to_numpy()
+    keep = pd.Series(np.where(same, None, ids), dtype='object').ffill().to_numpy()
+    merges = pd.DataFrame({'owner_id': owner[same], 'e164': e164[same], 'keep_id': keep[same], 'drop_id': ids[same]})
+    return merges
+
+
+def command_plan(conn, args):
+    """Lê as fontes, normaliza e grava o plano em args.out"""
+    catalog = fetch_table_columns(conn, ['public.contacts'])
+    conn.commit()
+    contact_columns = {name for name, _, _ in catalog.get('public.contacts', [])}
+    phone_sql = 'COALESCE(phone, phone_number)' if 'phone_number' in contact_columns else 'phone'
+    filled = [f"({quote_ident(c)} IS NOT NULL)::INT" for c in CONTACT_INFO_COLUMNS if c in contact_columns]
+    filled_sql = ' + '.join(filled) or '0'
+
+    started = time.monotonic()
+    contacts = load_normalized(conn, 'contacts', SOURCES['contacts'].format(phone=phone_sql, filled=filled_sql),
+                               ['id', 'owner_id', 'phone', 'created_at', 'filled'], args.batch_size)
+    leads = load_normalized(conn, 'leads', SOURCES['leads'], ['id', 'owner_id', 'phone'], args.batch_size)
+    messages = load_normalized(conn, 'whatsapp_mensagens', SOURCES['whatsapp_mensagens'],
+                               ['owner_id', 'phone', 'messages'], args.batch_size)
+
+    merges = plan_contact_merges(contacts)
+    dropped = set(merges['drop_id'])
+
+    os.makedirs(args.out, exist_ok=True)
+    entries = []
+
+    writer = TableWriter(args.out, 'contact_merges', ['owner_id', 'phone', 'keep_id', 'drop_id'])
+    for row in merges.itertuples(index=False):
+        writer.write((row.owner_id, row.e164, row.keep_id, row.drop_id))
+    writer.close()
+    entries.append(writer.describe())
+
+    writer = TableWriter(args.out, 'phone_updates', ['table_name', 'id', 'phone'])
+    for source, frame in (('contacts', contacts), ('leads', leads)):
+        changed = frame[frame['e164'].notna() & (frame['e164'] != frame['phone'])]
+        if source == 'contacts':
+            changed = changed[~changed['id'].isin(dropped)]
+        for row in changed.itertuples(index=False):
+            writer.write((source, row.id, row.e164))
+    writer.close()
+    entries.append(writer.describe())
+
+    writer = TableWriter(args.out, 'message_phone_map', ['owner_id', 'old_phone', 'phone'])
+    changed = messages[messages['e164'].notna() & (messages['e164'] != messages['phone'])]
+    for row in changed.itertuples(index=False):
+        writer.write((row.owner_id, row.phone, row.e164))
+    writer.close()
+    entries.append(writer.describe())
+
+    writer = TableWriter(args.out, 'invalid_phones', ['table_name', 'id', 'owner_id', 'phone'])
+    for source, frame in (('contacts', contacts), ('leads', leads)):
+        for row in frame[frame['e164'].isna()].itertuples(index=False):
+            writer.write((source, row.id, row.owner_id, row.phone))
+    writer.close()
+    entries.append(writer.describe())
+
+    # Cruzamento entre tabelas: leads e conversas que já têm (ou não) contato
+    contact_keys = pd.MultiIndex.from_frame(contacts.loc[contacts['e164'].notna(), ['owner_id', 'e164']])
+    lead_keys = pd.MultiIndex.from_frame(leads.loc[leads['e164'].notna(), ['owner_id', 'e164']])
+    chat_keys = pd.MultiIndex.from_frame(
+        messages.loc[messages['e164'].notna(), ['owner_id', 'e164']]).drop_duplicates()
+    summary = {
+        'contacts': len(contacts),
+        'contacts_invalid': int(contacts['e164'].isna().sum()),
+        'contact_duplicates': len(merges),
+        'contact_clusters': int(merges['keep_id'].nunique()),
+        'leads': len(leads),
+        'leads_invalid': int(leads['e164'].isna().sum()),
+        'leads_with_contact': int(lead_keys.isin(contact_keys).sum()),
+        'message_phones': len(messages),
+        'chat_phones_without_contact': int((~chat_keys.isin(contact_keys)).sum()),
+    }
+    write_manifest(args.out, entries, generator='phone_dedup', summary=summary)
+
+    print("📊 Resumo do plano:")
+    for name, value in summary.items():
+        print(f"   {name:<30} {value:>12,}")
+    print(f"🎉 Plano gravado em {args.out} em {format_duration(time.monotonic() - started)}")
+
+
+class PlanApplier:
+    """Aplica um plano carregado em tabelas temporárias, em lotes pela coluna n"""
+
+    def __init__(self, conn, throttle, chunker):
+        self.conn = conn
+        self.throttle = throttle
+        self.chunker = chunker
+
+    def load(self, directory, entry, temp_table, column_types):
+        """COPY do arquivo do plano para uma tabela temporária numerada"""
+        columns = ', '.join(f"{name} {pg_type}" for name, pg_type in column_types)
+        with self.conn.cursor() as cur:
+            cur.execute(f"CREATE TEMP TABLE {temp_table} ({columns}, n BIGSERIAL)")
+            with open_input(os.path.join(directory, entry['file'])) as fh:
+                cur.copy_expert(f"COPY {temp_table} ({', '.join(entry['columns'])}) FROM STDIN", fh)
+            cur.execute(f"CREATE INDEX ON {temp_table} (n)")
+            cur.execute(f"ANALYZE {temp_table}")
+        self.conn.commit()
+        return entry['rows']
+
+    def run(self, label, total, statements):
+        """Executa os statements (com %(lo)s/%(hi)s em n) lote a lote; retorna linhas alteradas"""
+        progress = ProgressReporter(label, total)
+        lo = 0
+        changed = 0
+        while lo < total:
+            self.throttle.wait()
+            hi = lo + self.chunker.size
+            started = time.monotonic()
+            with self.conn.cursor() as cur:
+                for sql in statements:
+                    cur.execute(sql, {'lo': lo, 'hi': hi})
+                    changed += max(cur.rowcount, 0)
+            self.conn.commit()
+            self.chunker.record(time.monotonic() - started)
+            progress.update(min(hi, total) - lo, alterados=changed)
+            lo = hi
+        progress.finish()
+        return changed
+
+
+def command_apply(conn, args):
+    """Aplica o plano: fusões de contatos, depois telefones de contacts/leads e mensagens"""
+    manifest = read_manifest(args.plan)
+    entries = {entry['name']: entry for entry in manifest['tables']}
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    applier = PlanApplier(conn, throttle, AdaptiveChunker(initial=args.batch, target_seconds=args.target_ms / 1000.0))
+    catalog = fetch_table_columns(conn, ['public.contacts', 'public.whatsapp_conversations'])
+    conn.commit()
+    contact_columns = {name for name, _, _ in catalog['public.contacts']}
+    started = time.monotonic()
+
+    # 1. Fusões antes dos UPDATEs de telefone (senão uq_contacts_owner_phone colide)
+    total = applier.load(args.plan, entries['contact_merges'], 'tmp_contact_merges',
+                         [('owner_id', 'UUID'), ('phone', 'TEXT'), ('keep_id', 'UUID'), ('drop_id', 'UUID')])
+    if total:
+        batch = "m.n > %(lo)s AND m.n <= %(hi)s"
+        fill = [f"{quote_ident(c)} = COALESCE(k.{quote_ident(c)}, d.{quote_ident(c)})"
+                for c in CONTACT_INFO_COLUMNS if c in contact_columns]
+        statements = []
+        if fill:
+            statements.append(f"""
+                UPDATE public.contacts k SET {', '.join(fill)}
+                FROM tmp_contact_merges m JOIN public.contacts d ON d.id = m.drop_id
+                WHERE k.id = m.keep_id AND {batch}""")
+        for fk in fetch_foreign_keys(conn):
+            if fk['parent'] == 'public.contacts' and len(fk['child_columns']) == 1:
+                column = quote_ident(fk['child_columns'][0])
+                schema, _, table = fk['child'].partition('.')
+                statements.append(f"""
+                    UPDATE {quote_ident(schema)}.{quote_ident(table)} c SET {column} = m.keep_id
+                    FROM tmp_contact_merges m WHERE c.{column} = m.drop_id AND {batch}""")
+        conn.commit()
+        statements.append(f"DELETE FROM public.contacts c USING tmp_contact_merges m WHERE c.id = m.drop_id AND {batch}")
+        applier.run('fusão de contatos', total, statements)
+
+    # 2. Telefones de contacts e leads
+    total = applier.load(args.plan, entries['phone_updates'], 'tmp_phone_updates',
+                         [('table_name', 'TEXT'), ('id', 'UUID'), ('phone', 'TEXT')])
+    if total:
+        statements = [
+            f"""UPDATE public.{table} t SET phone = u.phone FROM tmp_phone_updates u
+                WHERE u.table_name = '{table}' AND t.id = u.id AND u.n > %(lo)s AND u.n <= %(hi)s"""
+            for table in ('contacts', 'leads')
+        ]
+        applier.run('telefones de contacts/leads', total, statements)
+
+    # 3. Telefones das mensagens (e do resumo de conversas)
+    total = applier.load(args.plan, entries['message_phone_map'], 'tmp_message_phone_map',
+                         [('owner_id', 'UUID'), ('old_phone', 'TEXT'), ('phone', 'TEXT')])
+    if total:
+        statements = ["""
+            UPDATE public.whatsapp_mensagens m SET phone = p.phone FROM tmp_message_phone_map p
+            WHERE m.owner_id = p.owner_id AND m.phone = p.old_phone AND p.n > %(lo)s AND p.n <= %(hi)s"""]
+        if 'public.whatsapp_conversations' in catalog:
+            statements.append("""
+                UPDATE public.whatsapp_conversations c SET phone = p.phone FROM tmp_message_phone_map p
+                WHERE c.owner_id = p.owner_id AND c.phone = p.old_phone AND p.n > %(lo)s AND p.n <= %(hi)s""")
+        applier.run('telefones de whatsapp_mensagens', total, statements)
+
+    print(f"🎉 Plano aplicado em {format_duration(time.monotonic() - started)} "
+          f"(pausas por carga: {format_duration(throttle.total_paused)})")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Normalização de telefones e deduplicação de contatos")
+    parser.add_argument('command', choices=['plan', 'apply'])
+    parser.add_argument('plan', nargs='?', help="apply: diretório do plano")
+    parser.add_argument('--out', help="plan: diretório de saída do plano")
+    parser.add_argument('--batch-size', type=int, default=200000, help="plan: linhas por lote de leitura")
+    parser.add_argument('--batch', type=int, default=2000, help="apply: linhas do plano por lote inicial")
+    parser.add_argument('--target-ms', type=int, default=500, help="apply: duração alvo por lote")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    if args.command == 'plan' and not args.out:
+        parser.error("plan exige --out")
+    if args.command == 'apply' and not args.plan:
+        parser.error("apply exige o diretório do plano")
+    if pd is None:
+        print("❌ pandas/numpy não instalados. Execute: pip install pandas numpy")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='phone_dedup')
+    if args.command == 'plan':
+        command_plan(conn, args)
+    else:
+        command_apply(conn, args)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Toolkit de soft delete: índices parciais de linhas vivas, consultas e benchmark
+
+LiveQuery monta SELECTs que sempre aplicam "deleted_at IS NULL" (literal, para
+casar com os índices parciais); soft_delete_rows/restore_rows marcam e desmarcam
+em lote. O comando install cria, com CREATE INDEX CONCURRENTLY, os índices
+parciais de LIVE_INDEXES nas tabelas que têm deleted_at (com --add-column a coluna
+é criada antes). benchmark compara os planos das listagens de leads sem e com os
+índices parciais (os índices são removidos numa transação desfeita no final: use
+num banco de benchmark, a tabela fica travada durante a medição). Cada cenário roda
+--warmup execuções não medidas de cada consulta antes das amostras, para que "antes"
+e "depois" sejam comparados com o cache igualmente quente.
+
+Estruturas: supabase/migrations/20250928000000_soft_delete_partial_indexes.sql
+
+Uso:
+    python soft_delete.py status
+    python soft_delete.py install --table contacts --add-column
+    python soft_delete.py benchmark --samples 20 --report /tmp/soft_delete.json
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from message_index_benchmark import explain
+from pg_utils import fetch_table_columns, get_pg_connection, latency_summary, qualified_name, quote_ident
+
+LIVE_PREDICATE = 'deleted_at IS NULL'
+
+# Chaves compostas quentes por tabela: (nome do índice, colunas)
+LIVE_INDEXES = {
+    'public.leads': [
+        ('idx_leads_live_company_created', 'company_id, created_at DESC, id'),
+        ('idx_leads_live_company_stage', 'company_id, stage_id, created_at DESC'),
+        ('idx_leads_live_owner_created', 'owner_id, created_at DESC'),
+    ],
+    'public.contacts': [
+        ('idx_contacts_live_company_created', 'company_id, created_at DESC, id'),
+        ('idx_contacts_live_owner_phone', 'owner_id, phone'),
+    ],
+    'public.deals': [
+        ('idx_deals_live_company_stage', 'company_id, stage_id, created_at DESC'),
+    ],
+    'public.projects': [
+        ('idx_projects_live_company_status', 'company_id, status, created_at DESC'),
+    ],
+    'public.activities': [
+        ('idx_activities_live_company_status_due', 'company_id, status, due_date'),
+    ],
+}
+
+
+class LiveQuery:
+    """SELECT encadeável que nunca devolve linhas excluídas logicamente"""
+
+    def __init__(self, table, columns=('*',), include_deleted=False):
+        self.table = table
+        self.columns = list(columns)
+        self.include_deleted = include_deleted
+        self._conditions = []
+        self._params = {}
+        self._order = []
+        self._limit = None
+
+    def _param(self, value):
+        name = f"p{len(self._params)}"
+        self._params[name] = value
+        return f"%({name})s"
+
+    def eq(self, column, value):
+        """column = value (None vira IS NULL)"""
+        if value is None:
+            self._conditions.append(f"{quote_ident(column)} IS NULL")
+        else:
+            self._conditions.append(f"{quote_ident(column)} = {self._param(value)}")
+        return self
+
+    def any(self, column, values):
+        """column = ANY(values)"""
+        self._conditions.append(f"{quote_ident(column)} = ANY({self._param(list(values))})")
+        return self
+
+    def where(self, condition, **params):
+        """Condição SQL livre com parâmetros nomeados (%(nome)s)"""
+        self._conditions.append(f"({condition})")
+        self._params.update(params)
+        return self
+
+    def order_by(self, *terms):
+        """Termos como 'created_at DESC' ou 'id'"""
+        for term in terms:
+            column, _, direction = term.partition(' ')
+            direction = direction.strip().upper()
+            if direction not in ('', 'ASC', 'DESC'):
+                raise ValueError(f"Direção inválida: {term}")
+            self._order.append(f"{quote_ident(column)} {direction}".strip())
+        return self
+
+    def limit(self, count):
+        self._limit = int(count)
+        return self
+
+    def sql(self, select=None):
+        """(sql, params); o predicado de linha viva vem primeiro e sempre literal"""
+        conditions = ([] if self.include_deleted else [LIVE_PREDICATE]) + self._conditions
+        columns = select or ', '.join(c if c == '*' else quote_ident(c) for c in self.columns)
+        sql = f"SELECT {columns} FROM {qualified_name(self.table)}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if self._order and not select:
+            sql += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None and not select:
+            sql += f" LIMIT {self._limit}"
+        return sql, dict(self._params)
+
+    def fetch(self, conn):
+        sql, params = self.sql()
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def count(self, conn):
+        sql, params = self.sql(select='COUNT(*)')
+        with conn.cursor() as cur:
+            cur.execute(sql, params)
+            return cur.fetchone()[0]
+
+
+def soft_delete_rows(conn, table, ids):
+    """Marca deleted_at = now() num único UPDATE; retorna quantas linhas vivas foram marcadas"""
+    with conn.cursor() as cur:
+        cur.execute(f"UPDATE {qualified_name(table)} SET deleted_at = now() "
+                    f"WHERE id = ANY(%s) AND {LIVE_PREDICATE}", (list(ids),))
+        return cur.rowcount
+
+
+def restore_rows(conn, table, ids):
+    """Desfaz o soft delete de um lote"""
+    with conn.cursor() as cur:
+        cur.execute(f"UPDATE {qualified_name(table)} SET deleted_at = NULL "
+                    f"WHERE id = ANY(%s) AND deleted_at IS NOT NULL", (list(ids),))
+        return cur.rowcount
+
+
+def existing_index_names(conn, tables):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT schemaname || '.' || tablename, indexname FROM pg_indexes
+            WHERE schemaname || '.' || tablename = ANY(%s)
+        """, (list(tables),))
+        rows = cur.fetchall()
+    conn.commit()
+    return {name for _, name in rows}
+
+
+def command_status(conn, _args):
+    """Tabelas com deleted_at, índices parciais presentes e fração de linhas excluídas"""
+    catalog = fetch_table_columns(conn, list(LIVE_INDEXES))
+    present = existing_index_names(conn, LIVE_INDEXES)
+    for table, indexes in LIVE_INDEXES.items():
+        if table not in catalog:
+            continue
+        has_column = any(name == 'deleted_at' for name, _, _ in catalog[table])
+        line = f"   {table:<22} deleted_at: {'sim' if has_column else 'não'}"
+        if has_column:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*), COUNT(*) FILTER (WHERE deleted_at IS NOT NULL) "
+                            f"FROM {qualified_name(table)}")
+                total, deleted = cur.fetchone()
+            conn.commit()
+            line += f"  ({deleted:,}/{total:,} excluídas)"
+        print(line)
+        for name, columns in indexes:
+            print(f"      {'✅' if name in present else '❌'} {name} ({columns})")
+
+
+def command_install(conn, args):
+    """Cria os índices parciais (CONCURRENTLY) nas tabelas com soft delete"""
+    tables = [t if '.' in t else f"public.{t}" for t in (args.table or LIVE_INDEXES)]
+    unknown = [t for t in tables if t not in LIVE_INDEXES]
+    if unknown:
+        print(f"❌ Sem chaves definidas em LIVE_INDEXES para: {', '.join(unknown)}")
+        sys.exit(1)
+    catalog = fetch_table_columns(conn, tables)
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for table in tables:
+            if table not in catalog:
+                print(f"   ⏭️ {table}: tabela não existe")
+                continue
+            if not any(name == 'deleted_at' for name, _, _ in catalog[table]):
+                if not args.add_column:
+                    print(f"   ⏭️ {table}: sem deleted_at (use --add-column)")
+                    continue
+                cur.execute(f"ALTER TABLE {qualified_name(table)} "
+                            f"ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ DEFAULT NULL")
+                print(f"   ➕ {table}.deleted_at criada")
+            for name, columns in LIVE_INDEXES[table]:
+                started = time.monotonic()
+                cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {quote_ident(name)} "
+                            f"ON {qualified_name(table)} ({columns}) WHERE {LIVE_PREDICATE}")
+                print(f"   ✅ {name} ({time.monotonic() - started:.1f}s)")
+    conn.autocommit = False
+
+
+def benchmark_workloads(company_id, stage_id, owner_id):
+    """Listagens de leads no formato usado pelo frontend (RLS por empresa, Kanban, meus leads)"""
+    columns = ('id', 'name', 'stage_id', 'status', 'value', 'created_at')
+    return {
+        'company_recent': LiveQuery('leads', columns).eq('company_id', company_id)
+                                                     .order_by('created_at DESC', 'id DESC').limit(50),
+        'company_stage': LiveQuery('leads', columns).eq('company_id', company_id).eq('stage_id', stage_id)
+                                                    .order_by('created_at DESC').limit(50),
+        'owner_recent': LiveQuery('leads', columns).eq('owner_id', owner_id).order_by('created_at DESC').limit(50),
+        'company_count': LiveQuery('leads', columns).eq('company_id', company_id),
+    }
+
+
+def sample_keys(conn, seed):
+    """(company_id, stage_id, owner_id) de um lead vivo da maior empresa"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT company_id FROM public.leads
+            WHERE deleted_at IS NULL AND company_id IS NOT NULL
+            GROUP BY company_id ORDER BY COUNT(*) DESC LIMIT 5
+        """)
+        companies = [row[0] for row in cur.fetchall()]
+        if not companies:
+            return None
+        company_id = random.Random(seed).choice(companies)
+        cur.execute("""
+            SELECT stage_id, owner_id FROM public.leads
+            WHERE company_id = %s AND deleted_at IS NULL AND stage_id IS NOT NULL
+            LIMIT 1
+        """, (company_id,))
+        stage_id, owner_id = cur.fetchone() or (None, None)
+    conn.commit()
+    return company_id, stage_id, owner_id
+
+
+def measure(conn, workloads, samples, warmup=0):
+    """Latências e plano de cada consulta na transação corrente (sem commit)"""
+    results = {}
+    with conn.cursor() as cur:
+        for name, query in workloads.items():
+            sql, params = query.sql(select='COUNT(*)') if name == 'company_count' else query.sql()
+            for _ in range(warmup):
+                cur.execute(sql, params)
+                cur.fetchall()
+            latencies = []
+            for _ in range(samples):
+                started = time.perf_counter()
+                cur.execute(sql, params)
+                cur.fetchall()
+                latencies.append((time.perf_counter() - started) * 1000.0)
+            plan, used = explain(conn, sql, params)
+            results[name] = dict(latency_summary(latencies), indexes_used=used,
+                                 shared_hit=plan['Plan'].get('Shared Hit Blocks', 0),
+                                 shared_read=plan['Plan'].get('Shared Read Blocks', 0),
+                                 plan=plan)
+    return results
+
+
+def command_benchmark(conn, args):
+    """Planos e latências das listagens de leads sem e com os índices parciais"""
+    keys = sample_keys(conn, args.seed)
+    if not keys:
+        print("❌ Nenhum lead vivo com company_id; gere dados com generate_crm_dataset.py")
+        sys.exit(1)
+    workloads = benchmark_workloads(*keys)
+    names = [name for name, _ in LIVE_INDEXES['public.leads']]
+    present = [name for name in names if name in existing_index_names(conn, ['public.leads'])]
+    if not present:
+        print("❌ Índices parciais de leads ausentes; aplique a migration ou rode install")
+        sys.exit(1)
+
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = '5s'")
+        cur.execute("ANALYZE public.leads")
+    conn.commit()
+
+    report = {}
+    with conn.cursor() as cur:
+        for index in present:
+            cur.execute(f"DROP INDEX public.{quote_ident(index)}")
+    report['before'] = measure(conn, workloads, args.samples, args.warmup)
+    conn.rollback()
+    report['after'] = measure(conn, workloads, args.samples, args.warmup)
+    conn.rollback()
+
+    print(f"\n📊 Listagens de leads (p50/p95 em ms, {args.samples} execuções)")
+    for name in workloads:
+        before, after = report['before'][name], report['after'][name]
+        print(f"   {name:<16} antes p50 {before['p50']:>8.2f} p95 {before['p95']:>8.2f} "
+              f"[{', '.join(before['indexes_used']) or 'seq scan'}]")
+        print(f"   {'':<16} depois p50 {after['p50']:>7.2f} p95 {after['p95']:>8.2f} "
+              f"[{', '.join(after['indexes_used']) or 'seq scan'}]")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as fh:
+            json.dump({'keys': [str(k) for k in keys], 'dropped': present, **report}, fh, indent=2, default=str)
+        print(f"📁 Relatório salvo em {args.report}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Índices parciais e consultas para soft delete")
+    parser.add_argument('command', choices=['status', 'install', 'benchmark'])
+    parser.add_argument('--table', action='append', help="install: limita a estas tabelas")
+    parser.add_argument('--add-column', action='store_true', help="install: cria deleted_at onde faltar")
+    parser.add_argument('--samples', type=int, default=20, help="benchmark: execuções por consulta")
+    parser.add_argument('--warmup', type=int, default=3, help="benchmark: execuções não medidas por consulta e cenário")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--report', help="benchmark: grava planos e latências em JSON")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='soft_delete')
+    try:
+        {'status': command_status, 'install': command_install, 'benchmark': command_benchmark}[args.command](conn, args)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Snapshots de burndown das sprints (sprint_burndown_snapshots)
+
+snapshot grava, para cada sprint em andamento (ou encerrada há menos de
+--grace-hours), uma linha por intervalo com escopo total, concluídos, estimativa
+total e restante, e itens adicionados/removidos desde o intervalo anterior.
+Rodar várias vezes no mesmo intervalo atualiza a linha dele (fica o último
+estado do intervalo); sprint_burndown_scope guarda as atividades de cada sprint
+para separar adições de remoções. Tudo numa única transação.
+
+backfill reconstrói, de forma aproximada, a série das sprints que ainda não têm
+snapshots: a atividade entra no escopo em created_at (ou no início da sprint) e
+conta como concluída em completed_date (ou no updated_at, se concluída). Remoções
+e reaberturas passadas não deixam rastro e não aparecem; essas linhas ficam com
+backfilled = true.
+
+Estruturas: supabase/migrations/20251005000000_sprint_burndown.sql
+
+Uso:
+    python sprint_burndown.py snapshot
+    python sprint_burndown.py snapshot --interval-hours 6
+    python sprint_burndown.py backfill
+    python sprint_burndown.py show --sprint 00000000-0000-0000-0000-000000000000
+"""
+
+import argparse
+import sys
+import time
+
+from pg_utils import LoadThrottle, ProgressReporter, fetch_table_columns, format_duration, get_pg_connection
+
+# Intervalos alinhados à meia-noite de São Paulo
+BUCKET_ORIGIN = '2000-01-03 00:00:00-03'
+ACTIVE_STATUSES = ('em_andamento', 'active', 'planning')
+DONE_STATUS = 'completed'
+SKIPPED_STATUS = 'cancelled'
+
+
+class SprintSchema:
+    """Colunas de sprints/activities que variam entre as migrations"""
+
+    def __init__(self, conn):
+        catalog = fetch_table_columns(conn, ['public.sprints', 'public.activities'])
+        sprints = {c for c, _, _ in catalog.get('public.sprints', [])}
+        activities = {c for c, _, _ in catalog.get('public.activities', [])}
+        if 'sprint_id' not in activities:
+            print("❌ activities não tem sprint_id (20250115000000_add_sprint_support.sql)")
+            sys.exit(1)
+        self.start = 's.data_inicio' if 'data_inicio' in sprints else 's.start_date::timestamptz'
+        self.end = 's.data_fim' if 'data_fim' in sprints else 's.end_date::timestamptz'
+        self.estimate = 'COALESCE(a.estimated_hours, 0)' if 'estimated_hours' in activities else '0'
+        finished = 'COALESCE(a.completed_date, a.updated_at)' if 'completed_date' in activities else 'a.updated_at'
+        self.done_at = f"CASE WHEN a.status = '{DONE_STATUS}' THEN {finished} END"
+
+
+def run_snapshot(conn, schema, args):
+    params = {
+        'hours': args.interval_hours,
+        'origin': BUCKET_ORIGIN,
+        'grace': args.grace_hours,
+        'active': list(ACTIVE_STATUSES),
+        'ids': args.sprint,
+    }
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE burndown_sprints ON COMMIT DROP AS
+            SELECT s.id FROM public.sprints s
+            WHERE (s.status = ANY(%(active)s) OR {schema.end} > now() - make_interval(hours => %(grace)s))
+              AND (%(ids)s::uuid[] IS NULL OR s.id = ANY(%(ids)s::uuid[]))
+        """, params)
+        cur.execute(f"""
+            CREATE TEMP TABLE burndown_current ON COMMIT DROP AS
+            SELECT a.sprint_id, a.id AS activity_id, {schema.estimate}::numeric AS estimate,
+                   a.status = '{DONE_STATUS}' AS done
+            FROM public.activities a
+            JOIN burndown_sprints s ON s.id = a.sprint_id
+            WHERE a.status IS DISTINCT FROM '{SKIPPED_STATUS}'
+        """)
+
+        # Escopo: marca quem saiu e registra quem entrou (ou voltou)
+        cur.execute("""
+            UPDATE public.sprint_burndown_scope sc
+            SET removed_at = now()
+            WHERE sc.removed_at IS NULL
+              AND sc.sprint_id IN (SELECT id FROM burndown_sprints)
+              AND NOT EXISTS (SELECT 1 FROM burndown_current c
+                              WHERE c.sprint_id = sc.sprint_id AND c.activity_id = sc.activity_id)
+        """)
+        removed = cur.rowcount
+        cur.execute("""
+            INSERT INTO public.sprint_burndown_scope (sprint_id, activity_id)
+            SELECT sprint_id, activity_id FROM burndown_current
+            ON CONFLICT (sprint_id, activity_id) DO UPDATE
+            SET added_at = now(), removed_at = NULL
+            WHERE sprint_burndown_scope.removed_at IS NOT NULL
+        """)
+        added = cur.rowcount
+
+        # Uma linha por intervalo; adições/remoções contam desde o intervalo anterior
+        cur.execute("""
+            WITH bucket AS (
+              SELECT date_bin(make_interval(hours => %(hours)s), now(), %(origin)s::timestamptz) AS captured_at
+            )
+            INSERT INTO public.sprint_burndown_snapshots AS b
+              (sprint_id, captured_at, taken_at, total_items, completed_items, total_estimate,
+               remaining_estimate, added_items, removed_items, backfilled)
+            SELECT s.id, bucket.captured_at, now(),
+                   COALESCE(c.total_items, 0), COALESCE(c.completed_items, 0),
+                   COALESCE(c.total_estimate, 0), COALESCE(c.remaining_estimate, 0),
+                   CASE WHEN p.taken_at IS NULL THEN 0 ELSE (
+                     SELECT COUNT(*) FROM public.sprint_burndown_scope sc
+                     WHERE sc.sprint_id = s.id AND sc.removed_at IS NULL AND sc.added_at > p.taken_at) END,
+                   CASE WHEN p.taken_at IS NULL THEN 0 ELSE (
+                     SELECT COUNT(*) FROM public.sprint_burndown_scope sc
+                     WHERE sc.sprint_id = s.id AND sc.removed_at > p.taken_at) END,
+                   false
+            FROM burndown_sprints s
+            CROSS JOIN bucket
+            LEFT JOIN (
+              SELECT sprint_id, COUNT(*) AS total_items, COUNT(*) FILTER (WHERE done) AS completed_items,
+                     SUM(estimate) AS total_estimate, SUM(estimate) FILTER (WHERE NOT done) AS remaining_estimate
+              FROM burndown_current
+              GROUP BY sprint_id
+            ) c ON c.sprint_id = s.id
+            LEFT JOIN LATERAL (
+              SELECT prev.taken_at FROM public.sprint_burndown_snapshots prev
+              WHERE prev.sprint_id = s.id AND prev.captured_at < bucket.captured_at
+              ORDER BY prev.captured_at DESC
+              LIMIT 1
+            ) p ON true
+            ON CONFLICT (sprint_id, captured_at) DO UPDATE
+            SET taken_at = EXCLUDED.taken_at, total_items = EXCLUDED.total_items,
+                completed_items = EXCLUDED.completed_items, total_estimate = EXCLUDED.total_estimate,
+                remaining_estimate = EXCLUDED.remaining_estimate, added_items = EXCLUDED.added_items,
+                removed_items = EXCLUDED.removed_items, backfilled = false
+        """, params)
+        snapshots = cur.rowcount
+    conn.commit()
+    print(f"✅ {snapshots} sprints no snapshot ({added} atividades entraram, {removed} saíram do escopo)")
+
+
+def sprints_to_backfill(conn, schema, sprint_ids, force):
+    """[(sprint_id, início, fim)] com início conhecido e sem snapshots (ou todas, com force)"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT s.id::text, {schema.start}, LEAST(COALESCE({schema.end}, now()), now(),
+                   (SELECT MIN(b.captured_at) FROM public.sprint_burndown_snapshots b
+                    WHERE b.sprint_id = s.id AND NOT b.backfilled))
+            FROM public.sprints s
+            WHERE {schema.start} IS NOT NULL
+              AND (%(ids)s::uuid[] IS NULL OR s.id = ANY(%(ids)s::uuid[]))
+              AND (%(force)s OR NOT EXISTS (SELECT 1 FROM public.sprint_burndown_snapshots b
+                                            WHERE b.sprint_id = s.id))
+            ORDER BY 2
+        """, {'ids': sprint_ids, 'force': force})
+        rows = cur.fetchall()
+    conn.commit()
+    return [row for row in rows if row[1] < row[2]]
+
+
+def backfill_sprint(conn, schema, sprint_id, start, stop, interval_hours):
+    """Série aproximada de uma sprint entre o início e `stop`; retorna linhas gravadas"""
+    params = {'sprint': sprint_id, 'start': start, 'stop': stop,
+              'hours': interval_hours, 'origin': BUCKET_ORIGIN}
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM public.sprint_burndown_snapshots
+            WHERE sprint_id = %(sprint)s AND backfilled AND captured_at < %(stop)s
+        """, params)
+        cur.execute(f"""
+            WITH scope AS (
+              SELECT a.id, a.created_at, GREATEST(a.created_at, %(start)s) AS joined_at,
+                     {schema.estimate}::numeric AS estimate, {schema.done_at} AS done_at
+              FROM public.activities a
+              WHERE a.sprint_id = %(sprint)s AND a.status IS DISTINCT FROM '{SKIPPED_STATUS}'
+            ),
+            buckets AS (
+              SELECT ts, LEAST(ts + make_interval(hours => %(hours)s), now()) AS state_at
+              FROM generate_series(date_bin(make_interval(hours => %(hours)s), %(start)s, %(origin)s::timestamptz),
+                                   %(stop)s, make_interval(hours => %(hours)s)) AS ts
+              WHERE ts < %(stop)s
+            )
+            INSERT INTO public.sprint_burndown_snapshots
+              (sprint_id, captured_at, taken_at, total_items, completed_items, total_estimate,
+               remaining_estimate, added_items, removed_items, backfilled)
+            SELECT %(sprint)s, b.ts, b.state_at,
+                   COUNT(sc.id), COUNT(sc.id) FILTER (WHERE sc.done_at <= b.state_at),
+                   COALESCE(SUM(sc.estimate), 0),
+                   COALESCE(SUM(sc.estimate) FILTER (WHERE sc.done_at IS NULL OR sc.done_at > b.state_at), 0),
+                   COUNT(sc.id) FILTER (WHERE sc.created_at > %(start)s AND sc.joined_at > b.ts),
+                   0, true
+            FROM buckets b
+            LEFT JOIN scope sc ON sc.joined_at <= b.state_at
+            GROUP BY b.ts, b.state_at
+            ON CONFLICT (sprint_id, captured_at) DO NOTHING
+        """, params)
+        inserted = cur.rowcount
+        # Semeia o escopo para o primeiro snapshot real não contar tudo como adicionado
+        cur.execute(f"""
+            INSERT INTO public.sprint_burndown_scope (sprint_id, activity_id, added_at)
+            SELECT a.sprint_id, a.id, GREATEST(a.created_at, %(start)s)
+            FROM public.activities a
+            WHERE a.sprint_id = %(sprint)s AND a.status IS DISTINCT FROM '{SKIPPED_STATUS}'
+            ON CONFLICT (sprint_id, activity_id) DO NOTHING
+        """, params)
+    conn.commit()
+    return inserted
+
+
+def run_backfill(conn, schema, args):
+    sprints = sprints_to_backfill(conn, schema, args.sprint, args.force)
+    print(f"🚀 Backfill de {len(sprints)} sprints (intervalo de {args.interval_hours}h)...")
+    throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+    progress = ProgressReporter('sprints', len(sprints))
+    rows = 0
+    for sprint_id, start, stop in sprints:
+        throttle.wait()
+        rows += backfill_sprint(conn, schema, sprint_id, start, stop, args.interval_hours)
+        progress.update(1, snapshots=rows)
+    progress.finish()
+
+
+def run_show(conn, args):
+    if not args.sprint:
+        print("❌ show exige --sprint")
+        sys.exit(1)
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM public.get_sprint_burndown(%s)", (args.sprint[0],))
+        rows = cur.fetchall()
+    conn.commit()
+    if not rows:
+        print("ℹ️ Sprint sem snapshots; rode snapshot ou backfill")
+        return
+    peak = max(float(row[3]) for row in rows) or 1.0
+    for captured_at, total, done, estimate, remaining, added, removed, backfilled in rows:
+        bar = '█' * round(30 * float(remaining) / peak)
+        print(f"   {captured_at:%Y-%m-%d %H:%M} {bar:<30} restam {float(remaining):>8.1f}h de {float(estimate):.1f}h "
+              f"| {done}/{total} concluídos | +{added} -{removed}{' (backfill)' if backfilled else ''}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Snapshots de burndown das sprints")
+    parser.add_argument('command', choices=['snapshot', 'backfill', 'show'])
+    parser.add_argument('--interval-hours', type=int, default=24, help="Tamanho do intervalo dos snapshots")
+    parser.add_argument('--grace-hours', type=int, default=48,
+                        help="snapshot: inclui sprints encerradas há menos que isto")
+    parser.add_argument('--sprint', action='append', help="Limita a estas sprints")
+    parser.add_argument('--force', action='store_true', help="backfill: refaz sprints que já têm snapshots")
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    conn = get_pg_connection(args.dsn, application_name='sprint_burndown')
+    started = time.monotonic()
+    try:
+        if args.command == 'show':
+            run_show(conn, args)
+            return
+        schema = SprintSchema(conn)
+        if args.command == 'snapshot':
+            run_snapshot(conn, schema, args)
+        else:
+            run_backfill(conn, schema, args)
+        print(f"🎉 Concluído em {format_duration(time.monotonic() - started)}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; sprints concluídas já foram confirmadas")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
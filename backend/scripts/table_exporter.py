@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Exportação de tabelas em streaming para NDJSON, CSV ou Parquet
+
+Cada tabela é lida com paginação keyset pela chave primária (sem OFFSET) por um
+worker próprio, com tamanho de página derivado de um orçamento de memória. NDJSON
+e CSV saem comprimidos com gzip; Parquet é escrito em row groups tipados pelas
+colunas do catálogo. Ao final é gravado um manifest.json com linhas, bytes e
+SHA-256 de cada arquivo (exports NDJSON/CSV podem ser recarregados com bulk_loader.py).
+
+Uso:
+    python table_exporter.py --out /tmp/export leads contacts activities
+    python table_exporter.py --out /tmp/export --format parquet --jobs 4 --memory-mb 512 whatsapp_mensagens
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dataset_io import TableWriter, file_sha256, to_json, write_manifest
+from pg_utils import (
+    ProgressReporter,
+    estimate_row_count,
+    fetch_table_columns,
+    format_duration,
+    get_pg_connection,
+    qualified_name,
+    quote_ident,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_ROW_BYTES = 1024
+
+
+def fetch_primary_key(conn, table):
+    """Colunas da chave primária na ordem do índice"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT a.attname
+            FROM pg_index ix
+            JOIN unnest(ix.indkey) WITH ORDINALITY k(attnum, ord) ON true
+            JOIN pg_attribute a ON a.attrelid = ix.indrelid AND a.attnum = k.attnum
+            WHERE ix.indrelid = %s::regclass AND ix.indisprimary
+            ORDER BY k.ord
+        """, (qualified_name(table),))
+        return [row[0] for row in cur.fetchall()]
+
+
+def estimate_row_bytes(conn, table):
+    """Largura média da linha via pg_stats (ou tamanho/linhas como fallback)"""
+    schema, name = table.split('.', 1)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT COALESCE(SUM(avg_width), 0) FROM pg_stats WHERE schemaname = %s AND tablename = %s
+        """, (schema, name))
+        width = cur.fetchone()[0]
+        if not width:
+            cur.execute("""
+                SELECT pg_table_size(c.oid) / NULLIF(c.reltuples, 0)
+                FROM pg_class c WHERE c.oid = %s::regclass
+            """, (qualified_name(table),))
+            width = cur.fetchone()[0]
+    return int(width or DEFAULT_ROW_BYTES)
+
+
+def iter_keyset_pages(conn, table, columns, key_columns, page_size, where=None, params=None,
+                      start_after=None):
+    """Itera páginas ordenadas pela chave, usando (chave) > (última chave) em vez de OFFSET"""
+    column_sql = ', '.join(quote_ident(c) for c in columns)
+    key_sql = ', '.join(quote_ident(c) for c in key_columns)
+    key_positions = [columns.index(c) for c in key_columns]
+    base_filter = f"({where})" if where else "TRUE"
+    last_key = start_after
+
+    with conn.cursor() as cur:
+        while True:
+            query_params = dict(params or {})
+            query_params['limit'] = page_size
+            key_filter = ''
+            if last_key is not None:
+                placeholders = ', '.join(f"%(k{i})s" for i in range(len(key_columns)))
+                key_filter = f" AND ({key_sql}) > ({placeholders})"
+                query_params.update({f"k{i}": v for i, v in enumerate(last_key)})
+            cur.execute(f"""
+                SELECT {column_sql} FROM {qualified_name(table)}
+                WHERE {base_filter}{key_filter}
+                ORDER BY {key_sql}
+                LIMIT %(limit)s
+            """, query_params)
+            rows = cur.fetchall()
+            if not rows:
+                return
+            last_key = tuple(rows[-1][p] for p in key_positions)
+            yield rows, last_key
+            if len(rows) < page_size:
+                return
+
+
+def arrow_type(pg_type):
+    """Mapeia tipos do Postgres para tipos Arrow"""
+    if pg_type.endswith('[]'):
+        return pa.list_(arrow_type(pg_type[:-2]))
+    if pg_type in ('smallint', 'integer', 'bigint'):
+        return pa.int64()
+    if pg_type in ('real', 'double precision'):
+        return pa.float64()
+    if pg_type.startswith('numeric('):
+        precision, _, scale = pg_type[len('numeric('):-1].partition(',')
+        return pa.decimal128(int(precision), int(scale or 0))
+    if pg_type == 'boolean':
+        return pa.bool_()
+    if pg_type == 'date':
+        return pa.date32()
+    if pg_type.startswith('timestamp') and 'with time zone' in pg_type:
+        return pa.timestamp('us', tz='UTC')
+    if pg_type.startswith('timestamp'):
+        return pa.timestamp('us')
+    return pa.string()
+
+
+class ParquetTableWriter:
+    """Escreve uma página por row group, com schema tipado a partir do catálogo"""
+
+    def __init__(self, directory, table, columns, pg_types):
+        if pa is None:
+            print("❌ pyarrow não instalado. Execute: pip install pyarrow")
+            sys.exit(1)
+        self.table = table
+        self.columns = list(columns)
+        self.rows = 0
+        self.file_name = table.split('.')[-1] + '.parquet'
+        self.path = os.path.join(directory, self.file_name)
+        self.schema = pa.schema([(c, arrow_type(pg_types[c])) for c in self.columns])
+        self._string_columns = {i for i, c in enumerate(self.columns)
+                                if pa.types.is_string(self.schema.field(c).type)}
+        self._writer = pq.ParquetWriter(self.path, self.schema, compression='zstd')
+
+    def write_page(self, rows):
+        arrays = []
+        for i, column in enumerate(self.columns):
+            values = [row[i] for row in rows]
+            if i in self._string_columns:
+                values = [v if v is None or isinstance(v, str) else _as_text(v) for v in values]
+            arrays.append(pa.array(values, type=self.schema.field(column).type))
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.rows += len(rows)
+
+    def close(self):
+        self._writer.close()
+
+    def describe(self):
+        return {'name': self.table, 'file': self.file_name, 'format': 'parquet',
+                'columns': self.columns, 'rows': self.rows}
+
+
+def _as_text(value):
+    if isinstance(value, (dict, list)):
+        return to_json(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def export_table(dsn, table, out_dir, fmt, memory_bytes, columns=None, where=None):
+    """Exporta uma tabela inteira em conexão própria; retorna a entrada do manifest"""
+    conn = get_pg_connection(dsn, application_name='table_exporter')
+    started = time.monotonic()
+    try:
+        # Snapshot consistente durante toda a exportação da tabela
+        conn.set_session(readonly=True, isolation_level='REPEATABLE READ')
+        catalog = fetch_table_columns(conn, [table])[table]
+        pg_types = {name: data_type for name, data_type, _ in catalog}
+        columns = columns or [name for name, _, _ in catalog]
+        key_columns = fetch_primary_key(conn, table)
+        if not key_columns:
+            raise ValueError(f"{table} não tem chave primária; keyset pagination exige PK")
+
+        page_size = max(100, min(100000, memory_bytes // max(estimate_row_bytes(conn, table), 1)))
+        progress = ProgressReporter(f"export {table}", estimate_row_count(conn, table))
+
+        if fmt == 'parquet':
+            writer = ParquetTableWriter(out_dir, table, columns, pg_types)
+        else:
+            writer = TableWriter(out_dir, table, columns, fmt, compress=True)
+        last_key = None
+        try:
+            for rows, last_key in iter_keyset_pages(conn, table, columns, key_columns, page_size, where):
+                if fmt == 'parquet':
+                    writer.write_page(rows)
+                else:
+                    for row in rows:
+                        writer.write(row)
+                progress.update(len(rows))
+        finally:
+            writer.close()
+        conn.rollback()
+
+        entry = writer.describe()
+        entry.update({
+            'bytes': os.path.getsize(writer.path),
+            'sha256': file_sha256(writer.path),
+            'key_columns': key_columns,
+            'last_key': list(last_key) if last_key else None,
+            'page_size': page_size,
+            'seconds': round(time.monotonic() - started, 2),
+        })
+        return entry
+    finally:
+        conn.close()
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Exporta tabelas em streaming com paginação keyset")
+    parser.add_argument('tables', nargs='+', help="Tabelas a exportar (schema.tabela ou tabela)")
+    parser.add_argument('--out', required=True, help="Diretório de saída")
+    parser.add_argument('--format', choices=['ndjson', 'csv', 'parquet'], default='ndjson')
+    parser.add_argument('--jobs', type=int, default=4, help="Tabelas exportadas em paralelo")
+    parser.add_argument('--memory-mb', type=int, default=256,
+                        help="Orçamento total de memória para páginas (dividido entre workers)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    tables = [t if '.' in t else f"public.{t}" for t in args.tables]
+    os.makedirs(args.out, exist_ok=True)
+    per_worker = args.memory_mb * 1024 * 1024 // max(1, min(args.jobs, len(tables)))
+
+    print(f"🚀 Exportando {len(tables)} tabelas para {args.out} ({args.format}, {args.jobs} workers)...")
+    started = time.monotonic()
+    entries = {}
+    failed = []
+    with ThreadPoolExecutor(max_workers=args.jobs) as pool:
+        futures = {pool.submit(export_table, args.dsn, t, args.out, args.format, per_worker): t for t in tables}
+        for future in as_completed(futures):
+            table = futures[future]
+            try:
+                entry = future.result()
+                entries[table] = entry
+                print(f"   ✅ {table}: {entry['rows']:,} linhas, {entry['bytes'] / 1e6:,.1f} MB "
+                      f"em {format_duration(entry['seconds'])}")
+            except Exception as e:
+                failed.append(table)
+                print(f"   ❌ {table}: {e}")
+
+    write_manifest(
+        args.out,
+        [entries[t] for t in tables if t in entries],
+        generator='table_exporter',
+        format=args.format,
+        exported_at=datetime.datetime.now(datetime.timezone.utc),
+    )
+    print(f"🎉 Exportação concluída em {format_duration(time.monotonic() - started)}")
+    if failed:
+        print(f"⚠️ Falharam: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Normalização e deduplicação em massa das tags de leads
+
+Lê as tags distintas de leads.tags por um cursor no servidor (com a frequência
+de cada uma), calcula a forma canônica em Python (Unicode NFKD sem acentos,
+casefold, espaços colapsados e aparados) e aplica o mapa de sinônimos. O plano
+lista as fusões ('Urgente', 'urgente ', 'URGENTE' -> 'urgente'); o apply grava
+os sinônimos em lead_tag_synonyms e reescreve os arrays em lotes no servidor
+(lead_tags.rewrite_tags). Daí em diante o trigger trg_leads_normalize_tags
+mantém as gravações novas na forma canônica.
+
+Arquivo de sinônimos (JSON), em qualquer um dos formatos:
+    {"hot": "quente", "cliente vip": "vip"}
+    {"quente": ["hot", "lead quente"], "vip": ["cliente vip"]}
+
+Estruturas: supabase/migrations/20250930000000_lead_tag_normalization.sql
+
+Uso:
+    python tag_normalizer.py plan --synonyms tag_synonyms.json --show 30
+    python tag_normalizer.py plan --out /tmp/tag_plan.json
+    python tag_normalizer.py apply --synonyms tag_synonyms.json --max-batch 2000
+"""
+
+import argparse
+import collections
+import json
+import sys
+import time
+import unicodedata
+
+from lead_tags import rewrite_tags
+from pg_utils import AdaptiveChunker, LoadThrottle, format_duration, get_pg_connection
+
+
+def canonical_form(tag):
+    """Forma canônica sem sinônimos; None para tag vazia"""
+    if tag is None:
+        return None
+    decomposed = unicodedata.normalize('NFKD', tag)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.casefold().split()) or None
+
+
+def load_synonyms(path):
+    """{alias canônico: tag canônica} com cadeias resolvidas (a -> b -> c vira a -> c)"""
+    with open(path, encoding='utf-8') as fh:
+        raw = json.load(fh)
+    pairs = []
+    for key, value in raw.items():
+        if isinstance(value, list):
+            pairs.extend((alias, key) for alias in value)
+        else:
+            pairs.append((key, value))
+
+    synonyms = {}
+    for alias, target in pairs:
+        alias, target = canonical_form(alias), canonical_form(target)
+        if not alias or not target or alias == target:
+            continue
+        if synonyms.get(alias, target) != target:
+            raise ValueError(f"Sinônimo '{alias}' aponta para '{synonyms[alias]}' e '{target}'")
+        synonyms[alias] = target
+
+    for alias in list(synonyms):
+        seen = {alias}
+        target = synonyms[alias]
+        while target in synonyms:
+            if target in seen:
+                raise ValueError(f"Ciclo de sinônimos a partir de '{alias}'")
+            seen.add(target)
+            target = synonyms[target]
+        synonyms[alias] = target
+    return synonyms
+
+
+def fetch_synonyms(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT alias, canonical FROM public.lead_tag_synonyms")
+        rows = dict(cur.fetchall())
+    conn.commit()
+    return rows
+
+
+def sync_synonyms(conn, synonyms):
+    """Upsert do mapa em lead_tag_synonyms (usado pelo trigger); retorna linhas gravadas"""
+    if not synonyms:
+        return 0
+    aliases = sorted(synonyms)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO public.lead_tag_synonyms (alias, canonical)
+            SELECT * FROM unnest(%s::text[], %s::text[])
+            ON CONFLICT (alias) DO UPDATE SET canonical = EXCLUDED.canonical
+            WHERE lead_tag_synonyms.canonical IS DISTINCT FROM EXCLUDED.canonical
+        """, (aliases, [synonyms[a] for a in aliases]))
+        written = cur.rowcount
+    conn.commit()
+    return written
+
+
+def stream_tag_frequencies(conn, company_id=None, itersize=5000):
+    """Gera (tag, leads) das tags distintas, lidas por cursor no servidor"""
+    with conn.cursor(name='tag_normalizer_tags') as cur:
+        cur.itersize = itersize
+        cur.execute("""
+            SELECT u.tag, COUNT(*)
+            FROM public.leads l
+            CROSS JOIN LATERAL unnest(l.tags) AS u(tag)
+            WHERE l.tags <> '{}'
+              AND (%s::uuid IS NULL OR l.company_id = %s::uuid)
+            GROUP BY u.tag
+        """, (company_id, company_id))
+        for tag, count in cur:
+            yield tag, count
+    conn.commit()
+
+
+def build_plan(frequencies, synonyms):
+    """(mapa origem -> destino, {destino: [(origem, leads)]}, tags antes, tags depois)"""
+    mapping = {}
+    merges = collections.defaultdict(list)
+    before = 0
+    after = set()
+    for tag, count in frequencies:
+        before += 1
+        canonical = canonical_form(tag)
+        canonical = synonyms.get(canonical, canonical)
+        if canonical is not None:
+            after.add(canonical)
+        if canonical != tag:
+            mapping[tag] = canonical
+            merges[canonical].append((tag, count))
+    return mapping, merges, before, len(after)
+
+
+def sql_parity(conn, tags):
+    """Tags canônicas que o normalize_tag do banco ainda alteraria (deveria ser vazio)"""
+    if not tags:
+        return []
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT t FROM unnest(%s::text[]) t
+            WHERE public.normalize_tag(t) IS DISTINCT FROM t
+        """, (sorted(tags),))
+        rows = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return rows
+
+
+def print_plan(mapping, merges, before, after, show):
+    print(f"📋 {before:,} tags distintas → {after:,} canônicas ({len(mapping):,} a reescrever)")
+    ranked = sorted(merges.items(), key=lambda item: -sum(count for _, count in item[1]))
+    for canonical, sources in ranked[:show]:
+        origin = ', '.join(f"'{tag}' ({count:,})" for tag, count in sorted(sources, key=lambda s: -s[1])[:6])
+        print(f"   {canonical or '(removida)'!s:<25} ← {origin}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Normaliza e deduplica as tags de leads")
+    parser.add_argument('command', choices=['plan', 'apply'])
+    parser.add_argument('--synonyms', help="Arquivo JSON de sinônimos")
+    parser.add_argument('--company', help="Limita a uma company_id")
+    parser.add_argument('--out', help="plan: grava o mapa origem -> destino em JSON")
+    parser.add_argument('--show', type=int, default=20, help="Fusões exibidas")
+    parser.add_argument('--batch', type=int, default=500, help="Leads por lote inicial")
+    parser.add_argument('--max-batch', type=int, default=5000)
+    parser.add_argument('--target-ms', type=int, default=500, help="Duração alvo por lote")
+    parser.add_argument('--lock-timeout-ms', type=int, default=2000)
+    parser.add_argument('--max-lag', type=float, default=5.0, help="Lag de replicação máximo (s)")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL)")
+    args = parser.parse_args()
+
+    try:
+        file_synonyms = load_synonyms(args.synonyms) if args.synonyms else {}
+    except (OSError, ValueError) as e:
+        print(f"❌ Sinônimos inválidos: {e}")
+        sys.exit(1)
+
+    conn = get_pg_connection(args.dsn, application_name='tag_normalizer')
+    started = time.monotonic()
+    try:
+        synonyms = dict(fetch_synonyms(conn), **file_synonyms)
+        print(f"🚀 Lendo tags de leads ({len(synonyms)} sinônimos)...")
+        mapping, merges, before, after = build_plan(stream_tag_frequencies(conn, args.company), synonyms)
+        print_plan(mapping, merges, before, after, args.show)
+
+        drift = sql_parity(conn, {target for target in mapping.values() if target})
+        if drift:
+            print(f"⚠️ {len(drift)} tags canônicas seriam alteradas de novo pelo trigger "
+                  f"(ex.: {', '.join(drift[:5])}); revise normalize_tag")
+
+        if args.command == 'plan':
+            if args.out:
+                with open(args.out, 'w', encoding='utf-8') as fh:
+                    json.dump({'mapping': mapping, 'synonyms': synonyms}, fh, ensure_ascii=False, indent=2)
+                print(f"📁 Plano salvo em {args.out}")
+            return
+
+        written = sync_synonyms(conn, file_synonyms)
+        if written:
+            print(f"📚 {written} sinônimos gravados em lead_tag_synonyms")
+        chunker = AdaptiveChunker(initial=min(args.batch, args.max_batch), minimum=10,
+                                  maximum=args.max_batch, target_seconds=args.target_ms / 1000.0)
+        throttle = LoadThrottle(conn, max_replication_lag=args.max_lag)
+        changed = rewrite_tags(conn, mapping, chunker, throttle, args.company, args.lock_timeout_ms,
+                               label='leads normalizados')
+        print(f"🎉 {changed:,} leads normalizados em {format_duration(time.monotonic() - started)}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrompido; lotes concluídos já foram confirmados")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
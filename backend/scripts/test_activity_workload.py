@@ -0,0 +1,89 @@
+"""Testes da agregação de carga (activity_workload.dimension_report/company_report), sem banco"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from activity_workload import DIMENSIONS, company_report, dimension_report, segment_percentiles  # noqa: E402
+
+DAY = 86400.0
+NOW = 1000 * DAY
+NAN = float('nan')
+
+
+def make_data(rows):
+    """rows: (responsável, status, urgente, estimado, real, dias de atraso ou None)"""
+    n = len(rows)
+    data = {name: np.full(n, '', dtype=object) for name in DIMENSIONS}
+    data['employee'] = np.array([r[0] for r in rows], dtype=object)
+    data['status'] = np.array([r[1] for r in rows], dtype=object)
+    data['urgent'] = np.array([r[2] for r in rows], dtype=bool)
+    data['estimated'] = np.array([NAN if r[3] is None else r[3] for r in rows], dtype=np.float64)
+    data['actual'] = np.array([NAN if r[4] is None else r[4] for r in rows], dtype=np.float64)
+    data['due'] = np.array([NAN if r[5] is None else NOW - r[5] * DAY for r in rows], dtype=np.float64)
+    return data
+
+
+ROWS = [
+    ('ana', 'pending', True, 4, None, 2),
+    ('ana', 'in_progress', False, None, None, -1),
+    ('ana', 'completed', False, 2, 3, 10),
+    ('ana', 'archived', False, 8, None, 40),
+    ('bia', 'in-progress', False, 5, None, 45),
+    ('bia', 'completed', False, 4, 2, None),
+    ('bia', 'overdue', False, 1, None, 0.5),
+]
+
+
+def rows_by_key(rows):
+    return {key: (items, open_items, overdue, hours, metrics) for key, items, open_items, overdue, hours, metrics in rows}
+
+
+def test_open_load_uses_explicit_statuses():
+    data = make_data(ROWS)
+    report = rows_by_key(dimension_report(data['employee'], data, NOW))
+
+    items, open_items, overdue, hours, metrics = report['ana']
+    # archived não é carga aberta nem atraso, mas conta nos itens
+    assert (items, open_items, overdue, hours) == (4, 2, 1, 4.0)
+    assert metrics['load'] == {'open': 2, 'open_estimated_hours': 4.0, 'open_unestimated': 1, 'urgent_open': 1}
+    assert metrics['overdue']['aging'] == [0, 1, 0, 0, 0]
+
+    items, open_items, overdue, hours, metrics = report['bia']
+    assert (items, open_items, overdue, hours) == (3, 2, 2, 6.0)
+    assert metrics['overdue']['aging'] == [1, 0, 0, 0, 1]
+
+
+def test_estimate_error():
+    data = make_data(ROWS)
+    report = rows_by_key(dimension_report(data['employee'], data, NOW))
+
+    error = report['ana'][4]['estimate_error']
+    assert error['samples'] == 1
+    assert error['bias'] == 1.5
+    assert error['ratio']['p50'] == 1.5
+    assert error['histogram'] == [0, 0, 0, 1, 0]
+    assert report['ana'][4]['completed'] == {'items': 1, 'estimated_hours': 2.0, 'actual_hours': 3.0}
+
+    assert report['bia'][4]['estimate_error']['histogram'] == [0, 1, 0, 0, 0]
+
+
+def test_company_totals_and_empty_dimensions():
+    data = make_data(ROWS)
+    report = company_report(data, NOW)
+    [(key, items, open_items, overdue, hours, _)] = report['company']
+    assert (key, items, open_items, overdue, hours) == ('', 7, 4, 3, 10.0)
+    assert [row[0] for row in report['sprint']] == ['']
+
+    empty = make_data([])
+    assert dimension_report(empty['employee'], empty, NOW) == []
+
+
+def test_segment_percentiles_match_numpy():
+    rng = np.random.default_rng(3)
+    values = rng.random(500)
+    groups = rng.integers(0, 4, 500)
+    result = segment_percentiles(values, groups, 5, (50, 75, 90))
+    for g in range(4):
+        assert np.allclose(result[g], np.percentile(values[groups == g], (50, 75, 90)))
+    assert np.isnan(result[4]).all()
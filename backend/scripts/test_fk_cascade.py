@@ -0,0 +1,89 @@
+"""Testes do plano e do SQL gerado por fk_cascade (CascadePlan/CascadeSqlBuilder), sem banco"""
+
+from fk_cascade import CascadePlan, CascadeSqlBuilder, fk_is_indexed, index_ddl
+
+
+def fk(name, child, child_column, parent, parent_column='id', on_delete='a'):
+    columns = child_column if isinstance(child_column, list) else [child_column]
+    return {'name': name, 'child': f"public.{child}", 'child_columns': columns,
+            'parent': f"public.{parent}", 'parent_columns': [parent_column] * len(columns), 'on_delete': on_delete}
+
+
+FOREIGN_KEYS = [
+    fk('atendimentos_lead_fk', 'whatsapp_atendimentos', 'lead_id', 'leads'),
+    fk('mensagens_atendimento_fk', 'whatsapp_mensagens', 'atendimento_id', 'whatsapp_atendimentos', on_delete='c'),
+    fk('mensagens_lead_fk', 'whatsapp_mensagens', 'lead_id', 'leads'),
+    fk('activities_lead_fk', 'activities', 'lead_id', 'leads', on_delete='n'),
+    fk('comments_lead_fk', 'lead_comments', 'lead_id', 'leads', on_delete='c'),
+    fk('comments_parent_fk', 'lead_comments', 'parent_id', 'lead_comments', on_delete='c'),
+    fk('tags_composite_fk', 'lead_tags', ['lead_id', 'company_id'], 'leads'),
+    fk('notes_default_fk', 'lead_notes', 'lead_id', 'leads', on_delete='d'),
+    fk('unrelated_fk', 'products', 'supplier_id', 'suppliers'),
+]
+
+
+def test_plan_orders_parents_before_children():
+    plan = CascadePlan('public.leads', FOREIGN_KEYS)
+    assert plan.order[0] == 'public.leads'
+    position = {table: i for i, table in enumerate(plan.order)}
+    assert position['public.whatsapp_atendimentos'] < position['public.whatsapp_mensagens']
+    assert 'public.products' not in plan.nodes
+    assert [f['name'] for f in plan.null_edges] == ['activities_lead_fk']
+    assert [f['name'] for f in plan.self_edges['public.lead_comments']] == ['comments_parent_fk']
+    assert sorted(f['name'] for f, _ in plan.skipped) == ['notes_default_fk', 'tags_composite_fk']
+
+
+def test_plan_breaks_cycles_between_tables():
+    foreign_keys = [
+        fk('a_root', 'a', 'root_id', 'root'),
+        fk('b_a', 'b', 'a_id', 'a'),
+        fk('a_b', 'a', 'b_id', 'b'),
+    ]
+    plan = CascadePlan('public.root', foreign_keys)
+    assert plan.order == ['public.root', 'public.a', 'public.b']
+    assert [(f['name'], reason.startswith('fecha ciclo')) for f, reason in plan.skipped] == [('a_b', True)]
+
+
+def test_plan_respects_max_depth():
+    plan = CascadePlan('public.leads', FOREIGN_KEYS, max_depth=1)
+    assert 'public.whatsapp_mensagens' in plan.nodes  # alcançada também direto de leads
+    plan = CascadePlan('public.leads', FOREIGN_KEYS[:2], max_depth=1)
+    assert 'public.whatsapp_mensagens' not in plan.nodes
+    assert [f['name'] for f, _ in plan.skipped] == ['mensagens_atendimento_fk']
+
+
+def test_statements_delete_leaves_first():
+    builder = CascadeSqlBuilder(CascadePlan('public.leads', FOREIGN_KEYS), 'id', 'uuid')
+    statements = builder.statements()
+    labels = [label for label, _, _ in statements]
+    assert labels[-1] == 'leads'
+    assert labels.index('whatsapp_mensagens') < labels.index('whatsapp_atendimentos')
+    assert labels.index('activities.lead_id -> NULL') < labels.index('leads')
+
+    sql = dict((label, sql) for label, _, sql in statements)
+    assert sql['leads'] == 'DELETE FROM "public"."leads" t0 WHERE t0."id" = ANY(p_ids)'
+    # Mensagens: alcançadas por atendimento OU direto pelo lead
+    assert ' OR ' in sql['whatsapp_mensagens']
+    assert 'ANY(p_ids)' in sql['whatsapp_mensagens']
+    assert sql['activities.lead_id -> NULL'].startswith('UPDATE ')
+    # Auto-referência fecha o conjunto com CTE recursiva
+    assert 'WITH RECURSIVE' in sql['lead_comments']
+
+
+def test_function_sql():
+    builder = CascadeSqlBuilder(CascadePlan('public.leads', FOREIGN_KEYS), 'id', 'uuid')
+    text = builder.function_sql()
+    assert builder.function_name == 'cascade_delete_leads'
+    assert 'RETURNS TABLE (table_name TEXT, deleted BIGINT)' in text
+    assert 'SECURITY DEFINER' in text
+    assert 'GRANT EXECUTE ON FUNCTION "public"."cascade_delete_leads"(uuid[]) TO service_role;' in text
+    assert 'tags_composite_fk' in text and 'FK composta' in text
+    assert text.count('GET DIAGNOSTICS') == len(builder.statements())
+
+
+def test_index_helpers():
+    foreign_key = fk('mensagens_lead_fk', 'whatsapp_mensagens', 'lead_id', 'leads')
+    assert fk_is_indexed(foreign_key, {'public.whatsapp_mensagens': [['lead_id', 'created_at']]})
+    assert not fk_is_indexed(foreign_key, {'public.whatsapp_mensagens': [['created_at', 'lead_id']]})
+    assert 'idx_whatsapp_mensagens_lead_id' in index_ddl(foreign_key)
+    assert index_ddl(foreign_key).startswith('CREATE INDEX CONCURRENTLY IF NOT EXISTS')
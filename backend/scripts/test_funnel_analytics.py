@@ -0,0 +1,125 @@
+"""Testes da agregação do funil (funnel_analytics.company_metrics/funnel_metrics), sem banco"""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from funnel_analytics import StageCatalog, company_metrics, fetch_stages  # noqa: E402
+
+DAY = 86400.0
+NOW = 100 * DAY
+
+STAGES = [
+    ('s1', 'Novo', 1, 'p1'),
+    ('s2', 'Proposta', 2, 'p1'),
+    ('s3', 'Fechamento', 3, 'p1'),
+    ('x1', 'Sem pipeline', 1, None),
+]
+
+
+def make_history(rows):
+    """rows: (lead, stage, dia, backfilled, owner, status, value), contíguas por lead"""
+    columns = list(zip(*rows))
+    return {
+        'lead': np.array(columns[0], dtype=object),
+        'stage': np.array(columns[1], dtype=object),
+        'ts': np.array([d * DAY for d in columns[2]], dtype=np.float64),
+        'backfilled': np.array(columns[3], dtype=bool),
+        'owner': np.array(columns[4], dtype=object),
+        'status': np.array(columns[5], dtype=object),
+        'value': np.array(columns[6], dtype=np.float64),
+    }
+
+
+def by_key(results):
+    return {(pipeline, owner): (leads, metrics) for pipeline, owner, leads, metrics in results}
+
+
+def test_reach_conversion_and_matrix():
+    history = make_history([
+        ('a', 's1', 0, False, 'o1', 'won', 100),
+        ('a', 's2', 1, False, 'o1', 'won', 100),
+        ('a', 's3', 3, False, 'o1', 'won', 100),
+        ('b', 's1', 0, False, 'o1', 'lost', 50),
+        ('b', 's2', 2, False, 'o1', 'lost', 50),
+        ('c', 's1', 5, False, 'o2', 'cold', 0),
+    ])
+    results = by_key(company_metrics(history, StageCatalog(STAGES), NOW, min_owner_leads=2))
+
+    leads, metrics = results[('p1', None)]
+    assert leads == 3
+    assert metrics['stages'] == ['s1', 's2', 's3']
+    assert metrics['reach'] == [3, 2, 1]
+    assert metrics['conversion'] == [pytest.approx(2 / 3, abs=1e-4), 0.5]
+    assert metrics['matrix'] == [[0, 2, 0], [0, 0, 1], [0, 0, 0]]
+
+    velocity = metrics['velocity']
+    assert (velocity['won'], velocity['lost'], velocity['win_rate']) == (1, 1, 0.5)
+    assert velocity['avg_won_value'] == 100
+    assert velocity['avg_cycle_days'] == 3
+
+    # o1 tem 2 leads (>= min_owner_leads); o2 só 1
+    assert results[('p1', 'o1')][0] == 2
+    assert ('p1', 'o2') not in results
+
+
+def test_time_in_stage_skips_backfilled_entries():
+    history = make_history([
+        ('a', 's1', 0, True, 'o1', 'cold', 0),
+        ('a', 's2', 10, False, 'o1', 'cold', 0),
+        ('b', 's1', 20, False, 'o1', 'cold', 0),
+        ('b', 's2', 22, False, 'o1', 'cold', 0),
+    ])
+    metrics = by_key(company_metrics(history, StageCatalog(STAGES), NOW))[('p1', None)][1]
+
+    s1 = metrics['time_in_stage']['s1']
+    assert s1['closed'] == 1
+    assert s1['hours']['p50'] == 48.0
+    s2 = metrics['time_in_stage']['s2']
+    assert (s2['closed'], s2['open']) == (0, 2)
+    assert s2['open_median_hours'] == pytest.approx((90 + 78) / 2 * 24)
+
+
+class FakeConnection:
+    """Registra as consultas e devolve linhas fixas"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def commit(self):
+        pass
+
+
+def test_stage_catalog_is_scoped_to_company():
+    conn = FakeConnection(STAGES)
+    catalog = fetch_stages(conn, 'company-a', ['s1', None, 's1', 'x1'])
+    sql, params = conn.executed[0]
+    assert 'company_id = %(company)s' in sql
+    assert params == {'company': 'company-a', 'stages': ['s1', 'x1']}
+    assert catalog.by_pipeline == {'p1': ['s1', 's2', 's3'], None: ['x1']}
+
+    conn = FakeConnection([])
+    fetch_stages(conn, 'company-a', ['s1'], by_company=False)
+    assert 'company_id' not in conn.executed[0][0]
+
+
+def test_empty_history():
+    history = make_history([('a', 's1', 0, False, None, None, 0)])
+    empty = {name: values[:0] for name, values in history.items()}
+    assert company_metrics(empty, StageCatalog(STAGES), NOW) == []
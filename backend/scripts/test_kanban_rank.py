@@ -0,0 +1,65 @@
+"""Testes das chaves fracionárias do Kanban (kanban_rank.rank_between/spaced_keys/simulate)"""
+
+import random
+
+import pytest
+
+from kanban_rank import DIGITS, rank_between, simulate, spaced_keys
+
+
+def test_rank_between_orders_keys():
+    assert rank_between(None, None) == 'V'
+    for before, after in [('a', 'b'), ('a', 'a1'), ('0001', '0002'), ('V', 'W'), ('z', 'zz'), ('Az', 'B')]:
+        key = rank_between(before, after)
+        assert before < key < after, (before, after, key)
+        assert not key.endswith('0')
+
+
+def test_rank_between_ends():
+    assert rank_between('V', None) > 'V'
+    assert rank_between(None, 'V') < 'V'
+    # Topo repetido: cada chave nova fica antes da anterior
+    key = 'V'
+    for _ in range(200):
+        new = rank_between(None, key)
+        assert new < key
+        key = new
+
+
+def test_rank_between_rejects_unordered():
+    with pytest.raises(ValueError):
+        rank_between('b', 'a')
+    with pytest.raises(ValueError):
+        rank_between('a', 'a')
+
+
+def test_random_inserts_keep_order():
+    rng = random.Random(7)
+    keys = []
+    for _ in range(2000):
+        i = rng.randint(0, len(keys))
+        key = rank_between(keys[i - 1] if i else None, keys[i] if i < len(keys) else None)
+        keys.insert(i, key)
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert all(c in DIGITS for key in keys for c in key)
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 61, 62, 500, 5000])
+def test_spaced_keys(count):
+    keys = spaced_keys(count)
+    assert len(keys) == count
+    assert keys == sorted(keys)
+    assert len(set(keys)) == count
+    assert all(key and not key.endswith('0') for key in keys)
+    # Há espaço para inserir antes, entre e depois
+    if keys:
+        assert rank_between(None, keys[0]) < keys[0]
+        assert rank_between(keys[-1], None) > keys[-1]
+
+
+def test_simulate_adjacent_stays_in_column():
+    result = simulate(60, 3, 500, 'adjacent', 12, 1)
+    # Troca com o vizinho: a posição inteira grava no máximo os dois cards
+    assert result['integer'] <= 2 * 500
+    assert result['rank'] == 500
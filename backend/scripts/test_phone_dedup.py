@@ -0,0 +1,67 @@
+"""Testes da normalização de telefones e do plano de fusão (phone_dedup), sem banco"""
+
+import datetime
+
+import pytest
+
+pd = pytest.importorskip('pandas')
+
+from phone_dedup import normalize_phones, plan_contact_merges  # noqa: E402
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('(11) 98765-4321', '5511987654321'),
+    ('11987654321', '5511987654321'),
+    ('+55 11 98765-4321', '5511987654321'),
+    ('5511987654321', '5511987654321'),
+    # Prefixo de tronco e código de operadora
+    ('011 98765-4321', '5511987654321'),
+    ('0 15 21 98765-4321', '5521987654321'),
+    # JIDs do WhatsApp
+    ('5511987654321@s.whatsapp.net', '5511987654321'),
+    ('5511987654321:12@s.whatsapp.net', '5511987654321'),
+    # Celular antigo de 8 dígitos ganha o nono dígito; fixo não
+    ('1187654321', '5511987654321'),
+    ('+55 11 8765-4321', '5511987654321'),
+    ('1132654321', '551132654321'),
+    # Estrangeiros só com indicação internacional
+    ('+1 415 555 2671', '14155552671'),
+    ('00 44 1234 567890', '441234567890'),
+])
+def test_normalize_valid(raw, expected):
+    assert normalize_phones([raw]).tolist() == [expected]
+
+
+@pytest.mark.parametrize('raw', [None, '', '123', '(20) 98765-4321', '5511887654321', 'abc', '+55 11 1234'])
+def test_normalize_invalid(raw):
+    assert normalize_phones([raw]).isna().all()
+
+
+def test_normalize_keeps_positions():
+    result = normalize_phones(['bad', '11987654321', None])
+    assert result.isna().tolist() == [True, False, True]
+    assert result.iloc[1] == '5511987654321'
+
+
+def test_plan_contact_merges_picks_survivor():
+    day = datetime.datetime(2025, 1, 1)
+    contacts = pd.DataFrame.from_records([
+        ('c1', 'o1', '11987654321', day, 1),
+        ('c2', 'o1', '+55 11 98765-4321', day - datetime.timedelta(days=5), 1),
+        ('c3', 'o1', '5511987654321@s.whatsapp.net', day, 3),
+        ('c4', 'o2', '11987654321', day, 0),
+        ('c5', 'o1', '123', day, 0),
+    ], columns=['id', 'owner_id', 'phone', 'created_at', 'filled'])
+    contacts['e164'] = normalize_phones(contacts['phone'])
+
+    merges = plan_contact_merges(contacts)
+    # Mais campos preenchidos vence; no empate, o mais antigo vem primeiro
+    assert sorted(zip(merges['keep_id'], merges['drop_id'])) == [('c3', 'c1'), ('c3', 'c2')]
+    assert set(merges['owner_id']) == {'o1'}
+
+
+def test_plan_contact_merges_empty():
+    contacts = pd.DataFrame({'id': ['c1'], 'owner_id': ['o1'], 'phone': ['x'],
+                             'created_at': [None], 'filled': [0]})
+    contacts['e164'] = normalize_phones(contacts['phone'])
+    assert plan_contact_merges(contacts).empty
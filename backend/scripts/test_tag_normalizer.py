@@ -0,0 +1,85 @@
+"""Testes da forma canônica das tags (tag_normalizer) e da tabela translate de normalize_tag"""
+
+import json
+import os
+import re
+
+import pytest
+
+from tag_normalizer import build_plan, canonical_form, load_synonyms
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', '..', 'supabase', 'migrations',
+                         '20250930000000_lead_tag_normalization.sql')
+
+
+def translate_tables():
+    """(origem, destino) do translate() de public.normalize_tag"""
+    with open(MIGRATION, encoding='utf-8') as fh:
+        sql = fh.read()
+    match = re.search(r"translate\(\s*p_tag,\s*'([^']*)',\s*'([^']*)'", sql)
+    assert match, "translate() não encontrado em normalize_tag"
+    return match.group(1), match.group(2)
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('Urgente', 'urgente'),
+    ('  URGENTE  ', 'urgente'),
+    ('Lead   Quente', 'lead quente'),
+    ('Negociação', 'negociacao'),
+    ('ÁREA  Técnica\t', 'area tecnica'),
+    ('Straße', 'strasse'),
+    ('ﬁnanceiro', 'financeiro'),
+    ('', None),
+    ('   ', None),
+    (None, None),
+])
+def test_canonical_form(raw, expected):
+    assert canonical_form(raw) == expected
+
+
+def test_canonical_form_is_idempotent():
+    for tag in ('Negociação', 'VIP  cliente', 'Ação rápida'):
+        once = canonical_form(tag)
+        assert canonical_form(once) == once
+
+
+def test_translate_tables_match_canonical_form():
+    source, target = translate_tables()
+    assert len(source) == len(target)
+    assert len(set(source)) == len(source)
+    for accented, plain in zip(source, target):
+        # normalize_tag aplica lower() depois do translate
+        assert canonical_form(accented) == plain.lower(), accented
+
+
+def test_translate_output_is_fixed_point():
+    # A saída de canonical_form não pode conter nada que o translate ainda trocaria
+    source, _ = translate_tables()
+    for tag in ('Negociação Avançada', 'Ñandú', 'Crème brûlée', 'ÝÿÜ'):
+        assert not set(canonical_form(tag)) & set(source)
+
+
+def test_load_synonyms_resolves_chains(tmp_path):
+    path = tmp_path / 'synonyms.json'
+    path.write_text(json.dumps({'Hot': 'Lead Quente', 'lead quente': 'quente', 'vip': ['Cliente VIP', 'VIP ']}),
+                    encoding='utf-8')
+    assert load_synonyms(str(path)) == {'hot': 'quente', 'lead quente': 'quente', 'cliente vip': 'vip'}
+
+
+def test_load_synonyms_rejects_conflicts_and_cycles(tmp_path):
+    path = tmp_path / 'conflict.json'
+    path.write_text(json.dumps({'a': ['x'], 'b': ['x']}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_synonyms(str(path))
+    path = tmp_path / 'cycle.json'
+    path.write_text(json.dumps({'a': 'b', 'b': 'a'}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_synonyms(str(path))
+
+
+def test_build_plan():
+    frequencies = [('Urgente', 3), ('urgente ', 2), ('urgente', 10), ('Hot', 4), ('  ', 1)]
+    mapping, merges, before, after = build_plan(frequencies, {'hot': 'quente'})
+    assert mapping == {'Urgente': 'urgente', 'urgente ': 'urgente', 'Hot': 'quente', '  ': None}
+    assert sorted(merges['urgente']) == [('Urgente', 3), ('urgente ', 2)]
+    assert (before, after) == (5, 2)
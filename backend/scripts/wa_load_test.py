@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+"""
+Harness de carga offline para a ingestão e listagem de mensagens do WhatsApp
+
+Gera (ou reproduz de um NDJSON) eventos no formato do Baileys a taxas configuráveis
+e os persiste como wa-persist-message faz (upsert do atendimento, insert da
+mensagem, increment_unread_or_zero e atualização da prévia), direto no Postgres
+(--target sql) ou via PostgREST (--target rest). Em paralelo, leitores executam as
+listagens (get_conversations_keyset, get_conversation_messages_keyset e a consulta
+de wa-list-conversations) e um monitor amostra as esperas por lock.
+
+Relata, por fase de taxa: vazão de escrita atingida, latência de escrita
+(serviço e ponta a ponta, incluindo fila), latência das listagens sob escrita
+concorrente e esperas por lock (por tipo: tuple, transactionid, advisory...).
+
+As linhas geradas usam connection_id com prefixo loadtest_ e são removidas com
+--cleanup. Não rode contra produção.
+
+Uso:
+    python wa_load_test.py --owners 5 --rate 50,200,800 --phase-seconds 30 --writers 8 --readers 4
+    python wa_load_test.py --replay /tmp/crm_small/whatsapp_mensagens.ndjson.gz --rate 500 --report /tmp/wa_load.json
+    python wa_load_test.py --target rest --rest-url http://localhost:3000 --rate 100
+    python wa_load_test.py --cleanup
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+from dataset_io import iter_ndjson
+from pg_utils import get_pg_connection, latency_summary, list_distinct_owners
+
+try:
+    from psycopg2.extras import Json
+except ImportError:
+    Json = None
+
+RUN_PREFIX = 'loadtest_'
+
+CHAT_PHRASES = ['Oi, tudo bem?', 'Qual o valor?', 'Pode me mandar o orçamento?', 'Obrigado!',
+                'Vou verificar e te retorno', 'Tem disponível?', 'Fechado', 'Qual o prazo de entrega?']
+MEDIA_TYPES = {
+    'imageMessage': ('IMAGEM', 'image/jpeg'),
+    'audioMessage': ('AUDIO', 'audio/ogg; codecs=opus'),
+    'videoMessage': ('VIDEO', 'video/mp4'),
+    'documentMessage': ('DOCUMENTO', 'application/pdf'),
+    'stickerMessage': ('STICKER', 'image/webp'),
+}
+
+UPSERT_ATENDIMENTO_SQL = """
+    INSERT INTO public.whatsapp_atendimentos (
+      owner_id, connection_id, numero_cliente, nome_cliente, status,
+      ultima_mensagem_preview, ultima_mensagem_em
+    )
+    VALUES (%(owner)s, %(connection)s, %(phone)s, %(name)s, 'active', %(preview)s, %(ts)s)
+    ON CONFLICT (owner_id, connection_id, numero_cliente) DO UPDATE
+      SET nome_cliente = COALESCE(EXCLUDED.nome_cliente, whatsapp_atendimentos.nome_cliente),
+          status = 'active',
+          ultima_mensagem_preview = EXCLUDED.ultima_mensagem_preview,
+          ultima_mensagem_em = EXCLUDED.ultima_mensagem_em
+    RETURNING id
+"""
+
+INSERT_MESSAGE_SQL = """
+    INSERT INTO public.whatsapp_mensagens (
+      owner_id, atendimento_id, chat_id, message_id, phone, wpp_name, connection_id,
+      conteudo, tipo, message_type, remetente, "timestamp", lida, media_url, media_mime, raw
+    )
+    VALUES (
+      %(owner)s, %(atendimento)s, %(chat)s, %(message_id)s, %(phone)s, %(name)s, %(connection)s,
+      %(text)s, %(tipo)s, %(tipo)s, %(remetente)s, %(ts)s, %(lida)s, %(media_url)s, %(mime)s, %(raw)s
+    )
+"""
+
+UPDATE_PREVIEW_SQL = """
+    UPDATE public.whatsapp_atendimentos
+    SET ultima_mensagem_preview = %(preview)s, ultima_mensagem_em = %(ts)s
+    WHERE id = %(atendimento)s
+"""
+
+LIST_ATENDIMENTOS_SQL = """
+    SELECT id, connection_id, numero_cliente, nome_cliente, ultima_mensagem_preview,
+           ultima_mensagem_em, nao_lidas
+    FROM public.whatsapp_atendimentos
+    WHERE connection_id = %(connection)s
+    ORDER BY ultima_mensagem_em DESC NULLS LAST
+"""
+
+LOCK_SAMPLE_SQL = """
+    SELECT COALESCE(wait_event, '?'), COUNT(*),
+           COALESCE(MAX(EXTRACT(EPOCH FROM now() - query_start)), 0) * 1000.0
+    FROM pg_stat_activity
+    WHERE datname = current_database()
+      AND wait_event_type = 'Lock'
+      AND pid <> pg_backend_pid()
+    GROUP BY 1
+"""
+
+
+def parse_rates(text):
+    """'50,200,800' -> [50.0, 200.0, 800.0]"""
+    rates = [float(part) for part in text.split(',') if part.strip()]
+    if not rates or any(rate <= 0 for rate in rates):
+        raise argparse.ArgumentTypeError("taxas devem ser números positivos separados por vírgula")
+    return rates
+
+
+def connection_for(run_id, owner_id):
+    """connection_id sintético (prefixo loadtest_) de um owner nesta execução"""
+    return f"{RUN_PREFIX}{run_id}_{str(owner_id)[:8]}"
+
+
+# =====================================================
+# FONTES DE EVENTOS
+# =====================================================
+
+def generate_events(owners, seed=42, chats_per_owner=200, media_rate=0.15):
+    """Eventos sintéticos infinitos; poucas conversas concentram a maior parte do tráfego"""
+    rng = random.Random(seed)
+    chats = {}
+    for owner_id in owners:
+        chats[owner_id] = [
+            (f"55{rng.choice([11, 21, 31, 41, 51, 61, 71, 81])}9{rng.randint(10000000, 99999999)}",
+             f"Contato {rng.randint(1, 99999)}")
+            for _ in range(chats_per_owner)
+        ]
+    while True:
+        owner_id = rng.choice(owners)
+        # Pareto: as primeiras conversas da lista são as "quentes" (campanhas, grupos)
+        index = min(int(rng.paretovariate(1.2)) - 1, chats_per_owner - 1)
+        phone, name = chats[owner_id][index]
+        from_me = rng.random() < 0.4
+        message_id = f"3EB0{rng.getrandbits(64):016X}"
+        if rng.random() < media_rate:
+            kind = rng.choice(sorted(MEDIA_TYPES))
+            message = {kind: {'mimetype': MEDIA_TYPES[kind][1],
+                              'url': f"https://media.bench.local/{owner_id}/{message_id}"}}
+        else:
+            message = {'conversation': rng.choice(CHAT_PHRASES)}
+        yield {
+            'ownerId': owner_id,
+            'key': {'remoteJid': f"{phone}@s.whatsapp.net", 'fromMe': from_me, 'id': message_id},
+            'pushName': None if from_me else name,
+            'messageTimestamp': int(time.time()),
+            'message': message,
+        }
+
+
+def replay_events(path, owners, loop=False, keep_timestamps=False):
+    """
+    Reproduz eventos de um NDJSON: eventos Baileys puros ou linhas de
+    whatsapp_mensagens do generate_crm_dataset.py (usa a coluna raw). Cada chat é
+    atribuído a um dos owners de forma estável.
+    """
+    while True:
+        emitted = 0
+        for record in iter_ndjson(path):
+            event = record.get('raw') if 'raw' in record else record
+            if not isinstance(event, dict) or 'key' not in event:
+                continue
+            jid = event['key'].get('remoteJid') or ''
+            event = dict(event)
+            event['ownerId'] = owners[zlib.crc32(jid.encode()) % len(owners)]
+            if not keep_timestamps:
+                event['messageTimestamp'] = int(time.time())
+            emitted += 1
+            yield event
+        if not loop or not emitted:
+            return
+
+
+def event_to_message(event):
+    """Converte um evento Baileys nos campos persistidos por wa-persist-message"""
+    key = event.get('key') or {}
+    jid = key.get('remoteJid') or ''
+    message = event.get('message') or {}
+    from_me = bool(key.get('fromMe'))
+
+    text = message.get('conversation') or (message.get('extendedTextMessage') or {}).get('text')
+    tipo, mime, media_url = 'TEXTO', None, None
+    for kind, body in message.items():
+        if kind in MEDIA_TYPES or kind == 'mediaMessage':
+            tipo, default_mime = MEDIA_TYPES.get(kind, ('DOCUMENTO', None))
+            mime = (body or {}).get('mimetype') or default_mime
+            media_url = (body or {}).get('url')
+            text = text or (body or {}).get('caption')
+            if kind == 'mediaMessage' and mime:
+                tipo = {'image': 'IMAGEM', 'audio': 'AUDIO', 'video': 'VIDEO'}.get(mime.split('/')[0], 'DOCUMENTO')
+            break
+
+    ts = datetime.datetime.fromtimestamp(int(event.get('messageTimestamp') or time.time()),
+                                         tz=datetime.timezone.utc)
+    raw = {k: v for k, v in event.items() if k != 'ownerId'}
+    return {
+        'owner': event['ownerId'],
+        'chat': jid,
+        'phone': jid.split('@')[0],
+        'message_id': key.get('id') or uuid.uuid4().hex.upper(),
+        'name': None if from_me else event.get('pushName'),
+        'text': text,
+        'tipo': tipo,
+        'remetente': 'ATENDENTE' if from_me else 'CLIENTE',
+        'lida': from_me,
+        'media_url': media_url,
+        'mime': mime,
+        'ts': ts,
+        'preview': (text or f"[{tipo}]")[:160],
+        'raw': raw,
+    }
+
+
+# =====================================================
+# ALVOS: POSTGRES DIRETO OU POSTGREST
+# =====================================================
+
+class SqlTarget:
+    """Executa o caminho do wa-persist-message e as listagens direto no Postgres"""
+
+    def __init__(self, dsn, single_transaction=False):
+        self.conn = get_pg_connection(dsn, autocommit=not single_transaction,
+                                      application_name='wa_load_test')
+        self.single_transaction = single_transaction
+
+    def persist(self, msg):
+        params = dict(msg, raw=Json(msg['raw']))
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(UPSERT_ATENDIMENTO_SQL, params)
+                params['atendimento'] = cur.fetchone()[0]
+                cur.execute(INSERT_MESSAGE_SQL, params)
+                if msg['remetente'] == 'CLIENTE':
+                    cur.execute("SELECT public.increment_unread_or_zero(%s)", (params['atendimento'],))
+                cur.execute(UPDATE_PREVIEW_SQL, params)
+            if self.single_transaction:
+                self.conn.commit()
+        except Exception:
+            if not self.conn.autocommit:
+                self.conn.rollback()
+            raise
+
+    def list(self, workload, owner_id, chat_id, connection_id):
+        with self.conn.cursor() as cur:
+            if workload == 'conversations':
+                cur.execute("SELECT * FROM public.get_conversations_keyset(%s, 20, NULL)", (owner_id,))
+            elif workload == 'messages':
+                cur.execute("SELECT * FROM public.get_conversation_messages_keyset(%s, %s, 50, NULL)",
+                            (owner_id, chat_id))
+            else:
+                cur.execute(LIST_ATENDIMENTOS_SQL, {'connection': connection_id})
+            rows = cur.fetchall()
+        if not self.conn.autocommit:
+            self.conn.commit()
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
+
+
+class RestTarget:
+    """Mesmas operações via PostgREST (as mesmas idas e voltas do supabase-js)"""
+
+    def __init__(self, base_url, api_key=None):
+        try:
+            import requests
+        except ImportError:
+            print("❌ requests não encontrado. Instale com: pip install requests")
+            sys.exit(1)
+        self.base = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.session.headers['Content-Type'] = 'application/json'
+        if api_key:
+            self.session.headers['apikey'] = api_key
+            self.session.headers['Authorization'] = f"Bearer {api_key}"
+
+    def _call(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.base}/{path}", timeout=30, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path}: HTTP {response.status_code} {response.text[:200]}")
+        return response.json() if response.content else None
+
+    def persist(self, msg):
+        ts = msg['ts'].isoformat()
+        atendimento = self._call(
+            'POST', 'whatsapp_atendimentos',
+            params={'on_conflict': 'owner_id,connection_id,numero_cliente', 'select': 'id,nao_lidas'},
+            headers={'Prefer': 'resolution=merge-duplicates,return=representation'},
+            json={'owner_id': msg['owner'], 'connection_id': msg['connection'], 'numero_cliente': msg['phone'],
+                  'nome_cliente': msg['name'], 'status': 'active',
+                  'ultima_mensagem_preview': msg['preview'], 'ultima_mensagem_em': ts},
+        )[0]
+        self._call('POST', 'whatsapp_mensagens', headers={'Prefer': 'return=minimal'}, json={
+            'owner_id': msg['owner'], 'atendimento_id': atendimento['id'], 'chat_id': msg['chat'],
+            'message_id': msg['message_id'], 'phone': msg['phone'], 'wpp_name': msg['name'],
+            'connection_id': msg['connection'], 'conteudo': msg['text'], 'tipo': msg['tipo'],
+            'message_type': msg['tipo'], 'remetente': msg['remetente'], 'timestamp': ts, 'lida': msg['lida'],
+            'media_url': msg['media_url'], 'media_mime': msg['mime'], 'raw': msg['raw'],
+        })
+        if msg['remetente'] == 'CLIENTE':
+            self._call('POST', 'rpc/increment_unread_or_zero', json={'p_atendimento_id': atendimento['id']})
+        self._call('PATCH', 'whatsapp_atendimentos', params={'id': f"eq.{atendimento['id']}"},
+                   headers={'Prefer': 'return=minimal'},
+                   json={'ultima_mensagem_preview': msg['preview'], 'ultima_mensagem_em': ts})
+
+    def list(self, workload, owner_id, chat_id, connection_id):
+        if workload == 'conversations':
+            rows = self._call('POST', 'rpc/get_conversations_keyset', json={'p_owner_id': owner_id, 'p_limit': 20})
+        elif workload == 'messages':
+            rows = self._call('POST', 'rpc/get_conversation_messages_keyset',
+                              json={'p_owner_id': owner_id, 'p_chat_id': chat_id, 'p_limit': 50})
+        else:
+            rows = self._call('GET', 'whatsapp_atendimentos', params={
+                'select': 'id,connection_id,numero_cliente,nome_cliente,ultima_mensagem_preview,'
+                          'ultima_mensagem_em,nao_lidas',
+                'connection_id': f"eq.{connection_id}",
+                'order': 'ultima_mensagem_em.desc.nullslast',
+            })
+        return len(rows or [])
+
+    def close(self):
+        self.session.close()
+
+
+# =====================================================
+# EXECUÇÃO
+# =====================================================
+
+class PhaseStats:
+    """Métricas de uma fase de taxa, alimentadas por várias threads"""
+
+    def __init__(self, rate, seconds):
+        self.rate = rate
+        self.seconds = seconds
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.written = 0
+        self.errors = collections.Counter()
+        self.service_ms = []
+        self.e2e_ms = []
+        self.max_backlog = 0
+        self.reads = collections.defaultdict(list)
+        self.read_errors = 0
+        self.lock_samples = []
+        self.lock_events = collections.Counter()
+        self.max_lock_wait_ms = 0.0
+        self.started = None
+        self.finished = None
+
+    def record_write(self, service_ms, e2e_ms, error=None):
+        with self.lock:
+            if error:
+                self.errors[error] += 1
+            else:
+                self.written += 1
+                self.service_ms.append(service_ms)
+                self.e2e_ms.append(e2e_ms)
+
+    def record_read(self, workload, ms, error=False):
+        with self.lock:
+            if error:
+                self.read_errors += 1
+            else:
+                self.reads[workload].append(ms)
+
+    def record_locks(self, waiting, by_event, max_wait_ms):
+        with self.lock:
+            self.lock_samples.append(waiting)
+            self.lock_events.update(by_event)
+            self.max_lock_wait_ms = max(self.max_lock_wait_ms, max_wait_ms)
+
+    def summary(self):
+        elapsed = max((self.finished or time.monotonic()) - (self.started or time.monotonic()), 1e-9)
+        samples = self.lock_samples
+        return {
+            'target_rate': self.rate,
+            'seconds': round(elapsed, 1),
+            'sent': self.sent,
+            'written': self.written,
+            'achieved_rate': round(self.written / elapsed, 1),
+            'errors': dict(self.errors),
+            'max_backlog': self.max_backlog,
+            'write_service_ms': latency_summary(self.service_ms),
+            'write_e2e_ms': latency_summary(self.e2e_ms),
+            'reads_ms': {name: latency_summary(values) for name, values in sorted(self.reads.items())},
+            'read_errors': self.read_errors,
+            'lock_waiters': {
+                'mean': round(sum(samples) / len(samples), 2) if samples else 0,
+                'max': max(samples) if samples else 0,
+                'max_wait_ms': round(self.max_lock_wait_ms, 1),
+                'by_wait_event': dict(self.lock_events.most_common()),
+            },
+        }
+
+
+class LoadTest:
+    """Produtor com taxa controlada, escritores, leitores e monitor de locks"""
+
+    def __init__(self, args, owners, events, make_target):
+        self.args = args
+        self.owners = owners
+        self.events = events
+        self.make_target = make_target
+        self.phases = [PhaseStats(rate, args.phase_seconds) for rate in args.rate]
+        self.current = self.phases[0]
+        self.queue = queue.Queue(maxsize=max(args.writers * args.queue_per_writer, 1))
+        self.stop = threading.Event()
+        self.hot_chats = collections.defaultdict(lambda: collections.deque(maxlen=50))
+
+    def writer(self):
+        target = self.make_target()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                phase, scheduled, msg = item
+                started = time.monotonic()
+                error = None
+                try:
+                    target.persist(msg)
+                except Exception as e:
+                    error = type(e).__name__
+                    if phase.errors[error] == 0:
+                        print(f"   ⚠️ Erro na escrita ({error}): {str(e).strip()[:200]}")
+                done = time.monotonic()
+                phase.record_write((done - started) * 1000.0, (done - scheduled) * 1000.0, error)
+                if not error:
+                    self.hot_chats[msg['owner']].append(msg['chat'])
+        finally:
+            target.close()
+
+    def reader(self, seed):
+        rng = random.Random(seed)
+        target = self.make_target()
+        workloads = ['conversations', 'messages', 'atendimentos']
+        try:
+            while not self.stop.is_set():
+                owner_id = rng.choice(self.owners)
+                chats = self.hot_chats.get(owner_id)
+                workload = rng.choice(workloads if chats else workloads[:1] + workloads[2:])
+                chat_id = rng.choice(list(chats)) if chats else None
+                phase = self.current
+                started = time.monotonic()
+                try:
+                    target.list(workload, owner_id, chat_id, connection_for(self.args.run_id, owner_id))
+                    phase.record_read(workload, (time.monotonic() - started) * 1000.0)
+                except Exception:
+                    phase.record_read(workload, 0, error=True)
+                if self.args.read_interval:
+                    self.stop.wait(self.args.read_interval)
+        finally:
+            target.close()
+
+    def monitor(self, dsn):
+        conn = get_pg_connection(dsn, autocommit=True, application_name='wa_load_test_monitor')
+        try:
+            while not self.stop.is_set():
+                with conn.cursor() as cur:
+                    cur.execute(LOCK_SAMPLE_SQL)
+                    rows = cur.fetchall()
+                by_event = {event: count for event, count, _ in rows}
+                max_wait = max((float(wait) for _, _, wait in rows), default=0.0)
+                self.current.record_locks(sum(by_event.values()), by_event, max_wait)
+                self.stop.wait(self.args.sample_seconds)
+        finally:
+            conn.close()
+
+    def produce(self):
+        """Enfileira eventos no ritmo de cada fase; fila cheia = escritores saturados"""
+        events = iter(self.events)
+        for phase in self.phases:
+            self.current = phase
+            phase.started = time.monotonic()
+            interval = 1.0 / phase.rate
+            next_at = phase.started
+            deadline = phase.started + phase.seconds
+            print(f"▶️ Fase {phase.rate:g} eventos/s por {phase.seconds}s")
+            while True:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if next_at > now:
+                    time.sleep(min(next_at - now, deadline - now))
+                    continue
+                try:
+                    event = next(events)
+                except StopIteration:
+                    phase.finished = time.monotonic()
+                    print("   ⏹️ Fim dos eventos de replay")
+                    return
+                msg = event_to_message(event)
+                msg['connection'] = connection_for(self.args.run_id, msg['owner'])
+                self.queue.put((phase, next_at, msg))
+                phase.sent += 1
+                phase.max_backlog = max(phase.max_backlog, self.queue.qsize())
+                next_at += interval
+            phase.finished = time.monotonic()
+
+    def run(self, monitor_dsn):
+        threads = [threading.Thread(target=self.writer, daemon=True) for _ in range(self.args.writers)]
+        readers = [threading.Thread(target=self.reader, args=(self.args.seed + i,), daemon=True)
+                   for i in range(self.args.readers)]
+        if monitor_dsn:
+            readers.append(threading.Thread(target=self.monitor, args=(monitor_dsn,), daemon=True))
+        for thread in threads + readers:
+            thread.start()
+
+        try:
+            self.produce()
+        except KeyboardInterrupt:
+            print("\n⏹️ Interrompido; drenando a fila...")
+        for _ in threads:
+            self.queue.put(None)
+        for thread in threads:
+            thread.join()
+        self.stop.set()
+        for thread in readers:
+            thread.join()
+        return [phase.summary() for phase in self.phases if phase.started]
+
+
+def cleanup(dsn, batch_size=5000):
+    """Remove as linhas criadas por execuções anteriores (connection_id loadtest_*)"""
+    conn = get_pg_connection(dsn, autocommit=True, application_name='wa_load_test')
+    pattern = RUN_PREFIX.replace('_', r'\_') + '%'
+    total = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute("""
+                DELETE FROM public.whatsapp_mensagens
+                WHERE id IN (SELECT id FROM public.whatsapp_mensagens WHERE connection_id LIKE %s LIMIT %s)
+            """, (pattern, batch_size))
+            total += cur.rowcount
+            if cur.rowcount < batch_size:
+                break
+        cur.execute("DELETE FROM public.whatsapp_atendimentos WHERE connection_id LIKE %s", (pattern,))
+        atendimentos = cur.rowcount
+        cur.execute("""
+            SELECT to_regclass('public.whatsapp_conversations') IS NOT NULL
+        """)
+        if cur.fetchone()[0]:
+            cur.execute("DELETE FROM public.whatsapp_conversations WHERE connection_id LIKE %s", (pattern,))
+    conn.close()
+    print(f"🧹 {total:,} mensagens e {atendimentos:,} atendimentos de teste removidos")
+
+
+def print_report(phases):
+    print("\n📊 Resultado por fase")
+    print(f"   {'alvo/s':>8} {'atingido/s':>10} {'erros':>6} {'fila':>6} "
+          f"{'esc p50':>8} {'esc p99':>8} {'e2e p99':>9} {'locks máx':>9} {'espera máx':>10}")
+    for phase in phases:
+        service = phase['write_service_ms']
+        e2e = phase['write_e2e_ms']
+        locks = phase['lock_waiters']
+        print(f"   {phase['target_rate']:>8g} {phase['achieved_rate']:>10,.1f} {sum(phase['errors'].values()):>6} "
+              f"{phase['max_backlog']:>6} {service['p50'] or 0:>8.1f} {service['p99'] or 0:>8.1f} "
+              f"{e2e['p99'] or 0:>9.1f} {locks['max']:>9} {locks['max_wait_ms']:>9.0f}ms")
+    for phase in phases:
+        print(f"\n   Listagens a {phase['target_rate']:g} eventos/s:")
+        for name, stats in phase['reads_ms'].items():
+            print(f"      {name:<16} n={stats['n']:<6} p50={stats['p50']}ms p95={stats['p95']}ms p99={stats['p99']}ms")
+        if phase['lock_waiters']['by_wait_event']:
+            events = ', '.join(f"{k}={v}" for k, v in phase['lock_waiters']['by_wait_event'].items())
+            print(f"      esperas por lock: {events}")
+
+
+def main():
+    """Função principal"""
+    parser = argparse.ArgumentParser(description="Teste de carga da ingestão/listagem do WhatsApp")
+    parser.add_argument('--target', choices=['sql', 'rest'], default='sql')
+    parser.add_argument('--rate', type=parse_rates, default=[50.0],
+                        help="Eventos/s por fase, separados por vírgula (ex.: 50,200,800)")
+    parser.add_argument('--phase-seconds', type=int, default=30, help="Duração de cada fase")
+    parser.add_argument('--writers', type=int, default=4, help="Conexões de escrita concorrentes")
+    parser.add_argument('--readers', type=int, default=2, help="Conexões de listagem concorrentes")
+    parser.add_argument('--read-interval', type=float, default=0.05, help="Pausa entre listagens (s)")
+    parser.add_argument('--queue-per-writer', type=int, default=50, help="Eventos em fila por escritor")
+    parser.add_argument('--owner', action='append', help="owner_id usados (padrão: --owners existentes)")
+    parser.add_argument('--owners', type=int, default=3, help="Quantos owners existentes usar")
+    parser.add_argument('--chats', type=int, default=200, help="Conversas sintéticas por owner")
+    parser.add_argument('--replay', help="NDJSON de eventos Baileys (ou whatsapp_mensagens do gerador)")
+    parser.add_argument('--loop', action='store_true', help="Repete o arquivo de replay")
+    parser.add_argument('--keep-timestamps', action='store_true', help="Replay: mantém messageTimestamp original")
+    parser.add_argument('--single-transaction', action='store_true',
+                        help="sql: persiste cada evento numa transação (padrão: autocommit por comando)")
+    parser.add_argument('--sample-seconds', type=float, default=0.5, help="Intervalo do monitor de locks")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--rest-url', default=os.getenv('POSTGREST_URL', 'http://localhost:3000'),
+                        help="Raiz do PostgREST (local) ou https://<projeto>.supabase.co/rest/v1")
+    parser.add_argument('--api-key', default=os.getenv('SUPABASE_SERVICE_ROLE_KEY'))
+    parser.add_argument('--report', help="Grava o resultado em JSON")
+    parser.add_argument('--cleanup', action='store_true', help="Remove os dados de execuções anteriores e sai")
+    parser.add_argument('--dsn', help="Connection string (padrão: SUPABASE_DB_URL); no alvo rest, só para o monitor")
+    args = parser.parse_args()
+    args.run_id = uuid.uuid4().hex[:8]
+
+    if args.cleanup:
+        cleanup(args.dsn)
+        return
+
+    if args.target == 'sql' and Json is None:
+        print("❌ psycopg2 não encontrado. Instale com: pip install psycopg2-binary")
+        sys.exit(1)
+
+    dsn = args.dsn or os.getenv('SUPABASE_DB_URL') or os.getenv('DATABASE_URL')
+    owners = args.owner
+    if not owners and dsn:
+        conn = get_pg_connection(dsn, application_name='wa_load_test')
+        owners = [str(owner) for owner in list_distinct_owners(conn)[:args.owners]]
+        conn.close()
+    if not owners:
+        print("❌ Nenhum owner encontrado; informe --owner (deve existir em auth.users se houver FK)")
+        sys.exit(1)
+
+    if args.replay:
+        events = replay_events(args.replay, owners, loop=args.loop, keep_timestamps=args.keep_timestamps)
+    else:
+        events = generate_events(owners, seed=args.seed, chats_per_owner=args.chats)
+
+    if args.target == 'sql':
+        def make_target():
+            return SqlTarget(args.dsn, single_transaction=args.single_transaction)
+    else:
+        def make_target():
+            return RestTarget(args.rest_url, args.api_key)
+
+    print(f"🚀 Carga {args.target} (execução {args.run_id}): {len(owners)} owners, "
+          f"{args.writers} escritores, {args.readers} leitores, fases {args.rate}")
+    if not dsn:
+        print("   ⚠️ Sem DSN: esperas por lock não serão amostradas")
+
+    phases = LoadTest(args, owners, events, make_target).run(dsn)
+    print_report(phases)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'run_id': args.run_id, 'target': args.target, 'writers': args.writers,
+                       'readers': args.readers, 'owners': owners, 'phases': phases}, f, indent=2, default=str)
+        print(f"\n📁 Relatório salvo em {args.report}")
+    print("🧹 Para remover os dados gerados: python wa_load_test.py --cleanup")
+
+
+if __name__ == "__main__":
+    main()
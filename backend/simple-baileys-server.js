@@ -4377,27 +4377,12 @@ app.post('/api/baileys-simple/connections/:connectionId/mark-read', async (req,
   try {
     console.log(`📖 Marcando conversa como lida: ${chatId} para conexão: ${connectionId}`);
     
-    // Primeiro, verificar quantas mensagens não lidas existem
-    const { data: unreadMessages, error: countError } = await supabase
-      .from('whatsapp_mensagens')
-      .select('id')
-      .eq('connection_id', connectionId)
-      .eq('chat_id', chatId)
-      .eq('remetente', 'CLIENTE')
-      .eq('lida', false);
-
-    if (countError) throw countError;
-    
-    console.log(`🔍 Encontradas ${unreadMessages?.length || 0} mensagens não lidas para ${chatId}`);
-
-    const { error, count } = await supabase
-      .from('whatsapp_mensagens')
-      .update({ lida: true })
-      .eq('connection_id', connectionId)
-      .eq('chat_id', chatId)
-      .eq('remetente', 'CLIENTE')         // only customer messages count as unread
-      .eq('lida', false)
-      .select('id', { count: 'exact' });
+    // Um único UPDATE pelo índice de não lidas; o trigger de whatsapp_conversations
+    // desconta unread_count na mesma transação
+    const { data: count, error } = await supabase.rpc('mark_chat_read', {
+      p_chat_id: chatId,
+      p_connection_id: connectionId,
+    });
 
     if (error) throw error;
 
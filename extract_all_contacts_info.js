@@ -155,11 +155,8 @@ async function extractAllContactsInfo() {
 
     console.log(`⚠️ Mensagens sem wpp_name: ${mensagensSemWppName || 0}`);
 
-    // Contar mensagens sem raw
-    const { count: mensagensSemRaw } = await supabase
-      .from('whatsapp_mensagens')
-      .select('*', { count: 'exact', head: true })
-      .is('raw', null);
+    // Contar mensagens sem raw (o payload fica em whatsapp_mensagens_raw)
+    const { data: mensagensSemRaw } = await supabase.rpc('count_messages_without_raw');
 
     console.log(`⚠️ Mensagens sem raw: ${mensagensSemRaw || 0}`);
 
@@ -114,10 +114,11 @@ async function forceExtractAllContacts() {
     // 3. Atualizar mensagens com informações faltantes
     console.log('\n📊 ETAPA 3: Atualizando mensagens com informações faltantes...');
     
+    // O payload fica em whatsapp_mensagens_raw; raw IS NULL na tabela quente não é "sem payload"
     const { data: mensagensSemInfo, error: mensagensError } = await supabase
       .from('whatsapp_mensagens')
-      .select('*')
-      .or('wpp_name.is.null,raw.is.null')
+      .select('*, whatsapp_mensagens_raw(message_id)')
+      .or('wpp_name.is.null,whatsapp_mensagens_raw.is.null')
       .order('created_at', { ascending: false })
       .limit(50);
 
@@ -141,7 +142,7 @@ async function forceExtractAllContacts() {
             updateData.wpp_name = conversaMsg.nome_cliente;
           }
           
-          if (!mensagem.raw) {
+          if (!mensagem.raw && !mensagem.whatsapp_mensagens_raw) {
             updateData.raw = JSON.stringify({
               messageId: mensagem.message_id || mensagem.id,
               timestamp: mensagem.timestamp,
@@ -184,16 +185,13 @@ async function forceExtractAllContacts() {
       .select('*', { count: 'exact', head: true })
       .not('wpp_name', 'is', null);
 
-    const { count: mensagensComRaw } = await supabase
-      .from('whatsapp_mensagens')
-      .select('*', { count: 'exact', head: true })
-      .not('raw', 'is', null);
+    const { data: mensagensSemRaw } = await supabase.rpc('count_messages_without_raw');
 
     console.log('🎯 RESULTADOS DA EXTRAÇÃO:');
     console.log('========================');
     console.log(`✅ Conversas com display_name: ${conversasComDisplayName || 0}`);
     console.log(`✅ Mensagens com wpp_name: ${mensagensComWppName || 0}`);
-    console.log(`✅ Mensagens com raw: ${mensagensComRaw || 0}`);
+    console.log(`⚠️ Mensagens sem raw: ${mensagensSemRaw || 0}`);
 
     console.log('\n🚀 PRÓXIMOS PASSOS:');
     console.log('1. Reinicie o frontend para ver as mudanças');
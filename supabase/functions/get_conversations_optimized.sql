@@ -2,6 +2,8 @@
 -- OPTIMIZED: Função SQL para buscar conversas com paginação
 -- =====================================================
 -- Execute esta função no SQL Editor do Supabase para otimizar as consultas de conversas
+-- NOTA: a migration 20250921000000_whatsapp_conversations_summary.sql substitui
+-- get_conversations_optimized por uma versão que lê a tabela de resumo whatsapp_conversations
 
 CREATE OR REPLACE FUNCTION get_conversations_optimized(
   p_owner_id UUID,
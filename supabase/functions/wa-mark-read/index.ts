@@ -48,10 +48,10 @@ serve(async (req) => {
       )
     }
 
-    // Buscar o atendimento_id para este chat
+    // Buscar o atendimento (e o owner) para este chat
     const { data: atendimento, error: atendimentoError } = await supabaseClient
       .from('whatsapp_atendimentos')
-      .select('id')
+      .select('id, owner_id')
       .eq('connection_id', connectionId)
       .eq('chat_id', chatId)
       .single()
@@ -63,20 +63,14 @@ serve(async (req) => {
       )
     }
 
-    // Construir query para marcar mensagens como lidas
-    let query = supabaseClient
-      .from('whatsapp_mensagens')
-      .update({ ack: 4 }) // 4 = read
-      .eq('atendimento_id', atendimento.id)
-      .eq('direction', 'in') // Apenas mensagens recebidas
-      .lt('ack', 4) // Apenas mensagens não lidas
-
-    // Se messageId específico fornecido, filtrar por ele
-    if (messageId) {
-      query = query.eq('id', messageId)
-    }
-
-    const { error: updateError } = await query
+    // Marca as mensagens recebidas como lidas num único UPDATE; o trigger de
+    // whatsapp_conversations mantém unread_count
+    const { data: marked, error: updateError } = await supabaseClient.rpc('mark_chat_read', {
+      p_chat_id: chatId,
+      p_owner_id: atendimento.owner_id,
+      p_connection_id: connectionId,
+      p_message_id: messageId ?? null,
+    })
 
     if (updateError) {
       console.error('Error marking messages as read:', updateError)
@@ -86,21 +80,24 @@ serve(async (req) => {
       )
     }
 
-    // Resetar unread_count da conversa
-    const { error: resetError } = await supabaseClient
-      .from('whatsapp_atendimentos')
-      .update({ unread_count: 0 })
-      .eq('id', atendimento.id)
-
-    if (resetError) {
-      console.error('Error resetting unread count:', resetError)
-      // Não falhar a operação por causa disso
+    // Resetar o contador do atendimento
+    if (!messageId) {
+      const { error: resetError } = await supabaseClient
+        .from('whatsapp_atendimentos')
+        .update({ nao_lidas: 0 })
+        .eq('id', atendimento.id)
+
+      if (resetError) {
+        console.error('Error resetting unread count:', resetError)
+        // Não falhar a operação por causa disso
+      }
     }
 
     return new Response(
       JSON.stringify({
         success: true,
-        message: 'Messages marked as read'
+        message: 'Messages marked as read',
+        count: marked ?? 0
       }),
       { headers: { ...corsHeaders, 'Content-Type': 'application/json' } }
     )
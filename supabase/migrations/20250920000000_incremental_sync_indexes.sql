@@ -0,0 +1,24 @@
+-- =====================================================
+-- ÍNDICES PARA SINCRONIZAÇÃO INCREMENTAL (updated_at, id)
+-- =====================================================
+-- Usados pelo backend/scripts/incremental_exporter.py, que lê apenas as linhas
+-- alteradas desde o último watermark com "(updated_at, id) > (ultimo_ts, ultimo_id)
+-- ORDER BY updated_at, id". Sem estes índices cada execução varre a tabela inteira.
+
+CREATE INDEX IF NOT EXISTS idx_user_profiles_updated_at_id ON public.user_profiles (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_companies_updated_at_id ON public.companies (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_projects_updated_at_id ON public.projects (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_activities_updated_at_id ON public.activities (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_products_updated_at_id ON public.products (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_employees_updated_at_id ON public.employees (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_leads_updated_at_id ON public.leads (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_work_groups_updated_at_id ON public.work_groups (updated_at, id);
+CREATE INDEX IF NOT EXISTS idx_calendar_events_updated_at_id ON public.calendar_events (updated_at, id);
+
+-- Tombstones de soft delete (leads.deleted_at, ver backend/scripts/add_deleted_at_column.py).
+-- A coluna era criada só pelo script; garante que exista num banco novo.
+ALTER TABLE public.leads ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_leads_deleted_at_id
+ON public.leads (deleted_at, id)
+WHERE deleted_at IS NOT NULL;
@@ -0,0 +1,322 @@
+-- =====================================================
+-- RESUMO DE CONVERSAS DO WHATSAPP (whatsapp_conversations)
+-- =====================================================
+-- get_conversations_optimized ranqueava TODAS as mensagens do owner com
+-- ROW_NUMBER() OVER (PARTITION BY chat_id ...) e recontava total/não lidas a cada
+-- carregamento. Esta migration cria uma tabela de resumo por (owner_id, chat_id)
+-- mantida incrementalmente por triggers de statement (transition tables), de modo
+-- que listar conversas custa O(tamanho da página).
+--
+-- Reconstrução/verificação em massa: backend/scripts/conversation_summary.py
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_conversations (
+  id UUID NOT NULL DEFAULT gen_random_uuid() PRIMARY KEY,
+  owner_id UUID NOT NULL,
+  chat_id TEXT NOT NULL
+);
+
+ALTER TABLE public.whatsapp_conversations
+  ADD COLUMN IF NOT EXISTS phone TEXT,
+  ADD COLUMN IF NOT EXISTS wpp_name TEXT,
+  ADD COLUMN IF NOT EXISTS nome_cliente TEXT,
+  ADD COLUMN IF NOT EXISTS connection_id TEXT,
+  ADD COLUMN IF NOT EXISTS last_message_id UUID,
+  ADD COLUMN IF NOT EXISTS last_message TEXT,
+  ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMPTZ,
+  ADD COLUMN IF NOT EXISTS last_remetente TEXT,
+  ADD COLUMN IF NOT EXISTS last_tipo TEXT,
+  ADD COLUMN IF NOT EXISTS last_lida BOOLEAN,
+  ADD COLUMN IF NOT EXISTS status TEXT,
+  ADD COLUMN IF NOT EXISTS unread_count INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS total_messages BIGINT NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+-- Uma linha por conversa (alvo do ON CONFLICT dos triggers)
+CREATE UNIQUE INDEX IF NOT EXISTS uq_whatsapp_conversations_owner_chat
+ON public.whatsapp_conversations (owner_id, chat_id);
+
+-- Listagem da caixa de entrada: mais recentes primeiro
+CREATE INDEX IF NOT EXISTS idx_whatsapp_conversations_owner_last
+ON public.whatsapp_conversations (owner_id, last_message_at DESC NULLS LAST, chat_id DESC);
+
+-- Cada usuário lê só as próprias conversas. Não há policy de escrita: quem grava
+-- são os triggers (SECURITY DEFINER) e o service role.
+ALTER TABLE public.whatsapp_conversations ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS read_own_whatsapp_conversations ON public.whatsapp_conversations;
+CREATE POLICY read_own_whatsapp_conversations
+ON public.whatsapp_conversations
+FOR SELECT
+USING ( owner_id = auth.uid() );
+
+-- =====================================================
+-- TRIGGERS DE MANUTENÇÃO INCREMENTAL
+-- =====================================================
+-- Os triggers pegam um advisory lock compartilhado por owner; a reconstrução
+-- (rebuild_whatsapp_conversations) pega o exclusivo, então as duas nunca se cruzam.
+
+CREATE OR REPLACE FUNCTION public.whatsapp_conversations_on_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock_shared(hashtext('whatsapp_conversations:' || o.owner_id::text))
+  FROM (SELECT DISTINCT owner_id FROM new_rows WHERE chat_id IS NOT NULL ORDER BY owner_id) o;
+
+  INSERT INTO public.whatsapp_conversations AS c (
+    owner_id, chat_id, phone, wpp_name, nome_cliente, connection_id,
+    last_message_id, last_message, last_message_at, last_remetente, last_tipo, last_lida, status,
+    unread_count, total_messages, updated_at
+  )
+  SELECT DISTINCT ON (n.owner_id, n.chat_id)
+    n.owner_id, n.chat_id, n.phone, s.wpp_name, a.nome_cliente, n.connection_id,
+    n.id, n.conteudo, n.timestamp, n.remetente, n.message_type, n.lida, n.status,
+    s.unread, s.total, now()
+  FROM new_rows n
+  JOIN (
+    SELECT owner_id, chat_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE remetente = 'CLIENTE' AND lida = false) AS unread,
+           (ARRAY_AGG(wpp_name ORDER BY timestamp DESC NULLS LAST) FILTER (WHERE wpp_name IS NOT NULL))[1] AS wpp_name
+    FROM new_rows
+    WHERE chat_id IS NOT NULL
+    GROUP BY owner_id, chat_id
+  ) s ON s.owner_id = n.owner_id AND s.chat_id = n.chat_id
+  -- Nome do cliente vem do atendimento da mensagem mais recente do lote
+  LEFT JOIN public.whatsapp_atendimentos a ON a.id = n.atendimento_id
+  ORDER BY n.owner_id, n.chat_id, n.timestamp DESC NULLS LAST, n.id DESC
+  ON CONFLICT (owner_id, chat_id) DO UPDATE SET
+    total_messages = c.total_messages + EXCLUDED.total_messages,
+    unread_count = c.unread_count + EXCLUDED.unread_count,
+    wpp_name = COALESCE(EXCLUDED.wpp_name, c.wpp_name),
+    nome_cliente = COALESCE(EXCLUDED.nome_cliente, c.nome_cliente),
+    phone = COALESCE(c.phone, EXCLUDED.phone),
+    connection_id = COALESCE(EXCLUDED.connection_id, c.connection_id),
+    last_message_id = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                           THEN EXCLUDED.last_message_id ELSE c.last_message_id END,
+    last_message = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                        THEN EXCLUDED.last_message ELSE c.last_message END,
+    last_remetente = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                          THEN EXCLUDED.last_remetente ELSE c.last_remetente END,
+    last_tipo = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                     THEN EXCLUDED.last_tipo ELSE c.last_tipo END,
+    last_lida = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                     THEN EXCLUDED.last_lida ELSE c.last_lida END,
+    status = CASE WHEN c.last_message_at IS NULL OR EXCLUDED.last_message_at >= c.last_message_at
+                  THEN EXCLUDED.status ELSE c.status END,
+    last_message_at = GREATEST(c.last_message_at, EXCLUDED.last_message_at),
+    updated_at = now();
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.whatsapp_conversations_on_update()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock_shared(hashtext('whatsapp_conversations:' || o.owner_id::text))
+  FROM (SELECT DISTINCT owner_id FROM new_rows WHERE chat_id IS NOT NULL ORDER BY owner_id) o;
+
+  -- Marcar como lida / não lida ajusta só o contador
+  UPDATE public.whatsapp_conversations c
+  SET unread_count = GREATEST(c.unread_count + d.delta, 0),
+      updated_at = now()
+  FROM (
+    SELECT owner_id, chat_id, SUM(delta) AS delta
+    FROM (
+      SELECT owner_id, chat_id, 1 AS delta FROM new_rows WHERE remetente = 'CLIENTE' AND lida = false
+      UNION ALL
+      SELECT owner_id, chat_id, -1 FROM old_rows WHERE remetente = 'CLIENTE' AND lida = false
+    ) x
+    WHERE chat_id IS NOT NULL
+    GROUP BY owner_id, chat_id
+    HAVING SUM(delta) <> 0
+  ) d
+  WHERE c.owner_id = d.owner_id AND c.chat_id = d.chat_id;
+
+  -- Edições na última mensagem refletem no preview
+  UPDATE public.whatsapp_conversations c
+  SET last_message = n.conteudo,
+      last_lida = n.lida,
+      status = n.status,
+      updated_at = now()
+  FROM new_rows n
+  WHERE c.owner_id = n.owner_id
+    AND c.chat_id = n.chat_id
+    AND c.last_message_id = n.id
+    AND (c.last_message IS DISTINCT FROM n.conteudo
+         OR c.last_lida IS DISTINCT FROM n.lida
+         OR c.status IS DISTINCT FROM n.status);
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION public.whatsapp_conversations_on_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock_shared(hashtext('whatsapp_conversations:' || o.owner_id::text))
+  FROM (SELECT DISTINCT owner_id FROM old_rows WHERE chat_id IS NOT NULL ORDER BY owner_id) o;
+
+  UPDATE public.whatsapp_conversations c
+  SET total_messages = GREATEST(c.total_messages - g.total, 0),
+      unread_count = GREATEST(c.unread_count - g.unread, 0),
+      updated_at = now()
+  FROM (
+    SELECT owner_id, chat_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE remetente = 'CLIENTE' AND lida = false) AS unread
+    FROM old_rows
+    WHERE chat_id IS NOT NULL
+    GROUP BY owner_id, chat_id
+  ) g
+  WHERE c.owner_id = g.owner_id AND c.chat_id = g.chat_id;
+
+  -- Se a última mensagem foi removida, busca a nova última pelo índice (owner_id, chat_id, timestamp);
+  -- timestamp NULL fica por último, como em MAX(timestamp) (conversation_summary.py verify)
+  UPDATE public.whatsapp_conversations c
+  SET last_message_id = l.id,
+      last_message = l.conteudo,
+      last_message_at = l.timestamp,
+      last_remetente = l.remetente,
+      last_tipo = l.message_type,
+      last_lida = l.lida,
+      status = l.status
+  FROM old_rows o
+  CROSS JOIN LATERAL (
+    SELECT m.id, m.conteudo, m.timestamp, m.remetente, m.message_type, m.lida, m.status
+    FROM public.whatsapp_mensagens m
+    WHERE m.owner_id = o.owner_id AND m.chat_id = o.chat_id
+    ORDER BY m.timestamp DESC NULLS LAST, m.id DESC
+    LIMIT 1
+  ) l
+  WHERE c.owner_id = o.owner_id AND c.chat_id = o.chat_id AND c.last_message_id = o.id;
+
+  DELETE FROM public.whatsapp_conversations c
+  USING (SELECT DISTINCT owner_id, chat_id FROM old_rows) o
+  WHERE c.owner_id = o.owner_id AND c.chat_id = o.chat_id AND c.total_messages <= 0;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- O trigger antigo era um placeholder sem efeito
+DROP TRIGGER IF EXISTS trigger_update_conversation_stats ON public.whatsapp_mensagens;
+
+DROP TRIGGER IF EXISTS trg_whatsapp_conversations_insert ON public.whatsapp_mensagens;
+CREATE TRIGGER trg_whatsapp_conversations_insert
+  AFTER INSERT ON public.whatsapp_mensagens
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.whatsapp_conversations_on_insert();
+
+DROP TRIGGER IF EXISTS trg_whatsapp_conversations_update ON public.whatsapp_mensagens;
+CREATE TRIGGER trg_whatsapp_conversations_update
+  AFTER UPDATE ON public.whatsapp_mensagens
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.whatsapp_conversations_on_update();
+
+DROP TRIGGER IF EXISTS trg_whatsapp_conversations_delete ON public.whatsapp_mensagens;
+CREATE TRIGGER trg_whatsapp_conversations_delete
+  AFTER DELETE ON public.whatsapp_mensagens
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.whatsapp_conversations_on_delete();
+
+-- =====================================================
+-- RECONSTRUÇÃO EM MASSA (por owner ou total)
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION public.rebuild_whatsapp_conversations(p_owner_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  rebuilt INTEGER;
+BEGIN
+  IF p_owner_id IS NULL THEN
+    LOCK TABLE public.whatsapp_mensagens IN SHARE MODE;
+  ELSE
+    PERFORM pg_advisory_xact_lock(hashtext('whatsapp_conversations:' || p_owner_id::text));
+  END IF;
+
+  DELETE FROM public.whatsapp_conversations
+  WHERE p_owner_id IS NULL OR owner_id = p_owner_id;
+
+  INSERT INTO public.whatsapp_conversations (
+    owner_id, chat_id, phone, wpp_name, nome_cliente, connection_id,
+    last_message_id, last_message, last_message_at, last_remetente, last_tipo, last_lida, status,
+    unread_count, total_messages
+  )
+  SELECT DISTINCT ON (m.owner_id, m.chat_id)
+    m.owner_id, m.chat_id, m.phone, s.wpp_name, a.nome_cliente, m.connection_id,
+    m.id, m.conteudo, m.timestamp, m.remetente, m.message_type, m.lida, m.status,
+    s.unread, s.total
+  FROM public.whatsapp_mensagens m
+  JOIN (
+    SELECT owner_id, chat_id,
+           COUNT(*) AS total,
+           COUNT(*) FILTER (WHERE remetente = 'CLIENTE' AND lida = false) AS unread,
+           (ARRAY_AGG(wpp_name ORDER BY timestamp DESC NULLS LAST) FILTER (WHERE wpp_name IS NOT NULL))[1] AS wpp_name
+    FROM public.whatsapp_mensagens
+    WHERE chat_id IS NOT NULL AND (p_owner_id IS NULL OR owner_id = p_owner_id)
+    GROUP BY owner_id, chat_id
+  ) s ON s.owner_id = m.owner_id AND s.chat_id = m.chat_id
+  LEFT JOIN public.whatsapp_atendimentos a ON a.id = m.atendimento_id
+  WHERE p_owner_id IS NULL OR m.owner_id = p_owner_id
+  ORDER BY m.owner_id, m.chat_id, m.timestamp DESC NULLS LAST, m.id DESC;
+
+  GET DIAGNOSTICS rebuilt = ROW_COUNT;
+  RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- LISTAGEM DE CONVERSAS LENDO O RESUMO
+-- =====================================================
+-- Mesma assinatura e colunas de supabase/functions/get_conversations_optimized.sql
+
+CREATE OR REPLACE FUNCTION public.get_conversations_optimized(
+  p_owner_id UUID,
+  p_limit INT DEFAULT 20,
+  p_offset INT DEFAULT 0
+)
+RETURNS TABLE (
+  chat_id TEXT,
+  phone TEXT,
+  wpp_name TEXT,
+  connection_id TEXT,
+  last_message TEXT,
+  last_message_at TIMESTAMPTZ,
+  last_remetente TEXT,
+  last_tipo TEXT,
+  last_lida BOOLEAN,
+  unread_count BIGINT,
+  total_messages BIGINT,
+  status TEXT,
+  owner_id UUID
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    c.chat_id,
+    c.phone,
+    COALESCE(c.nome_cliente, c.wpp_name),
+    c.connection_id,
+    c.last_message,
+    c.last_message_at,
+    c.last_remetente,
+    c.last_tipo,
+    c.last_lida,
+    c.unread_count::BIGINT,
+    c.total_messages,
+    c.status,
+    c.owner_id
+  FROM public.whatsapp_conversations c
+  WHERE c.owner_id = p_owner_id
+  ORDER BY c.last_message_at DESC NULLS LAST, c.chat_id DESC
+  LIMIT p_limit
+  OFFSET p_offset;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Popular o resumo com o histórico existente
+SELECT public.rebuild_whatsapp_conversations();
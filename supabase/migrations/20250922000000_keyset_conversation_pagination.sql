@@ -0,0 +1,178 @@
+-- =====================================================
+-- PAGINAÇÃO POR CURSOR (KEYSET) PARA CONVERSAS E MENSAGENS
+-- =====================================================
+-- get_conversations_optimized e get_conversation_messages_optimized recebem p_offset,
+-- o que obriga o Postgres a percorrer e descartar todas as linhas anteriores: quanto
+-- mais fundo o scroll, mais lento. As variantes abaixo recebem um cursor opaco
+-- (timestamp, id) devolvido na página anterior, no mesmo espírito do parâmetro
+-- "before" da edge function wa-list-messages.
+--
+-- Mensagens: alinhado com idx_msgs_owner_chat_ts (performance-indexes.sql)
+-- Conversas: alinhado com idx_whatsapp_conversations_owner_last
+-- Benchmark: backend/scripts/keyset_pagination_benchmark.py
+
+-- Cursor opaco: hex de "timestamp|chave" (seguro para URL, sem quebras de linha).
+-- Linha sem timestamp vira "|chave": o cursor continua válido e indica a fase das
+-- linhas com timestamp NULL (decode devolve cursor_ts NULL com cursor_key preenchida).
+CREATE OR REPLACE FUNCTION public.encode_page_cursor(p_ts TIMESTAMPTZ, p_key TEXT)
+RETURNS TEXT AS $$
+  SELECT CASE WHEN p_key IS NULL THEN NULL
+         ELSE encode(convert_to(COALESCE(p_ts::text, '') || '|' || p_key, 'UTF8'), 'hex') END;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.decode_page_cursor(p_cursor TEXT, OUT cursor_ts TIMESTAMPTZ, OUT cursor_key TEXT)
+AS $$
+  SELECT NULLIF(split_part(raw, '|', 1), '')::timestamptz,
+         substr(raw, length(split_part(raw, '|', 1)) + 2)
+  FROM (SELECT convert_from(decode(p_cursor, 'hex'), 'UTF8') AS raw) r;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- CONVERSAS (mais recentes primeiro)
+-- =====================================================
+-- Duas fases, como o ORDER BY ... NULLS LAST: primeiro as conversas com
+-- last_message_at (comparação de linha), depois as sem (só por chat_id). A
+-- comparação de linha nunca é verdadeira para NULL, então a segunda fase precisa
+-- de predicado próprio.
+
+CREATE OR REPLACE FUNCTION public.get_conversations_keyset(
+  p_owner_id UUID,
+  p_limit INT DEFAULT 20,
+  p_cursor TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  chat_id TEXT,
+  phone TEXT,
+  wpp_name TEXT,
+  connection_id TEXT,
+  last_message TEXT,
+  last_message_at TIMESTAMPTZ,
+  last_remetente TEXT,
+  last_tipo TEXT,
+  last_lida BOOLEAN,
+  unread_count BIGINT,
+  total_messages BIGINT,
+  status TEXT,
+  owner_id UUID,
+  next_cursor TEXT
+) AS $$
+DECLARE
+  v_ts TIMESTAMPTZ;
+  v_chat TEXT;
+BEGIN
+  IF p_cursor IS NOT NULL THEN
+    SELECT d.cursor_ts, d.cursor_key INTO v_ts, v_chat FROM public.decode_page_cursor(p_cursor) d;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    c.chat_id,
+    c.phone,
+    COALESCE(c.nome_cliente, c.wpp_name),
+    c.connection_id,
+    c.last_message,
+    c.last_message_at,
+    c.last_remetente,
+    c.last_tipo,
+    c.last_lida,
+    c.unread_count::BIGINT,
+    c.total_messages,
+    c.status,
+    c.owner_id,
+    public.encode_page_cursor(c.last_message_at, c.chat_id)
+  FROM public.whatsapp_conversations c
+  WHERE c.owner_id = p_owner_id
+    AND (
+      v_chat IS NULL
+      -- Fase 1: ainda nas conversas com data; as sem data vêm todas depois
+      OR (v_ts IS NOT NULL AND ((c.last_message_at, c.chat_id) < (v_ts, v_chat) OR c.last_message_at IS NULL))
+      -- Fase 2: já nas conversas sem data
+      OR (v_ts IS NULL AND c.last_message_at IS NULL AND c.chat_id < v_chat)
+    )
+  ORDER BY c.last_message_at DESC NULLS LAST, c.chat_id DESC
+  LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- =====================================================
+-- MENSAGENS DE UMA CONVERSA (mais recentes primeiro, cursor "before")
+-- =====================================================
+-- idx_msgs_owner_chat_ts é "timestamp DESC", ou seja NULLS FIRST: as mensagens
+-- sem timestamp formam a primeira fase (por id), depois vêm as com timestamp.
+
+CREATE OR REPLACE FUNCTION public.get_conversation_messages_keyset(
+  p_owner_id UUID,
+  p_chat_id TEXT,
+  p_limit INT DEFAULT 50,
+  p_before TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  id TEXT,
+  message_id TEXT,
+  chat_id TEXT,
+  phone TEXT,
+  conteudo TEXT,
+  message_type TEXT,
+  media_url TEXT,
+  media_mime TEXT,
+  remetente TEXT,
+  status TEXT,
+  lida BOOLEAN,
+  "timestamp" TIMESTAMPTZ,
+  owner_id UUID,
+  connection_id TEXT,
+  next_cursor TEXT
+) AS $$
+DECLARE
+  v_ts TIMESTAMPTZ;
+  v_id TEXT;
+BEGIN
+  IF p_before IS NOT NULL THEN
+    SELECT d.cursor_ts, d.cursor_key INTO v_ts, v_id FROM public.decode_page_cursor(p_before) d;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    m.id::TEXT,
+    m.message_id,
+    m.chat_id,
+    m.phone,
+    m.conteudo,
+    m.message_type,
+    m.media_url,
+    m.media_mime,
+    m.remetente,
+    m.status,
+    m.lida,
+    m.timestamp,
+    m.owner_id,
+    m.connection_id,
+    public.encode_page_cursor(m.timestamp, m.id::TEXT)
+  FROM public.whatsapp_mensagens m
+  WHERE m.owner_id = p_owner_id
+    AND m.chat_id = p_chat_id
+    AND (
+      v_id IS NULL
+      -- Fase 1: ainda nas mensagens sem timestamp; todas as com timestamp vêm depois
+      OR (v_ts IS NULL AND ((m.timestamp IS NULL AND m.id::TEXT < v_id) OR m.timestamp IS NOT NULL))
+      -- Fase 2: faixa no timestamp usa idx_msgs_owner_chat_ts; o id só desempata o mesmo instante
+      OR (v_ts IS NOT NULL AND m.timestamp <= v_ts AND (m.timestamp < v_ts OR m.id::TEXT < v_id))
+    )
+  ORDER BY m.timestamp DESC NULLS FIRST, m.id::TEXT DESC
+  LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Primeira página de conversas:
+-- SELECT * FROM get_conversations_keyset('seu-uuid-aqui', 20);
+--
+-- -- Próxima página: passe o next_cursor da última linha recebida
+-- SELECT * FROM get_conversations_keyset('seu-uuid-aqui', 20, '323032352d30392d30312031323a30303a30302b30307c3535313139393939393939393940732e77686174736170702e6e6574');
+--
+-- -- Mensagens mais recentes de uma conversa e, depois, as anteriores:
+-- SELECT * FROM get_conversation_messages_keyset('seu-uuid-aqui', 'chat-id-aqui', 50);
+-- SELECT * FROM get_conversation_messages_keyset('seu-uuid-aqui', 'chat-id-aqui', 50, '<next_cursor>');
@@ -0,0 +1,177 @@
+-- =====================================================
+-- ARQUIVAMENTO FRIO DE whatsapp_mensagens
+-- =====================================================
+-- Mensagens mais antigas que a janela de retenção de cada owner saem da tabela
+-- quente para whatsapp_mensagens_archive (particionada por mês de "timestamp",
+-- raw comprimido com lz4) ou para arquivos Parquet catalogados em
+-- whatsapp_archive_files. A movimentação é feita em lotes pelo job
+-- backend/scripts/message_archiver.py; aqui ficam só as estruturas e o caminho de
+-- consulta para conversas antigas.
+--
+-- Observação: o DELETE na tabela quente passa pelos triggers de
+-- whatsapp_conversations, então total_messages/unread_count passam a contar só as
+-- mensagens quentes; conversas inteiramente arquivadas saem da caixa de entrada.
+
+-- =====================================================
+-- POLÍTICAS DE RETENÇÃO (uma linha por owner; sem linha = não arquiva)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_retention_policies (
+  owner_id UUID PRIMARY KEY,
+  retention_days INT NOT NULL CHECK (retention_days >= 30),
+  target TEXT NOT NULL DEFAULT 'table' CHECK (target IN ('table', 'parquet')),
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- =====================================================
+-- TABELA DE ARQUIVO (partições mensais criadas sob demanda)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_mensagens_archive (
+  LIKE public.whatsapp_mensagens INCLUDING DEFAULTS,
+  archived_at TIMESTAMPTZ NOT NULL DEFAULT now()
+) PARTITION BY RANGE ("timestamp");
+
+-- Mensagens sem timestamp
+CREATE TABLE IF NOT EXISTS public.whatsapp_mensagens_archive_default
+  PARTITION OF public.whatsapp_mensagens_archive DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_msgs_archive_owner_chat_ts
+ON public.whatsapp_mensagens_archive (owner_id, chat_id, "timestamp" DESC, id);
+
+CREATE INDEX IF NOT EXISTS idx_msgs_archive_id
+ON public.whatsapp_mensagens_archive (id);
+
+-- lz4 exige PostgreSQL 14+ compilado com suporte; sem ele fica o pglz padrão
+DO $$
+BEGIN
+  ALTER TABLE public.whatsapp_mensagens_archive ALTER COLUMN raw SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+  RAISE NOTICE 'Compressão lz4 indisponível (%); usando pglz', SQLERRM;
+END $$;
+
+CREATE OR REPLACE FUNCTION public.ensure_whatsapp_archive_partition(p_ts TIMESTAMPTZ)
+RETURNS TEXT AS $$
+DECLARE
+  v_start TIMESTAMPTZ := date_trunc('month', p_ts AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+  v_name TEXT := 'whatsapp_mensagens_archive_' || to_char(p_ts AT TIME ZONE 'UTC', '"y"YYYY"m"MM');
+BEGIN
+  IF to_regclass('public.' || v_name) IS NULL THEN
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.whatsapp_mensagens_archive FOR VALUES FROM (%L) TO (%L)',
+      v_name, v_start, v_start + INTERVAL '1 month'
+    );
+  END IF;
+  RETURN v_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- CATÁLOGO DE ARQUIVOS PARQUET
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_archive_files (
+  id BIGSERIAL PRIMARY KEY,
+  owner_id UUID NOT NULL,
+  path TEXT NOT NULL UNIQUE,
+  chat_ids TEXT[] NOT NULL,
+  min_timestamp TIMESTAMPTZ,
+  max_timestamp TIMESTAMPTZ,
+  row_count INT NOT NULL,
+  sha256 TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_whatsapp_archive_files_owner
+ON public.whatsapp_archive_files (owner_id, max_timestamp DESC);
+
+CREATE INDEX IF NOT EXISTS idx_whatsapp_archive_files_chats
+ON public.whatsapp_archive_files USING GIN (chat_ids);
+
+-- =====================================================
+-- CONSULTA DE CONVERSAS ANTIGAS
+-- =====================================================
+-- Mesmas colunas e cursor de get_conversation_messages_keyset: quando a tabela
+-- quente acaba (next_cursor da última página), o cliente continua aqui com o
+-- mesmo cursor. archived_files indica arquivos Parquet com a conversa.
+
+CREATE OR REPLACE FUNCTION public.get_archived_conversation_messages(
+  p_owner_id UUID,
+  p_chat_id TEXT,
+  p_limit INT DEFAULT 50,
+  p_before TEXT DEFAULT NULL
+)
+RETURNS TABLE (
+  id TEXT,
+  message_id TEXT,
+  chat_id TEXT,
+  phone TEXT,
+  conteudo TEXT,
+  message_type TEXT,
+  media_url TEXT,
+  media_mime TEXT,
+  remetente TEXT,
+  status TEXT,
+  lida BOOLEAN,
+  "timestamp" TIMESTAMPTZ,
+  owner_id UUID,
+  connection_id TEXT,
+  next_cursor TEXT
+) AS $$
+DECLARE
+  v_ts TIMESTAMPTZ;
+  v_id TEXT;
+BEGIN
+  IF p_before IS NOT NULL THEN
+    SELECT d.cursor_ts, d.cursor_key INTO v_ts, v_id FROM public.decode_page_cursor(p_before) d;
+  END IF;
+
+  RETURN QUERY
+  SELECT
+    m.id::TEXT,
+    m.message_id,
+    m.chat_id,
+    m.phone,
+    m.conteudo,
+    m.message_type,
+    m.media_url,
+    m.media_mime,
+    m.remetente,
+    m.status,
+    m.lida,
+    m.timestamp,
+    m.owner_id,
+    m.connection_id,
+    public.encode_page_cursor(m.timestamp, m.id::TEXT)
+  FROM public.whatsapp_mensagens_archive m
+  WHERE m.owner_id = p_owner_id
+    AND m.chat_id = p_chat_id
+    AND (v_ts IS NULL OR (m.timestamp <= v_ts AND (m.timestamp < v_ts OR m.id::TEXT < v_id)))
+  ORDER BY m.timestamp DESC, m.id::TEXT DESC
+  LIMIT p_limit;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION public.get_archived_conversation_files(p_owner_id UUID, p_chat_id TEXT)
+RETURNS TABLE (path TEXT, min_timestamp TIMESTAMPTZ, max_timestamp TIMESTAMPTZ, row_count INT) AS $$
+  SELECT f.path, f.min_timestamp, f.max_timestamp, f.row_count
+  FROM public.whatsapp_archive_files f
+  WHERE f.owner_id = p_owner_id AND f.chat_ids @> ARRAY[p_chat_id]
+  ORDER BY f.max_timestamp DESC;
+$$ LANGUAGE sql STABLE;
+
+-- Arquivo e catálogo só são acessados pelo service role (job e edge functions)
+ALTER TABLE public.whatsapp_retention_policies ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.whatsapp_mensagens_archive ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.whatsapp_archive_files ENABLE ROW LEVEL SECURITY;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Retenção de 1 ano em tabela de arquivo para um owner:
+-- INSERT INTO whatsapp_retention_policies (owner_id, retention_days) VALUES ('seu-uuid-aqui', 365);
+--
+-- -- Continuação do scroll depois da última página quente:
+-- SELECT * FROM get_archived_conversation_messages('seu-uuid-aqui', 'chat-id-aqui', 50, '<next_cursor>');
@@ -0,0 +1,112 @@
+-- =====================================================
+-- PAYLOAD RAW DO WHATSAPP EM TABELA LATERAL COMPRIMIDA
+-- =====================================================
+-- O JSON bruto do Baileys (raw) é de longe a coluna mais larga de
+-- whatsapp_mensagens e só é lido em depuração/reprocessamento. Ele passa a viver
+-- em whatsapp_mensagens_raw (lz4, TOAST agressivo), buscado sob demanda por
+-- get_message_raw; as listagens leem linhas estreitas e cabem mais mensagens por
+-- página de cache.
+--
+-- Novas mensagens: o trigger BEFORE INSERT/UPDATE desvia NEW.raw para a tabela
+-- lateral e grava NULL na tabela quente (as edge functions não mudam).
+-- Mensagens existentes: python backend/scripts/backfill_runner.py raw_offload
+-- (reescreve raw em lotes e o trigger faz o desvio; rode VACUUM depois)
+--
+-- raw IS NULL em whatsapp_mensagens não significa mais "sem payload"; use
+-- count_messages_without_raw().
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_mensagens_raw (
+  message_id UUID PRIMARY KEY
+    REFERENCES public.whatsapp_mensagens(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+  owner_id UUID,
+  raw JSONB NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Comprime também payloads pequenos (o padrão só comprime acima de ~2 KB)
+ALTER TABLE public.whatsapp_mensagens_raw SET (toast_tuple_target = 256);
+
+DO $$
+BEGIN
+  ALTER TABLE public.whatsapp_mensagens_raw ALTER COLUMN raw SET COMPRESSION lz4;
+EXCEPTION WHEN OTHERS THEN
+  RAISE NOTICE 'Compressão lz4 indisponível (%); usando pglz', SQLERRM;
+END $$;
+
+ALTER TABLE public.whatsapp_mensagens_raw ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "read_own_mensagens_raw" ON public.whatsapp_mensagens_raw;
+CREATE POLICY "read_own_mensagens_raw"
+ON public.whatsapp_mensagens_raw FOR SELECT
+USING (owner_id = auth.uid());
+
+-- =====================================================
+-- DESVIO NA ESCRITA
+-- =====================================================
+-- O payload do Baileys é imutável: num UPDATE o raw só é gravado se a mensagem
+-- ainda não tiver um (scripts de reparo que "preenchem" raw não sobrescrevem o real).
+
+CREATE OR REPLACE FUNCTION public.whatsapp_mensagens_offload_raw()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.raw IS NULL THEN
+    RETURN NEW;
+  END IF;
+
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO public.whatsapp_mensagens_raw (message_id, owner_id, raw)
+    VALUES (NEW.id, NEW.owner_id, NEW.raw)
+    ON CONFLICT (message_id) DO UPDATE SET raw = EXCLUDED.raw;
+  ELSE
+    INSERT INTO public.whatsapp_mensagens_raw (message_id, owner_id, raw)
+    VALUES (NEW.id, NEW.owner_id, NEW.raw)
+    ON CONFLICT (message_id) DO NOTHING;
+  END IF;
+
+  NEW.raw := NULL;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_whatsapp_mensagens_offload_raw ON public.whatsapp_mensagens;
+CREATE TRIGGER trg_whatsapp_mensagens_offload_raw
+  BEFORE INSERT OR UPDATE OF raw ON public.whatsapp_mensagens
+  FOR EACH ROW
+  WHEN (NEW.raw IS NOT NULL)
+  EXECUTE FUNCTION public.whatsapp_mensagens_offload_raw();
+
+-- =====================================================
+-- LEITURA SOB DEMANDA
+-- =====================================================
+-- Procura na tabela quente (linhas ainda não migradas), na lateral e no arquivo frio.
+
+CREATE OR REPLACE FUNCTION public.get_message_raw(p_owner_id UUID, p_message_id UUID)
+RETURNS JSONB AS $$
+  SELECT COALESCE(
+    (SELECT m.raw FROM public.whatsapp_mensagens m
+     WHERE m.id = p_message_id AND m.owner_id = p_owner_id AND m.raw IS NOT NULL),
+    (SELECT r.raw FROM public.whatsapp_mensagens_raw r
+     WHERE r.message_id = p_message_id AND r.owner_id = p_owner_id),
+    (SELECT a.raw FROM public.whatsapp_mensagens_archive a
+     WHERE a.id = p_message_id AND a.owner_id = p_owner_id LIMIT 1)
+  );
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.count_messages_without_raw()
+RETURNS BIGINT AS $$
+  SELECT COUNT(*)
+  FROM public.whatsapp_mensagens m
+  WHERE m.raw IS NULL
+    AND NOT EXISTS (SELECT 1 FROM public.whatsapp_mensagens_raw r WHERE r.message_id = m.id);
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Payload bruto de uma mensagem:
+-- SELECT get_message_raw('seu-uuid-aqui', 'uuid-da-mensagem');
+--
+-- -- Tamanho antes/depois da migração dos payloads existentes:
+-- SELECT pg_size_pretty(pg_total_relation_size('whatsapp_mensagens')),
+--        pg_size_pretty(pg_total_relation_size('whatsapp_mensagens_raw'));
@@ -0,0 +1,73 @@
+-- =====================================================
+-- ÍNDICES PARA O RECONCILIADOR DE CONTATOS
+-- =====================================================
+-- backend/scripts/contact_enrichment.py lê whatsapp_mensagens alteradas desde o
+-- último watermark ("(updated_at, id) > (...) ORDER BY updated_at, id") e casa os
+-- perfis com contacts por (owner_id, phone).
+
+CREATE INDEX IF NOT EXISTS idx_msgs_updated_at_id ON public.whatsapp_mensagens (updated_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_contacts_owner_phone ON public.contacts (owner_id, phone);
+
+-- =====================================================
+-- MENSAGENS REMOVIDAS (CONTADORES DO RELATÓRIO)
+-- =====================================================
+-- O relatório soma as mensagens novas a cada execução; sem isto as removidas
+-- (message_archiver.py, limpezas manuais) nunca seriam descontadas. Cada DELETE
+-- grava, por minuto de created_at, quantas linhas saíram e quantas estavam sem
+-- wpp_name/raw; o script consome e apaga o ledger na mesma leitura em que conta as
+-- novas, e só desconta minutos que já tinha contado.
+--
+-- raw: o CASCADE da tabela lateral roda antes do trigger de statement, então a
+-- mensagem entra como "sem raw" se raw IS NULL e a remoção da linha lateral desconta
+-- (without_raw negativo). O minuto da linha lateral é o do desvio, que coincide com
+-- o da mensagem exceto nas migradas pelo backfill (antigas, já contadas).
+
+CREATE TABLE IF NOT EXISTS public.whatsapp_message_deletions (
+  id BIGSERIAL PRIMARY KEY,
+  created_minute TIMESTAMPTZ,
+  messages BIGINT NOT NULL DEFAULT 0,
+  without_wpp_name BIGINT NOT NULL DEFAULT 0,
+  without_raw BIGINT NOT NULL DEFAULT 0,
+  deleted_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.whatsapp_message_deletions ENABLE ROW LEVEL SECURITY;
+
+CREATE OR REPLACE FUNCTION public.log_whatsapp_message_deletions()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_TABLE_NAME = 'whatsapp_mensagens' THEN
+    INSERT INTO public.whatsapp_message_deletions (created_minute, messages, without_wpp_name, without_raw)
+    SELECT date_trunc('minute', o.created_at), COUNT(*),
+           COUNT(*) FILTER (WHERE o.wpp_name IS NULL), COUNT(*) FILTER (WHERE o.raw IS NULL)
+    FROM old_rows o
+    GROUP BY 1;
+  ELSE
+    INSERT INTO public.whatsapp_message_deletions (created_minute, without_raw)
+    SELECT date_trunc('minute', o.created_at), -COUNT(*)
+    FROM old_rows o
+    GROUP BY 1;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_whatsapp_mensagens_log_deletions ON public.whatsapp_mensagens;
+CREATE TRIGGER trg_whatsapp_mensagens_log_deletions
+  AFTER DELETE ON public.whatsapp_mensagens
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.log_whatsapp_message_deletions();
+
+DO $$
+BEGIN
+  IF to_regclass('public.whatsapp_mensagens_raw') IS NOT NULL THEN
+    DROP TRIGGER IF EXISTS trg_whatsapp_mensagens_raw_log_deletions ON public.whatsapp_mensagens_raw;
+    CREATE TRIGGER trg_whatsapp_mensagens_raw_log_deletions
+      AFTER DELETE ON public.whatsapp_mensagens_raw
+      REFERENCING OLD TABLE AS old_rows
+      FOR EACH STATEMENT
+      EXECUTE FUNCTION public.log_whatsapp_message_deletions();
+  END IF;
+END $$;
@@ -0,0 +1,114 @@
+-- =====================================================
+-- CONTADORES DE NÃO LIDAS POR (owner_id, chat_id)
+-- =====================================================
+-- whatsapp_conversations.unread_count (20250921000000_whatsapp_conversations_summary.sql)
+-- já é mantido pelos triggers de INSERT/UPDATE/DELETE em whatsapp_mensagens. Aqui:
+--   * mark_chat_read: marca a conversa inteira (ou uma mensagem) como lida num único
+--     UPDATE pelo índice idx_msgs_unread; o trigger de UPDATE desconta o contador
+--   * get_unread_summary: badge da caixa de entrada lendo só os contadores
+--   * repair_whatsapp_unread_counts: recálculo em lote usado por
+--     backend/scripts/conversation_summary.py unread [--repair]
+
+CREATE INDEX IF NOT EXISTS idx_whatsapp_conversations_unread
+ON public.whatsapp_conversations (owner_id)
+WHERE unread_count > 0;
+
+-- O servidor Baileys conhece a conexão, não o owner
+CREATE INDEX IF NOT EXISTS idx_whatsapp_conversations_connection_chat
+ON public.whatsapp_conversations (connection_id, chat_id);
+
+CREATE OR REPLACE FUNCTION public.mark_chat_read(
+  p_chat_id TEXT,
+  p_owner_id UUID DEFAULT NULL,
+  p_connection_id TEXT DEFAULT NULL,
+  p_message_id UUID DEFAULT NULL
+)
+RETURNS INT AS $$
+DECLARE
+  v_owner UUID := p_owner_id;
+  v_count INT;
+BEGIN
+  IF v_owner IS NULL THEN
+    SELECT c.owner_id INTO v_owner
+    FROM public.whatsapp_conversations c
+    WHERE c.connection_id = p_connection_id AND c.chat_id = p_chat_id
+    LIMIT 1;
+    IF v_owner IS NULL THEN
+      RETURN 0;
+    END IF;
+  END IF;
+
+  UPDATE public.whatsapp_mensagens m
+  SET lida = true
+  WHERE m.owner_id = v_owner
+    AND m.chat_id = p_chat_id
+    AND m.lida = false
+    AND m.remetente = 'CLIENTE'
+    AND (p_connection_id IS NULL OR m.connection_id = p_connection_id)
+    AND (p_message_id IS NULL OR m.id = p_message_id);
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  RETURN v_count;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION public.get_unread_summary(p_owner_id UUID)
+RETURNS TABLE (unread_chats BIGINT, unread_messages BIGINT) AS $$
+  SELECT COUNT(*), COALESCE(SUM(c.unread_count), 0)::BIGINT
+  FROM public.whatsapp_conversations c
+  WHERE c.owner_id = p_owner_id AND c.unread_count > 0;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- VERIFICAÇÃO / REPARO EM LOTE
+-- =====================================================
+-- Recalcula as não lidas dos owners informados e devolve as conversas divergentes;
+-- com p_apply corrige no mesmo passo. Pega o advisory lock exclusivo de cada owner
+-- (o mesmo dos triggers), então não corre contra inserções concorrentes.
+
+CREATE OR REPLACE FUNCTION public.repair_whatsapp_unread_counts(p_owner_ids UUID[], p_apply BOOLEAN DEFAULT false)
+RETURNS TABLE (owner_id UUID, chat_id TEXT, expected INT, actual INT) AS $$
+BEGIN
+  IF p_apply THEN
+    PERFORM pg_advisory_xact_lock(hashtext('whatsapp_conversations:' || o::text))
+    FROM (SELECT DISTINCT unnest(p_owner_ids) AS o ORDER BY 1) s;
+  END IF;
+
+  RETURN QUERY
+  WITH expected AS (
+    SELECT m.owner_id, m.chat_id, COUNT(*)::INT AS unread
+    FROM public.whatsapp_mensagens m
+    WHERE m.owner_id = ANY(p_owner_ids)
+      AND m.chat_id IS NOT NULL
+      AND m.lida = false
+      AND m.remetente = 'CLIENTE'
+    GROUP BY m.owner_id, m.chat_id
+  ),
+  drift AS (
+    SELECT c.owner_id, c.chat_id, COALESCE(e.unread, 0) AS expected, c.unread_count AS actual
+    FROM public.whatsapp_conversations c
+    LEFT JOIN expected e ON e.owner_id = c.owner_id AND e.chat_id = c.chat_id
+    WHERE c.owner_id = ANY(p_owner_ids)
+      AND c.unread_count IS DISTINCT FROM COALESCE(e.unread, 0)
+  ),
+  fixed AS (
+    -- CTEs de escrita sempre executam, mesmo sem serem lidas
+    UPDATE public.whatsapp_conversations c
+    SET unread_count = d.expected, updated_at = now()
+    FROM drift d
+    WHERE p_apply AND c.owner_id = d.owner_id AND c.chat_id = d.chat_id
+  )
+  SELECT d.owner_id, d.chat_id, d.expected, d.actual
+  FROM drift d;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Marcar a conversa como lida (edge function / servidor Baileys):
+-- SELECT mark_chat_read('5511999999999@s.whatsapp.net', p_connection_id => 'conn-id');
+--
+-- -- Badge da caixa de entrada:
+-- SELECT * FROM get_unread_summary('seu-uuid-aqui');
@@ -0,0 +1,145 @@
+-- =====================================================
+-- PURGA EM LOTE DE LEADS EXCLUÍDOS (SOFT DELETE)
+-- =====================================================
+-- force_delete_lead (backend/scripts/force_delete_lead.sql) apaga um lead por
+-- chamada; a limpeza noturna fazia um RPC por lead. purge_leads recebe um lote de
+-- ids e apaga dependentes e leads com "lead_id = ANY($1)", um DELETE por tabela.
+-- Driver: python backend/scripts/lead_purge.py --retention-days 30
+
+ALTER TABLE public.leads
+ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ DEFAULT NULL;
+
+-- Candidatos à purga em ordem de exclusão, sem varrer os leads ativos: usa
+-- idx_leads_deleted_at_id (deleted_at, id) WHERE deleted_at IS NOT NULL,
+-- de 20250920000000_incremental_sync_indexes.sql
+
+-- Tabelas dependentes apagadas antes do lead, na ordem de exclusão
+CREATE OR REPLACE FUNCTION public.lead_purge_dependents()
+RETURNS TEXT[] AS $$
+  SELECT ARRAY['atendimentos', 'lead_activities', 'lead_notes', 'lead_attachments'];
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Sem índice em lead_id cada DELETE dependente varre a tabela inteira
+DO $$
+DECLARE
+  v_table TEXT;
+BEGIN
+  FOREACH v_table IN ARRAY public.lead_purge_dependents() LOOP
+    IF EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = 'public' AND table_name = v_table AND column_name = 'lead_id'
+    ) THEN
+      EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON public.%I (lead_id)', 'idx_' || v_table || '_lead_id', v_table);
+    END IF;
+  END LOOP;
+END $$;
+
+-- =====================================================
+-- PURGA DE UM LOTE
+-- =====================================================
+-- Trava os leads do lote antes de tocar nos dependentes; com p_only_soft_deleted
+-- leads restaurados (deleted_at NULL) no meio do caminho ficam de fora.
+
+CREATE OR REPLACE FUNCTION public.purge_leads(p_lead_ids UUID[], p_only_soft_deleted BOOLEAN DEFAULT true)
+RETURNS TABLE (table_name TEXT, deleted BIGINT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_ids UUID[];
+  v_table TEXT;
+  v_count BIGINT;
+BEGIN
+  SELECT array_agg(l.id) INTO v_ids
+  FROM (
+    SELECT id FROM public.leads
+    WHERE id = ANY(p_lead_ids)
+      AND (NOT p_only_soft_deleted OR deleted_at IS NOT NULL)
+    ORDER BY id
+    FOR UPDATE
+  ) l;
+
+  IF v_ids IS NULL THEN
+    RETURN;
+  END IF;
+
+  FOREACH v_table IN ARRAY public.lead_purge_dependents() LOOP
+    -- Tabela ausente ou sem lead_id neste schema: nada a apagar
+    IF NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = 'public' AND table_name = v_table AND column_name = 'lead_id'
+    ) THEN
+      CONTINUE;
+    END IF;
+    EXECUTE format('DELETE FROM public.%I WHERE lead_id = ANY($1)', v_table) USING v_ids;
+    GET DIAGNOSTICS v_count = ROW_COUNT;
+    table_name := v_table;
+    deleted := v_count;
+    RETURN NEXT;
+  END LOOP;
+
+  DELETE FROM public.leads WHERE id = ANY(v_ids);
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+  table_name := 'leads';
+  deleted := v_count;
+  RETURN NEXT;
+END;
+$$;
+
+-- =====================================================
+-- CONTAGEM (DRY-RUN)
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION public.count_purgeable_leads(p_cutoff TIMESTAMPTZ, p_company_id UUID DEFAULT NULL)
+RETURNS TABLE (table_name TEXT, rows_to_delete BIGINT)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_table TEXT;
+  v_count BIGINT;
+BEGIN
+  FOREACH v_table IN ARRAY public.lead_purge_dependents() LOOP
+    -- Tabela ausente ou sem lead_id neste schema: nada a apagar
+    IF NOT EXISTS (
+      SELECT 1 FROM information_schema.columns
+      WHERE table_schema = 'public' AND table_name = v_table AND column_name = 'lead_id'
+    ) THEN
+      CONTINUE;
+    END IF;
+    EXECUTE format(
+      'SELECT COUNT(*) FROM public.%I d WHERE d.lead_id IN (
+         SELECT l.id FROM public.leads l
+         WHERE l.deleted_at < $1 AND ($2::uuid IS NULL OR l.company_id = $2))', v_table)
+    INTO v_count USING p_cutoff, p_company_id;
+    table_name := v_table;
+    rows_to_delete := v_count;
+    RETURN NEXT;
+  END LOOP;
+
+  SELECT COUNT(*) INTO v_count
+  FROM public.leads l
+  WHERE l.deleted_at < p_cutoff AND (p_company_id IS NULL OR l.company_id = p_company_id);
+  table_name := 'leads';
+  rows_to_delete := v_count;
+  RETURN NEXT;
+END;
+$$;
+
+REVOKE ALL ON FUNCTION public.purge_leads(UUID[], BOOLEAN) FROM PUBLIC;
+REVOKE ALL ON FUNCTION public.count_purgeable_leads(TIMESTAMPTZ, UUID) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.purge_leads(UUID[], BOOLEAN) TO service_role;
+GRANT EXECUTE ON FUNCTION public.count_purgeable_leads(TIMESTAMPTZ, UUID) TO service_role;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- O que seria apagado com retenção de 30 dias:
+-- SELECT * FROM count_purgeable_leads(now() - interval '30 days');
+--
+-- -- Purga de um lote (o script faz isso em lotes com SKIP LOCKED):
+-- SELECT * FROM purge_leads(ARRAY['uuid-1', 'uuid-2']::uuid[]);
@@ -0,0 +1,49 @@
+-- =====================================================
+-- ÍNDICES PARCIAIS PARA LINHAS VIVAS (deleted_at IS NULL)
+-- =====================================================
+-- Quase toda leitura de leads filtra "deleted_at IS NULL" junto com company_id
+-- (RLS), owner_id ou stage_id e ordena por created_at. O idx_leads_deleted_at
+-- simples de add_deleted_at_column.py não serve a nenhuma delas: o planner acaba
+-- no índice de company_id e descarta as excluídas linha a linha. Os índices
+-- parciais abaixo cobrem só as linhas vivas, na ordem da listagem.
+--
+-- Outras tabelas com soft delete: python backend/scripts/soft_delete.py install
+-- Antes/depois dos planos: python backend/scripts/soft_delete.py benchmark
+
+ALTER TABLE public.leads
+ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ DEFAULT NULL;
+
+-- Listagem por empresa (RLS) e paginação keyset por (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_leads_live_company_created
+ON public.leads (company_id, created_at DESC, id)
+WHERE deleted_at IS NULL;
+
+-- Colunas do Kanban por etapa
+CREATE INDEX IF NOT EXISTS idx_leads_live_company_stage
+ON public.leads (company_id, stage_id, created_at DESC)
+WHERE deleted_at IS NULL;
+
+-- "Meus leads"
+CREATE INDEX IF NOT EXISTS idx_leads_live_owner_created
+ON public.leads (owner_id, created_at DESC)
+WHERE deleted_at IS NULL;
+
+-- Substituído pelos parciais acima (linhas vivas) e por idx_leads_deleted_at_id
+-- (tombstones, 20250920000000_incremental_sync_indexes.sql)
+DROP INDEX IF EXISTS public.idx_leads_deleted_at;
+
+-- Duplicata exata de idx_leads_deleted_at_id que versões anteriores de
+-- 20250927000000_lead_purge.sql criavam; a purga usa o índice de tombstones
+DROP INDEX IF EXISTS public.idx_leads_purge_candidates;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Deve usar idx_leads_live_company_stage:
+-- EXPLAIN SELECT id, name FROM leads
+-- WHERE company_id = 'uuid' AND stage_id = 'uuid' AND deleted_at IS NULL
+-- ORDER BY created_at DESC LIMIT 50;
+--
+-- -- O predicado precisa aparecer literalmente na consulta; "deleted_at IS NULL"
+-- -- via parâmetro ou COALESCE não casa com o índice parcial.
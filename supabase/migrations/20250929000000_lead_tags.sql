@@ -0,0 +1,234 @@
+-- =====================================================
+-- TAGS DE LEADS: ÍNDICE GIN, BUSCA E CONTAGEM POR EMPRESA
+-- =====================================================
+-- add_tags_migration.py criou leads.tags TEXT[] sem índice: filtrar por tag
+-- ("tags @> '{urgente}'") varre a tabela e não havia como listar as tags de uma
+-- empresa sem ler todos os leads. Esta migration cria o índice GIN, funções de
+-- busca por contenção (@>) e sobreposição (&&) e a tabela lead_tag_counts,
+-- mantida por triggers de statement (transition tables) como whatsapp_conversations.
+--
+-- Renomear/remover/verificar em massa: backend/scripts/lead_tags.py
+
+ALTER TABLE public.leads
+ADD COLUMN IF NOT EXISTS tags TEXT[] DEFAULT '{}';
+
+-- Atende @>, && e <@ (array_ops)
+CREATE INDEX IF NOT EXISTS idx_leads_tags_gin
+ON public.leads USING GIN (tags);
+
+-- Leads vivos por tag e empresa; cada lead conta uma vez por tag
+CREATE TABLE IF NOT EXISTS public.lead_tag_counts (
+  company_id UUID NOT NULL,
+  tag TEXT NOT NULL,
+  lead_count BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (company_id, tag)
+);
+
+-- Tags mais usadas da empresa
+CREATE INDEX IF NOT EXISTS idx_lead_tag_counts_company_count
+ON public.lead_tag_counts (company_id, lead_count DESC);
+
+ALTER TABLE public.lead_tag_counts ENABLE ROW LEVEL SECURITY;
+
+-- Visível para quem enxerga algum lead da empresa (a RLS de leads vale na subconsulta)
+DROP POLICY IF EXISTS lead_tag_counts_company_read ON public.lead_tag_counts;
+CREATE POLICY lead_tag_counts_company_read ON public.lead_tag_counts
+  FOR SELECT USING (
+    EXISTS (SELECT 1 FROM public.leads l WHERE l.company_id = lead_tag_counts.company_id)
+  );
+
+-- =====================================================
+-- MANUTENÇÃO INCREMENTAL
+-- =====================================================
+-- Os triggers só somam deltas (+1 por tag de lead vivo novo, -1 por tag de lead
+-- vivo antigo); updates que não mexem em tags, deleted_at ou company_id não geram
+-- delta nenhum. A reconstrução trava a tabela de contagem e recalcula do zero.
+
+CREATE OR REPLACE FUNCTION public.lead_tag_counts_merge(p_company_ids UUID[], p_tags TEXT[], p_deltas BIGINT[])
+RETURNS VOID AS $$
+  INSERT INTO public.lead_tag_counts AS c (company_id, tag, lead_count)
+  SELECT company_id, tag, SUM(d)
+  FROM unnest(p_company_ids, p_tags, p_deltas) AS x(company_id, tag, d)
+  GROUP BY company_id, tag
+  HAVING SUM(d) <> 0
+  ORDER BY company_id, tag
+  ON CONFLICT (company_id, tag) DO UPDATE SET
+    lead_count = c.lead_count + EXCLUDED.lead_count,
+    updated_at = now();
+
+  -- Tag que sumiu de todos os leads vivos da empresa
+  DELETE FROM public.lead_tag_counts c
+  USING unnest(p_company_ids, p_tags, p_deltas) AS x(company_id, tag, d)
+  WHERE x.d < 0 AND c.company_id = x.company_id AND c.tag = x.tag AND c.lead_count <= 0;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION public.lead_tag_counts_on_change()
+RETURNS TRIGGER AS $$
+DECLARE
+  v_companies UUID[];
+  v_tags TEXT[];
+  v_deltas BIGINT[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(n.company_id), array_agg(t.tag), array_agg(1::BIGINT)
+    INTO v_companies, v_tags, v_deltas
+    FROM new_rows n
+    CROSS JOIN LATERAL (SELECT DISTINCT u.tag FROM unnest(n.tags) u(tag) WHERE u.tag IS NOT NULL) t
+    WHERE n.company_id IS NOT NULL AND n.deleted_at IS NULL;
+
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(o.company_id), array_agg(t.tag), array_agg(-1::BIGINT)
+    INTO v_companies, v_tags, v_deltas
+    FROM old_rows o
+    CROSS JOIN LATERAL (SELECT DISTINCT u.tag FROM unnest(o.tags) u(tag) WHERE u.tag IS NOT NULL) t
+    WHERE o.company_id IS NOT NULL AND o.deleted_at IS NULL;
+
+  ELSE
+    WITH changed AS (
+      SELECT o.company_id AS old_company, o.tags AS old_tags, o.deleted_at AS old_deleted,
+             n.company_id AS new_company, n.tags AS new_tags, n.deleted_at AS new_deleted
+      FROM old_rows o
+      JOIN new_rows n ON n.id = o.id
+      WHERE o.tags IS DISTINCT FROM n.tags
+         OR o.company_id IS DISTINCT FROM n.company_id
+         OR (o.deleted_at IS NULL) <> (n.deleted_at IS NULL)
+    ),
+    delta AS (
+      SELECT c.new_company AS company_id, t.tag, 1::BIGINT AS d
+      FROM changed c
+      CROSS JOIN LATERAL (SELECT DISTINCT u.tag FROM unnest(c.new_tags) u(tag) WHERE u.tag IS NOT NULL) t
+      WHERE c.new_company IS NOT NULL AND c.new_deleted IS NULL
+      UNION ALL
+      SELECT c.old_company, t.tag, -1::BIGINT
+      FROM changed c
+      CROSS JOIN LATERAL (SELECT DISTINCT u.tag FROM unnest(c.old_tags) u(tag) WHERE u.tag IS NOT NULL) t
+      WHERE c.old_company IS NOT NULL AND c.old_deleted IS NULL
+    )
+    SELECT array_agg(company_id), array_agg(tag), array_agg(d)
+    INTO v_companies, v_tags, v_deltas
+    FROM delta;
+  END IF;
+
+  IF v_companies IS NOT NULL THEN
+    PERFORM public.lead_tag_counts_merge(v_companies, v_tags, v_deltas);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_lead_tag_counts_insert ON public.leads;
+CREATE TRIGGER trg_lead_tag_counts_insert
+  AFTER INSERT ON public.leads
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.lead_tag_counts_on_change();
+
+DROP TRIGGER IF EXISTS trg_lead_tag_counts_update ON public.leads;
+CREATE TRIGGER trg_lead_tag_counts_update
+  AFTER UPDATE ON public.leads
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.lead_tag_counts_on_change();
+
+DROP TRIGGER IF EXISTS trg_lead_tag_counts_delete ON public.leads;
+CREATE TRIGGER trg_lead_tag_counts_delete
+  AFTER DELETE ON public.leads
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.lead_tag_counts_on_change();
+
+-- Contagem esperada (recalculada dos leads), usada pela reconstrução e pela verificação
+CREATE OR REPLACE FUNCTION public.lead_tag_counts_expected(p_company_id UUID DEFAULT NULL)
+RETURNS TABLE (company_id UUID, tag TEXT, lead_count BIGINT) AS $$
+  SELECT l.company_id, t.tag, COUNT(*)
+  FROM public.leads l
+  CROSS JOIN LATERAL (SELECT DISTINCT u.tag FROM unnest(l.tags) u(tag) WHERE u.tag IS NOT NULL) t
+  WHERE l.company_id IS NOT NULL
+    AND l.deleted_at IS NULL
+    AND (p_company_id IS NULL OR l.company_id = p_company_id)
+  GROUP BY l.company_id, t.tag;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.rebuild_lead_tag_counts(p_company_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  rebuilt INTEGER;
+BEGIN
+  -- Espera as transações que já somaram deltas e bloqueia novas até o fim
+  LOCK TABLE public.lead_tag_counts IN SHARE ROW EXCLUSIVE MODE;
+
+  DELETE FROM public.lead_tag_counts c
+  WHERE p_company_id IS NULL OR c.company_id = p_company_id;
+
+  INSERT INTO public.lead_tag_counts (company_id, tag, lead_count)
+  SELECT e.company_id, e.tag, e.lead_count
+  FROM public.lead_tag_counts_expected(p_company_id) e;
+
+  GET DIAGNOSTICS rebuilt = ROW_COUNT;
+  RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- =====================================================
+-- BUSCA POR TAGS
+-- =====================================================
+-- SECURITY INVOKER: a RLS de leads continua valendo. O filtro é escrito como
+-- "tags @> $1" / "tags && $1" para o planner usar idx_leads_tags_gin.
+
+CREATE OR REPLACE FUNCTION public.search_leads_by_tags(
+  p_company_id UUID,
+  p_tags TEXT[],
+  p_match TEXT DEFAULT 'all',
+  p_limit INT DEFAULT 50,
+  p_offset INT DEFAULT 0
+)
+RETURNS SETOF public.leads AS $$
+BEGIN
+  IF p_match = 'all' THEN
+    RETURN QUERY
+    SELECT l.* FROM public.leads l
+    WHERE l.company_id = p_company_id AND l.deleted_at IS NULL AND l.tags @> p_tags
+    ORDER BY l.created_at DESC, l.id DESC
+    LIMIT p_limit OFFSET p_offset;
+  ELSIF p_match = 'any' THEN
+    RETURN QUERY
+    SELECT l.* FROM public.leads l
+    WHERE l.company_id = p_company_id AND l.deleted_at IS NULL AND l.tags && p_tags
+    ORDER BY l.created_at DESC, l.id DESC
+    LIMIT p_limit OFFSET p_offset;
+  ELSE
+    RAISE EXCEPTION 'p_match deve ser all ou any (recebido: %)', p_match;
+  END IF;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE OR REPLACE FUNCTION public.get_lead_tag_counts(p_company_id UUID, p_limit INT DEFAULT 100)
+RETURNS TABLE (tag TEXT, lead_count BIGINT) AS $$
+  SELECT c.tag, c.lead_count
+  FROM public.lead_tag_counts c
+  WHERE c.company_id = p_company_id
+  ORDER BY c.lead_count DESC, c.tag
+  LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
+
+REVOKE ALL ON FUNCTION public.rebuild_lead_tag_counts(UUID) FROM PUBLIC;
+GRANT EXECUTE ON FUNCTION public.rebuild_lead_tag_counts(UUID) TO service_role;
+
+-- Popular a contagem com os leads existentes
+SELECT public.rebuild_lead_tag_counts();
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Leads com todas as tags / com qualquer uma delas:
+-- SELECT id, name, tags FROM search_leads_by_tags('company-uuid', ARRAY['urgente', 'vip']);
+-- SELECT id, name, tags FROM search_leads_by_tags('company-uuid', ARRAY['urgente', 'vip'], 'any');
+--
+-- -- Pelo client do Supabase (usa o mesmo índice):
+-- supabase.from('leads').select('*').contains('tags', ['urgente'])
+-- supabase.from('leads').select('*').overlaps('tags', ['urgente', 'vip'])
+--
+-- -- Tags mais usadas da empresa:
+-- SELECT * FROM get_lead_tag_counts('company-uuid');
@@ -0,0 +1,84 @@
+-- =====================================================
+-- NORMALIZAÇÃO DE TAGS DE LEADS
+-- =====================================================
+-- leads.tags é gravado como veio do formulário ('Urgente', 'urgente ', 'URGENTE'),
+-- o que multiplica entradas no índice GIN e em lead_tag_counts. A forma canônica
+-- é: sem acento, minúsculas, espaços colapsados e aparados, e então o sinônimo de
+-- lead_tag_synonyms, se houver. O trigger abaixo aplica isso em toda gravação;
+-- o legado é reescrito em lotes por backend/scripts/tag_normalizer.py, que usa a
+-- mesma regra (com Unicode completo) e sincroniza os sinônimos do arquivo JSON.
+
+-- Sinônimo -> tag canônica; alias já normalizado (sem acento, minúsculo)
+CREATE TABLE IF NOT EXISTS public.lead_tag_synonyms (
+  alias TEXT PRIMARY KEY,
+  canonical TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  CHECK (alias <> canonical)
+);
+
+ALTER TABLE public.lead_tag_synonyms ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS lead_tag_synonyms_read ON public.lead_tag_synonyms;
+CREATE POLICY lead_tag_synonyms_read ON public.lead_tag_synonyms
+  FOR SELECT USING (auth.role() = 'authenticated');
+
+-- Acentos do português/espanhol/francês; tag_normalizer.py cobre o resto do Unicode
+-- e sua saída é ponto fixo desta função
+CREATE OR REPLACE FUNCTION public.normalize_tag(p_tag TEXT)
+RETURNS TEXT AS $$
+  SELECT NULLIF(btrim(regexp_replace(lower(translate(
+    p_tag,
+    'áàâãäåÁÀÂÃÄÅçÇéèêëÉÈÊËíìîïÍÌÎÏñÑóòôõöÓÒÔÕÖúùûüÚÙÛÜýÿÝ',
+    'aaaaaaAAAAAAcCeeeeEEEEiiiiIIIInNoooooOOOOOuuuuUUUUyyY'
+  )), '\s+', ' ', 'g')), '');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Normaliza, aplica sinônimos e remove vazias/duplicadas mantendo a ordem
+CREATE OR REPLACE FUNCTION public.normalize_tag_array(p_tags TEXT[])
+RETURNS TEXT[] AS $$
+  SELECT COALESCE(ARRAY(
+    SELECT r.tag
+    FROM (
+      SELECT COALESCE(s.canonical, n.tag) AS tag, u.ord
+      FROM unnest(p_tags) WITH ORDINALITY AS u(raw, ord)
+      CROSS JOIN LATERAL (SELECT public.normalize_tag(u.raw) AS tag) n
+      LEFT JOIN public.lead_tag_synonyms s ON s.alias = n.tag
+      WHERE n.tag IS NOT NULL
+    ) r
+    GROUP BY r.tag
+    ORDER BY MIN(r.ord)
+  ), '{}');
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION public.leads_normalize_tags()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF NEW.tags IS NOT NULL AND NEW.tags <> '{}' THEN
+    NEW.tags := public.normalize_tag_array(NEW.tags);
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- BEFORE: lead_tag_counts (AFTER, por statement) já recebe as tags canônicas
+DROP TRIGGER IF EXISTS trg_leads_normalize_tags ON public.leads;
+CREATE TRIGGER trg_leads_normalize_tags
+  BEFORE INSERT OR UPDATE OF tags ON public.leads
+  FOR EACH ROW
+  EXECUTE FUNCTION public.leads_normalize_tags();
+
+REVOKE ALL ON public.lead_tag_synonyms FROM anon, authenticated;
+GRANT SELECT ON public.lead_tag_synonyms TO authenticated;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- SELECT normalize_tag_array(ARRAY['Urgente', 'urgente ', 'URGENTE', 'Reunião']);
+-- -- {urgente,reuniao}
+--
+-- -- Sinônimos (o script sincroniza a partir de um JSON):
+-- INSERT INTO lead_tag_synonyms (alias, canonical) VALUES ('hot', 'quente');
+--
+-- -- Reescrever os leads existentes:
+-- -- python backend/scripts/tag_normalizer.py apply --synonyms tag_synonyms.json
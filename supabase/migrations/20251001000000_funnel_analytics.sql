@@ -0,0 +1,130 @@
+-- =====================================================
+-- HISTÓRICO DE ETAPAS E CACHE DE ANÁLISE DO FUNIL
+-- =====================================================
+-- leads guarda só a etapa atual, então conversão entre etapas, tempo em etapa e
+-- velocidade do pipeline não podiam ser calculados. lead_stage_history registra
+-- cada entrada em etapa (triggers de statement em leads) e funnel_analytics_daily
+-- guarda as métricas calculadas por backend/scripts/funnel_analytics.py, uma linha
+-- por (empresa, pipeline, responsável, dia). A página de Relatórios lê o cache.
+
+CREATE TABLE IF NOT EXISTS public.lead_stage_history (
+  id BIGSERIAL PRIMARY KEY,
+  lead_id UUID NOT NULL REFERENCES public.leads(id) ON DELETE CASCADE,
+  company_id UUID,
+  owner_id UUID,
+  from_stage_id UUID,
+  to_stage_id UUID NOT NULL,
+  entered_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  backfilled BOOLEAN NOT NULL DEFAULT false
+);
+
+-- Sequência de etapas de um lead (o script lê por empresa, em ordem de lead)
+CREATE INDEX IF NOT EXISTS idx_lead_stage_history_lead
+ON public.lead_stage_history (lead_id, entered_at, id);
+
+CREATE INDEX IF NOT EXISTS idx_lead_stage_history_company_entered
+ON public.lead_stage_history (company_id, entered_at);
+
+ALTER TABLE public.lead_stage_history ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS lead_stage_history_read ON public.lead_stage_history;
+CREATE POLICY lead_stage_history_read ON public.lead_stage_history
+  FOR SELECT USING (EXISTS (SELECT 1 FROM public.leads l WHERE l.id = lead_stage_history.lead_id));
+
+CREATE OR REPLACE FUNCTION public.lead_stage_history_on_change()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO public.lead_stage_history (lead_id, company_id, owner_id, from_stage_id, to_stage_id, entered_at)
+    SELECT n.id, n.company_id, n.owner_id, NULL, n.stage_id, COALESCE(n.created_at, now())
+    FROM new_rows n
+    WHERE n.stage_id IS NOT NULL;
+  ELSE
+    INSERT INTO public.lead_stage_history (lead_id, company_id, owner_id, from_stage_id, to_stage_id, entered_at)
+    SELECT n.id, n.company_id, n.owner_id, o.stage_id, n.stage_id, now()
+    FROM old_rows o
+    JOIN new_rows n ON n.id = o.id
+    WHERE n.stage_id IS NOT NULL AND n.stage_id IS DISTINCT FROM o.stage_id;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS trg_lead_stage_history_insert ON public.leads;
+CREATE TRIGGER trg_lead_stage_history_insert
+  AFTER INSERT ON public.leads
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.lead_stage_history_on_change();
+
+DROP TRIGGER IF EXISTS trg_lead_stage_history_update ON public.leads;
+CREATE TRIGGER trg_lead_stage_history_update
+  AFTER UPDATE ON public.leads
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+  FOR EACH STATEMENT
+  EXECUTE FUNCTION public.lead_stage_history_on_change();
+
+-- Leads anteriores ao histórico: só se sabe a etapa atual. Entram como uma única
+-- entrada em created_at (backfilled = true); o tempo em etapa desses leads é
+-- descartado pelo script, mas eles contam para o alcance do funil.
+INSERT INTO public.lead_stage_history (lead_id, company_id, owner_id, from_stage_id, to_stage_id, entered_at, backfilled)
+SELECT l.id, l.company_id, l.owner_id, NULL, l.stage_id, l.created_at, true
+FROM public.leads l
+WHERE l.stage_id IS NOT NULL
+  AND NOT EXISTS (SELECT 1 FROM public.lead_stage_history h WHERE h.lead_id = l.id);
+
+-- =====================================================
+-- CACHE DIÁRIO DAS MÉTRICAS
+-- =====================================================
+-- pipeline_id NULL = etapas sem pipeline; owner_id NULL = todos os responsáveis.
+-- metrics (JSONB): reach, conversion, matrix,
+-- time_in_stage (p50/p75/p90 em horas), velocity; formato em funnel_analytics.py.
+
+CREATE TABLE IF NOT EXISTS public.funnel_analytics_daily (
+  id BIGSERIAL PRIMARY KEY,
+  company_id UUID NOT NULL,
+  pipeline_id UUID,
+  owner_id UUID,
+  day DATE NOT NULL,
+  window_days INTEGER NOT NULL,
+  leads BIGINT NOT NULL DEFAULT 0,
+  metrics JSONB NOT NULL,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_funnel_analytics_daily_company_day
+ON public.funnel_analytics_daily (company_id, day DESC, window_days);
+
+ALTER TABLE public.funnel_analytics_daily ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS funnel_analytics_daily_read ON public.funnel_analytics_daily;
+CREATE POLICY funnel_analytics_daily_read ON public.funnel_analytics_daily
+  FOR SELECT USING (EXISTS (SELECT 1 FROM public.leads l WHERE l.company_id = funnel_analytics_daily.company_id));
+
+-- Métricas mais recentes da empresa (ou de um dia específico)
+CREATE OR REPLACE FUNCTION public.get_funnel_analytics(
+  p_company_id UUID,
+  p_day DATE DEFAULT NULL,
+  p_window_days INT DEFAULT 90
+)
+RETURNS TABLE (pipeline_id UUID, owner_id UUID, day DATE, leads BIGINT, metrics JSONB, computed_at TIMESTAMPTZ) AS $$
+  SELECT f.pipeline_id, f.owner_id, f.day, f.leads, f.metrics, f.computed_at
+  FROM public.funnel_analytics_daily f
+  WHERE f.company_id = p_company_id
+    AND f.window_days = p_window_days
+    AND f.day = COALESCE(p_day, (
+      SELECT MAX(d.day) FROM public.funnel_analytics_daily d
+      WHERE d.company_id = p_company_id AND d.window_days = p_window_days
+    ))
+  ORDER BY f.pipeline_id NULLS FIRST, f.owner_id NULLS FIRST;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Calcular o dia (o script pula empresas já em cache, use --force para refazer):
+-- -- python backend/scripts/funnel_analytics.py compute --window-days 90
+--
+-- -- Relatórios:
+-- SELECT * FROM get_funnel_analytics('company-uuid');
@@ -0,0 +1,160 @@
+-- =====================================================
+-- ORDENAÇÃO DO KANBAN POR CHAVE FRACIONÁRIA (kanban_rank)
+-- =====================================================
+-- Com posição inteira, arrastar um card reescreve a posição de todos os cards
+-- entre a origem e o destino. kanban_rank é uma string base 62 comparada byte a
+-- byte (COLLATE "C"): mover um card grava só a linha dele, com uma chave entre as
+-- dos vizinhos (rank_between). Quando as chaves de uma coluna ficam longas demais,
+-- backend/scripts/kanban_rank.py reescreve a coluna com chaves curtas e
+-- igualmente espaçadas (mesmo algoritmo em Python).
+--
+-- Colunas: leads por (company_id, stage_id); activities por (company_id, status).
+-- Ordem de exibição: ORDER BY kanban_rank, id (o id desempata chaves iguais).
+
+ALTER TABLE public.leads
+ADD COLUMN IF NOT EXISTS kanban_rank TEXT COLLATE "C";
+
+ALTER TABLE public.activities
+ADD COLUMN IF NOT EXISTS kanban_rank TEXT COLLATE "C";
+
+CREATE INDEX IF NOT EXISTS idx_leads_kanban_rank
+ON public.leads (company_id, stage_id, kanban_rank, id)
+WHERE deleted_at IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_activities_kanban_rank
+ON public.activities (company_id, status, kanban_rank, id);
+
+-- =====================================================
+-- CHAVE ENTRE DOIS VIZINHOS
+-- =====================================================
+-- Dígitos 0-9A-Za-z em ordem ASCII. NULL em p_before = início da coluna, NULL em
+-- p_after = fim. Entre dois cards usa o ponto médio; nas pontas anda um dígito
+-- (topo/fim repetidos crescem a chave 1 caractere a cada ~30 movimentos, e não a
+-- cada 6). Chaves nunca terminam em '0', então sempre existe espaço entre duas
+-- chaves distintas. Espelha rank_between() de kanban_rank.py.
+
+CREATE OR REPLACE FUNCTION public.rank_between(p_before TEXT, p_after TEXT)
+RETURNS TEXT AS $$
+DECLARE
+  digits CONSTANT TEXT := '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz';
+  a TEXT COLLATE "C" := COALESCE(p_before, '');
+  b TEXT COLLATE "C" := p_after;
+  prefix TEXT COLLATE "C" := '';
+  at_start CONSTANT BOOLEAN := p_before IS NULL;
+  at_end CONSTANT BOOLEAN := p_after IS NULL;
+  n INT;
+  da INT;
+  db INT;
+BEGIN
+  IF b IS NOT NULL AND a >= b THEN
+    RAISE EXCEPTION 'rank_between: % deve ser menor que %', a, b;
+  END IF;
+
+  LOOP
+    IF b IS NOT NULL THEN
+      n := 0;
+      WHILE n < length(b) AND COALESCE(NULLIF(substr(a, n + 1, 1), ''), '0') = substr(b, n + 1, 1) LOOP
+        n := n + 1;
+      END LOOP;
+      prefix := prefix || left(b, n);
+      a := substr(a, n + 1);
+      b := substr(b, n + 1);
+    END IF;
+
+    da := CASE WHEN a = '' THEN 0 ELSE strpos(digits, left(a, 1)) - 1 END;
+    db := CASE WHEN b IS NULL OR b = '' THEN 62 ELSE strpos(digits, left(b, 1)) - 1 END;
+
+    IF db - da > 1 THEN
+      RETURN prefix || substr(digits, CASE
+        WHEN at_end AND NOT at_start AND a <> '' THEN da + 1
+        WHEN at_start AND NOT at_end AND b IS NOT NULL THEN db - 1
+        ELSE (da + db) / 2
+      END + 1, 1);
+    END IF;
+    IF b IS NOT NULL AND length(b) > 1 THEN
+      RETURN prefix || left(b, 1);
+    END IF;
+
+    prefix := prefix || substr(digits, da + 1, 1);
+    a := substr(a, 2);
+    b := NULL;
+  END LOOP;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- =====================================================
+-- MOVER UM CARD (UMA LINHA)
+-- =====================================================
+-- p_before_id / p_after_id: cards que ficarão acima/abaixo no destino (NULL nas
+-- pontas). SECURITY INVOKER: a RLS vale para o card e para os vizinhos.
+
+CREATE OR REPLACE FUNCTION public.move_lead(
+  p_lead_id UUID,
+  p_stage_id UUID,
+  p_before_id UUID DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL
+)
+RETURNS TEXT AS $$
+DECLARE
+  v_before TEXT COLLATE "C";
+  v_after TEXT COLLATE "C";
+  v_rank TEXT;
+BEGIN
+  SELECT kanban_rank INTO v_before FROM public.leads WHERE id = p_before_id AND stage_id = p_stage_id;
+  SELECT kanban_rank INTO v_after FROM public.leads WHERE id = p_after_id AND stage_id = p_stage_id;
+
+  -- Vizinhos empatados: fica logo depois do de cima
+  IF v_before IS NOT NULL AND v_after IS NOT NULL AND v_before >= v_after THEN
+    v_rank := v_before || public.rank_between(NULL, NULL);
+  ELSE
+    v_rank := public.rank_between(v_before, v_after);
+  END IF;
+
+  UPDATE public.leads
+  SET stage_id = p_stage_id, kanban_rank = v_rank, updated_at = now()
+  WHERE id = p_lead_id;
+  RETURN v_rank;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION public.move_activity(
+  p_activity_id UUID,
+  p_status TEXT,
+  p_before_id UUID DEFAULT NULL,
+  p_after_id UUID DEFAULT NULL
+)
+RETURNS TEXT AS $$
+DECLARE
+  v_before TEXT COLLATE "C";
+  v_after TEXT COLLATE "C";
+  v_rank TEXT;
+BEGIN
+  SELECT kanban_rank INTO v_before FROM public.activities WHERE id = p_before_id AND status = p_status;
+  SELECT kanban_rank INTO v_after FROM public.activities WHERE id = p_after_id AND status = p_status;
+
+  IF v_before IS NOT NULL AND v_after IS NOT NULL AND v_before >= v_after THEN
+    v_rank := v_before || public.rank_between(NULL, NULL);
+  ELSE
+    v_rank := public.rank_between(v_before, v_after);
+  END IF;
+
+  UPDATE public.activities
+  SET status = p_status, kanban_rank = v_rank, updated_at = now()
+  WHERE id = p_activity_id;
+  RETURN v_rank;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Chaves iniciais (ordem atual por created_at) e rebalanceamento:
+-- -- python backend/scripts/kanban_rank.py rebalance --table leads --all
+--
+-- -- Frontend, ao soltar o card entre dois outros:
+-- supabase.rpc('move_lead', { p_lead_id, p_stage_id, p_before_id, p_after_id })
+--
+-- -- Listagem da coluna:
+-- SELECT * FROM leads WHERE company_id = $1 AND stage_id = $2 AND deleted_at IS NULL
+-- ORDER BY kanban_rank, id;
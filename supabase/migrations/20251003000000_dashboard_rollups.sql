@@ -0,0 +1,119 @@
+-- =====================================================
+-- ROLLUPS DIÁRIOS DO DASHBOARD E DOS RELATÓRIOS
+-- =====================================================
+-- Dashboard e Relatórios agregavam leads, deals, activities, projects e products
+-- da empresa a cada carregamento. dashboard_daily_rollups guarda, por empresa e
+-- por dia de criação (fuso America/Sao_Paulo), a contagem e a soma de valor por
+-- status e prioridade; as páginas somam O(dias) linhas. Atividades abertas também
+-- entram por dia de vencimento (entity = 'activities_due'), o que dá o atraso
+-- (dias < hoje) sem varrer activities.
+--
+-- Atualização incremental por watermark de updated_at:
+-- backend/scripts/dashboard_rollups.py refresh
+
+CREATE TABLE IF NOT EXISTS public.dashboard_daily_rollups (
+  company_id UUID NOT NULL,
+  entity TEXT NOT NULL,
+  day DATE NOT NULL,
+  status TEXT NOT NULL DEFAULT '',
+  priority TEXT NOT NULL DEFAULT '',
+  items BIGINT NOT NULL DEFAULT 0,
+  amount NUMERIC(16,2) NOT NULL DEFAULT 0,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (company_id, entity, day, status, priority)
+);
+
+-- Último (updated_at, id) já consolidado por entidade
+CREATE TABLE IF NOT EXISTS public.dashboard_rollup_watermarks (
+  entity TEXT PRIMARY KEY,
+  updated_at TIMESTAMPTZ,
+  last_id UUID,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE public.dashboard_daily_rollups ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS dashboard_daily_rollups_read ON public.dashboard_daily_rollups;
+CREATE POLICY dashboard_daily_rollups_read ON public.dashboard_daily_rollups
+  FOR SELECT USING (EXISTS (SELECT 1 FROM public.leads l WHERE l.company_id = dashboard_daily_rollups.company_id)
+                 OR EXISTS (SELECT 1 FROM public.activities a WHERE a.company_id = dashboard_daily_rollups.company_id));
+
+-- Estado interno do script (service role): RLS sem políticas bloqueia anon/authenticated
+ALTER TABLE public.dashboard_rollup_watermarks ENABLE ROW LEVEL SECURITY;
+
+-- Recalcular um dia de uma empresa lê só as linhas criadas naquele dia
+-- (leads já tem idx_leads_live_company_created)
+CREATE INDEX IF NOT EXISTS idx_deals_company_created ON public.deals (company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_activities_company_created ON public.activities (company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_projects_company_created ON public.projects (company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_products_company_created ON public.products (company_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_deals_updated_at_id ON public.deals (updated_at, id);
+
+-- Atividades abertas por vencimento (recalculadas por empresa). Os status abertos são
+-- os de OPEN_STATUSES (activity_workload.py); archived e desconhecidos ficam fora
+CREATE INDEX IF NOT EXISTS idx_activities_open_due
+ON public.activities (company_id, due_date)
+WHERE due_date IS NOT NULL AND status IN ('pending', 'in_progress', 'in-progress', 'overdue');
+
+-- =====================================================
+-- LEITURA PELAS PÁGINAS
+-- =====================================================
+
+-- Totais por entidade/status/prioridade no período (por dia de criação)
+CREATE OR REPLACE FUNCTION public.get_dashboard_summary(
+  p_company_id UUID,
+  p_from DATE DEFAULT NULL,
+  p_to DATE DEFAULT NULL
+)
+RETURNS TABLE (entity TEXT, status TEXT, priority TEXT, items BIGINT, amount NUMERIC) AS $$
+  SELECT r.entity, r.status, r.priority, SUM(r.items)::BIGINT, SUM(r.amount)
+  FROM public.dashboard_daily_rollups r
+  WHERE r.company_id = p_company_id
+    AND r.entity <> 'activities_due'
+    AND (p_from IS NULL OR r.day >= p_from)
+    AND (p_to IS NULL OR r.day <= p_to)
+  GROUP BY r.entity, r.status, r.priority
+  ORDER BY r.entity, r.status, r.priority;
+$$ LANGUAGE sql STABLE;
+
+-- Série diária de uma entidade (ex.: novos leads por dia)
+CREATE OR REPLACE FUNCTION public.get_dashboard_series(
+  p_company_id UUID,
+  p_entity TEXT,
+  p_from DATE,
+  p_to DATE DEFAULT CURRENT_DATE
+)
+RETURNS TABLE (day DATE, items BIGINT, amount NUMERIC) AS $$
+  SELECT r.day, SUM(r.items)::BIGINT, SUM(r.amount)
+  FROM public.dashboard_daily_rollups r
+  WHERE r.company_id = p_company_id AND r.entity = p_entity AND r.day BETWEEN p_from AND p_to
+  GROUP BY r.day
+  ORDER BY r.day;
+$$ LANGUAGE sql STABLE;
+
+-- Atividades abertas vencidas e a vencer hoje, por prioridade
+CREATE OR REPLACE FUNCTION public.get_overdue_activities(p_company_id UUID)
+RETURNS TABLE (priority TEXT, overdue BIGINT, due_today BIGINT) AS $$
+  SELECT r.priority,
+         COALESCE(SUM(r.items) FILTER (WHERE r.day < (now() AT TIME ZONE 'America/Sao_Paulo')::date), 0)::BIGINT,
+         COALESCE(SUM(r.items) FILTER (WHERE r.day = (now() AT TIME ZONE 'America/Sao_Paulo')::date), 0)::BIGINT
+  FROM public.dashboard_daily_rollups r
+  WHERE r.company_id = p_company_id AND r.entity = 'activities_due'
+  GROUP BY r.priority
+  ORDER BY r.priority;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Carga inicial e atualização (cron a cada poucos minutos):
+-- -- python backend/scripts/dashboard_rollups.py refresh --full
+-- -- python backend/scripts/dashboard_rollups.py refresh
+--
+-- -- Pipeline em aberto (valor de leads que não estão ganhos/perdidos):
+-- SELECT SUM(amount) FROM get_dashboard_summary('company-uuid')
+-- WHERE entity = 'leads' AND status NOT IN ('won', 'lost');
+--
+-- -- Novos leads nos últimos 30 dias:
+-- SELECT * FROM get_dashboard_series('company-uuid', 'leads', CURRENT_DATE - 30);
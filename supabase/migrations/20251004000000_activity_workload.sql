@@ -0,0 +1,77 @@
+-- =====================================================
+-- RELATÓRIO DE CARGA DE TRABALHO DAS ATIVIDADES
+-- =====================================================
+-- activities tem estimated_hours, actual_hours, work_group, department, is_urgent,
+-- project_id e sprint_id, mas nada agregava essas colunas. activity_workload_reports
+-- guarda o relatório calculado por backend/scripts/activity_workload.py: uma linha
+-- por (empresa, dimensão, chave), com dimensão employee, work_group, department,
+-- sprint, project ou company (chave '', total da empresa).
+--
+-- metrics (JSONB): carga aberta, backlog vencido por faixa de atraso e distribuição
+-- do erro estimado × real das atividades concluídas; formato em activity_workload.py.
+--
+-- activity_workload_state guarda, por empresa, o maior updated_at já incluído no
+-- relatório. O script só recalcula empresas com atividades alteradas depois disso,
+-- ou com relatório mais velho que --max-age-hours (o atraso cresce com o tempo).
+
+CREATE TABLE IF NOT EXISTS public.activity_workload_reports (
+  company_id UUID NOT NULL,
+  dimension TEXT NOT NULL,
+  dimension_key TEXT NOT NULL DEFAULT '',
+  items BIGINT NOT NULL DEFAULT 0,
+  open_items BIGINT NOT NULL DEFAULT 0,
+  overdue_items BIGINT NOT NULL DEFAULT 0,
+  open_estimated_hours NUMERIC(12,2) NOT NULL DEFAULT 0,
+  metrics JSONB NOT NULL,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (company_id, dimension, dimension_key)
+);
+
+CREATE TABLE IF NOT EXISTS public.activity_workload_state (
+  company_id UUID PRIMARY KEY,
+  source_updated_at TIMESTAMPTZ,
+  activities BIGINT NOT NULL DEFAULT 0,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_workload_state_source
+ON public.activity_workload_state (source_updated_at);
+
+ALTER TABLE public.activity_workload_reports ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS activity_workload_reports_read ON public.activity_workload_reports;
+CREATE POLICY activity_workload_reports_read ON public.activity_workload_reports
+  FOR SELECT USING (EXISTS (SELECT 1 FROM public.activities a WHERE a.company_id = activity_workload_reports.company_id));
+
+-- Estado interno do script (service role): RLS sem políticas bloqueia anon/authenticated
+ALTER TABLE public.activity_workload_state ENABLE ROW LEVEL SECURITY;
+
+-- Leitura das atividades de uma empresa (o script lê empresa a empresa)
+CREATE INDEX IF NOT EXISTS idx_activities_company_updated
+ON public.activities (company_id, updated_at);
+
+-- Relatório da empresa numa dimensão, maior backlog vencido primeiro
+CREATE OR REPLACE FUNCTION public.get_activity_workload(
+  p_company_id UUID,
+  p_dimension TEXT DEFAULT 'employee'
+)
+RETURNS TABLE (
+  dimension_key TEXT, items BIGINT, open_items BIGINT, overdue_items BIGINT,
+  open_estimated_hours NUMERIC, metrics JSONB, computed_at TIMESTAMPTZ
+) AS $$
+  SELECT r.dimension_key, r.items, r.open_items, r.overdue_items, r.open_estimated_hours, r.metrics, r.computed_at
+  FROM public.activity_workload_reports r
+  WHERE r.company_id = p_company_id AND r.dimension = p_dimension
+  ORDER BY r.overdue_items DESC, r.open_estimated_hours DESC, r.dimension_key;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Atualização incremental (cron de hora em hora):
+-- -- python backend/scripts/activity_workload.py refresh
+--
+-- -- Carga por responsável e por sprint:
+-- SELECT * FROM get_activity_workload('company-uuid', 'employee');
+-- SELECT * FROM get_activity_workload('company-uuid', 'sprint');
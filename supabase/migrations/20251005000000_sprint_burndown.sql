@@ -0,0 +1,77 @@
+-- =====================================================
+-- SNAPSHOTS DE BURNDOWN DAS SPRINTS
+-- =====================================================
+-- O burndown era recalculado do estado atual das atividades e não tinha
+-- histórico. sprint_burndown_snapshots guarda, por sprint e por intervalo
+-- (dia, por padrão), o escopo total, o que foi concluído, o que resta e as
+-- mudanças de escopo desde o snapshot anterior. O gráfico é uma leitura por
+-- faixa da chave primária (sprint_id, captured_at).
+--
+-- sprint_burndown_scope lembra quais atividades estavam na sprint no último
+-- snapshot, para separar itens adicionados e removidos (um delta no total não
+-- distingue as duas coisas).
+--
+-- Snapshots e backfill: backend/scripts/sprint_burndown.py
+
+CREATE TABLE IF NOT EXISTS public.sprint_burndown_snapshots (
+  sprint_id UUID NOT NULL REFERENCES public.sprints(id) ON DELETE CASCADE,
+  captured_at TIMESTAMPTZ NOT NULL,
+  taken_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  total_items INTEGER NOT NULL DEFAULT 0,
+  completed_items INTEGER NOT NULL DEFAULT 0,
+  total_estimate NUMERIC(10,2) NOT NULL DEFAULT 0,
+  remaining_estimate NUMERIC(10,2) NOT NULL DEFAULT 0,
+  added_items INTEGER NOT NULL DEFAULT 0,
+  removed_items INTEGER NOT NULL DEFAULT 0,
+  backfilled BOOLEAN NOT NULL DEFAULT false,
+  PRIMARY KEY (sprint_id, captured_at)
+);
+
+CREATE TABLE IF NOT EXISTS public.sprint_burndown_scope (
+  sprint_id UUID NOT NULL REFERENCES public.sprints(id) ON DELETE CASCADE,
+  activity_id UUID NOT NULL,
+  added_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  removed_at TIMESTAMPTZ,
+  PRIMARY KEY (sprint_id, activity_id)
+);
+
+ALTER TABLE public.sprint_burndown_snapshots ENABLE ROW LEVEL SECURITY;
+
+-- A RLS de sprints (owner_id) decide quem vê os snapshots
+DROP POLICY IF EXISTS sprint_burndown_snapshots_read ON public.sprint_burndown_snapshots;
+CREATE POLICY sprint_burndown_snapshots_read ON public.sprint_burndown_snapshots
+  FOR SELECT USING (EXISTS (SELECT 1 FROM public.sprints s WHERE s.id = sprint_burndown_snapshots.sprint_id));
+
+ALTER TABLE public.sprint_burndown_scope ENABLE ROW LEVEL SECURITY;
+
+-- Série do gráfico
+CREATE OR REPLACE FUNCTION public.get_sprint_burndown(
+  p_sprint_id UUID,
+  p_from TIMESTAMPTZ DEFAULT NULL,
+  p_to TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (
+  captured_at TIMESTAMPTZ, total_items INTEGER, completed_items INTEGER, total_estimate NUMERIC,
+  remaining_estimate NUMERIC, added_items INTEGER, removed_items INTEGER, backfilled BOOLEAN
+) AS $$
+  SELECT b.captured_at, b.total_items, b.completed_items, b.total_estimate,
+         b.remaining_estimate, b.added_items, b.removed_items, b.backfilled
+  FROM public.sprint_burndown_snapshots b
+  WHERE b.sprint_id = p_sprint_id
+    AND (p_from IS NULL OR b.captured_at >= p_from)
+    AND (p_to IS NULL OR b.captured_at <= p_to)
+  ORDER BY b.captured_at;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- INSTRUÇÕES DE USO:
+-- =====================================================
+--
+-- -- Snapshot das sprints em andamento (cron a cada hora; grava 1 por intervalo):
+-- -- python backend/scripts/sprint_burndown.py snapshot
+--
+-- -- Histórico aproximado das sprints anteriores a esta migration:
+-- -- python backend/scripts/sprint_burndown.py backfill
+--
+-- -- Gráfico:
+-- SELECT * FROM get_sprint_burndown('sprint-uuid');